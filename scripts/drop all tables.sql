@@ -1,5 +1,6 @@
 -- Don't do this unless you're sure of what you're doing
 DROP TABLE simulation.agent;
+DROP TABLE simulation.checkpoint;
 DROP TABLE simulation.config;
 DROP TABLE simulation.electricity_price;
 DROP TABLE simulation.extra_cost;
@@ -10,6 +11,7 @@ DROP TABLE simulation.job;
 DROP TABLE simulation.level;
 DROP TABLE simulation.mock_data;
 DROP TABLE simulation.results;
+DROP TABLE simulation.solve_info;
 DROP TABLE simulation.trade;
 DROP TYPE simulation.action;
 DROP TYPE simulation.extracosttype;
@@ -43,3 +43,13 @@ class TestBlockAgent(TestCase):
         usage_producer = self.block_agent_prod.get_actual_usage_for_resource(SOME_DATETIME, Resource.ELECTRICITY)
         self.assertFalse(np.isnan(usage_producer))
         self.assertTrue(usage_producer < 0)
+
+    def test_get_actual_usage_for_periods(self):
+        """Test that get_actual_usage_for_periods gives the same values as get_actual_usage_for_resource does, one
+        period at a time, also for resources that the agent doesn't use."""
+        periods = DATETIME_ARRAY[100:124]
+        for resource in [Resource.ELECTRICITY, Resource.COOLING]:
+            usage = self.block_agent_cons.get_actual_usage_for_periods(periods, resource)
+            self.assertEqual((24,), usage.shape)
+            for period, value in zip(periods, usage):
+                self.assertAlmostEqual(self.block_agent_cons.get_actual_usage_for_resource(period, resource), value)
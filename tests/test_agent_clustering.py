@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+import numpy as np
+
+import pandas as pd
+
+from tradingplatformpoc.agent.block_agent import BlockAgent
+from tradingplatformpoc.digitaltwin.battery import Battery
+from tradingplatformpoc.digitaltwin.static_digital_twin import StaticDigitalTwin
+from tradingplatformpoc.market.trade import Action, Market, Resource, Trade, TradeMetadataKey
+from tradingplatformpoc.simulation_runner.agent_clustering import AgentClusters, allocate_clusters, cluster_agents, \
+    disaggregate_outputs, merge_agents
+from tradingplatformpoc.simulation_runner.chalmers_interface import ChalmersOutputs
+
+START = datetime(2019, 2, 1, tzinfo=timezone.utc)
+PERIODS = [START + timedelta(hours=hour) for hour in range(48)]
+
+
+def create_agent(guid: str, elec_usage: np.ndarray, battery_capacity: float = 0.0, atemp: float = 100.0,
+                 hp_produce_cooling: bool = True) -> BlockAgent:
+    digital_twin = StaticDigitalTwin(atemp=atemp, electricity_usage=pd.Series(elec_usage, index=PERIODS),
+                                     space_heating_usage=pd.Series(np.full(len(PERIODS), 2.0), index=PERIODS),
+                                     hp_produce_cooling=hp_produce_cooling)
+    return BlockAgent(digital_twin=digital_twin, heat_pump_max_input=10.0, heat_pump_max_output=30.0,
+                      frac_for_bites=0.5, battery=Battery(battery_capacity, 0.4, 0.4, 0.9), guid=guid)
+
+
+class TestAgentClustering(TestCase):
+
+    def test_allocate_clusters(self):
+        self.assertEqual([3, 1], allocate_clusters([9, 3], 4))
+        # At least one cluster per group, and at most one per agent
+        self.assertEqual([1, 1], allocate_clusters([10, 1], 1))
+        self.assertEqual([2, 1], allocate_clusters([2, 1], 5))
+
+    def test_similar_agents_are_merged(self):
+        hours = np.arange(len(PERIODS)) % 24
+        day_profile = np.where((hours > 7) & (hours < 18), 10.0, 1.0)
+        night_profile = np.where((hours > 7) & (hours < 18), 1.0, 10.0)
+        agents = [create_agent('Day 1', day_profile), create_agent('Night 1', night_profile),
+                  create_agent('Day 2', day_profile * 1.1), create_agent('Night 2', night_profile * 0.9),
+                  create_agent('Cooling', day_profile, hp_produce_cooling=False)]
+        agent_clusters = cluster_agents(agents, 3, PERIODS)
+        self.assertEqual(3, len(agent_clusters.aggregate_agents))
+        self.assertEqual([['Day 1', 'Day 2'], ['Night 1', 'Night 2']], list(agent_clusters.members.values()))
+        # The agent with a different heat pump mode isn't merged with the others
+        self.assertEqual('Cooling', agent_clusters.aggregate_agents[2].guid)
+
+    def test_merge_agents(self):
+        first = create_agent('First', np.full(len(PERIODS), 1.0), battery_capacity=10.0, atemp=100.0)
+        second = create_agent('Second', np.full(len(PERIODS), 3.0), battery_capacity=0.0, atemp=300.0)
+        second.frac_for_bites = 0.0
+        merged = merge_agents([first, second], 'Merged')
+        self.assertEqual(4.0, merged.get_actual_usage_for_resource(PERIODS[5], Resource.ELECTRICITY))
+        self.assertEqual(4.0, merged.get_actual_usage_for_resource(PERIODS[5], Resource.LOW_TEMP_HEAT))
+        self.assertEqual(400.0, merged.digital_twin.atemp)
+        self.assertAlmostEqual(0.125, merged.frac_for_bites)
+        self.assertEqual(10.0, merged.battery.max_capacity_kwh)
+        self.assertAlmostEqual(first.battery.charge_limit_kwh, merged.battery.charge_limit_kwh)
+        self.assertEqual(60.0, merged.heat_pump_max_output)
+        self.assertAlmostEqual(first.acc_tank_volume + second.acc_tank_volume, merged.acc_tank_volume)
+
+    def test_disaggregate_outputs(self):
+        first = create_agent('First', np.full(len(PERIODS), 1.0), battery_capacity=10.0)
+        # Has PV production exceeding its usage, so its net usage is -3 kWh every hour
+        second = create_agent('Second', np.full(len(PERIODS), -3.0))
+        agent_clusters = AgentClusters([[first, second]], PERIODS)
+        guid = agent_clusters.aggregate_agents[0].guid
+        period = PERIODS[0]
+        trade = Trade(period=period, action=Action.SELL, resource=Resource.ELECTRICITY, quantity=2.0, price=0.5,
+                      source=guid, by_external=False, market=Market.LOCAL)
+        outputs = ChalmersOutputs([trade],
+                                  {TradeMetadataKey.BATTERY_LEVEL: {guid: {period: 0.5}},
+                                   TradeMetadataKey.HP_LOW_HEAT_PROD: {guid: {period: 6.0}}},
+                                  {TradeMetadataKey.COOL_DUMP: {period: 0.0}})
+        disaggregated = disaggregate_outputs(outputs, agent_clusters)
+        # Split by the energy exchanged: 1 and 3 kWh per hour
+        self.assertEqual({'First': 0.5, 'Second': 1.5},
+                         {trade.source: trade.quantity_pre_loss for trade in disaggregated.trades})
+        self.assertTrue(all(trade.price == 0.5 for trade in disaggregated.trades))
+        # Only the agent with a battery gets its (relative) level
+        self.assertEqual({'First': {period: 0.5}},
+                         disaggregated.metadata_per_agent_and_period[TradeMetadataKey.BATTERY_LEVEL])
+        self.assertEqual({'First': {period: 3.0}, 'Second': {period: 3.0}},
+                         disaggregated.metadata_per_agent_and_period[TradeMetadataKey.HP_LOW_HEAT_PROD])
+        # The first agent's usage is covered by the second agent's production within the aggregate agent
+        self.assertEqual({period: 2.0},
+                         disaggregated.metadata_per_period[TradeMetadataKey.AGENT_CLUSTERING_ERROR])
@@ -0,0 +1,119 @@
+from unittest import TestCase, skipUnless
+
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+
+from tests.utility_test_objects import get_agent_ems_test_inputs, get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import AgentEMS, CEMS_function
+from tradingplatformpoc.trading_platform_utils import InProcessHighsSolver
+
+SOLVER = pyo.SolverFactory('glpk')
+
+
+@skipUnless(SOLVER.available(exception_flag=False), 'GLPK not available')
+class TestCEMSFunction(TestCase):
+
+    def test_model_reused_for_next_horizon(self):
+        """Test that a stored model is reused when only the horizon data changes, and gives the same result as a
+        freshly built one."""
+        model_store = {}
+        first_model, _ = CEMS_function.solve_model(SOLVER, model_store=model_store, **get_cems_test_inputs(seed=1))
+        second_inputs = get_cems_test_inputs(seed=2)
+        second_model, results = CEMS_function.solve_model(SOLVER, model_store=model_store, **second_inputs)
+        self.assertIs(first_model, second_model)
+        self.assertEqual(1, len(model_store))
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+
+        fresh_model, _ = CEMS_function.solve_model(SOLVER, **second_inputs)
+        self.assertAlmostEqual(pyo.value(fresh_model.obj), pyo.value(second_model.obj), places=4)
+
+    def test_new_model_for_new_structure(self):
+        """Test that a new model is built when switching between summer mode and winter mode."""
+        model_store = {}
+        CEMS_function.solve_model(SOLVER, model_store=model_store, **get_cems_test_inputs(summer_mode=False, month=4))
+        CEMS_function.solve_model(SOLVER, model_store=model_store, **get_cems_test_inputs(summer_mode=True, month=5))
+        self.assertEqual(2, len(model_store))
+
+    def test_no_constraints_for_absent_assets(self):
+        """Test that asset constraints are only added for agents having the asset, and that the asset's variables are
+        fixed to 0 for the other agents."""
+        model, results = CEMS_function.solve_model(SOLVER, **get_cems_test_inputs(summer_mode=True, month=5))
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        self.assertEqual({0}, {i for i, _ in model.con_BES_Ebalance})
+        self.assertEqual({0, 1}, {i for i, _ in model.con_HP_Hproduct})
+        self.assertEqual({0, 1}, {i for i, _ in model.con_BITES_Eshallow_balance})
+        self.assertTrue(all(model.Pcha[1, t].fixed and model.SOCTES[1, t].fixed for t in model.T))
+        self.assertTrue(all(model.Hhp[2, t].fixed and model.Flow[2, t].fixed for t in model.T))
+        self.assertFalse(model.Pcha[0, 0].fixed)
+
+
+@skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+class TestWarmStart(TestCase):
+    # HiGHS stops at a relative MIP gap of 1e-4 by default, so warm and cold solves may differ slightly
+    REL_TOLERANCE = 1e-4
+
+    def test_lec_warm_start(self):
+        """Test that warm-starting from the previous horizon's solution gives the same result as solving cold."""
+        solver = InProcessHighsSolver()
+        model_store = {}
+        CEMS_function.solve_model(solver, model_store=model_store, warm_start=True, **get_cems_test_inputs(seed=1))
+        warm_model, results = CEMS_function.solve_model(solver, model_store=model_store, warm_start=True,
+                                                        **get_cems_test_inputs(seed=2))
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        cold_model, _ = CEMS_function.solve_model(solver, **get_cems_test_inputs(seed=2))
+        self.assertAlmostEqual(pyo.value(cold_model.obj), pyo.value(warm_model.obj),
+                               delta=self.REL_TOLERANCE * abs(pyo.value(cold_model.obj)))
+
+    def test_agent_warm_start(self):
+        """Test that the previous model's variable values are used as a start, and give the same result."""
+        solver = InProcessHighsSolver()
+        previous_model, _ = AgentEMS.solve_model(solver, **get_agent_ems_test_inputs(0, seed=1))
+        warm_model, results = AgentEMS.solve_model(solver, warm_start_model=previous_model,
+                                                   **get_agent_ems_test_inputs(0, seed=2))
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        cold_model, _ = AgentEMS.solve_model(solver, **get_agent_ems_test_inputs(0, seed=2))
+        self.assertAlmostEqual(pyo.value(cold_model.obj), pyo.value(warm_model.obj),
+                               delta=self.REL_TOLERANCE * abs(pyo.value(cold_model.obj)))
+
+    def test_agent_warm_start_keeps_fixed_variables(self):
+        """Test that variables fixed for assets the agent doesn't have aren't given the previous model's values."""
+        solver = InProcessHighsSolver()
+        # Agent 0 has a battery, agent 1 doesn't, so its battery variables are fixed
+        previous_model, _ = AgentEMS.solve_model(solver, **get_agent_ems_test_inputs(0, seed=1))
+        self.assertTrue(any(pyo.value(previous_model.Pcha[t]) > 0 for t in previous_model.T))
+        inputs = get_agent_ems_test_inputs(1, seed=2)
+        warm_model, results = AgentEMS.solve_model(solver, warm_start_model=previous_model, **inputs)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        for t in warm_model.T:
+            self.assertTrue(warm_model.Pcha[t].fixed)
+            self.assertEqual(0, pyo.value(warm_model.Pcha[t]))
+            self.assertEqual(inputs['SOCBES0'], pyo.value(warm_model.SOCBES[t]))
+        cold_model, _ = AgentEMS.solve_model(solver, **inputs)
+        self.assertAlmostEqual(pyo.value(cold_model.obj), pyo.value(warm_model.obj),
+                               delta=self.REL_TOLERANCE * abs(pyo.value(cold_model.obj)))
+
+    def test_copy_variable_values(self):
+        solver = InProcessHighsSolver()
+        source, _ = AgentEMS.solve_model(solver, **get_agent_ems_test_inputs(0, seed=1))
+        target, _ = AgentEMS.solve_model(solver, **get_agent_ems_test_inputs(0, seed=2))
+        AgentEMS.copy_variable_values(source, target)
+        self.assertEqual(pyo.value(source.Pbuy_market[5]), pyo.value(target.Pbuy_market[5]))
+        self.assertEqual(pyo.value(source.avg_elec_peak_load), pyo.value(target.avg_elec_peak_load))
+
+
+@skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+class TestBatchedAgents(TestCase):
+
+    def test_same_result_as_separate_solves(self):
+        """Test that solving agents together, as one block-diagonal problem, gives each agent the same result as
+        solving it on its own."""
+        solver = InProcessHighsSolver()
+        agent_inputs = [get_agent_ems_test_inputs(agent, summer_mode=True, month=7) for agent in range(3)]
+        models, results = AgentEMS.solve_models_batched(solver, agent_inputs)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        self.assertEqual(3, len(models))
+        for batched_model, inputs in zip(models, agent_inputs):
+            separate_model, _ = AgentEMS.solve_model(solver, **inputs)
+            self.assertAlmostEqual(pyo.value(separate_model.obj), pyo.value(batched_model.obj.expr),
+                                   delta=TestWarmStart.REL_TOLERANCE * abs(pyo.value(separate_model.obj)))
@@ -0,0 +1,210 @@
+import datetime
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+import pandas as pd
+
+import pyomo.environ as pyo
+from pyomo.opt import SolverResults, TerminationCondition
+
+from tests import utility_test_objects
+from tests.utility_test_objects import get_agent_ems_test_inputs, get_cems_test_inputs
+
+from tradingplatformpoc.price.electricity_price import ElectricityPrice
+from tradingplatformpoc.price.heating_price import HeatingPrice
+from tradingplatformpoc.simulation_runner.chalmers import CEMS_function
+from tradingplatformpoc.simulation_runner.chalmers.matrix_model import MatrixModel
+from tradingplatformpoc.simulation_runner.chalmers_interface import ACCEPT_INCUMBENT, FAIL_JOB, InfeasibilityError, \
+    ModelValues, SOLVE_RELAXATION, SolverSettings, solve_agent, solve_and_extract_for_agent, solve_matrix_model, \
+    solve_with_time_limit_fallback, time_limit_reached
+from tradingplatformpoc.sql.solve_info.crud import solve_infos_to_db_dict
+from tradingplatformpoc.trading_platform_utils import InProcessHighsSolver, hourly_datetime_array_between
+
+START_DATETIME = datetime.datetime(2019, 2, 1, tzinfo=datetime.timezone.utc)
+DATETIME_ARRAY = hourly_datetime_array_between(START_DATETIME,
+                                               datetime.datetime(2019, 2, 3, tzinfo=datetime.timezone.utc))
+
+area_info = utility_test_objects.AREA_INFO
+
+
+def get_pricing():
+    elec_pricing = ElectricityPrice(
+        elec_wholesale_offset=area_info['ExternalElectricityWholesalePriceOffset'],
+        elec_tax=area_info["ElectricityTax"],
+        elec_transmission_fee=area_info["ElectricityTransmissionFee"],
+        elec_effect_fee=area_info["ElectricityEffectFee"],
+        elec_tax_internal=area_info["ElectricityTaxInternal"],
+        elec_transmission_fee_internal=area_info["ElectricityTransmissionFeeInternal"],
+        elec_effect_fee_internal=area_info["ElectricityEffectFeeInternal"],
+        nordpool_data=pd.Series(np.ones(len(DATETIME_ARRAY)) * 0.6, index=DATETIME_ARRAY))
+    heat_pricing = HeatingPrice(heating_wholesale_price_fraction=area_info['ExternalHeatingWholesalePriceFraction'])
+    return elec_pricing, heat_pricing
+
+
+def get_results(termination_condition: TerminationCondition, wallclock_time: float) -> SolverResults:
+    results = SolverResults()
+    results.solver.termination_condition = termination_condition
+    results.solver.wallclock_time = wallclock_time
+    return results
+
+
+class TestChalmersInterface(TestCase):
+
+    def test_infeasibility_error_can_be_pickled(self):
+        """The error needs to be passed from worker processes to the simulation's process."""
+        error = InfeasibilityError('Infeasible optimization problem', ['agent1'], [], START_DATETIME,
+                                   START_DATETIME + datetime.timedelta(hours=24), {'agent_Pbalance'})
+        unpickled = pickle.loads(pickle.dumps(error))
+        self.assertEqual(error.message, unpickled.message)
+        self.assertEqual(error.agent_names, unpickled.agent_names)
+        self.assertEqual(error.constraints, unpickled.constraints)
+
+    @skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+    def test_solve_in_worker_process(self):
+        """
+        Test that solving agents in worker processes, and adding the recorded history to the original pricing objects,
+        gives the same trades and history as solving in this process.
+        """
+        serial_elec_pricing, serial_heat_pricing = get_pricing()
+        serial_trades = []
+        for agent in range(2):
+            trades, _metadata, _solve_info, _elec, _heat = solve_and_extract_for_agent(
+                'HiGHS', get_agent_ems_test_inputs(agent), START_DATETIME, 'ElecGrid', 'HeatGrid',
+                serial_elec_pricing, serial_heat_pricing, 'agent{}'.format(agent))
+            serial_trades.extend(trades)
+
+        parallel_elec_pricing, parallel_heat_pricing = get_pricing()
+        parallel_trades = []
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(solve_and_extract_for_agent, 'HiGHS', get_agent_ems_test_inputs(agent),
+                                       START_DATETIME, 'ElecGrid', 'HeatGrid',
+                                       parallel_elec_pricing.copy_without_history(),
+                                       parallel_heat_pricing.copy_without_history(), 'agent{}'.format(agent))
+                       for agent in range(2)]
+            for future in futures:
+                trades, _metadata, _solve_info, agent_elec_pricing, agent_heat_pricing = future.result()
+                parallel_elec_pricing.add_history_from(agent_elec_pricing)
+                parallel_heat_pricing.add_history_from(agent_heat_pricing)
+                parallel_trades.extend(trades)
+
+        self.assertEqual(len(serial_trades), len(parallel_trades))
+        for serial_trade, parallel_trade in zip(serial_trades, parallel_trades):
+            self.assertEqual(serial_trade.source, parallel_trade.source)
+            self.assertEqual(serial_trade.period, parallel_trade.period)
+            self.assertAlmostEqual(serial_trade.quantity_pre_loss, parallel_trade.quantity_pre_loss, places=4)
+        pd.testing.assert_series_equal(serial_elec_pricing.get_sells(), parallel_elec_pricing.get_sells(), atol=1e-4)
+        for agent_id in ['agent0', 'agent1']:
+            pd.testing.assert_series_equal(serial_heat_pricing.get_sells(agent_id),
+                                           parallel_heat_pricing.get_sells(agent_id), atol=1e-4)
+
+    @skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+    def test_solve_info(self):
+        """Test that the telemetry of a solve describes the model, and that it can be turned into database rows."""
+        model, solve_info = solve_agent(InProcessHighsSolver(), get_agent_ems_test_inputs(0), START_DATETIME, 'agent0')
+        self.assertEqual('optimal', solve_info.status)
+        self.assertAlmostEqual(pyo.value(model.obj), solve_info.objective)
+        self.assertEqual(model.nconstraints(), solve_info.n_constraints)
+        self.assertEqual(sum(1 for var in model.component_data_objects(pyo.Var) if var.is_binary() and not var.fixed),
+                         solve_info.n_binaries)
+        self.assertLess(solve_info.n_binaries, solve_info.n_variables)
+        self.assertGreater(solve_info.solve_seconds, 0)
+        self.assertGreaterEqual(solve_info.build_seconds, 0)
+        rows = solve_infos_to_db_dict([solve_info], 'job1')
+        self.assertEqual(START_DATETIME, rows[0]['horizon_start'])
+        self.assertEqual('agent0', rows[0]['model_name'])
+
+    @skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+    def test_time_limit_reached(self):
+        self.assertTrue(time_limit_reached(get_results(TerminationCondition.maxTimeLimit, 10), 10))
+        self.assertTrue(time_limit_reached(get_results(TerminationCondition.feasible, 10.2), 10))
+        # GLPK stopping at the MIP gap
+        self.assertFalse(time_limit_reached(get_results(TerminationCondition.feasible, 3), 10))
+        self.assertFalse(time_limit_reached(get_results(TerminationCondition.optimal, 3), 10))
+        # No time limit
+        self.assertFalse(time_limit_reached(get_results(TerminationCondition.feasible, 3), 0))
+
+    def test_time_limit_fallback(self):
+        """Test each fallback, with a solve function recording whether the binaries were relaxed."""
+        relaxed_args = []
+
+        def solve(results_if_exact: SolverResults):
+            def solve_function(relax_binaries: bool):
+                relaxed_args.append(relax_binaries)
+                return None, results_if_exact if not relax_binaries else get_results(TerminationCondition.optimal, 2)
+            return solve_function
+
+        incumbent = get_results(TerminationCondition.feasible, 10)
+        no_solution = get_results(TerminationCondition.maxTimeLimit, 10)
+        _model, results, fallback = solve_with_time_limit_fallback(
+            solve(get_results(TerminationCondition.optimal, 1)), False, SolverSettings(0.0, 10, FAIL_JOB), 'LEC',
+            START_DATETIME, 24, [])
+        self.assertIsNone(fallback)
+
+        _model, results, fallback = solve_with_time_limit_fallback(
+            solve(incumbent), False, SolverSettings(0.0, 10, ACCEPT_INCUMBENT), 'LEC', START_DATETIME, 24, [])
+        self.assertEqual(ACCEPT_INCUMBENT, fallback)
+        self.assertIs(incumbent, results)
+        with self.assertRaises(InfeasibilityError):
+            solve_with_time_limit_fallback(solve(no_solution), False, SolverSettings(0.0, 10, ACCEPT_INCUMBENT),
+                                           'LEC', START_DATETIME, 24, [])
+
+        relaxed_args.clear()
+        _model, results, fallback = solve_with_time_limit_fallback(
+            solve(no_solution), False, SolverSettings(0.0, 10, SOLVE_RELAXATION), 'LEC', START_DATETIME, 24, [])
+        self.assertEqual(SOLVE_RELAXATION, fallback)
+        self.assertEqual([False, True], relaxed_args)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        self.assertEqual(12, results.solver.wallclock_time)
+
+        with self.assertRaises(InfeasibilityError) as context:
+            solve_with_time_limit_fallback(solve(incumbent), False, SolverSettings(0.0, 10, FAIL_JOB), 'agent1',
+                                           START_DATETIME, 24, ['agent1'])
+        self.assertEqual(['agent1'], context.exception.agent_names)
+
+    def test_model_values(self):
+        """Test that values read in bulk are the same as those read one at a time."""
+        model, _ = CEMS_function.solve_model(InProcessHighsSolver(), **get_cems_test_inputs())
+        model_values = ModelValues(model)
+        hbuy_grid = model_values.array('Hbuy_grid')
+        self.assertEqual((len(model.I), len(model.T)), hbuy_grid.shape)
+        self.assertEqual(pyo.value(model.Hbuy_grid[1, 5]), hbuy_grid[1, 5])
+        self.assertEqual(pyo.value(model.Pbuy_market[3]), model_values.array('Pbuy_market')[3])
+        self.assertEqual(pyo.value(model.Heat_trans_loss), model_values.scalar('Heat_trans_loss'))
+        self.assertEqual((len(model.T),), model_values.array_or_zeros('NA').shape)
+
+    def test_matrix_model_values(self):
+        """Test that a solved matrix model is read as the corresponding Pyomo model is, also with 2-hour time steps."""
+        for time_step in [1, 2]:
+            inputs = get_cems_test_inputs(summer_mode=True, month=5, trading_horizon=24 // time_step)
+            model, _ = CEMS_function.solve_model(InProcessHighsSolver(), time_step=time_step, **inputs)
+            model_values = ModelValues(model)
+            matrix_model_values, solve_info = solve_matrix_model(
+                partial(CEMS_function.build_matrix_model, time_step=time_step, **inputs), 'LEC', START_DATETIME, 24,
+                [], SolverSettings())
+            self.assertEqual('optimal', solve_info.status)
+            self.assertAlmostEqual(pyo.value(model.obj), solve_info.objective, places=4)
+            self.assertEqual(model.nconstraints(), solve_info.n_constraints)
+            self.assertEqual(model_values.hours, matrix_model_values.hours)
+            for name in ['nordpool_price', 'elec_tax_fee', 'Hprice_energy', 'Heat_trans_loss', 'cold_trans_loss',
+                         'Emax_BES', 'kwh_per_deg', 'Energy_shallow_cap', 'Phpmax', 'PhpBmax', 'BITES_Eshallow0']:
+                np.testing.assert_allclose(model_values.array(name), matrix_model_values.array(name))
+            for name in ['Pbuy_market', 'Hbuy_grid', 'SOCBES', 'Loss_shallow', 'avg_elec_peak_load']:
+                self.assertEqual(model_values.array(name).shape, matrix_model_values.array(name).shape)
+            self.assertEqual(model_values.sum_of_param('Hbuy_market'), matrix_model_values.sum_of_param('Hbuy_market'))
+            self.assertFalse(matrix_model_values.has('NA'))
+
+    def test_matrix_model_infeasible(self):
+        def build():
+            model = MatrixModel('test')
+            x = model.add_variable('x')
+            model.add_constraints('con', [(1, x)], '<=', -1)
+            return model
+
+        with self.assertRaises(InfeasibilityError) as context:
+            solve_matrix_model(build, 'agent1', START_DATETIME, 24, ['agent1'], SolverSettings())
+        self.assertEqual(['agent1'], context.exception.agent_names)
@@ -0,0 +1,35 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+import numpy as np
+
+from tradingplatformpoc.price.heating_price import HeatingPrice
+from tradingplatformpoc.sql.checkpoint.crud import add_price_history_from_db_dict, checkpoint_to_db_dict
+
+START = datetime(2019, 2, 1, tzinfo=timezone.utc)
+PERIODS = [START + timedelta(hours=hour) for hour in range(48)]
+
+
+class TestCheckpoint(TestCase):
+
+    def test_price_history_round_trip(self):
+        """The pricing history in a checkpoint, stored as JSON, should restore the history that was recorded."""
+        pricing = HeatingPrice(heating_wholesale_price_fraction=0.5, effect_fee=0.1)
+        pricing.add_external_sells(PERIODS, list(np.arange(48.0)))
+        pricing.add_external_sells_for_agent(PERIODS[:24], [1.5] * 24, 'Agent 1')
+        pricing.add_price_estimates(PERIODS, [0.8] * 48)
+        pricing.add_price_estimates_for_agent(PERIODS[24:], [0.9] * 24, 'Agent 1')
+
+        checkpoint = checkpoint_to_db_dict('job', 2, PERIODS[24], {'Agent 1': np.float64(3.0)}, {'Agent 1': 4.0},
+                                           pricing.copy_with_history_between(PERIODS[24]), pricing)
+        checkpoint = json.loads(json.dumps(checkpoint, default=str))
+        self.assertEqual({'Agent 1': 3.0}, checkpoint['shallow_storage_end'])
+
+        restored = pricing.copy_without_history()
+        add_price_history_from_db_dict(restored, checkpoint['heating_price_history'])
+        self.assertTrue(pricing.all_external_sells.equals(restored.all_external_sells))
+        self.assertTrue(pricing.get_sells('Agent 1').equals(restored.get_sells('Agent 1')))
+        self.assertEqual(0.9, restored.get_retail_price_estimate(PERIODS[30], 'Agent 1'))
+        # Only the second day was in the copy passed as the electricity pricing
+        self.assertEqual(24, len(checkpoint['electricity_price_history']['all_external_sells']['periods']))
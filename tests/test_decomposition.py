@@ -0,0 +1,61 @@
+from unittest import TestCase, skipUnless
+
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+
+from tests.utility_test_objects import get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import CEMS_function
+from tradingplatformpoc.simulation_runner.chalmers.decomposition import DecompositionSettings, get_agent_inputs, \
+    get_gap, solve_decomposed
+
+SOLVER = pyo.SolverFactory('glpk')
+
+
+class TestDecompositionInputs(TestCase):
+
+    def test_get_agent_inputs(self):
+        inputs = get_cems_test_inputs(n_agents=3)
+        agent_inputs = get_agent_inputs(inputs, 1)
+        self.assertEqual(1, agent_inputs['n_agents'])
+        self.assertEqual(inputs['heatpump_max_power'][1:2], agent_inputs['heatpump_max_power'])
+        self.assertEqual((1, 24), agent_inputs['elec_consumption'].shape)
+        self.assertEqual(inputs['elec_consumption'][1, 5], agent_inputs['elec_consumption'][0, 5])
+        # Inputs of the LEC as a whole are kept
+        self.assertIs(inputs['nordpool_price'], agent_inputs['nordpool_price'])
+
+    def test_get_gap(self):
+        self.assertAlmostEqual(0.1, get_gap(90.0, 100.0))
+        self.assertEqual(0.0, get_gap(100.0, 100.0))
+        self.assertEqual(float('inf'), get_gap(90.0, float('inf')))
+
+
+@skipUnless(SOLVER.available(exception_flag=False), 'GLPK not available')
+class TestDecomposition(TestCase):
+
+    def test_same_as_full_problem(self):
+        """Test that the decomposed solution satisfies the local market balances, and is close to the optimal one."""
+        for summer_mode, month in [(False, 2), (True, 7)]:
+            inputs = get_cems_test_inputs(summer_mode=summer_mode, month=month)
+            exact_model, _ = CEMS_function.solve_model(SOLVER, **inputs)
+            model, results = solve_decomposed(SOLVER, inputs, DecompositionSettings(tolerance=0.001,
+                                                                                    max_iterations=30))
+            self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+            for t in model.T:
+                for constraint in [model.con_LEC_Pbalance, model.con_LEC_Hbalance, model.con_LEC_Cbalance]:
+                    self.assertAlmostEqual(0.0, pyo.value(constraint[t].body) - pyo.value(constraint[t].upper),
+                                           places=4)
+            exact_objective = pyo.value(exact_model.obj)
+            self.assertGreaterEqual(pyo.value(model.obj), exact_objective - 1e-6)
+            self.assertLessEqual(pyo.value(model.obj), exact_objective + 0.01 * abs(exact_objective))
+
+    def test_model_restored(self):
+        """Test that a stored model can be reused for exact solves afterwards."""
+        model_store = {}
+        model, _ = solve_decomposed(SOLVER, get_cems_test_inputs(seed=1), DecompositionSettings(),
+                                    model_store=model_store)
+        self.assertFalse(model.UCbuy_grid[0, 0].fixed)
+        inputs = get_cems_test_inputs(seed=2)
+        reused_model, _ = CEMS_function.solve_model(SOLVER, model_store=model_store, **inputs)
+        fresh_model, _ = CEMS_function.solve_model(SOLVER, **inputs)
+        self.assertAlmostEqual(pyo.value(fresh_model.obj), pyo.value(reused_model.obj), places=4)
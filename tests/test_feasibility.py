@@ -0,0 +1,75 @@
+import pickle
+from unittest import TestCase
+
+import numpy as np
+
+from tests.utility_test_objects import get_agent_ems_test_inputs, get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError
+from tradingplatformpoc.simulation_runner.chalmers.feasibility import check_agent_inputs, check_lec_inputs
+
+
+def lec_check_arguments(inputs: dict) -> dict:
+    """Arguments to check_lec_inputs, from inputs to CEMS_function.solve_model."""
+    return dict(summer_mode=inputs['summer_mode'], month=inputs['month'],
+                elec_consumption=inputs['elec_consumption'], pv_production=inputs['pv_production'],
+                hot_water_heatdem=inputs['hot_water_heatdem'], cold_consumption=inputs['cold_consumption'],
+                battery_discharge_rate=inputs['battery_discharge_rate'], heatpump_cop=inputs['heatpump_COP'],
+                heatpump_max_power=inputs['heatpump_max_power'], hp_cproduct_active=inputs['HP_Cproduct_active'],
+                borehole=inputs['borehole'], booster_heatpump_max_heat=inputs['booster_heatpump_max_heat'],
+                kwh_per_deg=[v * 4182 * 998 / 3600000 for v in inputs['thermalstorage_volume']],
+                thermalstorage_max_temp=inputs['thermalstorage_max_temp'],
+                max_elec_transfer_between_agents=500, max_elec_transfer_to_external=1000, chiller_cop=1.5,
+                chiller_max_power=100, trading_horizon=inputs['trading_horizon'])
+
+
+class TestFeasibility(TestCase):
+
+    def test_feasible_inputs_pass(self):
+        for summer_mode, month in [(False, 2), (True, 5), (True, 7)]:
+            check_lec_inputs(**lec_check_arguments(get_cems_test_inputs(summer_mode=summer_mode, month=month)))
+
+    def test_unfillable_hot_water_demand(self):
+        """Test that the agent and hour with a hot water demand that the booster can't cover are reported."""
+        inputs = get_cems_test_inputs(summer_mode=True, month=5)
+        inputs['hot_water_heatdem'][1, 5] = 1000
+        with self.assertRaises(CEMSError) as context:
+            check_lec_inputs(**lec_check_arguments(inputs))
+        self.assertEqual('Unfillable hot water demand for agent(s)', context.exception.message)
+        self.assertEqual([1], context.exception.agent_indices)
+        self.assertEqual([5], context.exception.hour_indices)
+
+    def test_unfillable_elec_demand(self):
+        """Test that an agent needing to buy more electricity than it can, after using its battery, is reported."""
+        inputs = get_cems_test_inputs()
+        inputs['elec_consumption'][0, 3] = 530
+        check_lec_inputs(**lec_check_arguments(inputs))  # The battery covers some of it
+        inputs['elec_consumption'][0, 3] = 600
+        with self.assertRaises(CEMSError) as context:
+            check_lec_inputs(**lec_check_arguments(inputs))
+        self.assertEqual([0], context.exception.agent_indices)
+        self.assertEqual([3], context.exception.hour_indices)
+
+    def test_unfillable_cooling_demand_for_agent(self):
+        """Test that an agent without heat pump cooling can't have a cooling demand in the summer."""
+        inputs = get_agent_ems_test_inputs(2, month=7)
+        cold_consumption = np.zeros(inputs['trading_horizon'])
+        cold_consumption[[2, 4]] = 1
+        with self.assertRaises(CEMSError) as context:
+            check_agent_inputs(month=7, agent=2, elec_consumption=inputs['elec_consumption'],
+                               pv_production=inputs['pv_production'], cold_consumption=cold_consumption,
+                               battery_discharge_rate=inputs['battery_discharge_rate'],
+                               heatpump_cop=inputs['heatpump_COP'], heatpump_max_power=inputs['heatpump_max_power'],
+                               hp_cproduct_active=inputs['HP_Cproduct_active'], borehole=inputs['borehole'],
+                               max_elec_transfer_to_external=1000, trading_horizon=inputs['trading_horizon'])
+        self.assertEqual('Unfillable cooling demand for agent', context.exception.message)
+        self.assertEqual([2], context.exception.agent_indices)
+        self.assertEqual([2, 4], context.exception.hour_indices)
+
+    def test_error_can_be_pickled(self):
+        """Agents' inputs may be checked in worker processes, from which the error needs to be passed back."""
+        error = CEMSError('Unfillable cooling demand for agent', [2], [2, 4])
+        unpickled = pickle.loads(pickle.dumps(error))
+        self.assertEqual(error.message, unpickled.message)
+        self.assertEqual(error.agent_indices, unpickled.agent_indices)
+        self.assertEqual(error.hour_indices, unpickled.hour_indices)
@@ -66,6 +66,53 @@ class TestElectricityPrice(TestCase):
         self.electricity_pricing.add_external_sell(DATETIME_ARRAY[0], 100)
         self.assertTrue(1.09 < self.electricity_pricing.get_exact_retail_price(DATETIME_ARRAY[0], True))
 
+    def test_add_history_from(self):
+        """Test that sells and price estimates recorded in a copy without history can be added to the original."""
+        self.electricity_pricing.add_external_sell(DATETIME_ARRAY[0], 100)
+        self.electricity_pricing.add_external_sell_for_agent(DATETIME_ARRAY[0], 100, 'agent1')
+        pricing_copy = self.electricity_pricing.copy_without_history()
+        self.assertEqual(0, len(pricing_copy.get_sells()))
+        self.assertIs(self.electricity_pricing.nordpool_data, pricing_copy.nordpool_data)
+
+        pricing_copy.add_external_sell(DATETIME_ARRAY[0], 50)
+        pricing_copy.add_external_sell_for_agent(DATETIME_ARRAY[0], 50, 'agent2')
+        pricing_copy.add_price_estimate_for_agent(DATETIME_ARRAY[0], 1.5, 'agent2')
+        self.electricity_pricing.add_history_from(pricing_copy)
+        self.assertEqual(150, self.electricity_pricing.get_sells()[DATETIME_ARRAY[0]])
+        self.assertEqual(100, self.electricity_pricing.get_sells('agent1')[DATETIME_ARRAY[0]])
+        self.assertEqual(50, self.electricity_pricing.get_sells('agent2')[DATETIME_ARRAY[0]])
+        self.assertEqual(1.5, self.electricity_pricing.get_retail_price_estimate(DATETIME_ARRAY[0], 'agent2'))
+
+    def test_copy_with_history_between(self):
+        """Test that only the sells and price estimates recorded between start and end are copied."""
+        self.electricity_pricing.add_external_sells(list(DATETIME_ARRAY[:3]), [10.0, 20.0, 30.0])
+        self.electricity_pricing.add_external_sells_for_agent(list(DATETIME_ARRAY[:3]), [1.0, 2.0, 3.0], 'agent1')
+        self.electricity_pricing.add_price_estimates(list(DATETIME_ARRAY[:3]), [1.0, 1.5, 2.0])
+        pricing_copy = self.electricity_pricing.copy_with_history_between(DATETIME_ARRAY[1], DATETIME_ARRAY[2])
+        self.assertEqual([20.0], pricing_copy.get_sells().tolist())
+        self.assertEqual([2.0], pricing_copy.get_sells('agent1').tolist())
+        self.assertEqual(1.5, pricing_copy.get_retail_price_estimate(DATETIME_ARRAY[1], None))
+        self.assertEqual(3, len(self.electricity_pricing.get_sells()))
+        open_ended_copy = self.electricity_pricing.copy_with_history_between(DATETIME_ARRAY[1])
+        self.assertEqual([20.0, 30.0], open_ended_copy.get_sells().tolist())
+
+    def test_add_external_sells_same_as_one_at_a_time(self):
+        """Test that adding several sells at once gives the same result as adding them one at a time."""
+        one_at_a_time = self.electricity_pricing.copy_without_history()
+        one_at_a_time.add_external_sell(DATETIME_ARRAY[0], 100.0)
+        for period, quantity in zip(DATETIME_ARRAY[:3], [10.0, 20.0, 30.0]):
+            one_at_a_time.add_external_sell(period, quantity)
+        self.electricity_pricing.add_external_sell(DATETIME_ARRAY[0], 100.0)
+        self.electricity_pricing.add_external_sells(list(DATETIME_ARRAY[:3]), [10.0, 20.0, 30.0])
+        pd.testing.assert_series_equal(one_at_a_time.get_sells(), self.electricity_pricing.get_sells())
+        self.assertEqual(110, self.electricity_pricing.get_sells()[DATETIME_ARRAY[0]])
+
+    def test_add_price_estimates_for_agent_does_not_overwrite(self):
+        self.electricity_pricing.add_price_estimates_for_agent(list(DATETIME_ARRAY[:2]), [1.0, 1.5], 'agent1')
+        self.assertEqual(1.5, self.electricity_pricing.get_retail_price_estimate(DATETIME_ARRAY[1], 'agent1'))
+        with self.assertRaises(ValueError):
+            self.electricity_pricing.add_price_estimates_for_agent(list(DATETIME_ARRAY[1:3]), [2.0, 2.5], 'agent1')
+
     def test_get_effect_fee_per_day(self):
         """Test that get_effect_fee_per_day works as expected"""
         effect_fee = 35
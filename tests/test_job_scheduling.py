@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+from tradingplatformpoc.simulation_runner.job_scheduling import BASE_MEMORY_MB, BITES_MODEL_MEMORY_FACTOR, \
+    JobFootprint, MEMORY_MB_PER_AGENT, MODEL_MEMORY_MB_PER_AGENT_HOUR, ResourceBudget, estimate_footprint
+
+
+def make_config(n_agents: int, fraction_used_for_bites: float = 0.0, **area_info) -> dict:
+    agents = [{'Type': 'BlockAgent', 'Name': 'Agent {}'.format(i), 'FractionUsedForBITES': fraction_used_for_bites}
+              for i in range(n_agents)]
+    agents.append({'Type': 'GridAgent', 'Name': 'ElectricityGridAgent'})
+    return {'AreaInfo': {'LocalMarketEnabled': False, 'TradingHorizon': 24, **area_info}, 'Agents': agents}
+
+
+class TestEstimateFootprint(TestCase):
+
+    def test_single_process(self):
+        footprint = estimate_footprint(make_config(10), 1, 1)
+        self.assertEqual(1, footprint.cpus)
+        self.assertAlmostEqual(BASE_MEMORY_MB + 10 * MEMORY_MB_PER_AGENT + 10 * 24 * MODEL_MEMORY_MB_PER_AGENT_HOUR,
+                               footprint.memory_mb)
+
+    def test_grows_with_horizon_and_bites(self):
+        footprint = estimate_footprint(make_config(10), 1, 1)
+        longer_horizon = estimate_footprint(make_config(10, TradingHorizon=48), 1, 1)
+        with_bites = estimate_footprint(make_config(10, fraction_used_for_bites=0.5), 1, 1)
+        model_memory_mb = 10 * 24 * MODEL_MEMORY_MB_PER_AGENT_HOUR
+        self.assertAlmostEqual(model_memory_mb, longer_horizon.memory_mb - footprint.memory_mb)
+        self.assertAlmostEqual(model_memory_mb * (BITES_MODEL_MEMORY_FACTOR - 1),
+                               with_bites.memory_mb - footprint.memory_mb)
+
+    def test_processes(self):
+        """Agents' problems are only solved in several processes when they aren't part of a single LEC problem."""
+        self.assertEqual(4, estimate_footprint(make_config(10), 4, 1).cpus)
+        self.assertEqual(1, estimate_footprint(make_config(10, LocalMarketEnabled=True), 4, 1).cpus)
+        self.assertEqual(4, estimate_footprint(make_config(10, LocalMarketEnabled=True, DecomposeLEC=True), 4, 1).cpus)
+        self.assertEqual(6, estimate_footprint(make_config(10, LocalMarketEnabled=True), 4, 6).cpus)
+
+    def test_clusters_reduce_model_size(self):
+        clustered = estimate_footprint(make_config(100, LocalMarketEnabled=True, AgentClusters=10), 1, 1)
+        self.assertAlmostEqual(BASE_MEMORY_MB + 100 * MEMORY_MB_PER_AGENT + 10 * 24 * MODEL_MEMORY_MB_PER_AGENT_HOUR,
+                               clustered.memory_mb)
+
+
+class TestResourceBudget(TestCase):
+
+    def test_jobs_fit_until_budget_is_used(self):
+        budget = ResourceBudget(8, 10000)
+        budget.reserve(JobFootprint(4, 3000))
+        self.assertTrue(budget.fits(JobFootprint(4, 7000)))
+        self.assertFalse(budget.fits(JobFootprint(5, 1000)))
+        self.assertFalse(budget.fits(JobFootprint(1, 8000)))
+        budget.release(JobFootprint(4, 3000))
+        self.assertTrue(budget.fits(JobFootprint(8, 10000)))
+
+    def test_too_large_job_runs_alone(self):
+        budget = ResourceBudget(2, 1000)
+        too_large = JobFootprint(4, 5000)
+        self.assertTrue(budget.fits(too_large))
+        budget.reserve(too_large)
+        self.assertFalse(budget.fits(JobFootprint(1, 10)))
@@ -0,0 +1,122 @@
+import threading
+import time
+from contextlib import contextmanager
+from unittest import TestCase, mock
+
+from tests.test_job_scheduling import make_config
+
+from tradingplatformpoc.settings import settings
+from tradingplatformpoc.simulation_runner.job_scheduling import JobFootprint, ResourceBudget
+from tradingplatformpoc.simulation_runner.job_worker import BudgetCheck, JobThread
+from tradingplatformpoc.sql.job.crud import claim_next_job
+from tradingplatformpoc.sql.job.models import Job
+
+WORKER = 'tradingplatformpoc.simulation_runner.job_worker'
+
+
+class FakeSimulator:
+    """Runs until the thread running it is stopped, as TradingSimulator does."""
+    stopped_with: list = []
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def __call__(self):
+        current_thread = threading.current_thread()
+        while not current_thread.is_stopped():
+            time.sleep(0.01)
+        FakeSimulator.stopped_with.append(current_thread.keep_job_data)
+
+
+class TestJobThread(TestCase):
+
+    def setUp(self):
+        FakeSimulator.stopped_with = []
+
+    def run_job_losing_lease(self, job_exists: bool) -> mock.Mock:
+        with (mock.patch.object(settings, 'JOB_HEARTBEAT_SECONDS', 0.01),
+              mock.patch(WORKER + '.TradingSimulator', FakeSimulator),
+              mock.patch(WORKER + '.renew_lease', return_value=False),
+              mock.patch(WORKER + '.job_exists', return_value=job_exists),
+              mock.patch(WORKER + '.release_lease') as release_lease):
+            then = mock.Mock()
+            job_thread = JobThread('job', 'worker', then)
+            job_thread.start()
+            job_thread.join(5)
+            self.assertFalse(job_thread.is_alive())
+            then.assert_called_once()
+            return release_lease
+
+    def test_job_taken_over_is_stopped_keeping_data(self):
+        release_lease = self.run_job_losing_lease(job_exists=True)
+        self.assertEqual([True], FakeSimulator.stopped_with)
+        # The lease is now someone else's
+        release_lease.assert_not_called()
+
+    def test_deleted_job_is_stopped(self):
+        self.run_job_losing_lease(job_exists=False)
+        self.assertEqual([False], FakeSimulator.stopped_with)
+
+    def test_lease_is_released_when_finished(self):
+        with (mock.patch.object(settings, 'JOB_HEARTBEAT_SECONDS', 0.01),
+              mock.patch(WORKER + '.TradingSimulator') as simulator,
+              mock.patch(WORKER + '.renew_lease', return_value=True),
+              mock.patch(WORKER + '.release_lease') as release_lease):
+            job_thread = JobThread('job', 'worker')
+            job_thread.start()
+            job_thread.join(5)
+            simulator.assert_called_once_with('job')
+            release_lease.assert_called_once_with('job', 'worker')
+
+
+class TestBudgetCheck(TestCase):
+
+    def test_footprint_kept(self):
+        """Test that a job is accepted if it fits in the budget, with the footprint that was checked kept."""
+        budget = ResourceBudget(cpus=4, memory_mb=2000)
+        budget.reserve(JobFootprint(cpus=3, memory_mb=1000))
+        budget_check = BudgetCheck(budget)
+        with (mock.patch.object(settings, 'OPTIMIZATION_WORKERS', 1),
+              mock.patch.object(settings, 'MONTH_WORKERS', 1),
+              mock.patch(WORKER + '.read_config', return_value=make_config(10))):
+            self.assertTrue(budget_check('config'))
+            self.assertEqual(1, budget_check.footprint.cpus)
+            with mock.patch.object(settings, 'OPTIMIZATION_WORKERS', 2):
+                self.assertFalse(budget_check('config'))
+                self.assertEqual(2, budget_check.footprint.cpus)
+
+
+class TestClaimNextJob(TestCase):
+
+    def claim(self, jobs: list, max_attempts: int = 3):
+        """Claims a job, with the queue query returning the given jobs, one per query, and then None."""
+        db = mock.Mock()
+        db.execute.return_value.scalars.return_value.first.side_effect = jobs + [None]
+
+        @contextmanager
+        def session_generator():
+            yield db
+
+        return claim_next_job('worker', 60, max_attempts, session_generator=session_generator)
+
+    def test_attempts_are_counted(self):
+        job = Job(id='job', config_id='config', attempts=1)
+        self.assertEqual('job', self.claim([job]))
+        self.assertEqual(2, job.attempts)
+        self.assertEqual('worker', job.worker_id)
+        self.assertIsNone(job.fail_info)
+
+    def test_job_taken_too_many_times_fails(self):
+        """Test that a job that keeps making its worker crash is failed, and the next job in the queue is taken."""
+        crashing_job = Job(id='crashing', config_id='config', attempts=3, worker_id='crashed worker')
+        next_job = Job(id='next', config_id='config')
+        self.assertEqual('next', self.claim([crashing_job, next_job]))
+        self.assertEqual(3, crashing_job.attempts)
+        self.assertIn('3 times', crashing_job.fail_info['message'])
+        self.assertIsNone(crashing_job.worker_id)
+        self.assertEqual(1, next_job.attempts)
+
+    def test_no_job_left(self):
+        crashing_job = Job(id='crashing', config_id='config', attempts=3)
+        self.assertIsNone(self.claim([crashing_job]))
+        self.assertIsNotNone(crashing_job.fail_info)
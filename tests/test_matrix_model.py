@@ -0,0 +1,109 @@
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+
+from tests.utility_test_objects import get_agent_ems_test_inputs, get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import AgentEMS, CEMS_function
+from tradingplatformpoc.simulation_runner.chalmers.matrix_model import INFEASIBLE, MatrixModel
+from tradingplatformpoc.trading_platform_utils import InProcessHighsSolver
+
+SOLVER = pyo.SolverFactory('glpk')
+if not SOLVER.available(exception_flag=False):
+    SOLVER = InProcessHighsSolver()
+    # HiGHS stops at a relative MIP gap of 1e-4 by default, the objectives are compared at optimality
+    SOLVER.highs_options['mip_rel_gap'] = 0
+
+
+class TestMatrixModel(TestCase):
+
+    def test_constraint_matrix(self):
+        """Test that constraint families are broadcast to one row per element, and that the bounds follow the sense."""
+        model = MatrixModel('test')
+        x = model.add_variable('x', (2, 3))
+        y = model.add_variable('y', 3, ub=5)
+        model.add_constraints('con', [(np.array([[1], [2]]), x), (-1, y)], '<=', 4)
+        self.assertEqual((6, 9), model.constraint_matrix().shape)
+        self.assertEqual(12, model.constraint_matrix().nnz)
+        self.assertEqual(2, model.constraint_matrix()[4, x[1, 1]])
+        self.assertEqual(-1, model.constraint_matrix()[4, y[1]])
+        row_lb, row_ub = model.row_bounds()
+        self.assertTrue(np.all(row_lb == -np.inf))
+        self.assertTrue(np.all(row_ub == 4))
+
+    def test_solve(self):
+        """Test a small MILP: maximize x + 2y, with x integer, subject to x + y <= 3.5 and y <= 2.2."""
+        model = MatrixModel('test')
+        x = model.add_variable('x', integer=True)
+        y = model.add_variable('y')
+        model.add_constraints('con_sum', [(1, x), (1, y)], '<=', 3.5)
+        model.add_constraints('con_y', [(1, y)], '<=', 2.2)
+        model.add_to_objective(-1, x)
+        model.add_to_objective(-2, y)
+        solution = model.solve()
+        self.assertTrue(solution.is_optimal())
+        self.assertAlmostEqual(-5.4, solution.objective)
+        self.assertAlmostEqual(1, solution.values['x'])
+        self.assertAlmostEqual(2.2, solution.values['y'])
+
+    def test_fix_variables(self):
+        """Test that fixed variables get both bounds set to the fixed value, broadcast against the columns."""
+        model = MatrixModel('test')
+        x = model.add_variable('x', (2, 3), ub=5)
+        model.fix_variables(x[0])
+        model.fix_variables(x[1, :2], np.array([1.5, 2.5]))
+        lower_bounds, upper_bounds = model.variable_bounds()
+        np.testing.assert_array_equal([0, 0, 0, 1.5, 2.5, 0], lower_bounds)
+        np.testing.assert_array_equal([0, 0, 0, 1.5, 2.5, 5], upper_bounds)
+
+    def test_infeasible(self):
+        model = MatrixModel('test')
+        x = model.add_variable('x', 2)
+        model.add_constraints('con', [(1, x)], '>=', np.array([1, 2]))
+        model.add_constraints('con', [(1, x)], '<=', 1)
+        self.assertEqual(4, len(model.constraints['con']))
+        self.assertEqual(INFEASIBLE, model.solve().status)
+
+
+@skipUnless(SOLVER.available(exception_flag=False), 'Neither GLPK nor highspy available')
+class TestMatrixModelEquivalence(TestCase):
+    """The Pyomo models are the reference implementation, the matrix models should give the same optimal objective."""
+
+    def test_lec_model(self):
+        for summer_mode, month in [(False, 2), (True, 5), (True, 7)]:
+            inputs = get_cems_test_inputs(summer_mode=summer_mode, month=month)
+            model, results = CEMS_function.solve_model(SOLVER, **inputs)
+            self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+            matrix_model = CEMS_function.build_matrix_model(**inputs)
+            solution = matrix_model.solve(mip_rel_gap=0)
+            self.assertTrue(solution.is_optimal())
+            self.assertAlmostEqual(pyo.value(model.obj), solution.objective, places=4)
+            self.assertEqual(model.nconstraints(), matrix_model.n_rows)
+            self.assertEqual(model.nvariables(), matrix_model.n_columns)
+
+    def test_agent_model(self):
+        for month in [2, 7]:
+            for agent in range(3):
+                inputs = get_agent_ems_test_inputs(agent, month=month)
+                model, results = AgentEMS.solve_model(SOLVER, **inputs)
+                self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+                matrix_model = AgentEMS.build_matrix_model(**inputs)
+                solution = matrix_model.solve(mip_rel_gap=0)
+                self.assertTrue(solution.is_optimal())
+                self.assertAlmostEqual(pyo.value(model.obj), solution.objective, places=4)
+
+    def test_longer_time_steps(self):
+        """With 2-hour time steps, storage balances, losses and the objective are scaled in both models."""
+        inputs = get_cems_test_inputs(summer_mode=False, month=2, trading_horizon=12)
+        model, results = CEMS_function.solve_model(SOLVER, time_step=2, **inputs)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        solution = CEMS_function.build_matrix_model(time_step=2, **inputs).solve(mip_rel_gap=0)
+        self.assertAlmostEqual(pyo.value(model.obj), solution.objective, places=4)
+        agent_inputs = get_agent_ems_test_inputs(0, month=2, trading_horizon=12)
+        model, results = AgentEMS.solve_model(SOLVER, time_step=2, **agent_inputs)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        solution = AgentEMS.build_matrix_model(time_step=2, **agent_inputs).solve(mip_rel_gap=0)
+        self.assertAlmostEqual(pyo.value(model.obj), solution.objective, places=4)
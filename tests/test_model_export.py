@@ -0,0 +1,82 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase, skipUnless
+
+import pyomo.environ as pyo
+
+from tests.utility_test_objects import get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import CEMS_function
+from tradingplatformpoc.simulation_runner.model_export import export_model, get_base_name, read_corpus
+from tradingplatformpoc.simulation_runner.solver_benchmark import BenchmarkResult, GlpkBackend, SolverBackend, \
+    parse_cbc_solution, parse_glpk_output, run_benchmark, shifted_geometric_mean, summarize
+
+SOLVER = pyo.SolverFactory('glpk')
+HORIZON_START = datetime.datetime(2019, 2, 1, tzinfo=datetime.timezone.utc)
+
+
+class TestSolverBenchmark(TestCase):
+
+    def test_parse_glpk_output(self):
+        output = 'Problem:    unknown\nRows:       10\nStatus:     INTEGER OPTIMAL\n' \
+                 'Objective:  obj = 1234.5 (MINimum)\n'
+        self.assertEqual(('integer optimal', 1234.5), parse_glpk_output(output))
+        output = 'Status:     INTEGER EMPTY\nObjective:  obj = 0 (MINimum)\n'
+        self.assertEqual(('integer empty', None), parse_glpk_output(output))
+
+    def test_parse_cbc_solution(self):
+        self.assertEqual(('optimal', 12.5), parse_cbc_solution('Optimal - objective value 12.50000000\n'))
+        self.assertEqual(('stopped on time', -3.0), parse_cbc_solution('Stopped on time - objective value -3\n'))
+        self.assertEqual(('infeasible', None), parse_cbc_solution('Infeasible - objective value 0.00000000\n'))
+
+    def test_backend_must_implement_solve(self):
+        class IncompleteBackend(SolverBackend):
+            name = 'Incomplete'
+
+            def available(self) -> bool:
+                return True
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_summarize(self):
+        results = [BenchmarkResult('a.mps', 'LEC', 'GLPK', 0.0, 'optimal', 100.0, 100.0, 1.0),
+                   BenchmarkResult('b.mps', 'LEC', 'GLPK', 0.0, 'optimal', 110.0, 100.0, 3.0),
+                   BenchmarkResult('a.mps', 'LEC', 'HiGHS', 0.0, 'time limit reached', None, 100.0, 5.0)]
+        glpk, highs = summarize(results)
+        self.assertEqual(('GLPK', 2, 2, 1), (glpk['solver'], glpk['models'], glpk['solved'],
+                                             glpk['objective_mismatches']))
+        self.assertAlmostEqual(4.0, glpk['total_seconds'])
+        self.assertAlmostEqual(shifted_geometric_mean([1.0, 3.0]), glpk['shifted_geometric_mean_seconds'])
+        self.assertEqual(0, highs['solved'])
+
+    def test_shifted_geometric_mean(self):
+        self.assertAlmostEqual(2.0, shifted_geometric_mean([2.0, 2.0]))
+        # (1 + 1) * (7 + 1) = 4 ** 2
+        self.assertAlmostEqual(3.0, shifted_geometric_mean([1.0, 7.0]))
+
+    def test_get_base_name(self):
+        self.assertEqual('Agent_1_a_b_2019020100', get_base_name('Agent 1 a/b', HORIZON_START))
+
+
+@skipUnless(SOLVER.available(exception_flag=False), 'GLPK not available')
+class TestModelExport(TestCase):
+
+    def test_export_and_benchmark(self):
+        """An exported model should give the same objective when solved from file."""
+        model, results = CEMS_function.solve_model(SOLVER, **get_cems_test_inputs())
+        objective = pyo.value(model.obj)
+        with tempfile.TemporaryDirectory() as directory:
+            for file_format in ['mps', 'lp']:
+                export_model(model, directory, 'LEC', 'LEC', HORIZON_START, str(results.solver.termination_condition),
+                             objective, results.solver.wallclock_time, file_format)
+            # The same model again is only kept once
+            export_model(model, directory, 'LEC', 'LEC', HORIZON_START, 'optimal', objective, None)
+            corpus = read_corpus(directory)
+            self.assertEqual(2, len(corpus))
+            self.assertEqual(4, len(os.listdir(directory)))
+            self.assertEqual(HORIZON_START.isoformat(), corpus[0]['horizon_start'])
+            for result in run_benchmark(corpus, [GlpkBackend()], [0.0], 0.0):
+                self.assertEqual('integer optimal', result.status)
+                self.assertAlmostEqual(0.0, result.objective_difference, places=5)
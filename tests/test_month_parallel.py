@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from tests import utility_test_objects
+
+from tradingplatformpoc.price.electricity_price import ElectricityPrice
+from tradingplatformpoc.price.heating_price import HeatingPrice
+from tradingplatformpoc.simulation_runner.month_parallel import get_boundary_state, get_horizon_state, \
+    split_into_months, states_match
+from tradingplatformpoc.trading_platform_utils import hourly_datetime_array_between
+
+area_info = utility_test_objects.AREA_INFO
+
+
+def get_pricing():
+    elec_pricing = ElectricityPrice(
+        elec_wholesale_offset=area_info['ExternalElectricityWholesalePriceOffset'],
+        elec_tax=area_info["ElectricityTax"],
+        elec_transmission_fee=area_info["ElectricityTransmissionFee"],
+        elec_effect_fee=area_info["ElectricityEffectFee"],
+        elec_tax_internal=area_info["ElectricityTaxInternal"],
+        elec_transmission_fee_internal=area_info["ElectricityTransmissionFeeInternal"],
+        elec_effect_fee_internal=area_info["ElectricityEffectFeeInternal"],
+        nordpool_data=None)
+    heat_pricing = HeatingPrice(heating_wholesale_price_fraction=area_info['ExternalHeatingWholesalePriceFraction'])
+    return elec_pricing, heat_pricing
+
+
+class TestMonthParallel(TestCase):
+
+    def test_split_into_months(self):
+        horizon_starts = list(hourly_datetime_array_between(datetime(2019, 1, 30, tzinfo=timezone.utc),
+                                                            datetime(2019, 3, 2, tzinfo=timezone.utc)))[::24]
+        months = split_into_months(horizon_starts)
+        self.assertEqual([2, 28, 2], [len(month) for month in months])
+        self.assertEqual(datetime(2019, 2, 1, tzinfo=timezone.utc), months[1][0])
+
+    def test_states_match(self):
+        state = [('shallow storage agent1', 10.0), ('deep storage agent1', 5.0)]
+        self.assertTrue(states_match(state, [('shallow storage agent1', 10.0 + 1e-9), ('deep storage agent1', 5.0)]))
+        self.assertFalse(states_match(state, [('shallow storage agent1', 10.1), ('deep storage agent1', 5.0)]))
+        self.assertFalse(states_match(state, [('shallow storage agent2', 10.0), ('deep storage agent1', 5.0)]))
+        self.assertFalse(states_match(state, state[:1]))
+        self.assertFalse(states_match(None, state))
+
+    def test_horizon_state_early_in_month(self):
+        """Early in the month, the previous month's peaks are also used, so there is no state to compare."""
+        elec_pricing, heat_pricing = get_pricing()
+        self.assertIsNone(get_horizon_state(datetime(2019, 3, 2, tzinfo=timezone.utc), {}, {}, elec_pricing,
+                                            heat_pricing))
+        self.assertIsNotNone(get_horizon_state(datetime(2019, 3, 10, tzinfo=timezone.utc), {}, {}, elec_pricing,
+                                               heat_pricing))
+
+    def test_boundary_state_depends_on_previous_month_peaks(self):
+        """Test that the boundary state changes with the previous month's peaks, but not with earlier months'."""
+        month_start = datetime(2019, 3, 1, tzinfo=timezone.utc)
+        elec_pricing, heat_pricing = get_pricing()
+        empty_boundary = get_boundary_state(month_start, {}, {}, elec_pricing, heat_pricing)
+
+        elec_pricing.add_external_sell(datetime(2019, 1, 15, 12, tzinfo=timezone.utc), 100.0)
+        heat_pricing.add_external_sell(datetime(2019, 1, 15, 12, tzinfo=timezone.utc), 100.0)
+        self.assertTrue(states_match(empty_boundary, get_boundary_state(month_start, {}, {}, elec_pricing,
+                                                                        heat_pricing)))
+
+        elec_pricing.add_external_sell(datetime(2019, 2, 15, 12, tzinfo=timezone.utc), 100.0)
+        self.assertFalse(states_match(empty_boundary, get_boundary_state(month_start, {}, {}, elec_pricing,
+                                                                         heat_pricing)))
+        self.assertFalse(states_match(empty_boundary, get_boundary_state(month_start, {'agent1': 1.0}, {},
+                                                                         *get_pricing())))
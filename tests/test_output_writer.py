@@ -0,0 +1,68 @@
+import threading
+from unittest import TestCase
+
+from tradingplatformpoc.simulation_runner.output_writer import OutputWriter
+
+
+class TestOutputWriter(TestCase):
+
+    def test_writes_in_order(self):
+        written = []
+        writer = OutputWriter(lambda batch, checkpoint: written.append((batch, checkpoint)), 2)
+        for batch in range(5):
+            writer.submit(batch, {'n_horizons': batch})
+        writer.flush()
+        self.assertEqual([(batch, {'n_horizons': batch}) for batch in range(5)], written)
+        writer.close()
+        self.assertFalse(writer.thread.is_alive())
+
+    def test_submit_waits_when_queue_is_full(self):
+        """Once max_queued batches are waiting to be written, submitting another one should block."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def write(batch):
+            started.set()
+            release.wait()
+
+        writer = OutputWriter(write, 1)
+        writer.submit(0)
+        started.wait()
+        # The first batch is being written, the second one waits in the queue
+        writer.submit(1)
+        third_submitted = threading.Event()
+        submitter = threading.Thread(target=lambda: (writer.submit(2), third_submitted.set()))
+        submitter.start()
+        self.assertFalse(third_submitted.wait(0.2))
+        release.set()
+        submitter.join()
+        writer.flush()
+        writer.close()
+
+    def test_error_is_raised(self):
+        written = []
+
+        def write(batch):
+            if batch == 1:
+                raise ValueError('Lost connection')
+            written.append(batch)
+
+        writer = OutputWriter(write, 5)
+        for batch in range(3):
+            writer.submit(batch)
+        with self.assertRaises(ValueError):
+            writer.flush()
+        # Batches after the failed one aren't written
+        self.assertEqual([0], written)
+        with self.assertRaises(ValueError):
+            writer.submit(3)
+        writer.close()
+
+    def test_without_queue(self):
+        written = []
+        writer = OutputWriter(written.append, 0)
+        writer.submit(0)
+        self.assertEqual([0], written)
+        self.assertIsNone(writer.thread)
+        writer.flush()
+        writer.close()
@@ -0,0 +1,37 @@
+import threading
+from unittest import TestCase
+
+from tradingplatformpoc.simulation_runner.phase_timer import LOAD_DATA, PhaseTimer, SOLVE, WRITE_OUTPUTS
+
+
+class TestPhaseTimer(TestCase):
+
+    def test_phases_are_summed_in_order(self):
+        timer = PhaseTimer()
+        timer.add(WRITE_OUTPUTS, 1.0)
+        timer.add(SOLVE, 2.0, 3)
+        timer.add(SOLVE, 0.5, 2)
+        with timer.time(LOAD_DATA):
+            pass
+        timings = timer.to_dict()
+        self.assertEqual([LOAD_DATA, SOLVE, WRITE_OUTPUTS], list(timings.keys()))
+        self.assertEqual({'seconds': 2.5, 'count': 5}, timings[SOLVE])
+        self.assertEqual(1, timings[LOAD_DATA]['count'])
+
+    def test_phase_is_timed_when_failing(self):
+        timer = PhaseTimer()
+        with self.assertRaises(ValueError):
+            with timer.time(LOAD_DATA):
+                raise ValueError('No data')
+        self.assertEqual(1, timer.to_dict()[LOAD_DATA]['count'])
+
+    def test_timing_from_several_threads(self):
+        timer = PhaseTimer()
+        threads = [threading.Thread(target=lambda: [timer.add(WRITE_OUTPUTS, 0.001) for _ in range(1000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4000, timer.to_dict()[WRITE_OUTPUTS]['count'])
+        self.assertAlmostEqual(4.0, timer.to_dict()[WRITE_OUTPUTS]['seconds'])
@@ -0,0 +1,89 @@
+from typing import Callable, Dict
+from unittest import TestCase, skipUnless
+
+import pyomo.environ as pyo
+from pyomo.opt import OptSolver, TerminationCondition
+
+from tests.utility_test_objects import get_agent_ems_test_inputs, get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import AgentEMS, CEMS_function
+from tradingplatformpoc.simulation_runner.chalmers.relaxation import is_integral
+from tradingplatformpoc.trading_platform_utils import InProcessHighsSolver
+
+# The solvers available in this environment, each with the tolerance of its objective values, relative to the exact
+# objective. HiGHS stops at a relative MIP gap of 1e-4 by default.
+SOLVERS: Dict[str, Callable[[], OptSolver]] = {name: factory for name, factory
+                                               in [('GLPK', lambda: pyo.SolverFactory('glpk')),
+                                                   ('HiGHS', InProcessHighsSolver)]
+                                               if factory().available(exception_flag=False)}
+REL_TOLERANCES = {'GLPK': 0.0, 'HiGHS': 1e-4}
+
+
+@skipUnless(len(SOLVERS) > 0, 'Neither GLPK nor highspy available')
+class TestRelaxation(TestCase):
+
+    def assert_binaries_integral(self, model: pyo.ConcreteModel):
+        for var in model.component_data_objects(pyo.Var):
+            if var.is_binary():
+                self.assertTrue(is_integral(var.value), var.name)
+
+    def assert_objective_at_least(self, value: float, lower_bound: float, solver_name: str):
+        self.assertGreaterEqual(value, lower_bound - REL_TOLERANCES[solver_name] * abs(lower_bound) - 1e-6)
+
+    def test_lec_model(self):
+        """Test that the repaired solution is feasible for the MILP, and no better than the exact solution."""
+        for solver_name, get_solver in SOLVERS.items():
+            solver = get_solver()
+            for summer_mode, month in [(False, 2), (True, 7)]:
+                with self.subTest(solver=solver_name, month=month):
+                    inputs = get_cems_test_inputs(summer_mode=summer_mode, month=month)
+                    exact_model, _ = CEMS_function.solve_model(solver, **inputs)
+                    relaxed_model, results = CEMS_function.solve_model(solver, relax_binaries=True, **inputs)
+                    self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+                    self.assert_binaries_integral(relaxed_model)
+                    self.assert_objective_at_least(pyo.value(relaxed_model.obj), pyo.value(exact_model.obj),
+                                                   solver_name)
+
+    def test_lec_model_feasible_inputs(self):
+        """Test that inputs for which the MILP is feasible give a solution when relaxed as well."""
+        for solver_name, get_solver in SOLVERS.items():
+            solver = get_solver()
+            for seed in range(1, 4):
+                with self.subTest(solver=solver_name, seed=seed):
+                    model, results = CEMS_function.solve_model(solver, relax_binaries=True,
+                                                               **get_cems_test_inputs(seed=seed))
+                    self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+                    self.assert_binaries_integral(model)
+
+    def test_model_restored(self):
+        """Test that a stored model is left with its binaries and fixed variables as before, so that it can be reused
+        for exact solves, with the same solver."""
+        for solver_name, get_solver in SOLVERS.items():
+            with self.subTest(solver=solver_name):
+                solver = get_solver()
+                model_store = {}
+                model, _ = CEMS_function.solve_model(solver, model_store=model_store, relax_binaries=True,
+                                                     **get_cems_test_inputs(seed=1))
+                self.assertTrue(model.UCbuy_grid[0, 0].is_binary())
+                self.assertFalse(model.UCbuy_grid[0, 0].fixed)
+                # Agent 1 has no battery, so its battery variables are always fixed
+                self.assertTrue(model.Pcha[1, 0].fixed)
+                inputs = get_cems_test_inputs(seed=2)
+                reused_model, results = CEMS_function.solve_model(solver, model_store=model_store, **inputs)
+                self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+                fresh_model, _ = CEMS_function.solve_model(solver, **inputs)
+                self.assertAlmostEqual(pyo.value(fresh_model.obj), pyo.value(reused_model.obj),
+                                       delta=REL_TOLERANCES[solver_name] * abs(pyo.value(fresh_model.obj)) + 1e-4)
+
+    def test_agent_models(self):
+        for solver_name, get_solver in SOLVERS.items():
+            solver = get_solver()
+            for agent in range(3):
+                with self.subTest(solver=solver_name, agent=agent):
+                    inputs = get_agent_ems_test_inputs(agent)
+                    exact_model, _ = AgentEMS.solve_model(solver, **inputs)
+                    relaxed_model, results = AgentEMS.solve_model(solver, relax_binaries=True, **inputs)
+                    self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+                    self.assert_binaries_integral(relaxed_model)
+                    self.assert_objective_at_least(pyo.value(relaxed_model.obj), pyo.value(exact_model.obj),
+                                                   solver_name)
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+import numpy as np
+
+import pandas as pd
+
+from tradingplatformpoc.simulation_runner.representative_days import get_period_weights, \
+    select_representative_horizons
+
+
+class TestRepresentativeDays(TestCase):
+
+    def test_select_representative_horizons(self):
+        """Two distinct kinds of days in each month should give one representative of each, weighted by their counts."""
+        starts = [datetime(2019, 1, 1, tzinfo=timezone.utc) + timedelta(days=day) for day in range(59)]
+        cold = np.array([start.day % 3 != 0 for start in starts])
+        features = pd.DataFrame({'heat_demand': np.where(cold, 100.0, 10.0) + np.arange(59) * 0.01,
+                                 'price': np.where(cold, 1.0, 0.5)}, index=pd.Index(starts))
+        representatives = select_representative_horizons(features, 2)
+        self.assertEqual(4, len(representatives))
+        self.assertEqual(59, sum(representatives.values()))
+        january = {start: weight for start, weight in representatives.items() if start.month == 1}
+        self.assertEqual(sorted([21, 10]), sorted(january.values()))
+        self.assertEqual(sorted(representatives.keys()), list(representatives.keys()))
+
+    def test_fewer_horizons_than_clusters(self):
+        starts = [datetime(2019, 1, 1, tzinfo=timezone.utc) + timedelta(days=day) for day in range(3)]
+        features = pd.DataFrame({'price': [1.0, 2.0, 3.0]}, index=pd.Index(starts))
+        self.assertEqual({start: 1 for start in starts}, select_representative_horizons(features, 5))
+
+    def test_get_period_weights(self):
+        start = datetime(2019, 1, 1, tzinfo=timezone.utc)
+        weights = get_period_weights({start: 3, start + timedelta(days=2): 2}, 24)
+        self.assertEqual(48, len(weights))
+        self.assertEqual(3.0, weights[start + timedelta(hours=23)])
+        self.assertEqual(2.0, weights[start + timedelta(days=2)])
+        self.assertAlmostEqual(3 * 24 + 2 * 24, weights.sum())
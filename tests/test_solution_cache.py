@@ -0,0 +1,85 @@
+import datetime
+import tempfile
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+
+from tests.utility_test_objects import get_agent_ems_test_inputs, get_cems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import CEMS_function
+from tradingplatformpoc.simulation_runner.chalmers_interface import SolverSettings, solve_agent
+from tradingplatformpoc.simulation_runner.solution_cache import SolutionCache, get_cache_key
+from tradingplatformpoc.trading_platform_utils import InProcessHighsSolver
+
+START_DATETIME = datetime.datetime(2019, 2, 1, tzinfo=datetime.timezone.utc)
+
+
+class TestCacheKey(TestCase):
+
+    def test_same_values_give_same_key(self):
+        """Lists and arrays with the same values, and ints and floats with the same value, should give the same key."""
+        self.assertEqual(get_cache_key('Agent', 'HiGHS', 0, {'a': [1, 2, 3], 'b': 1, 'c': True}),
+                         get_cache_key('Agent', 'HiGHS', 0.0, {'c': 1.0, 'b': 1.0, 'a': np.array([1.0, 2.0, 3.0])}))
+
+    def test_different_values_give_different_keys(self):
+        key = get_cache_key('Agent', 'HiGHS', 0.0, {'a': [1, 2, 3], 'b': 1})
+        self.assertNotEqual(key, get_cache_key('Agent', 'HiGHS', 0.0, {'a': [1, 2, 3.0001], 'b': 1}))
+        self.assertNotEqual(key, get_cache_key('Agent', 'HiGHS', 0.0, {'a': [1, 2, 3], 'b': 2}))
+        self.assertNotEqual(key, get_cache_key('LEC', 'HiGHS', 0.0, {'a': [1, 2, 3], 'b': 1}))
+        # Same values, different shape
+        self.assertNotEqual(get_cache_key('LEC', 'HiGHS', 0.0, {'a': np.ones((2, 3))}),
+                            get_cache_key('LEC', 'HiGHS', 0.0, {'a': np.ones((3, 2))}))
+
+    def test_different_solver_settings_give_different_keys(self):
+        """Solutions found with another solver, or within a MIP gap, should not be reused."""
+        key = get_cache_key('Agent', 'HiGHS', 0.0, {'a': [1, 2, 3]})
+        self.assertNotEqual(key, get_cache_key('Agent', 'GLPK', 0.0, {'a': [1, 2, 3]}))
+        self.assertNotEqual(key, get_cache_key('Agent', 'HiGHS', 0.01, {'a': [1, 2, 3]}))
+
+
+@skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+class TestSolutionCache(TestCase):
+
+    def test_agent_solution_reused(self):
+        """Test that a cached solution is reused, also for another agent with the same data, without solving."""
+        solver = InProcessHighsSolver()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SolutionCache(directory)
+            solved_model, solve_info = solve_agent(solver, get_agent_ems_test_inputs(0), START_DATETIME, 'agent0',
+                                                   cache)
+            self.assertIsNotNone(solve_info)
+            # Agent 0's data, but under another agent index and name
+            agent_inputs = get_agent_ems_test_inputs(0)
+            agent_inputs['agent'] = 1
+            cached_model, solve_info = solve_agent(solver, agent_inputs, START_DATETIME, 'agent1', cache)
+            self.assertIsNone(solve_info)
+            self.assertEqual(1, cache.hits)
+            self.assertAlmostEqual(pyo.value(solved_model.obj), pyo.value(cached_model.obj))
+            for hour in solved_model.T:
+                self.assertEqual(pyo.value(solved_model.Pbuy_market[hour]), pyo.value(cached_model.Pbuy_market[hour]))
+
+    def test_lec_solution_loaded(self):
+        """Test that the LEC model is given a passed-in solution instead of being solved."""
+        solver = InProcessHighsSolver()
+        solved_model, _ = CEMS_function.solve_model(solver, **get_cems_test_inputs(seed=1))
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SolutionCache(directory)
+            cache.put('key', solved_model)
+            cached_model, results = CEMS_function.solve_model(solver, solution=cache.get('key'),
+                                                              **get_cems_test_inputs(seed=1))
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        self.assertAlmostEqual(pyo.value(solved_model.obj), pyo.value(cached_model.obj))
+
+    def test_agent_solution_not_reused_with_mip_gap(self):
+        """Test that a solution found without a MIP gap isn't reused when solving with one."""
+        solver = InProcessHighsSolver()
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SolutionCache(directory)
+            solve_agent(solver, get_agent_ems_test_inputs(0), START_DATETIME, 'agent0', cache)
+            _, solve_info = solve_agent(solver, get_agent_ems_test_inputs(0), START_DATETIME, 'agent0', cache,
+                                        solver_settings=SolverSettings(mip_gap=0.01))
+            self.assertIsNotNone(solve_info)
+            self.assertEqual(0, cache.hits)
@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+import numpy as np
+
+from tradingplatformpoc.simulation_runner.time_aggregation import aggregate, expand, expand_levels, \
+    get_aggregation_error, get_time_step
+
+
+class TestTimeAggregation(TestCase):
+
+    def test_get_time_step(self):
+        self.assertEqual(1, get_time_step({'TradingHorizon': 24}))
+        self.assertEqual(4, get_time_step({'TradingHorizon': 24, 'TimeStep': 4}))
+        # 4 doesn't divide 18, so falls back to hourly time steps
+        self.assertEqual(1, get_time_step({'TradingHorizon': 18, 'TimeStep': 4}))
+
+    def test_aggregate_and_expand(self):
+        hourly = np.array([[1.0, 3.0, 2.0, 2.0], [0.0, 0.0, 4.0, 0.0]])
+        aggregated = aggregate(hourly, 2)
+        np.testing.assert_array_equal([[2.0, 2.0], [0.0, 2.0]], aggregated)
+        np.testing.assert_array_equal([[2.0, 2.0, 2.0, 2.0], [0.0, 0.0, 2.0, 2.0]], expand(aggregated, 2))
+        # Total energy is kept
+        self.assertEqual(hourly.sum(), expand(aggregated, 2).sum())
+
+    def test_expand_levels(self):
+        """Levels are interpolated from the start level, and the end of each time step is kept."""
+        levels = np.array([[4.0, 2.0]])
+        np.testing.assert_array_almost_equal([[1.0, 2.0, 3.0, 4.0, 3.5, 3.0, 2.5, 2.0]],
+                                             expand_levels(levels, np.array([0.0]), 4))
+        np.testing.assert_array_almost_equal([3.0, 4.0, 3.0, 2.0], expand_levels(np.array([4.0, 2.0]), 2.0, 2))
+
+    def test_get_aggregation_error(self):
+        """The error is summed over agents, for each hour."""
+        hourly = np.array([[1.0, 3.0, 2.0, 2.0], [0.0, 0.0, 4.0, 0.0]])
+        np.testing.assert_array_equal([1.0, 1.0, 2.0, 2.0], get_aggregation_error(hourly, 2))
+        np.testing.assert_array_equal([0.0, 0.0, 0.0, 0.0], get_aggregation_error(hourly, 1))
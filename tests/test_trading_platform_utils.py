@@ -1,10 +1,22 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
 from collections import Counter
 from datetime import datetime
-from unittest import TestCase
+from typing import List
+from unittest import TestCase, mock, skipUnless
 
-from tradingplatformpoc.trading_platform_utils import add_all_to_nested_dict, energy_to_water_volume, \
-    flatten_collection, get_final_storage_level, get_if_exists_else, get_intersection, minus_n_hours, \
-    water_volume_to_energy
+import pyomo.environ as pyo
+from pyomo.opt import TerminationCondition
+
+from tests.utility_test_objects import get_agent_ems_test_inputs
+
+from tradingplatformpoc.simulation_runner.chalmers import AgentEMS
+from tradingplatformpoc.trading_platform_utils import InProcessHighsSolver, add_all_to_nested_dict, \
+    energy_to_water_volume, flatten_collection, get_final_storage_level, get_if_exists_else, get_intersection, \
+    get_solver, minus_n_hours, water_volume_to_energy
 
 
 class Test(TestCase):
@@ -90,3 +102,95 @@ class Test(TestCase):
         """Test that energy_to_water_volume and water_volume_to_energy are each other's inverse."""
         self.assertAlmostEqual(75.35731666666666, water_volume_to_energy(1, 65))
         self.assertAlmostEqual(1.0, energy_to_water_volume(75.35731666666666, 65))
+
+    def test_get_solver_falls_back_on_glpk(self):
+        """Test that an unknown solver name gives the GLPK solver."""
+        self.assertEqual('glpk', get_solver('NoSuchSolver').name)
+
+    def test_get_solver_with_limits(self):
+        """Test that the MIP gap and time limit are passed to GLPK as command line options, rounding up the time."""
+        solver = get_solver('GLPK', mip_gap=0.01, time_limit=2.5)
+        self.assertEqual(0.01, solver.options['mipgap'])
+        self.assertEqual(3, solver.options['tmlim'])
+        self.assertNotIn('tmlim', get_solver('GLPK').options)
+
+    def test_without_highspy(self):
+        """Test that the module can be imported without highspy, which is optional, and that GLPK is used instead."""
+        script = "import sys; sys.modules['highspy'] = None\n" \
+                 "from tradingplatformpoc.trading_platform_utils import get_solver\n" \
+                 "print(get_solver('HiGHS').name)"
+        output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.dirname(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual('glpk', output.strip())
+
+
+@skipUnless(InProcessHighsSolver().available(exception_flag=False), 'highspy not available')
+class TestInProcessHighsSolver(TestCase):
+
+    def test_solve(self):
+        """Test that the solution is loaded into the model."""
+        model = pyo.ConcreteModel()
+        model.x = pyo.Var(within=pyo.NonNegativeReals)
+        model.con = pyo.Constraint(expr=model.x >= 1)
+        model.obj = pyo.Objective(expr=model.x)
+        results = get_solver('HiGHS').solve(model)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        self.assertAlmostEqual(1, pyo.value(model.x))
+
+    def test_infeasible(self):
+        """Test that infeasibility is reported through the termination condition, like for GLPK, instead of raised."""
+        model = pyo.ConcreteModel()
+        model.x = pyo.Var(within=pyo.NonNegativeReals)
+        model.con = pyo.Constraint(expr=model.x <= -1)
+        model.obj = pyo.Objective(expr=model.x)
+        results = get_solver('HiGHS').solve(model)
+        self.assertEqual(TerminationCondition.infeasible, results.solver.termination_condition)
+
+    def test_warm_start_capable(self):
+        """Test that warm starts are only supported if Pyomo's HiGHS interface has the members that they rely on."""
+        self.assertTrue(InProcessHighsSolver().warm_start_capable())
+        with mock.patch('tradingplatformpoc.trading_platform_utils.HIGHS_MIP_START_ATTRIBUTES',
+                        ['_pyomo_var_to_solver_var_map', '_no_such_attribute']):
+            solver = InProcessHighsSolver()
+            self.assertFalse(solver.warm_start_capable())
+            # Solving with warmstart=True still works, without a MIP start
+            model = pyo.ConcreteModel()
+            model.x = pyo.Var(within=pyo.Binary)
+            model.obj = pyo.Objective(expr=model.x, sense=pyo.maximize)
+            model.x.set_value(0)
+            results = solver.solve(model, warmstart=True)
+        self.assertEqual(TerminationCondition.optimal, results.solver.termination_condition)
+        self.assertAlmostEqual(1, pyo.value(model.x))
+
+    def test_solve_with_logging_to_stderr(self):
+        """
+        Test that HiGHS' output isn't logged again and again when logging to stderr, as job_worker.configure_logging
+        does: the output is captured from stderr while solving, which then holds what was logged.
+        """
+        root_logger = logging.getLogger()
+        # Writing to the file descriptor of stderr, since the test runner may have replaced sys.stderr
+        stderr = open(2, 'w', closefd=False)
+        handler = logging.StreamHandler(stderr)
+        handler.setFormatter(logging.Formatter('%(levelname)s | %(name)s | %(message)s'))
+        records: List[logging.LogRecord] = []
+        recorder = logging.Handler()
+        recorder.emit = records.append  # type: ignore
+        previous_level = root_logger.level
+        root_logger.addHandler(handler)
+        root_logger.addHandler(recorder)
+        root_logger.setLevel(logging.INFO)
+        results = []
+        try:
+            thread = threading.Thread(target=lambda: results.append(
+                AgentEMS.solve_model(get_solver('HiGHS'), **get_agent_ems_test_inputs(0))[1]), daemon=True)
+            thread.start()
+            thread.join(60)
+        finally:
+            root_logger.removeHandler(handler)
+            root_logger.removeHandler(recorder)
+            root_logger.setLevel(previous_level)
+            stderr.close()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(TerminationCondition.optimal, results[0].solver.termination_condition)
+        self.assertEqual([], [record for record in records if ' | INFO | ' in record.getMessage()
+                              or record.getMessage().startswith('INFO | ')])
@@ -1,3 +1,5 @@
+import numpy as np
+
 AREA_INFO = {
     "PVEfficiency": 0.165,
     "HeatTransferLoss": 0.05,
@@ -11,3 +13,77 @@ AREA_INFO = {
     "ExternalElectricityWholesalePriceOffset": 0.05,
     "ExternalHeatingWholesalePriceFraction": 0.5
 }
+
+
+def get_cems_test_inputs(summer_mode: bool = False, month: int = 2, n_agents: int = 3, trading_horizon: int = 24,
+                         seed: int = 1) -> dict:
+    """
+    Small, feasible set of inputs to CEMS_function.solve_model (everything except the solver). The first agent has all
+    assets, the second one lacks battery and accumulator tank, and the third has no assets at all.
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(trading_horizon)
+
+    def time_series(scale: float, offset: float = 0.0) -> np.ndarray:
+        return offset + scale * rng.random((n_agents, trading_horizon))
+
+    has_assets = [i % 3 == 0 for i in range(n_agents)]
+    has_heat_pump = [i % 3 != 2 for i in range(n_agents)]
+    # Agents without heat pump have no way of covering a cooling demand outside of the LEC
+    cold_consumption = time_series(8.0 if summer_mode else 1.0) * np.array(has_heat_pump)[:, np.newaxis]
+    return {'summer_mode': summer_mode,
+            'month': month,
+            'n_agents': n_agents,
+            'nordpool_price': 0.5 + 0.3 * np.sin(hours / 24 * 2 * np.pi) + 0.1 * rng.random(trading_horizon),
+            'external_heat_buy_price': 0.8,
+            'battery_capacity': [100.0 if x else 0.0 for x in has_assets],
+            'battery_charge_rate': [40.0 if x else 0.0 for x in has_assets],
+            'battery_discharge_rate': [40.0 if x else 0.0 for x in has_assets],
+            'SOCBES0': [0.2] * n_agents,
+            'HP_Cproduct_active': has_heat_pump,
+            'heatpump_COP': [3.0 if summer_mode else 2.5] * n_agents,
+            'heatpump_max_power': [20.0 if x else 0.0 for x in has_heat_pump],
+            'heatpump_max_heat': [60.0 if x else 0.0 for x in has_heat_pump],
+            'booster_heatpump_COP': [4.0] * n_agents,
+            'booster_heatpump_max_power': [20.0] * n_agents,
+            'booster_heatpump_max_heat': [80.0] * n_agents,
+            'build_area': [1000.0 if x else 0.0 for x in has_heat_pump],
+            'SOCTES0': [0.2] * n_agents,
+            'thermalstorage_max_temp': [65.0] * n_agents,
+            'thermalstorage_volume': [1.0 if x else 0.0 for x in has_assets],
+            'BITES_Eshallow0': [5.0 if x else 0.0 for x in has_heat_pump],
+            'BITES_Edeep0': [20.0 if x else 0.0 for x in has_heat_pump],
+            'borehole': has_heat_pump,
+            'elec_consumption': time_series(30.0, 10.0),
+            'hot_water_heatdem': time_series(5.0),
+            'space_heating_heatdem': time_series(5.0 if summer_mode else 40.0),
+            'cold_consumption': cold_consumption,
+            'pv_production': time_series(20.0 if summer_mode else 5.0),
+            'excess_low_temp_heat': time_series(0.0),
+            'excess_high_temp_heat': time_series(0.0),
+            'elec_trans_fee': 0.13,
+            'elec_tax_fee': 0.36,
+            'incentive_fee': 0.05,
+            'hist_top_three_elec_peak_load': [40.0, 30.0, 20.0],
+            'elec_peak_load_fee': 35.0 / 28,
+            'hist_monthly_heat_peak_energy': 100.0,
+            'heat_peak_load_fee': 0.0,
+            'trading_horizon': trading_horizon}
+
+
+def get_agent_ems_test_inputs(agent: int, **kwargs) -> dict:
+    """Inputs to AgentEMS.solve_model (everything except the solver), for one of the agents in get_cems_test_inputs."""
+    lec_inputs = get_cems_test_inputs(**kwargs)
+    agent_inputs = {'month': lec_inputs['month'], 'agent': agent}
+    for key in ['nordpool_price', 'external_heat_buy_price', 'elec_trans_fee', 'elec_tax_fee', 'incentive_fee',
+                'hist_top_three_elec_peak_load', 'elec_peak_load_fee', 'hist_monthly_heat_peak_energy',
+                'heat_peak_load_fee', 'trading_horizon']:
+        agent_inputs[key] = lec_inputs[key]
+    for key in ['battery_capacity', 'battery_charge_rate', 'battery_discharge_rate', 'SOCBES0', 'HP_Cproduct_active',
+                'heatpump_COP', 'heatpump_max_power', 'heatpump_max_heat', 'build_area', 'SOCTES0',
+                'thermalstorage_max_temp', 'thermalstorage_volume', 'BITES_Eshallow0', 'BITES_Edeep0', 'borehole']:
+        agent_inputs[key] = lec_inputs[key][agent]
+    for key in ['elec_consumption', 'hot_water_heatdem', 'space_heating_heatdem', 'cold_consumption', 'pv_production',
+                'excess_high_temp_heat']:
+        agent_inputs[key] = lec_inputs[key][agent, :]
+    return agent_inputs
@@ -1,4 +1,5 @@
 from tradingplatformpoc.sql.agent.models import Agent  # noqa: F401
+from tradingplatformpoc.sql.checkpoint.models import Checkpoint  # noqa: F401
 from tradingplatformpoc.sql.config.models import Config  # noqa: F401
 from tradingplatformpoc.sql.electricity_price.models import ElectricityPrice  # noqa: F401
 from tradingplatformpoc.sql.extra_cost.models import ExtraCost  # noqa: F401
@@ -8,4 +9,5 @@ from tradingplatformpoc.sql.job.models import Job  # noqa: F401
 from tradingplatformpoc.sql.level.models import Level  # noqa: F401
 from tradingplatformpoc.sql.mock_data.models import MockData  # noqa: F401
 from tradingplatformpoc.sql.results.models import PreCalculatedResults  # noqa: F401
+from tradingplatformpoc.sql.solve_info.models import SolveInfo  # noqa: F401
 from tradingplatformpoc.sql.trade.models import Trade  # noqa: F401
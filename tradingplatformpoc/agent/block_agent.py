@@ -1,6 +1,8 @@
 import datetime
 import logging
-from typing import Optional
+from typing import List, Optional
+
+import numpy as np
 
 from tradingplatformpoc.agent.iagent import IAgent
 from tradingplatformpoc.constants import ACC_TANK_TEMPERATURE
@@ -40,3 +42,11 @@ class BlockAgent(IAgent):
         actual_consumption = self.digital_twin.get_consumption(period, resource)
         actual_production = self.digital_twin.get_production(period, resource)
         return actual_consumption - actual_production
+
+    def get_actual_usage_for_periods(self, periods: List[datetime.datetime], resource: Resource) -> np.ndarray:
+        """Same as get_actual_usage_for_resource, but for several periods at once. Returns one value per period."""
+        # The digital twin returns Series when given a list of periods, or 0 if the resource isn't used/produced
+        actual_consumption = self.digital_twin.get_consumption(periods, resource)
+        actual_production = self.digital_twin.get_production(periods, resource)
+        usage = np.asarray(actual_consumption, dtype=float) - np.asarray(actual_production, dtype=float)
+        return np.broadcast_to(usage, (len(periods),))
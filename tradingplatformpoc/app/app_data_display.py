@@ -322,7 +322,9 @@ def build_leaderboard_df(list_of_dicts: List[dict]) -> pd.DataFrame:
                       ResultsKey.format_results_key_name(ResultsKey.SUM_IMPORT_BELOW_1_C, Resource.HIGH_TEMP_HEAT),
                       ResultsKey.format_results_key_name(ResultsKey.SUM_IMPORT_JAN_FEB, Resource.HIGH_TEMP_HEAT),
                       ResultsKey.HEAT_DUMPED,
-                      ResultsKey.COOL_DUMPED]
+                      ResultsKey.COOL_DUMPED,
+                      ResultsKey.TIME_AGGREGATION_ERROR,
+                      ResultsKey.AGENT_CLUSTERING_ERROR]
 
     for wanted_column in wanted_columns:
         if wanted_column not in df_to_display.columns:
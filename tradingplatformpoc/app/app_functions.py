@@ -1,15 +1,15 @@
 import logging
 import string
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import pandas as pd
 
 import streamlit as st
 from streamlit.runtime.scriptrunner import add_script_run_ctx
 
-from tradingplatformpoc.app.app_threading import StoppableThread
-from tradingplatformpoc.simulation_runner.trading_simulator import TradingSimulator
-from tradingplatformpoc.sql.job.crud import get_all_queued_jobs
+from tradingplatformpoc.settings import settings
+from tradingplatformpoc.simulation_runner.job_worker import JobThread, get_worker_id
+from tradingplatformpoc.sql.job.crud import claim_next_job
 
 
 logger = logging.getLogger(__name__)
@@ -77,6 +77,16 @@ def color_in(val):
     return 'color: %s' % color
 
 
+def phase_timings_to_df(phase_timings: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    """The time spent in each phase of a job, as saved with the job by TradingSimulator, and its share of the total."""
+    df = pd.DataFrame.from_records([{'Phase': phase, 'Seconds': timing['seconds'], 'Count': timing['count']}
+                                    for phase, timing in phase_timings.items()])
+    if not df.empty:
+        total = df['Seconds'].sum()
+        df['Share (%)'] = 100 * df['Seconds'] / total if total > 0 else 0.0
+    return df
+
+
 def cleanup_config_name(name: str) -> str:
     """
     All lower case, replacing blanks with underlines
@@ -105,21 +115,18 @@ def config_naming_is_valid(name: str) -> bool:
     return (not has_control_characters(name)) and (len(name.replace(' ', '')) > 0)
 
 
-def run_simulation(job_id: str):
-    logger.info("Running simulation")
-    simulator = TradingSimulator(job_id)
-    simulator()
-    run_next_job_in_queue()
-    # TODO: Delete job if not finished?
-    # TODO: Add functionality to schedule removal of potential uncompleted jobs
-
-
 def run_next_job_in_queue() -> bool:
-    queue = get_all_queued_jobs()
-    if len(queue) > 0:
-        job_id = queue[0]
+    """
+    Takes the next job in the queue, as the headless workers do (see job_worker), and runs it in a thread. Once it has
+    finished, the next job is taken, and so on until the queue is empty.
+    """
+    if not settings.RUN_JOBS_IN_APP:
+        return False
+    worker_id = get_worker_id()
+    job_id = claim_next_job(worker_id, settings.JOB_LEASE_SECONDS, settings.JOB_MAX_ATTEMPTS)
+    if job_id is not None:
         logger.info('Running job with ID {}'.format(job_id))
-        t = StoppableThread(name='run_' + job_id, target=run_simulation, args=(job_id,))
+        t = JobThread(job_id, worker_id, then=run_next_job_in_queue)
         add_script_run_ctx(t)
         t.start()
         return True
@@ -16,9 +16,15 @@ class StoppableThread(threading.Thread):
     def __init__(self, *args, **kwargs):
         super(StoppableThread, self).__init__(*args, **kwargs)
         self._stopper = threading.Event()
+        self.keep_job_data = False
 
-    def stop_it(self):
+    def stop_it(self, keep_job_data: bool = False):
+        """
+        Unless keep_job_data is True, the job run in the thread is deleted once stopped. It is True when the job has
+        been taken over by another worker.
+        """
         logger.info('Stopping thread.')
+        self.keep_job_data = keep_job_data
         self._stopper.set()
 
     def is_stopped(self):
@@ -1,3 +1,4 @@
+import datetime
 import logging
 import time
 
@@ -9,11 +10,13 @@ import streamlit as st
 
 from tradingplatformpoc.app import footer
 from tradingplatformpoc.app.app_functions import calculate_height_for_no_scroll_up_to, color_in, \
-    run_next_job_in_queue, set_max_width
+    phase_timings_to_df, run_next_job_in_queue, set_max_width
 from tradingplatformpoc.app.app_threading import get_running_threads
+from tradingplatformpoc.settings import settings
 from tradingplatformpoc.sql.config.crud import \
     get_all_config_ids_in_db_with_jobs_df, get_all_config_ids_in_db_without_jobs, read_config
 from tradingplatformpoc.sql.job.crud import create_job_if_new_config, delete_job, get_failed_jobs_df
+from tradingplatformpoc.sql.job.models import BACKGROUND_PRIORITY, INTERACTIVE_PRIORITY
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +25,8 @@ add_indentation()
 
 set_max_width('1000px')  # This tab looks a bit daft when it is too wide, so limiting it here.
 
-if len([thread for thread in get_running_threads() if 'run_' in thread.name]) == 0:
+# Jobs are run by the app only if configured to, otherwise only by workers (see job_worker)
+if settings.RUN_JOBS_IN_APP and len([thread for thread in get_running_threads() if 'run_' in thread.name]) == 0:
     run_started = run_next_job_in_queue()
     if run_started:
         time.sleep(5)
@@ -36,6 +40,9 @@ if len(config_ids) > 0:
 else:
     st.markdown('Set up a configuration in **Setup configuration**')
 
+run_in_background = st.checkbox('Run in the background', value=False,
+                                help='Jobs run in the background are run after other queued jobs, such as when '
+                                'queueing many configurations at once.')
 run_sim = st.button("**CLICK TO RUN/QUEUE SIMULATION FOR *{}***".format(chosen_config_id)
                     if chosen_config_id is not None else "**CLICK TO RUN SIMULATION**",
                     disabled=(len(config_ids) == 0),
@@ -44,7 +51,8 @@ run_sim = st.button("**CLICK TO RUN/QUEUE SIMULATION FOR *{}***".format(chosen_c
                     type='primary')
 
 if run_sim:
-    new_job_id = create_job_if_new_config(chosen_config_id)
+    new_job_id = create_job_if_new_config(chosen_config_id,
+                                          BACKGROUND_PRIORITY if run_in_background else INTERACTIVE_PRIORITY)
     run_sim = False
     st.experimental_rerun()
 
@@ -56,9 +64,11 @@ if not config_df.empty:
     n_rows = len(config_df.index)
     config_df['Delete'] = False
     config_df['Status'] = 'Could not finish'
-    config_df.loc[config_df['Job ID'].isin([thread.name[4:] for thread in get_running_threads()]),
-                  'Status'] = 'Running'
-    config_df.loc[(config_df['Start time'].isna() & config_df['End time'].isna()), 'Status'] = 'Pending'
+    # A job is running as long as its worker, in this app or elsewhere, renews its lease on it. Jobs whose lease has
+    # expired are pending, since they will be resumed by the next worker looking for a job.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    config_df.loc[config_df['End time'].isna(), 'Status'] = 'Pending'
+    config_df.loc[pd.to_datetime(config_df['Lease expires at'], utc=True) > now, 'Status'] = 'Running'
     config_df.loc[config_df['End time'].notna(), 'Status'] = 'Completed'
     config_df['Status'] = pd.Categorical(config_df['Status'],
                                          categories=["Running", "Pending", "Completed", "Could not finish"],
@@ -73,9 +83,9 @@ if not config_df.empty:
         column_config={
             "Delete": st.column_config.CheckboxColumn(help="Check the box if you want to delete the data for this run.")
         },
-        column_order=['Status', 'Config ID', 'Delete', 'Start time', 'End time', 'Description', 'Job ID'],
+        column_order=['Status', 'Config ID', 'Delete', 'Start time', 'End time', 'Description', 'Worker', 'Job ID'],
         hide_index=True,
-        disabled=['Status', 'Config ID', 'Start time', 'End time', 'Description', 'Job ID'],
+        disabled=['Status', 'Config ID', 'Start time', 'End time', 'Description', 'Worker', 'Job ID'],
         height=calculate_height_for_no_scroll_up_to(n_rows)
     )
     delete_runs_submit = delete_runs_form.form_submit_button(
@@ -87,12 +97,24 @@ if not config_df.empty:
             for _i, row in edited_df[edited_df['Delete']].iterrows():
                 active = [thread for thread in get_running_threads() if thread.name == 'run_' + row['Job ID']]
                 if len(active) == 0:
+                    # If the job is running in a worker, the worker stops it once it notices that it has been deleted
                     delete_job(row['Job ID'])
                 else:
                     active[0].stop_it()
             st.experimental_rerun()
         else:
             st.markdown('No runs selected to delete.')
+
+    timed_df = config_df[config_df['Phase timings'].notna()]
+    if not timed_df.empty:
+        st.subheader('Time per phase')
+        st.caption('Where a job spends its time. Building models, solving and extracting outputs are summed over all '
+                   'models, so exceed the wall-clock time when models are solved in parallel.')
+        timed_config_id = st.selectbox('Choose a job', timed_df['Config ID'], key='timed_config_id')
+        phase_timings = timed_df.loc[timed_df['Config ID'] == timed_config_id, 'Phase timings'].iloc[0]
+        st.dataframe(phase_timings_to_df(phase_timings), hide_index=True, use_container_width=True,
+                     column_config={'Seconds': st.column_config.NumberColumn(format='%.1f'),
+                                    'Share (%)': st.column_config.NumberColumn(format='%.1f')})
 else:
     st.dataframe(pd.DataFrame(columns=['Status', 'Config ID', 'Start time', 'End time', 'Description', 'Job ID']),
                  hide_index=True, use_container_width=True)
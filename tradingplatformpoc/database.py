@@ -1,6 +1,6 @@
 import logging
 from contextlib import _GeneratorContextManager
-from typing import Callable, List
+from typing import Any, Callable, List, Tuple
 
 from sqlalchemy import text
 
@@ -21,9 +21,19 @@ def create_db_and_tables():
     SQLModel.metadata.create_all(db_engine)
     logger.info('Creating db and tables')
 
+    # Columns added to existing tables, which create_all doesn't add
+    with db_engine.connect() as connection:
+        connection.execute(text("ALTER TABLE job ADD COLUMN IF NOT EXISTS worker_id VARCHAR"))
+        connection.execute(text("ALTER TABLE job ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE"))
+        connection.execute(text("ALTER TABLE job ADD COLUMN IF NOT EXISTS priority INTEGER NOT NULL DEFAULT 0"))
+        connection.execute(text("ALTER TABLE job ADD COLUMN IF NOT EXISTS phase_timings JSONB"))
+        connection.execute(text("ALTER TABLE job ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0"))
+        connection.commit()
+
     # Grant privileges to afryx_admin - there is probably a better way to do this
     with db_engine.connect() as connection:
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE agent TO afryx_admin"))
+        connection.execute(text("GRANT ALL PRIVILEGES ON TABLE checkpoint TO afryx_admin"))
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE config TO afryx_admin"))
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE electricity_price TO afryx_admin"))
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE extra_cost TO afryx_admin"))
@@ -34,6 +44,7 @@ def create_db_and_tables():
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE level TO afryx_admin"))
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE mock_data TO afryx_admin"))
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE results TO afryx_admin"))
+        connection.execute(text("GRANT ALL PRIVILEGES ON TABLE solve_info TO afryx_admin"))
         connection.execute(text("GRANT ALL PRIVILEGES ON TABLE trade TO afryx_admin"))
         connection.commit()
 
@@ -51,6 +62,16 @@ def bulk_insert(table_type, dicts: List[dict],
         db.commit()
 
 
+def bulk_insert_all(inserts: List[Tuple[Any, List[dict]]],
+                    session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope):
+    """Same as bulk_insert, for several tables, in a single transaction: either all rows are inserted, or none."""
+    with session_generator() as db:
+        enable_batch_inserting(db)
+        for table_type, dicts in inserts:
+            db.bulk_insert_mappings(table_type, dicts)
+        db.commit()
+
+
 def insert_default_config_into_db():
     config = read_config()
 
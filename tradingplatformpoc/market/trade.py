@@ -67,6 +67,12 @@ class TradeMetadataKey(Enum):
     CM_HEAT_PROD = 19
     CM_ELEC_CONS = 20
 
+    # Energy by which the aggregated inputs deviate from the hourly ones, when optimizing with time steps longer than
+    # one hour
+    TIME_AGGREGATION_ERROR = 21
+    # Energy netted within aggregate agents, rather than traded between their members, when agents are clustered
+    AGENT_CLUSTERING_ERROR = 22
+
 
 class Trade:
     """
@@ -5,7 +5,7 @@ from typing import List, Optional, Union
 import pandas as pd
 
 from tradingplatformpoc.market.trade import Market, Resource
-from tradingplatformpoc.price.iprice import IPrice, get_days_in_month
+from tradingplatformpoc.price.iprice import DAYS_USING_PREVIOUS_MONTH_PEAKS, IPrice, get_days_in_month
 
 logger = logging.getLogger(__name__)
 
@@ -98,7 +98,7 @@ class ElectricityPrice(IPrice):
         """
         sells_series = self.get_sells(agent)
         top_3_this_month = calculate_top_three_hourly_outtakes_for_month(sells_series, period.year, period.month)
-        at_least_n_days = 5
+        at_least_n_days = DAYS_USING_PREVIOUS_MONTH_PEAKS
         if period.day < at_least_n_days:
             # Early in the month, we'll also use last month's values, so that we don't underestimate.
             # We will scale those values a bit though, so that we don't overestimate.
@@ -8,7 +8,7 @@ import numpy as np
 import pandas as pd
 
 from tradingplatformpoc.market.trade import Resource
-from tradingplatformpoc.price.iprice import IPrice, get_days_in_month
+from tradingplatformpoc.price.iprice import DAYS_USING_PREVIOUS_MONTH_PEAKS, IPrice, get_days_in_month
 
 logger = logging.getLogger(__name__)
 
@@ -153,7 +153,7 @@ class HeatingPrice(IPrice):
         """
         sells_series = self.get_sells(agent)
         peak_this_month = calculate_peak_day_avg_cons_kw(sells_series, period.year, period.month)
-        at_least_n_days = 5
+        at_least_n_days = DAYS_USING_PREVIOUS_MONTH_PEAKS
         if period.day < at_least_n_days:
             # Early in the month, we'll also use last month's value, so that we don't underestimate.
             # We will scale that value a bit though, so that we don't overestimate.
@@ -1,7 +1,8 @@
+import copy
 import datetime
 from abc import ABC, abstractmethod
 from calendar import monthrange
-from typing import Dict, Optional
+from typing import Dict, List, Optional, TypeVar
 
 import numpy as np
 
@@ -10,6 +11,10 @@ import pandas as pd
 from tradingplatformpoc.market.trade import Resource
 
 EMPTY_DATETIME_INDEXED_SERIES = pd.Series([], dtype=float, index=pd.to_datetime([], utc=True))
+# Early in a month, before this day of the month, the previous month's peaks are also used to estimate the month's peaks
+DAYS_USING_PREVIOUS_MONTH_PEAKS = 5
+
+PriceType = TypeVar('PriceType', bound='IPrice')
 
 
 class IPrice(ABC):
@@ -74,6 +79,76 @@ class IPrice(ABC):
         self.price_estimates_by_agent[agent_id] = set_in_series(
             self.price_estimates_by_agent[agent_id], period, price_estimate)
 
+    def add_external_sells(self, periods: List[datetime.datetime], external_sell_quantities: List[float]):
+        """
+        Same as add_external_sell, but for several periods at once, which is much faster than one at a time.
+        """
+        self.all_external_sells = add_all_to_series(self.all_external_sells, periods, external_sell_quantities)
+
+    def add_external_sells_for_agent(self, periods: List[datetime.datetime], external_sell_quantities: List[float],
+                                     agent_id: str):
+        """
+        Same as add_external_sell_for_agent, but for several periods at once, which is much faster than one at a time.
+        """
+        if agent_id not in self.external_sells_by_agent.keys():
+            self.external_sells_by_agent[agent_id] = EMPTY_DATETIME_INDEXED_SERIES.copy()
+        self.external_sells_by_agent[agent_id] = add_all_to_series(
+            self.external_sells_by_agent[agent_id], periods, external_sell_quantities)
+
+    def add_price_estimates(self, periods: List[datetime.datetime], price_estimates: List[float]):
+        """
+        Same as add_price_estimate, but for several periods at once, which is much faster than one at a time.
+        """
+        self.price_estimates = set_all_in_series(self.price_estimates, periods, price_estimates)
+
+    def add_price_estimates_for_agent(self, periods: List[datetime.datetime], price_estimates: List[float],
+                                      agent_id: str):
+        """
+        Same as add_price_estimate_for_agent, but for several periods at once, which is much faster than one at a time.
+        """
+        if agent_id not in self.price_estimates_by_agent.keys():
+            self.price_estimates_by_agent[agent_id] = EMPTY_DATETIME_INDEXED_SERIES.copy()
+        self.price_estimates_by_agent[agent_id] = set_all_in_series(
+            self.price_estimates_by_agent[agent_id], periods, price_estimates)
+
+    def copy_without_history(self: PriceType) -> PriceType:
+        """
+        A copy of this object, with no external sells or price estimates recorded. Used to extract outputs in another
+        process, after which what was recorded can be added back with add_history_from.
+        """
+        price_copy = copy.copy(self)
+        price_copy.all_external_sells = EMPTY_DATETIME_INDEXED_SERIES.copy()
+        price_copy.external_sells_by_agent = {}
+        price_copy.price_estimates = EMPTY_DATETIME_INDEXED_SERIES.copy()
+        price_copy.price_estimates_by_agent = {}
+        return price_copy
+
+    def copy_with_history_between(self: PriceType, start: datetime.datetime,
+                                  end: Optional[datetime.datetime] = None) -> PriceType:
+        """
+        A copy of this object, with only the external sells and price estimates recorded for periods from start up to,
+        but not including, end.
+        """
+        price_copy = self.copy_without_history()
+        price_copy.all_external_sells = get_between(self.all_external_sells, start, end)
+        price_copy.external_sells_by_agent = {agent_id: get_between(sells, start, end)
+                                              for agent_id, sells in self.external_sells_by_agent.items()}
+        price_copy.price_estimates = get_between(self.price_estimates, start, end)
+        price_copy.price_estimates_by_agent = {agent_id: get_between(estimates, start, end)
+                                               for agent_id, estimates in self.price_estimates_by_agent.items()}
+        return price_copy
+
+    def add_history_from(self, other: 'IPrice'):
+        """
+        Adds the external sells and price estimates recorded in "other", as if they had been recorded in this object.
+        """
+        self.add_external_sells(other.all_external_sells.index.tolist(), other.all_external_sells.tolist())
+        for agent_id, sells in other.external_sells_by_agent.items():
+            self.add_external_sells_for_agent(sells.index.tolist(), sells.tolist(), agent_id)
+        self.add_price_estimates(other.price_estimates.index.tolist(), other.price_estimates.tolist())
+        for agent_id, price_estimates in other.price_estimates_by_agent.items():
+            self.add_price_estimates_for_agent(price_estimates.index.tolist(), price_estimates.tolist(), agent_id)
+
     def get_retail_price_estimate(self, period: datetime.datetime, agent: Optional[str]) \
             -> float:
         if agent is not None:
@@ -117,3 +192,42 @@ def set_in_series(dt_series: pd.Series, period: datetime.datetime, value: float)
     to_add_in = pd.Series(value, index=[period])
     dt_series = pd.concat([dt_series, to_add_in])
     return dt_series
+
+
+def add_all_to_series(dt_series: pd.Series, periods: List[datetime.datetime], quantities: List[float]) -> pd.Series:
+    """
+    Same as add_to_series, for several periods at once: quantities for periods already in the series are added to the
+    existing values, the others are appended, in one go.
+    """
+    if len(periods) == 0:
+        return dt_series
+    to_add = pd.Series(quantities, index=pd.DatetimeIndex(periods), dtype=float)
+    already_in_series = to_add.index.isin(dt_series.index)
+    if already_in_series.any():
+        existing_periods = to_add.index[already_in_series]
+        dt_series[existing_periods] = dt_series[existing_periods].to_numpy() + to_add[already_in_series].to_numpy()
+        to_add = to_add[~already_in_series]
+    if len(to_add) == 0:
+        return dt_series
+    return pd.concat([dt_series, to_add])
+
+
+def set_all_in_series(dt_series: pd.Series, periods: List[datetime.datetime], values: List[float]) -> pd.Series:
+    """
+    Same as set_in_series, for several periods at once, raising an error if a value already exists for any of them.
+    """
+    if len(periods) == 0:
+        return dt_series
+    to_add_in = pd.Series(values, index=pd.DatetimeIndex(periods), dtype=float)
+    already_in_series = to_add_in.index.isin(dt_series.index)
+    if already_in_series.any():
+        raise ValueError('Tried to overwrite value for period {}'.format(to_add_in.index[already_in_series][0]))
+    return pd.concat([dt_series, to_add_in])
+
+
+def get_between(dt_series: pd.Series, start: datetime.datetime, end: Optional[datetime.datetime] = None) -> pd.Series:
+    """The part of a datetime-indexed series from start up to, but not including, end (if specified)."""
+    in_range = dt_series.index >= start
+    if end is not None:
+        in_range &= dt_series.index < end
+    return dt_series[in_range].copy()
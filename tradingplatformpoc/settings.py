@@ -35,6 +35,31 @@ class Settings(BaseSettings):
     GLPK_PATH: Optional[str] = os.getenv('GLPK_PATH')
     # Whether to run in "test mode", simulating only a few days of the year.
     NOT_FULL_YEAR: bool = os.getenv('NOT_FULL_YEAR', 'False').lower() in ('true', '1', 't')
+    # Number of processes to solve agents' optimization problems in, when the local market is disabled. 1 means that
+    # they are solved one at a time, in the simulation's own process.
+    OPTIMIZATION_WORKERS: int = int(os.getenv('OPTIMIZATION_WORKERS', '1'))
+    # Number of processes to simulate the months of the year in, reconciling where each month starts from with the end
+    # of the previous month. 1 means that the trading horizons are simulated one after the other.
+    MONTH_WORKERS: int = int(os.getenv('MONTH_WORKERS', '1'))
+    # Whether the app runs queued jobs itself, one at a time. If not, jobs are only run by workers, see job_worker.
+    RUN_JOBS_IN_APP: bool = os.getenv('RUN_JOBS_IN_APP', 'True').lower() in ('true', '1', 't')
+    # A job's worker renews its lease on the job every JOB_HEARTBEAT_SECONDS. If the lease hasn't been renewed in
+    # JOB_LEASE_SECONDS, for example because the worker was shut down, the job is resumed by another worker.
+    JOB_HEARTBEAT_SECONDS: float = float(os.getenv('JOB_HEARTBEAT_SECONDS', '60'))
+    JOB_LEASE_SECONDS: float = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+    # A job that has been taken by workers this many times without finishing, for example because it makes its worker
+    # process crash, is marked as failed instead of being taken again.
+    JOB_MAX_ATTEMPTS: int = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    # Number of batches of outputs that can wait to be written to the database, while the simulation goes on. 0 means
+    # that the simulation waits for each batch to be written.
+    OUTPUT_QUEUE_SIZE: int = int(os.getenv('OUTPUT_QUEUE_SIZE', '1'))
+    # Directory in which to cache solutions of optimization problems, for reuse by later jobs. No caching if not set.
+    SOLUTION_CACHE_DIR: Optional[str] = os.getenv('SOLUTION_CACHE_DIR')
+    # Directory in which to write every solved optimization model, for benchmarking solvers (see model_export and
+    # solver_benchmark). No models are written if not set.
+    MODEL_EXPORT_DIR: Optional[str] = os.getenv('MODEL_EXPORT_DIR')
+    # File format of exported models: "mps" or "lp"
+    MODEL_EXPORT_FORMAT: str = os.getenv('MODEL_EXPORT_FORMAT', 'mps')
 
 
 settings = Settings()
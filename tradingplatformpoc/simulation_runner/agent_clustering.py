@@ -0,0 +1,306 @@
+import datetime
+import functools
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+import pandas as pd
+
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from tradingplatformpoc.agent.block_agent import BlockAgent
+from tradingplatformpoc.constants import ACC_TANK_TEMPERATURE
+from tradingplatformpoc.digitaltwin.battery import Battery
+from tradingplatformpoc.digitaltwin.static_digital_twin import StaticDigitalTwin, add_series_or_none
+from tradingplatformpoc.market.trade import Resource, Trade, TradeMetadataKey
+from tradingplatformpoc.simulation_runner.chalmers_interface import ChalmersOutputs, DECIMALS_TO_ROUND_TO
+from tradingplatformpoc.trading_platform_utils import add_to_nested_dict, should_use_summer_mode, \
+    water_volume_to_energy
+
+logger = logging.getLogger(__name__)
+
+"""
+For large communities, block agents with similar load profiles and assets can be merged into aggregate agents, which
+are optimized in place of their members: this gives much smaller local market problems. An aggregate agent's load
+profiles and asset capacities are the sums of its members', and its trades and metadata are split back between its
+members, in proportion to each member's share of the resource or asset in question, before they are saved.
+The approximation lies in the energy that members of an aggregate agent would have traded with each other: within the
+aggregate agent this is netted, without the losses and internal fees of the local market. This energy is saved as
+AGENT_CLUSTERING_ERROR metadata. Transfer limits between agents and the LEC apply to each aggregate agent as a whole.
+"""
+
+RESOURCES = [Resource.ELECTRICITY, Resource.HIGH_TEMP_HEAT, Resource.LOW_TEMP_HEAT, Resource.COOLING]
+DIGITAL_TWIN_SERIES = ['electricity_usage', 'space_heating_usage', 'hot_water_usage', 'cooling_usage',
+                       'electricity_production', 'space_heating_production', 'hot_water_production',
+                       'cooling_production']
+
+# What members' shares of an aggregate agent's results are based on
+ELECTRICITY = 'electricity'
+HEAT = 'heat'
+COOLING = 'cooling'
+BATTERY = 'battery'
+ACC_TANK = 'acc_tank'
+BITES = 'bites'
+HEAT_PUMP = 'heat_pump'
+BOOSTER = 'booster'
+ATEMP = 'atemp'
+
+TRADE_SHARE_BASES = {Resource.ELECTRICITY: ELECTRICITY,
+                     Resource.HIGH_TEMP_HEAT: HEAT,
+                     Resource.LOW_TEMP_HEAT: HEAT,
+                     Resource.COOLING: COOLING}
+METADATA_SHARE_BASES = {TradeMetadataKey.BATTERY_LEVEL: BATTERY,
+                        TradeMetadataKey.ACC_TANK_LEVEL: ACC_TANK,
+                        TradeMetadataKey.SHALLOW_STORAGE_REL: BITES,
+                        TradeMetadataKey.DEEP_STORAGE_REL: BITES,
+                        TradeMetadataKey.SHALLOW_STORAGE_ABS: BITES,
+                        TradeMetadataKey.DEEP_STORAGE_ABS: BITES,
+                        TradeMetadataKey.SHALLOW_LOSS: BITES,
+                        TradeMetadataKey.DEEP_LOSS: BITES,
+                        TradeMetadataKey.SHALLOW_CHARGE: BITES,
+                        TradeMetadataKey.FLOW_SHALLOW_TO_DEEP: BITES,
+                        TradeMetadataKey.HP_COOL_PROD: HEAT_PUMP,
+                        TradeMetadataKey.HP_LOW_HEAT_PROD: HEAT_PUMP}
+# Levels relative to the asset's capacity, which are the same for all members that have the asset
+RELATIVE_LEVELS = [TradeMetadataKey.BATTERY_LEVEL, TradeMetadataKey.ACC_TANK_LEVEL,
+                   TradeMetadataKey.SHALLOW_STORAGE_REL, TradeMetadataKey.DEEP_STORAGE_REL]
+
+
+class AgentClusters:
+    """
+    Block agents merged into aggregate agents, and each member's share of its aggregate agent's results. Clusters with
+    a single member are optimized as they are.
+    """
+    aggregate_agents: List[BlockAgent]
+    # Member agents' guids of each aggregate agent, by the aggregate agent's guid
+    members: Dict[str, List[str]]
+    # (aggregate agent guid, (share basis, (member guid, share)))
+    shares: Dict[str, Dict[str, Dict[str, float]]]
+    # Energy netted within the aggregate agents, rather than traded between their members, per period
+    clustering_error: Dict[datetime.datetime, float]
+
+    def __init__(self, clusters: List[List[BlockAgent]], periods: List[datetime.datetime]):
+        self.aggregate_agents = []
+        self.members = {}
+        self.shares = {}
+        error = np.zeros(len(periods))
+        for cluster in clusters:
+            if len(cluster) == 1:
+                self.aggregate_agents.append(cluster[0])
+                continue
+            guid = 'Agent cluster {}'.format(len(self.members) + 1)
+            usage = get_usage(cluster, periods)
+            self.aggregate_agents.append(merge_agents(cluster, guid))
+            self.members[guid] = [agent.guid for agent in cluster]
+            self.shares[guid] = get_member_shares(cluster, usage)
+            error += get_clustering_error(usage)
+            logger.info('{} merges {}'.format(guid, ', '.join(self.members[guid])))
+        self.clustering_error = {period: round(value, DECIMALS_TO_ROUND_TO)
+                                 for period, value in zip(periods, error.tolist())}
+
+
+def cluster_agents(block_agents: List[BlockAgent], n_clusters: int, periods: List[datetime.datetime]) \
+        -> AgentClusters:
+    """
+    Clusters the block agents into (around) n_clusters aggregate agents, using Ward's hierarchical clustering on their
+    load profile and asset features (see get_agent_features). Agents whose heat pumps produce cooling are only merged
+    with each other, as are those whose heat pumps don't.
+    """
+    weighted_features = get_weighted_features(get_agent_features(block_agents, periods))
+    positions = {agent.guid: i_agent for i_agent, agent in enumerate(block_agents)}
+    groups: Dict[bool, List[int]] = {}
+    for i_agent, agent in enumerate(block_agents):
+        groups.setdefault(agent.digital_twin.hp_produce_cooling, []).append(i_agent)
+    counts = allocate_clusters([len(indices) for indices in groups.values()], n_clusters)
+    clusters: List[List[BlockAgent]] = []
+    for indices, count in zip(groups.values(), counts):
+        values = weighted_features.iloc[indices].to_numpy()
+        if len(indices) <= count:
+            labels = np.arange(len(indices))
+        else:
+            labels = fcluster(linkage(values, method='ward'), t=count, criterion='maxclust')
+        for label in np.unique(labels):
+            clusters.append([block_agents[indices[i]] for i in np.flatnonzero(labels == label)])
+    # Keep the order of the agents, as far as possible
+    clusters.sort(key=lambda cluster: positions[cluster[0].guid])
+    logger.info('Merged {} block agents into {} aggregate agents'.format(len(block_agents), len(clusters)))
+    return AgentClusters(clusters, periods)
+
+
+def allocate_clusters(group_sizes: List[int], n_clusters: int) -> List[int]:
+    """
+    Distributes n_clusters between groups of agents in proportion to their sizes, with at least one cluster per group
+    and at most one per agent.
+    """
+    total = sum(group_sizes)
+    counts = [min(size, max(1, n_clusters * size // total)) for size in group_sizes]
+    while sum(counts) < n_clusters and any(count < size for count, size in zip(counts, group_sizes)):
+        # Next cluster goes to the group with the most agents per cluster
+        i_group = max((i for i in range(len(counts)) if counts[i] < group_sizes[i]),
+                      key=lambda i: group_sizes[i] / counts[i])
+        counts[i_group] += 1
+    return counts
+
+
+def get_usage(block_agents: List[BlockAgent], periods: List[datetime.datetime]) -> np.ndarray:
+    """Net usage of each agent (first axis) of each resource in RESOURCES (second axis) for each period (last axis)."""
+    return np.array([[agent.get_actual_usage_for_periods(periods, resource) for resource in RESOURCES]
+                     for agent in block_agents], dtype=float).reshape(len(block_agents), len(RESOURCES), len(periods))
+
+
+def get_agent_features(block_agents: List[BlockAgent], periods: List[datetime.datetime]) -> pd.DataFrame:
+    """
+    Features of each agent, with one row per agent, in two blocks of columns: "load" holds its average demand and
+    supply of each resource per hour of the day and per month, which describe both the size and the shape of its load
+    profiles, and "assets" holds the sizes of its battery, heat pumps, accumulator tank and BITES.
+    """
+    usage = get_usage(block_agents, periods)
+    flows = np.concatenate([np.clip(usage, 0, None), np.clip(-usage, 0, None)], axis=1)
+    flows_per_period = pd.DataFrame(flows.reshape(-1, len(periods)).T)
+    period_index = pd.DatetimeIndex(periods)
+    profiles = [flows_per_period.groupby(period_index.hour.to_numpy()).mean(),
+                flows_per_period.groupby(period_index.month.to_numpy()).mean()]
+    load = np.concatenate([profile.to_numpy().T.reshape(len(block_agents), -1) for profile in profiles], axis=1)
+    guids = [agent.guid for agent in block_agents]
+    assets = pd.DataFrame({'battery_capacity': [agent.battery.max_capacity_kwh for agent in block_agents],
+                           'heat_pump_max_input': [agent.heat_pump_max_input for agent in block_agents],
+                           'heat_pump_max_output': [agent.heat_pump_max_output for agent in block_agents],
+                           'booster_pump_max_input': [agent.booster_pump_max_input for agent in block_agents],
+                           'booster_pump_max_output': [agent.booster_pump_max_output for agent in block_agents],
+                           'acc_tank_volume': [agent.acc_tank_volume for agent in block_agents],
+                           'bites_area': [agent.digital_twin.atemp * agent.frac_for_bites for agent in block_agents]},
+                          index=guids)
+    return pd.concat({'load': pd.DataFrame(load, index=guids), 'assets': assets}, axis=1)
+
+
+def get_weighted_features(features: pd.DataFrame) -> pd.DataFrame:
+    """
+    Standardizes the features, and weights them so that each block of columns (see get_agent_features) counts
+    equally in the distances between agents, however many columns it has.
+    """
+    std = features.std(ddof=0)
+    standardized = ((features - features.mean()) / std.replace(0.0, 1.0)).fillna(0.0)
+    n_varying_per_block = (std > 0).groupby(level=0).sum().clip(lower=1)
+    n_varying = n_varying_per_block.reindex(features.columns.get_level_values(0)).to_numpy(dtype=float)
+    return standardized / np.sqrt(n_varying)
+
+
+def merge_agents(members: List[BlockAgent], guid: str) -> BlockAgent:
+    """An agent with the summed load profiles and asset capacities of the members."""
+    twins = [member.digital_twin for member in members]
+    series = {name: functools.reduce(add_series_or_none, [getattr(twin, name) for twin in twins])
+              for name in DIGITAL_TWIN_SERIES}
+    atemp = sum(twin.atemp for twin in twins)
+    digital_twin = StaticDigitalTwin(atemp=atemp, hp_produce_cooling=twins[0].hp_produce_cooling, **series)
+    batteries = [member.battery for member in members]
+    capacity = sum(battery.max_capacity_kwh for battery in batteries)
+    if capacity > 0:
+        battery = Battery(max_capacity_kwh=capacity,
+                          max_charge_rate_fraction=sum(b.charge_limit_kwh for b in batteries) / capacity,
+                          max_discharge_rate_fraction=sum(b.discharge_limit_kwh for b in batteries) / capacity,
+                          discharging_efficiency=sum(b.discharging_efficiency * b.max_capacity_kwh
+                                                     for b in batteries) / capacity)
+    else:
+        battery = batteries[0]
+    bites_area = sum(member.digital_twin.atemp * member.frac_for_bites for member in members)
+    return BlockAgent(digital_twin=digital_twin,
+                      heat_pump_max_input=sum(member.heat_pump_max_input for member in members),
+                      heat_pump_max_output=sum(member.heat_pump_max_output for member in members),
+                      booster_pump_max_input=sum(member.booster_pump_max_input for member in members),
+                      booster_pump_max_output=sum(member.booster_pump_max_output for member in members),
+                      acc_tank_capacity=water_volume_to_energy(sum(member.acc_tank_volume for member in members),
+                                                               ACC_TANK_TEMPERATURE),
+                      frac_for_bites=bites_area / atemp if atemp > 0 else 0.0,
+                      battery=battery, guid=guid)
+
+
+def get_member_shares(members: List[BlockAgent], usage: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """
+    Each member's share of the aggregate agent's trades and metadata, per share basis. Trades of a resource are
+    split by the members' energy exchanged of it (net usage, summed over periods regardless of sign), usage being as
+    returned by get_usage. Assets' metadata are split by the members' capacities.
+    """
+    exchanged = np.abs(usage).sum(axis=2)
+    weights = {ELECTRICITY: exchanged[:, 0],
+               HEAT: exchanged[:, 1] + exchanged[:, 2],
+               COOLING: exchanged[:, 3],
+               BATTERY: [member.battery.max_capacity_kwh for member in members],
+               ACC_TANK: [member.acc_tank_volume for member in members],
+               BITES: [member.digital_twin.atemp * member.frac_for_bites for member in members],
+               HEAT_PUMP: [member.heat_pump_max_output for member in members],
+               BOOSTER: [member.booster_pump_max_output for member in members],
+               ATEMP: [member.digital_twin.atemp for member in members]}
+    guids = [member.guid for member in members]
+    return {basis: get_shares(guids, np.asarray(basis_weights, dtype=float))
+            for basis, basis_weights in weights.items()}
+
+
+def get_shares(guids: List[str], weights: np.ndarray) -> Dict[str, float]:
+    """Each member's share of the total weight. Shared equally if the total is zero."""
+    total = weights.sum()
+    if total <= 0:
+        return {guid: 1 / len(guids) for guid in guids}
+    return {guid: weight / total for guid, weight in zip(guids, weights.tolist())}
+
+
+def get_clustering_error(usage: np.ndarray) -> np.ndarray:
+    """
+    The energy [kWh] that the members would have traded with each other, but which is netted within the aggregate
+    agent, for each period: the sum of the members' absolute net usage minus the absolute net usage of the aggregate,
+    summed over resources. usage is as returned by get_usage.
+    """
+    return (np.abs(usage).sum(axis=0) - np.abs(usage.sum(axis=0))).sum(axis=0)
+
+
+def get_metadata_share_basis(key: TradeMetadataKey, period: datetime.datetime) -> str:
+    if key == TradeMetadataKey.HP_HIGH_HEAT_PROD:
+        # High-temperature heat comes from the booster heat pumps in the summer mode
+        return BOOSTER if should_use_summer_mode(period) else HEAT_PUMP
+    return METADATA_SHARE_BASES.get(key, ATEMP)
+
+
+def disaggregate_outputs(outputs: ChalmersOutputs, agent_clusters: AgentClusters) -> ChalmersOutputs:
+    """
+    Splits aggregate agents' trades and metadata between their members, and adds the clustering error for the periods
+    of the outputs.
+    """
+    trades: List[Trade] = []
+    for trade in outputs.trades:
+        if trade.source in agent_clusters.shares and not trade.by_external:
+            trades.extend(split_trade(trade, agent_clusters.shares[trade.source][TRADE_SHARE_BASES[trade.resource]]))
+        else:
+            trades.append(trade)
+
+    metadata_per_agent_and_period: Dict[TradeMetadataKey, Dict[str, Dict[datetime.datetime, float]]] = {}
+    for key, values_per_agent in outputs.metadata_per_agent_and_period.items():
+        metadata_per_agent_and_period[key] = {}
+        for guid, values in values_per_agent.items():
+            if guid not in agent_clusters.shares:
+                metadata_per_agent_and_period[key][guid] = values
+                continue
+            for period, value in values.items():
+                shares = agent_clusters.shares[guid][get_metadata_share_basis(key, period)]
+                for member_guid, share in shares.items():
+                    if share > 0:
+                        member_value = value if key in RELATIVE_LEVELS else round(value * share, DECIMALS_TO_ROUND_TO)
+                        add_to_nested_dict(metadata_per_agent_and_period[key], member_guid, period, member_value)
+
+    metadata_per_period = dict(outputs.metadata_per_period)
+    periods = set(trade.period for trade in outputs.trades).union(
+        *[values.keys() for values in outputs.metadata_per_period.values()])
+    metadata_per_period[TradeMetadataKey.AGENT_CLUSTERING_ERROR] = {
+        period: agent_clusters.clustering_error[period] for period in sorted(periods)
+        if period in agent_clusters.clustering_error}
+    return ChalmersOutputs(trades, metadata_per_agent_and_period, metadata_per_period, outputs.solve_infos,
+                           outputs.input_seconds)
+
+
+def split_trade(trade: Trade, shares: Dict[str, float]) -> List[Trade]:
+    """One trade per member with a share, at the same price, for its share of the quantity."""
+    loss = max(0.0, 1 - trade.quantity_post_loss / trade.quantity_pre_loss)
+    return [Trade(period=trade.period, action=trade.action, resource=trade.resource,
+                  quantity=trade.quantity_pre_loss * share, price=trade.price, source=member_guid,
+                  by_external=trade.by_external, market=trade.market, loss=loss, tax_paid=trade.tax_paid,
+                  grid_fee_paid=trade.grid_fee_paid)
+            for member_guid, share in shares.items() if share > 0]
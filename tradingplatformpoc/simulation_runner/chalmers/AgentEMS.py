@@ -1,33 +1,106 @@
-from typing import Tuple
+import time
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
-import pandas as pd
 import pyomo.environ as pyo
 from pyomo.opt import OptSolver, SolverResults
 
-from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError, PERC_OF_HT_COVERABLE_BY_LT
+from tradingplatformpoc.simulation_runner.chalmers.domain import PERC_OF_HT_COVERABLE_BY_LT
+from tradingplatformpoc.simulation_runner.chalmers.feasibility import check_agent_inputs
+from tradingplatformpoc.simulation_runner.chalmers.matrix_model import MatrixModel, add_storage_balance
+from tradingplatformpoc.simulation_runner.chalmers.relaxation import solve_with_relaxed_binaries
 
 
-def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Series,
+def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: np.ndarray,
                 external_heat_buy_price: float, battery_capacity: float,
                 battery_charge_rate: float, battery_discharge_rate: float, SOCBES0: float, HP_Cproduct_active: bool,
                 heatpump_COP: float, heatpump_max_power: float, heatpump_max_heat: float,
                 build_area: float, SOCTES0: float,
                 thermalstorage_max_temp: float, thermalstorage_volume: float, BITES_Eshallow0: float,
-                BITES_Edeep0: float, borehole: bool, elec_consumption: pd.Series, hot_water_heatdem: pd.Series,
-                space_heating_heatdem: pd.Series, cold_consumption: pd.Series, pv_production: pd.Series,
-                excess_high_temp_heat: pd.Series,
+                BITES_Edeep0: float, borehole: bool, elec_consumption: np.ndarray, hot_water_heatdem: np.ndarray,
+                space_heating_heatdem: np.ndarray, cold_consumption: np.ndarray, pv_production: np.ndarray,
+                excess_high_temp_heat: np.ndarray,
                 elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
                 hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
                 hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float,
                 battery_efficiency: float = 0.95,
                 max_elec_transfer_to_external: float = 1000, max_heat_transfer_to_external: float = 1000,
                 thermalstorage_efficiency: float = 0.98,
-                heat_trans_loss: float = 0.05, trading_horizon: int = 24) \
+                heat_trans_loss: float = 0.05, trading_horizon: int = 24, time_step: int = 1,
+                warm_start_model: Optional[pyo.ConcreteModel] = None, relax_binaries: bool = False) \
         -> Tuple[pyo.ConcreteModel, SolverResults]:
     """
     This function should be exposed to AFRY's trading simulator in some way.
     Which solver to use should be left to the user, so we'll request it as an argument, rather than defining it here.
+    Time series inputs are 1-dimensional arrays (pd.Series work too), of which the first trading_horizon values are
+    used.
+    Each time step of the model is time_step hours long, as in CEMS_function.solve_model.
+    If warm_start_model is specified (typically this agent's model for the previous horizon), its variable values are
+    copied, hour by hour, and given to the solver as a MIP start. The solver needs to support this.
+    If relax_binaries is True, the model is solved approximately (see relaxation.solve_with_relaxed_binaries), without
+    warm start.
     """
+    model = build_model(month=month, agent=agent, nordpool_price=nordpool_price,
+                        external_heat_buy_price=external_heat_buy_price, battery_capacity=battery_capacity,
+                        battery_charge_rate=battery_charge_rate, battery_discharge_rate=battery_discharge_rate,
+                        SOCBES0=SOCBES0, HP_Cproduct_active=HP_Cproduct_active, heatpump_COP=heatpump_COP,
+                        heatpump_max_power=heatpump_max_power, heatpump_max_heat=heatpump_max_heat,
+                        build_area=build_area, SOCTES0=SOCTES0, thermalstorage_max_temp=thermalstorage_max_temp,
+                        thermalstorage_volume=thermalstorage_volume, BITES_Eshallow0=BITES_Eshallow0,
+                        BITES_Edeep0=BITES_Edeep0, borehole=borehole, elec_consumption=elec_consumption,
+                        hot_water_heatdem=hot_water_heatdem, space_heating_heatdem=space_heating_heatdem,
+                        cold_consumption=cold_consumption, pv_production=pv_production,
+                        excess_high_temp_heat=excess_high_temp_heat, elec_trans_fee=elec_trans_fee,
+                        elec_tax_fee=elec_tax_fee, incentive_fee=incentive_fee,
+                        hist_top_three_elec_peak_load=hist_top_three_elec_peak_load,
+                        elec_peak_load_fee=elec_peak_load_fee,
+                        hist_monthly_heat_peak_energy=hist_monthly_heat_peak_energy,
+                        heat_peak_load_fee=heat_peak_load_fee, battery_efficiency=battery_efficiency,
+                        max_elec_transfer_to_external=max_elec_transfer_to_external,
+                        max_heat_transfer_to_external=max_heat_transfer_to_external,
+                        thermalstorage_efficiency=thermalstorage_efficiency, heat_trans_loss=heat_trans_loss,
+                        trading_horizon=trading_horizon, time_step=time_step)
+
+    # Solve!
+    solve_start = time.perf_counter()
+    if relax_binaries:
+        results = solve_with_relaxed_binaries(solver, model)
+    elif warm_start_model is not None:
+        copy_variable_values(warm_start_model, model)
+        results = solver.solve(model, warmstart=True)
+    else:
+        results = solver.solve(model)
+    # The time spent in the solver only, so that callers can tell it from the time spent building the model
+    results.solver.wallclock_time = time.perf_counter() - solve_start
+
+    return model, results
+
+
+def build_model(month: int, agent: int, nordpool_price: np.ndarray,
+                external_heat_buy_price: float, battery_capacity: float,
+                battery_charge_rate: float, battery_discharge_rate: float, SOCBES0: float, HP_Cproduct_active: bool,
+                heatpump_COP: float, heatpump_max_power: float, heatpump_max_heat: float,
+                build_area: float, SOCTES0: float,
+                thermalstorage_max_temp: float, thermalstorage_volume: float, BITES_Eshallow0: float,
+                BITES_Edeep0: float, borehole: bool, elec_consumption: np.ndarray, hot_water_heatdem: np.ndarray,
+                space_heating_heatdem: np.ndarray, cold_consumption: np.ndarray, pv_production: np.ndarray,
+                excess_high_temp_heat: np.ndarray,
+                elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
+                hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
+                hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float,
+                battery_efficiency: float = 0.95,
+                max_elec_transfer_to_external: float = 1000, max_heat_transfer_to_external: float = 1000,
+                thermalstorage_efficiency: float = 0.98,
+                heat_trans_loss: float = 0.05, trading_horizon: int = 24, time_step: int = 1) -> pyo.ConcreteModel:
+    """
+    Builds the agent's optimization model, without solving it. See solve_model.
+    """
+    nordpool_price = np.asarray(nordpool_price, dtype=float)
+    elec_consumption = np.asarray(elec_consumption, dtype=float)
+    hot_water_heatdem = np.asarray(hot_water_heatdem, dtype=float)
+    space_heating_heatdem = np.asarray(space_heating_heatdem, dtype=float)
+    cold_consumption = np.asarray(cold_consumption, dtype=float)
+    pv_production = np.asarray(pv_production, dtype=float)
+    excess_high_temp_heat = np.asarray(excess_high_temp_heat, dtype=float)
     # Some validation (should probably raise specific exceptions rather than use assert)
     assert len(elec_consumption) >= trading_horizon
     assert len(hot_water_heatdem) >= trading_horizon
@@ -46,15 +119,10 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
     # This assumes that HTESdis and HTEScha are in kW.
     kwh_per_deg = thermalstorage_volume * 4182 * 998 / 3600000
 
-    # Check the maximum cooling produced vs the cooling demand
-    max_cooling_produced_for_1_hour = (heatpump_COP - 1) * heatpump_max_power if HP_Cproduct_active else \
-        np.inf if borehole and month not in [6, 7, 8] else 0
-    too_big_cool_demand = cold_consumption.gt(max_cooling_produced_for_1_hour)
-    if too_big_cool_demand.any():
-        problematic_hours = [i for i, x in enumerate(too_big_cool_demand) if x]
-        raise CEMSError(message='Unfillable cooling demand for agent',
-                        agent_indices=[agent],
-                        hour_indices=problematic_hours)
+    check_agent_inputs(month, agent, elec_consumption, pv_production, cold_consumption, battery_discharge_rate,
+                       heatpump_cop=heatpump_COP, heatpump_max_power=heatpump_max_power,
+                       hp_cproduct_active=HP_Cproduct_active, borehole=borehole,
+                       max_elec_transfer_to_external=max_elec_transfer_to_external, trading_horizon=trading_horizon)
 
     # Build model for each agent
     model = pyo.ConcreteModel(name=f"Agent{agent}")
@@ -62,7 +130,8 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
     model.T = pyo.Set(initialize=range(int(trading_horizon)))  # index of time intervals
     # Parameters
     model.penalty = pyo.Param(initialize=1000)
-    model.nordpool_price = pyo.Param(model.T, initialize=nordpool_price)
+    model.time_step = pyo.Param(initialize=time_step)  # hours per time interval
+    model.nordpool_price = pyo.Param(model.T, initialize=horizon_values(nordpool_price, trading_horizon))
     model.elec_peak_load_fee = pyo.Param(initialize=elec_peak_load_fee)
     model.elec_trans_fee = pyo.Param(initialize=elec_trans_fee)
     model.elec_tax_fee = pyo.Param(initialize=elec_tax_fee)
@@ -76,13 +145,13 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
                                                                           for i in range(3)})
     model.Hist_monthly_heat_peak_energy = pyo.Param(initialize=hist_monthly_heat_peak_energy)
     # Demand data of agents
-    model.Pdem = pyo.Param(model.T, initialize=lambda m, t: elec_consumption.iloc[t])
-    model.Hhw = pyo.Param(model.T, initialize=lambda m, t: hot_water_heatdem.iloc[t])
-    model.Hsh = pyo.Param(model.T, initialize=lambda m, t: space_heating_heatdem.iloc[t])
-    model.Cld = pyo.Param(model.T, initialize=lambda m, t: cold_consumption.iloc[t])
+    model.Pdem = pyo.Param(model.T, initialize=horizon_values(elec_consumption, trading_horizon))
+    model.Hhw = pyo.Param(model.T, initialize=horizon_values(hot_water_heatdem, trading_horizon))
+    model.Hsh = pyo.Param(model.T, initialize=horizon_values(space_heating_heatdem, trading_horizon))
+    model.Cld = pyo.Param(model.T, initialize=horizon_values(cold_consumption, trading_horizon))
     # Supply data of agents
-    model.Ppv = pyo.Param(model.T, initialize=lambda m, t: pv_production.iloc[t])
-    model.Hsh_excess_high_temp = pyo.Param(model.T, initialize=lambda m, t: excess_high_temp_heat.iloc[t])
+    model.Ppv = pyo.Param(model.T, initialize=horizon_values(pv_production, trading_horizon))
+    model.Hsh_excess_high_temp = pyo.Param(model.T, initialize=horizon_values(excess_high_temp_heat, trading_horizon))
     # BES data
     model.effe = pyo.Param(initialize=battery_efficiency)
     model.SOCBES0 = pyo.Param(initialize=SOCBES0)
@@ -157,7 +226,8 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
 
     # Objective function: minimize the total charging cost (eq. 1 of the report)
     def obj_rule(model):
-        return sum(
+        # Costs are per hour, so they are multiplied by the number of hours in each time step
+        return model.time_step * sum(
             # Electricity cost terms:
             model.Pbuy_market[t] * (
                         model.nordpool_price[t] + model.elec_trans_fee + model.elec_tax_fee)  # Purchasing cost
@@ -254,7 +324,7 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
                                             + model.hist_top_three_elec_peak_load[2]) / 3
 
     def heat_peak_load1(model):
-        return model.daily_heat_peak_energy >= sum(model.Hbuy_market[t] for t in model.T)
+        return model.daily_heat_peak_energy >= model.time_step * sum(model.Hbuy_market[t] for t in model.T)
 
     def heat_peak_load2(model):
         return model.monthly_heat_peak_energy >= model.daily_heat_peak_energy
@@ -273,11 +343,11 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
     # (eqs. 22 to 28 of the report)
     def BITES_Eshallow_balance(model, t):
         if t == 0:
-            return model.Energy_shallow[0] == model.BITES_Eshallow0 + model.Hcha_shallow[0] \
-                   - model.Flow[0] - model.Loss_shallow[0]
+            return model.Energy_shallow[0] == model.BITES_Eshallow0 \
+                   + model.time_step * (model.Hcha_shallow[0] - model.Flow[0]) - model.Loss_shallow[0]
         else:
-            return model.Energy_shallow[t] == model.Energy_shallow[t - 1] + model.Hcha_shallow[t] \
-                   - model.Flow[t] - model.Loss_shallow[t]
+            return model.Energy_shallow[t] == model.Energy_shallow[t - 1] \
+                   + model.time_step * (model.Hcha_shallow[t] - model.Flow[t]) - model.Loss_shallow[t]
 
     def BITES_shallow_dis(model, t):
         # Negative charge means discharge
@@ -288,13 +358,13 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
 
     def BITES_Edeep_balance(model, t):
         if t == 0:
-            return model.Energy_deep[0] == model.BITES_Edeep0 + model.Flow[0] - model.Loss_deep[0]
+            return model.Energy_deep[0] == model.BITES_Edeep0 + model.time_step * model.Flow[0] - model.Loss_deep[0]
         else:
-            return model.Energy_deep[t] == model.Energy_deep[t - 1] + model.Flow[t] - model.Loss_deep[t]
+            return model.Energy_deep[t] == model.Energy_deep[t - 1] + model.time_step * model.Flow[t] \
+                   - model.Loss_deep[t]
 
     def BITES_Eflow_between_storages(model, t):
-        if (model.Energy_shallow_cap == 0) or (model.Energy_deep_cap == 0):
-            return model.Flow[t] == 0
+        # Only used with a building area, so the capacities are non-zero
         return model.Flow[t] == ((model.Energy_shallow[t] / model.Energy_shallow_cap)
                                  - (model.Energy_deep[t] / model.Energy_deep_cap)) * model.Kval
 
@@ -308,13 +378,13 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
         if t == 0:
             return model.Loss_shallow[0] == 0
         else:
-            return model.Loss_shallow[t] == model.Energy_shallow[t - 1] * (1 - model.Kloss_shallow)
+            return model.Loss_shallow[t] == model.Energy_shallow[t - 1] * (1 - model.Kloss_shallow ** model.time_step)
 
     def BITES_deep_loss(model, t):
         if t == 0:
             return model.Loss_deep[0] == 0
         else:
-            return model.Loss_deep[t] == model.Energy_deep[t - 1] * (1 - model.Kloss_deep)
+            return model.Loss_deep[t] == model.Energy_deep[t - 1] * (1 - model.Kloss_deep ** model.time_step)
 
     def BITES_max_Hdis_shallow(model, t):
         # Negative charge means discharge
@@ -333,17 +403,14 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
 
     # State of charge modelling
     def BES_Ebalance(model, t):
-        if model.Emax_BES == 0:
-            # No storage capacity, then we need to ensure that charge and discharge are 0 as well.
-            return model.Pcha[t] + model.Pdis[t] == model.Emax_BES
-        # We assume that model.effe cannot be 0
+        # Only used with a battery. We assume that model.effe cannot be 0
         if t == 0:
-            charge = model.Pcha[0] * model.effe / model.Emax_BES
-            discharge = model.Pdis[0] / (model.Emax_BES * model.effe)
+            charge = model.time_step * model.Pcha[0] * model.effe / model.Emax_BES
+            discharge = model.time_step * model.Pdis[0] / (model.Emax_BES * model.effe)
             return model.SOCBES[0] == model.SOCBES0 + charge - discharge
         else:
-            charge = model.Pcha[t] * model.effe / model.Emax_BES
-            discharge = model.Pdis[t] / (model.Emax_BES * model.effe)
+            charge = model.time_step * model.Pcha[t] * model.effe / model.Emax_BES
+            discharge = model.time_step * model.Pdis[t] / (model.Emax_BES * model.effe)
             return model.SOCBES[t] == model.SOCBES[t - 1] + charge - discharge
 
     def BES_final_SOC(model):
@@ -403,13 +470,10 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
 
     # State of charge modelling
     def HTES_Ebalance(model, t):
-        if model.kwh_per_deg == 0:
-            # No storage capacity, then we need to ensure that charge and discharge are 0 as well.
-            return model.HTESdis[t] + model.HTEScha[t] == model.kwh_per_deg
-        # We assume that model.efft and model.Tmax_TES cannot be 0
+        # Only used with an accumulator tank. We assume that model.efft and model.Tmax_TES cannot be 0
         charge = model.HTEScha[t] * model.efft / (model.kwh_per_deg * model.Tmax_TES)
         discharge = model.HTESdis[t] / ((model.kwh_per_deg * model.Tmax_TES) * model.efft)
-        charge_change = charge - discharge
+        charge_change = model.time_step * (charge - discharge)
         if t == 0:
             return model.SOCTES[0] == model.SOCTES0 + charge_change
         else:
@@ -444,36 +508,300 @@ def solve_model(solver: OptSolver, month: int, agent: int, nordpool_price: pd.Se
     else:
         model.con_agent_Cbalance_winter = pyo.Constraint(model.T, rule=agent_Cbalance_winter)
     model.con_Hhw_supplied_by_HTES = pyo.Constraint(model.T, rule=Hhw_supplied_by_HTES)
-    model.con_BITES_Eshallow_balance = pyo.Constraint(model.T, rule=BITES_Eshallow_balance)
-    model.con_BITES_shallow_dis = pyo.Constraint(model.T, rule=BITES_shallow_dis)
-    model.con_BITES_shallow_cha = pyo.Constraint(model.T, rule=BITES_shallow_cha)
-    model.con_BITES_Edeep_balance = pyo.Constraint(model.T, rule=BITES_Edeep_balance)
-    model.con_BITES_Eflow_between_storages = pyo.Constraint(model.T, rule=BITES_Eflow_between_storages)
-    model.con_BITES_shallow_loss = pyo.Constraint(model.T, rule=BITES_shallow_loss)
-    model.con_BITES_deep_loss = pyo.Constraint(model.T, rule=BITES_deep_loss)
-    model.con_BITES_max_Hdis_shallow = pyo.Constraint(model.T, rule=BITES_max_Hdis_shallow)
-    model.con_BITES_max_Hcha_shallow = pyo.Constraint(model.T, rule=BITES_max_Hcha_shallow)
-    model.con_BITES_max_Eshallow = pyo.Constraint(model.T, rule=BITES_max_Eshallow)
-    model.con_BITES_max_Edeep = pyo.Constraint(model.T, rule=BITES_max_Edeep)
-    model.con_BES_max_dis = pyo.Constraint(model.T, rule=BES_max_dis)
-    model.con_BES_max_cha = pyo.Constraint(model.T, rule=BES_max_cha)
-    model.con_BES_Ebalance = pyo.Constraint(model.T, rule=BES_Ebalance)
-    model.con_BES_final_SOC = pyo.Constraint(rule=BES_final_SOC)
-    model.con_BES_remove_binaries = pyo.Constraint(model.T, rule=BES_remove_binaries)
-    model.con_HP_Hproduct = pyo.Constraint(model.T, rule=HP_Hproduct)
-    model.con_HP_Cproduct = pyo.Constraint(model.T, rule=HP_Cproduct)
-    model.con_max_HP_Hproduct = pyo.Constraint(model.T, rule=max_HP_Hproduct)
-    model.con_HP_Pconsump = pyo.Constraint(model.T, rule=HP_Pconsump)
-    model.con_max_HP_Pconsumption = pyo.Constraint(model.T, rule=max_HP_Pconsumption)
-    model.con_max_HP_Pconsumption_Hmod = pyo.Constraint(model.T, rule=max_HP_Pconsumption_Hmod)
-    model.con_max_HP_Pconsumption_Cmod = pyo.Constraint(model.T, rule=max_HP_Pconsumption_Cmod)
-    model.con_max_HP_Pconsumption_Coordinator = pyo.Constraint(model.T, rule=max_HP_Pconsumption_Coordinate)
-    model.con_max_HTES_dis = pyo.Constraint(model.T, rule=max_HTES_dis)
-    model.con_max_HTES_cha = pyo.Constraint(model.T, rule=max_HTES_cha)
-    model.con_HTES_Ebalance = pyo.Constraint(model.T, rule=HTES_Ebalance)
-    model.con_HTES_final_SOC = pyo.Constraint(rule=HTES_final_SOC)
+    # Constraints concerning only one asset are added if the agent has it, otherwise the asset's variables are fixed.
+    # Fixed variables are passed to the solver as constants, so the size of the problem scales with the assets
+    # actually installed.
+    if build_area != 0:
+        model.con_BITES_Eshallow_balance = pyo.Constraint(model.T, rule=BITES_Eshallow_balance)
+        model.con_BITES_shallow_dis = pyo.Constraint(model.T, rule=BITES_shallow_dis)
+        model.con_BITES_shallow_cha = pyo.Constraint(model.T, rule=BITES_shallow_cha)
+        model.con_BITES_Edeep_balance = pyo.Constraint(model.T, rule=BITES_Edeep_balance)
+        model.con_BITES_Eflow_between_storages = pyo.Constraint(model.T, rule=BITES_Eflow_between_storages)
+        model.con_BITES_shallow_loss = pyo.Constraint(model.T, rule=BITES_shallow_loss)
+        model.con_BITES_deep_loss = pyo.Constraint(model.T, rule=BITES_deep_loss)
+        model.con_BITES_max_Hdis_shallow = pyo.Constraint(model.T, rule=BITES_max_Hdis_shallow)
+        model.con_BITES_max_Hcha_shallow = pyo.Constraint(model.T, rule=BITES_max_Hcha_shallow)
+        model.con_BITES_max_Eshallow = pyo.Constraint(model.T, rule=BITES_max_Eshallow)
+        model.con_BITES_max_Edeep = pyo.Constraint(model.T, rule=BITES_max_Edeep)
+    else:
+        for variable in [model.Energy_shallow, model.Hcha_shallow, model.Flow, model.Loss_shallow,
+                         model.Energy_deep, model.Loss_deep]:
+            variable.fix(0)
+    if battery_capacity != 0:
+        model.con_BES_max_dis = pyo.Constraint(model.T, rule=BES_max_dis)
+        model.con_BES_max_cha = pyo.Constraint(model.T, rule=BES_max_cha)
+        model.con_BES_Ebalance = pyo.Constraint(model.T, rule=BES_Ebalance)
+        model.con_BES_final_SOC = pyo.Constraint(rule=BES_final_SOC)
+        model.con_BES_remove_binaries = pyo.Constraint(model.T, rule=BES_remove_binaries)
+    else:
+        model.Pcha.fix(0)
+        model.Pdis.fix(0)
+        model.SOCBES.fix(SOCBES0)
+    if heatpump_max_power != 0:
+        model.con_HP_Hproduct = pyo.Constraint(model.T, rule=HP_Hproduct)
+        model.con_HP_Cproduct = pyo.Constraint(model.T, rule=HP_Cproduct)
+        model.con_max_HP_Hproduct = pyo.Constraint(model.T, rule=max_HP_Hproduct)
+        model.con_HP_Pconsump = pyo.Constraint(model.T, rule=HP_Pconsump)
+        model.con_max_HP_Pconsumption = pyo.Constraint(model.T, rule=max_HP_Pconsumption)
+        model.con_max_HP_Pconsumption_Hmod = pyo.Constraint(model.T, rule=max_HP_Pconsumption_Hmod)
+        model.con_max_HP_Pconsumption_Cmod = pyo.Constraint(model.T, rule=max_HP_Pconsumption_Cmod)
+        model.con_max_HP_Pconsumption_Coordinator = pyo.Constraint(model.T, rule=max_HP_Pconsumption_Coordinate)
+    else:
+        for variable in [model.Hhp, model.Chp, model.Php, model.Php_Hmod, model.Php_Cmod, model.Uhp_Hmod,
+                         model.Uhp_Cmod]:
+            variable.fix(0)
+    if kwh_per_deg != 0:
+        model.con_max_HTES_dis = pyo.Constraint(model.T, rule=max_HTES_dis)
+        model.con_max_HTES_cha = pyo.Constraint(model.T, rule=max_HTES_cha)
+        model.con_HTES_Ebalance = pyo.Constraint(model.T, rule=HTES_Ebalance)
+        model.con_HTES_final_SOC = pyo.Constraint(rule=HTES_final_SOC)
+    else:
+        model.HTEScha.fix(0)
+        model.HTESdis.fix(0)
+        model.SOCTES.fix(SOCTES0)
 
-    # Solve!
-    results = solver.solve(model)
+    return model
 
-    return model, results
+
+def horizon_values(values: np.ndarray, trading_horizon: int) -> Dict[int, float]:
+    """Bulk initializer for parameters indexed by hour: maps each hour of the horizon to its value."""
+    return dict(enumerate(values[:trading_horizon].tolist()))
+
+
+def copy_variable_values(source: pyo.ConcreteModel, target: pyo.ConcreteModel):
+    """
+    Sets the values of the variables of "target" to those of the same variable, at the same index, in "source". Fixed
+    variables keep their values, which build_model fixed them to.
+    """
+    for target_var in target.component_objects(pyo.Var):
+        source_var = source.find_component(target_var.name)
+        if source_var is None:
+            continue
+        for index, var_data in target_var.items():
+            if index in source_var and not var_data.fixed:
+                var_data.set_value(source_var[index].value, skip_validation=True)
+
+
+def solve_models_batched(solver: OptSolver, agent_inputs: List[Dict[str, Any]], relax_binaries: bool = False) \
+        -> Tuple[List[pyo.ConcreteModel], SolverResults]:
+    """
+    Builds the models of several agents (agent_inputs holding the arguments to build_model for each of them), and
+    solves them together, as one block-diagonal problem: the agents' models are blocks of one model, with the sum of
+    their objectives as its objective. Since the agents are independent, each block's solution is the same as if the
+    agent's model had been solved on its own, but with only one solver invocation.
+    Returns the agents' models, in the order of agent_inputs, and the solver results for the combined model.
+    If relax_binaries is True, the combined model is solved approximately, see relaxation.solve_with_relaxed_binaries.
+    """
+    combined_model = pyo.ConcreteModel(name="Agents")
+    models: List[pyo.ConcreteModel] = []
+    for inputs in agent_inputs:
+        model = build_model(**inputs)
+        model.obj.deactivate()
+        combined_model.add_component('agent{}'.format(len(models)), model)
+        models.append(model)
+    combined_model.obj = pyo.Objective(expr=sum(model.obj.expr for model in models), sense=pyo.minimize)
+    solve_start = time.perf_counter()
+    results = solve_with_relaxed_binaries(solver, combined_model) if relax_binaries else solver.solve(combined_model)
+    results.solver.wallclock_time = time.perf_counter() - solve_start
+    return models, results
+
+
+def build_matrix_model(month: int, agent: int, nordpool_price: np.ndarray,
+                       external_heat_buy_price: float, battery_capacity: float,
+                       battery_charge_rate: float, battery_discharge_rate: float, SOCBES0: float,
+                       HP_Cproduct_active: bool, heatpump_COP: float, heatpump_max_power: float,
+                       heatpump_max_heat: float, build_area: float, SOCTES0: float,
+                       thermalstorage_max_temp: float, thermalstorage_volume: float, BITES_Eshallow0: float,
+                       BITES_Edeep0: float, borehole: bool, elec_consumption: np.ndarray,
+                       hot_water_heatdem: np.ndarray, space_heating_heatdem: np.ndarray,
+                       cold_consumption: np.ndarray, pv_production: np.ndarray, excess_high_temp_heat: np.ndarray,
+                       elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
+                       hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
+                       hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float,
+                       battery_efficiency: float = 0.95,
+                       max_elec_transfer_to_external: float = 1000, max_heat_transfer_to_external: float = 1000,
+                       thermalstorage_efficiency: float = 0.98,
+                       heat_trans_loss: float = 0.05, trading_horizon: int = 24, time_step: int = 1) -> MatrixModel:
+    """
+    Assembles the same agent model as solve_model, but directly as a sparse matrix, skipping Pyomo expression
+    generation and model file writing. Takes the same arguments as solve_model. The Pyomo model is the reference
+    implementation: any change to the equations there needs to be mirrored here (test_matrix_model compares the two).
+    Variables have the same names as in the Pyomo model, shaped (hour,).
+    """
+    T = int(trading_horizon)
+    penalty = 1000
+    Kloss_shallow = 0.9913
+    Kloss_deep = 0.9963
+    price = np.asarray(nordpool_price, dtype=float)[:T]
+    Pdem = np.asarray(elec_consumption, dtype=float)[:T]
+    Hhw = np.asarray(hot_water_heatdem, dtype=float)[:T]
+    Hsh = np.asarray(space_heating_heatdem, dtype=float)[:T]
+    Cld = np.asarray(cold_consumption, dtype=float)[:T]
+    Ppv = np.asarray(pv_production, dtype=float)[:T]
+    Hsh_excess_high_temp = np.asarray(excess_high_temp_heat, dtype=float)[:T]
+    Energy_shallow_cap = 0.046 * build_area
+    Energy_deep_cap = 0.291 * build_area
+    Heat_rate_shallow = 0.023 * build_area
+    Kval = 0.03 * build_area
+    kwh_per_deg = thermalstorage_volume * 4182 * 998 / 3600000
+    Pmax_market = max_elec_transfer_to_external
+    Hmax_market = max_heat_transfer_to_external
+
+    mm = MatrixModel(name=f"Agent{agent}")
+    # Variables
+    Pbuy_market = mm.add_variable('Pbuy_market', T)
+    Psell_market = mm.add_variable('Psell_market', T)
+    U_power_buy_sell_market = mm.add_binary_variable('U_power_buy_sell_market', T)
+    Hbuy_market = mm.add_variable('Hbuy_market', T)
+    Pcha = mm.add_variable('Pcha', T)
+    Pdis = mm.add_variable('Pdis', T)
+    SOCBES = mm.add_variable('SOCBES', T, ub=1)
+    Hhp = mm.add_variable('Hhp', T)
+    Chp = mm.add_variable('Chp', T)
+    Php = mm.add_variable('Php', T)
+    Php_Hmod = mm.add_variable('Php_Hmod', T)
+    Php_Cmod = mm.add_variable('Php_Cmod', T)
+    Uhp_Hmod = mm.add_binary_variable('Uhp_Hmod', T)
+    Uhp_Cmod = mm.add_binary_variable('Uhp_Cmod', T)
+    HTEScha = mm.add_variable('HTEScha', T)
+    HTESdis = mm.add_variable('HTESdis', T)
+    SOCTES = mm.add_variable('SOCTES', T, ub=1)
+    Energy_shallow = mm.add_variable('Energy_shallow', T)
+    Hcha_shallow = mm.add_variable('Hcha_shallow', T, lb=-np.inf)
+    Flow = mm.add_variable('Flow', T, lb=-np.inf)
+    Loss_shallow = mm.add_variable('Loss_shallow', T)
+    Energy_deep = mm.add_variable('Energy_deep', T)
+    Loss_deep = mm.add_variable('Loss_deep', T)
+    heat_dump = mm.add_variable('heat_dump', T)
+    cool_dump = mm.add_variable('cool_dump', T)
+    daily_elec_peak_load = mm.add_variable('daily_elec_peak_load')
+    avg_elec_peak_load = mm.add_variable('avg_elec_peak_load')
+    daily_heat_peak_energy = mm.add_variable('daily_heat_peak_energy')
+    monthly_heat_peak_energy = mm.add_variable('monthly_heat_peak_energy')
+
+    # Objective function (see obj_rule), with the terms that don't depend on t summed over the horizon
+    mm.add_to_objective(time_step * (price + elec_trans_fee + elec_tax_fee), Pbuy_market)
+    mm.add_to_objective(-time_step * (price + incentive_fee), Psell_market)
+    mm.add_to_objective(time_step * T * elec_peak_load_fee, avg_elec_peak_load)
+    mm.add_to_objective(time_step * external_heat_buy_price, Hbuy_market)
+    mm.add_to_objective(time_step * T * heat_peak_load_fee / 24, monthly_heat_peak_energy)
+    mm.add_to_objective(time_step * penalty, heat_dump)
+    mm.add_to_objective(time_step * penalty, cool_dump)
+
+    # Variables of absent assets are fixed, as in build_model
+    if build_area == 0:
+        for columns in [Energy_shallow, Hcha_shallow, Flow, Loss_shallow, Energy_deep, Loss_deep]:
+            mm.fix_variables(columns)
+    if battery_capacity == 0:
+        mm.fix_variables(Pcha)
+        mm.fix_variables(Pdis)
+        mm.fix_variables(SOCBES, SOCBES0)
+    if heatpump_max_power == 0:
+        for columns in [Hhp, Chp, Php, Php_Hmod, Php_Cmod, Uhp_Hmod, Uhp_Cmod]:
+            mm.fix_variables(columns)
+    if kwh_per_deg == 0:
+        mm.fix_variables(HTEScha)
+        mm.fix_variables(HTESdis)
+        mm.fix_variables(SOCTES, SOCTES0)
+
+    # Constraints, with the same names as in solve_model
+    mm.add_constraints('con_max_Pbuy_market', [(1, Pbuy_market), (-Pmax_market, U_power_buy_sell_market)], '<=', 0)
+    mm.add_constraints('con_max_Hbuy_market', [(1, Hbuy_market)], '<=', Hmax_market)
+    mm.add_constraints('con_max_Psell_market', [(1, Psell_market), (Pmax_market, U_power_buy_sell_market)], '<=',
+                       Pmax_market)
+    mm.add_constraints('con_elec_peak_load1', [(1, daily_elec_peak_load), (-1, Pbuy_market), (1, Psell_market)],
+                       '>=', 0)
+    mm.add_constraints('con_elec_peak_load2', [(1, avg_elec_peak_load), (-1 / 3, daily_elec_peak_load)],
+                       '>=', (hist_top_three_elec_peak_load[0] + hist_top_three_elec_peak_load[1]) / 3)
+    mm.add_constraints('con_elec_peak_load3', [(1, avg_elec_peak_load)], '>=',
+                       (hist_top_three_elec_peak_load[0] + hist_top_three_elec_peak_load[1]
+                        + hist_top_three_elec_peak_load[2]) / 3)
+    mm.add_constraints('con_heat_peak_load1',
+                       [(1, daily_heat_peak_energy)] + [(-time_step, Hbuy_market[t]) for t in range(T)],
+                       '>=', 0)
+    mm.add_constraints('con_heat_peak_load2', [(1, monthly_heat_peak_energy), (-1, daily_heat_peak_energy)], '>=', 0)
+    mm.add_constraints('con_heat_peak_load3', [(1, monthly_heat_peak_energy)], '>=', hist_monthly_heat_peak_energy)
+    mm.add_constraints('con_agent_Pbalance', [(1, Pdis), (1, Pbuy_market), (-1, Php), (-1, Pcha), (-1, Psell_market)],
+                       '==', Pdem - Ppv)
+    if kwh_per_deg != 0:
+        mm.add_constraints('con_agent_Hbalance',
+                           [(1, Hbuy_market), (1, Hhp), (-1, Hcha_shallow), (-1, HTEScha), (-1, heat_dump)],
+                           '==', Hsh - Hsh_excess_high_temp)
+    else:
+        mm.add_constraints('con_agent_Hbalance', [(1, Hbuy_market), (1, Hhp), (-1, Hcha_shallow), (-1, heat_dump)],
+                           '==', Hsh + Hhw - Hsh_excess_high_temp)
+    if month in [6, 7, 8]:
+        mm.add_constraints('con_agent_Cbalance_summer', [(1, Chp), (-1, cool_dump)], '==', Cld)
+    else:
+        mm.add_constraints('con_agent_Cbalance_winter', [(1, Chp), (-1, cool_dump)], '==', Cld * (1 - borehole))
+    if kwh_per_deg != 0:
+        mm.add_constraints('con_Hhw_supplied_by_HTES', [(1, HTESdis)], '==', Hhw)
+    if build_area != 0:
+        add_storage_balance(mm, 'con_BITES_Eshallow_balance', Energy_shallow,
+                            [(time_step, Hcha_shallow), (-time_step, Flow), (-1, Loss_shallow)], BITES_Eshallow0)
+        mm.add_constraints('con_BITES_shallow_dis', [(-1, Hcha_shallow)], '<=', Heat_rate_shallow)
+        mm.add_constraints('con_BITES_shallow_cha', [(1, Hcha_shallow)], '<=', Heat_rate_shallow)
+        add_storage_balance(mm, 'con_BITES_Edeep_balance', Energy_deep, [(time_step, Flow), (-1, Loss_deep)],
+                            BITES_Edeep0)
+        mm.add_constraints('con_BITES_Eflow_between_storages',
+                           [(1, Flow), (-Kval / Energy_shallow_cap, Energy_shallow),
+                            (Kval / Energy_deep_cap, Energy_deep)], '==', 0)
+        mm.add_constraints('con_BITES_shallow_loss', [(1, Loss_shallow[:1])], '==', 0)
+        mm.add_constraints('con_BITES_shallow_loss',
+                           [(1, Loss_shallow[1:]), (-(1 - Kloss_shallow ** time_step), Energy_shallow[:-1])], '==', 0)
+        mm.add_constraints('con_BITES_deep_loss', [(1, Loss_deep[:1])], '==', 0)
+        mm.add_constraints('con_BITES_deep_loss',
+                           [(1, Loss_deep[1:]), (-(1 - Kloss_deep ** time_step), Energy_deep[:-1])], '==', 0)
+        mm.add_constraints('con_BITES_max_Hdis_shallow', [(-1, Hcha_shallow)], '<=', Hsh)
+        mm.add_constraints('con_BITES_max_Hcha_shallow', [(1, Hcha_shallow)], '<=',
+                           heatpump_max_heat + Hmax_market - Hsh)
+        mm.add_constraints('con_BITES_max_Eshallow', [(1, Energy_shallow)], '<=', Energy_shallow_cap)
+        mm.add_constraints('con_BITES_max_Edeep', [(1, Energy_deep)], '<=', Energy_deep_cap)
+    if battery_capacity != 0:
+        mm.add_constraints('con_BES_max_dis', [(1, Pdis)], '<=', battery_discharge_rate)
+        mm.add_constraints('con_BES_max_cha', [(1, Pcha)], '<=', battery_charge_rate)
+        add_storage_balance(mm, 'con_BES_Ebalance', SOCBES,
+                            [(time_step * battery_efficiency / battery_capacity, Pcha),
+                             (-time_step / (battery_capacity * battery_efficiency), Pdis)], SOCBES0)
+        mm.add_constraints('con_BES_final_SOC', [(1, SOCBES[-1])], '==', SOCBES0)
+        if (battery_discharge_rate == 0) or (battery_charge_rate == 0):
+            mm.add_constraints('con_BES_remove_binaries', [(1, Pcha), (1, Pdis)], '<=', 0)
+        else:
+            mm.add_constraints('con_BES_remove_binaries',
+                               [(1 / battery_discharge_rate, Pdis), (1 / battery_charge_rate, Pcha)], '<=', 1)
+    if heatpump_max_power != 0:
+        mm.add_constraints('con_HP_Hproduct', [(1, Hhp), (-heatpump_COP, Php)], '==', 0)
+        if HP_Cproduct_active:
+            mm.add_constraints('con_HP_Cproduct', [(1, Chp), (-(heatpump_COP - 1), Php_Cmod)], '==', 0)
+        else:
+            mm.add_constraints('con_HP_Cproduct', [(1, Chp)], '==', 0)
+        mm.add_constraints('con_max_HP_Hproduct', [(1, Hhp)], '<=', heatpump_max_heat)
+        mm.add_constraints('con_HP_Pconsump', [(1, Php), (-1, Php_Hmod), (-1, Php_Cmod)], '==', 0)
+        mm.add_constraints('con_max_HP_Pconsumption', [(1, Php)], '<=', heatpump_max_power)
+        mm.add_constraints('con_max_HP_Pconsumption_Hmod', [(1, Php_Hmod), (-heatpump_max_power, Uhp_Hmod)], '<=', 0)
+        mm.add_constraints('con_max_HP_Pconsumption_Cmod', [(1, Php_Cmod), (-heatpump_max_power, Uhp_Cmod)], '<=', 0)
+        mm.add_constraints('con_max_HP_Pconsumption_Coordinator', [(1, Uhp_Hmod), (1, Uhp_Cmod)], '<=', 1)
+    if kwh_per_deg != 0:
+        tes_capacity = kwh_per_deg * thermalstorage_max_temp
+        mm.add_constraints('con_max_HTES_dis', [(1, HTESdis)], '<=', tes_capacity)
+        mm.add_constraints('con_max_HTES_cha', [(1, HTEScha)], '<=', tes_capacity)
+        add_storage_balance(mm, 'con_HTES_Ebalance', SOCTES,
+                            [(time_step * thermalstorage_efficiency / tes_capacity, HTEScha),
+                             (-time_step / (tes_capacity * thermalstorage_efficiency), HTESdis)], SOCTES0)
+        mm.add_constraints('con_HTES_final_SOC', [(1, SOCTES[-1])], '==', SOCTES0)
+
+    # Inputs that outputs are read from (see chalmers_interface.MatrixModelValues), named as in the Pyomo model
+    mm.add_parameter('time_step', time_step)
+    mm.add_parameter('nordpool_price', price, hourly=True)
+    mm.add_parameter('elec_peak_load_fee', elec_peak_load_fee)
+    mm.add_parameter('elec_trans_fee', elec_trans_fee)
+    mm.add_parameter('elec_tax_fee', elec_tax_fee)
+    mm.add_parameter('incentive_fee', incentive_fee)
+    mm.add_parameter('Hprice_energy', external_heat_buy_price)
+    mm.add_parameter('heat_peak_load_fee', heat_peak_load_fee)
+    mm.add_parameter('Heat_trans_loss', heat_trans_loss)
+    mm.add_parameter('SOCBES0', SOCBES0)
+    mm.add_parameter('SOCTES0', SOCTES0)
+    mm.add_parameter('BITES_Eshallow0', BITES_Eshallow0)
+    mm.add_parameter('BITES_Edeep0', BITES_Edeep0)
+    return mm
@@ -1,16 +1,20 @@
-from typing import List, Tuple
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
-import pandas as pd
-
 import pyomo.environ as pyo
+from pyomo.core.base.param import IndexedParam
 from pyomo.opt import OptSolver, SolverResults
 
-from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError, PERC_OF_HT_COVERABLE_BY_LT
+from tradingplatformpoc.simulation_runner.chalmers.domain import PERC_OF_HT_COVERABLE_BY_LT
+from tradingplatformpoc.simulation_runner.chalmers.feasibility import check_lec_inputs
+from tradingplatformpoc.simulation_runner.chalmers.matrix_model import MatrixModel, add_storage_balance
+from tradingplatformpoc.simulation_runner.chalmers.relaxation import solve_with_relaxed_binaries
+from tradingplatformpoc.simulation_runner.solution_cache import Solution, get_optimal_results, load_solution
 
 
-def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int, nordpool_price: pd.Series,
+def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int, nordpool_price: np.ndarray,
                 external_heat_buy_price: float,
                 battery_capacity: List[float], battery_charge_rate: List[float], battery_discharge_rate: List[float],
                 SOCBES0: List[float], HP_Cproduct_active: list[bool], heatpump_COP: List[float],
@@ -19,9 +23,9 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
                 booster_heatpump_max_heat: List[float], build_area: List[float], SOCTES0: List[float],
                 thermalstorage_max_temp: List[float], thermalstorage_volume: List[float], BITES_Eshallow0: List[float],
                 BITES_Edeep0: List[float], borehole: List[bool],
-                elec_consumption: pd.DataFrame, hot_water_heatdem: pd.DataFrame, space_heating_heatdem: pd.DataFrame,
-                cold_consumption: pd.DataFrame, pv_production: pd.DataFrame,
-                excess_low_temp_heat: pd.DataFrame, excess_high_temp_heat: pd.DataFrame,
+                elec_consumption: np.ndarray, hot_water_heatdem: np.ndarray, space_heating_heatdem: np.ndarray,
+                cold_consumption: np.ndarray, pv_production: np.ndarray,
+                excess_low_temp_heat: np.ndarray, excess_high_temp_heat: np.ndarray,
                 elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
                 hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
                 hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float,
@@ -30,27 +34,109 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
                 max_heat_transfer_between_agents: float = 500, max_heat_transfer_to_external: float = 1000,
                 chiller_COP: float = 1.5, chiller_heat_recovery: bool = True, Pccmax: float = 100,
                 thermalstorage_efficiency: float = 0.98,
-                heat_trans_loss: float = 0.05, cold_trans_loss: float = 0.05, trading_horizon: int = 24) \
+                heat_trans_loss: float = 0.05, cold_trans_loss: float = 0.05, trading_horizon: int = 24,
+                time_step: int = 1, model_store: Optional[Dict[tuple, pyo.ConcreteModel]] = None,
+                warm_start: bool = False,
+                solution: Optional[Solution] = None, relax_binaries: bool = False) \
         -> Tuple[pyo.ConcreteModel, SolverResults]:
     """
     This function should be exposed to AFRY's trading simulator in some way.
     Which solver to use should be left to the user, so we'll request it as an argument, rather than defining it here.
+    If a model_store is passed in, models are built once per structural signature and kept in the store. Later calls
+    with the same signature (typically the next trading horizon) only update the mutable parameters of the stored
+    model, instead of constructing the whole model again.
+    Time series inputs are arrays with one row per agent and one column per hour (DataFrames work too), of which the
+    first trading_horizon columns are used.
+    Each time step of the model is time_step hours long: time series, transfer limits and the rates of assets are then
+    average powers over each time step, while storage levels and the heat peak are energies. With a time_step of more
+    than one hour, time series should be aggregated to that resolution (see time_aggregation), and trading_horizon is
+    the number of time steps.
+    If warm_start is True, and the model is taken from the model_store, the solver is given the previous solution of
+    the model (i.e. that of the previous horizon, hour by hour) as a MIP start. The solver needs to support this.
+    If a solution is passed in (a previously found solution for exactly the same inputs), it is loaded into the model
+    instead of solving it.
+    If relax_binaries is True, the model is solved approximately (see relaxation.solve_with_relaxed_binaries), without
+    warm start.
     """
+    model, has_previous_solution = prepare_model(
+        summer_mode, month, n_agents, nordpool_price, external_heat_buy_price, battery_capacity, battery_charge_rate,
+        battery_discharge_rate, SOCBES0, HP_Cproduct_active, heatpump_COP, heatpump_max_power, heatpump_max_heat,
+        booster_heatpump_COP, booster_heatpump_max_power, booster_heatpump_max_heat, build_area, SOCTES0,
+        thermalstorage_max_temp, thermalstorage_volume, BITES_Eshallow0, BITES_Edeep0, borehole, elec_consumption,
+        hot_water_heatdem, space_heating_heatdem, cold_consumption, pv_production, excess_low_temp_heat,
+        excess_high_temp_heat, elec_trans_fee, elec_tax_fee, incentive_fee, hist_top_three_elec_peak_load,
+        elec_peak_load_fee, hist_monthly_heat_peak_energy, heat_peak_load_fee, battery_efficiency,
+        max_elec_transfer_between_agents, max_elec_transfer_to_external, max_heat_transfer_between_agents,
+        max_heat_transfer_to_external, chiller_COP, chiller_heat_recovery, Pccmax, thermalstorage_efficiency,
+        heat_trans_loss, cold_trans_loss, trading_horizon, time_step, model_store)
+
+    # Solve!
+    solve_start = time.perf_counter()
+    if solution is not None:
+        load_solution(model, solution)
+        results = get_optimal_results()
+    elif relax_binaries:
+        results = solve_with_relaxed_binaries(solver, model)
+    elif warm_start and has_previous_solution:
+        results = solver.solve(model, warmstart=True)
+    else:
+        results = solver.solve(model)
+    # The time spent in the solver only, so that callers can tell it from the time spent building the model
+    results.solver.wallclock_time = time.perf_counter() - solve_start
+    return model, results
+
+
+def prepare_model(summer_mode: bool, month: int, n_agents: int, nordpool_price: np.ndarray,
+                  external_heat_buy_price: float,
+                  battery_capacity: List[float], battery_charge_rate: List[float], battery_discharge_rate: List[float],
+                  SOCBES0: List[float], HP_Cproduct_active: list[bool], heatpump_COP: List[float],
+                  heatpump_max_power: List[float], heatpump_max_heat: List[float],
+                  booster_heatpump_COP: List[float], booster_heatpump_max_power: List[float],
+                  booster_heatpump_max_heat: List[float], build_area: List[float], SOCTES0: List[float],
+                  thermalstorage_max_temp: List[float], thermalstorage_volume: List[float],
+                  BITES_Eshallow0: List[float], BITES_Edeep0: List[float], borehole: List[bool],
+                  elec_consumption: np.ndarray, hot_water_heatdem: np.ndarray, space_heating_heatdem: np.ndarray,
+                  cold_consumption: np.ndarray, pv_production: np.ndarray,
+                  excess_low_temp_heat: np.ndarray, excess_high_temp_heat: np.ndarray,
+                  elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
+                  hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
+                  hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float,
+                  battery_efficiency: float = 0.95,
+                  max_elec_transfer_between_agents: float = 500, max_elec_transfer_to_external: float = 1000,
+                  max_heat_transfer_between_agents: float = 500, max_heat_transfer_to_external: float = 1000,
+                  chiller_COP: float = 1.5, chiller_heat_recovery: bool = True, Pccmax: float = 100,
+                  thermalstorage_efficiency: float = 0.98,
+                  heat_trans_loss: float = 0.05, cold_trans_loss: float = 0.05, trading_horizon: int = 24,
+                  time_step: int = 1, model_store: Optional[Dict[tuple, pyo.ConcreteModel]] = None) \
+        -> Tuple[pyo.ConcreteModel, bool]:
+    """
+    Validates the inputs, and returns a model holding their data, ready to be solved, along with whether the model was
+    taken from the model_store (its variable values are then those of its previous solution). Takes the same arguments
+    as solve_model.
+    """
+    nordpool_price = np.asarray(nordpool_price, dtype=float)
+    elec_consumption = np.asarray(elec_consumption, dtype=float)
+    hot_water_heatdem = np.asarray(hot_water_heatdem, dtype=float)
+    space_heating_heatdem = np.asarray(space_heating_heatdem, dtype=float)
+    cold_consumption = np.asarray(cold_consumption, dtype=float)
+    pv_production = np.asarray(pv_production, dtype=float)
+    excess_low_temp_heat = np.asarray(excess_low_temp_heat, dtype=float)
+    excess_high_temp_heat = np.asarray(excess_high_temp_heat, dtype=float)
     # Some validation (should probably raise specific exceptions rather than use assert)
-    assert len(elec_consumption.index) == n_agents
-    assert len(hot_water_heatdem.index) == n_agents
-    assert len(space_heating_heatdem.index) == n_agents
-    assert len(cold_consumption.index) == n_agents
-    assert len(pv_production.index) == n_agents
-    assert len(excess_low_temp_heat.index) == n_agents
-    assert len(excess_high_temp_heat.index) == n_agents
-    assert len(elec_consumption.columns) >= trading_horizon
-    assert len(hot_water_heatdem.columns) >= trading_horizon
-    assert len(space_heating_heatdem.columns) >= trading_horizon
-    assert len(cold_consumption.columns) >= trading_horizon
-    assert len(pv_production.columns) >= trading_horizon
-    assert len(excess_low_temp_heat.columns) >= trading_horizon
-    assert len(excess_high_temp_heat.columns) >= trading_horizon
+    assert elec_consumption.shape[0] == n_agents
+    assert hot_water_heatdem.shape[0] == n_agents
+    assert space_heating_heatdem.shape[0] == n_agents
+    assert cold_consumption.shape[0] == n_agents
+    assert pv_production.shape[0] == n_agents
+    assert excess_low_temp_heat.shape[0] == n_agents
+    assert excess_high_temp_heat.shape[0] == n_agents
+    assert elec_consumption.shape[1] >= trading_horizon
+    assert hot_water_heatdem.shape[1] >= trading_horizon
+    assert space_heating_heatdem.shape[1] >= trading_horizon
+    assert cold_consumption.shape[1] >= trading_horizon
+    assert pv_production.shape[1] >= trading_horizon
+    assert excess_low_temp_heat.shape[1] >= trading_horizon
+    assert excess_high_temp_heat.shape[1] >= trading_horizon
     assert len(nordpool_price) >= trading_horizon
     assert battery_efficiency > 0  # Otherwise we'll get division by zero
     assert thermalstorage_efficiency > 0  # Otherwise we'll get division by zero
@@ -63,75 +149,108 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
     # 1000 should be removed from the following formulation:
     kwh_per_deg = [v * 4182 * 998 / 3600000 for v in thermalstorage_volume]
 
-    # When running in summer mode, agents cannot buy high-temperature district heating, so all hot water needs to be
-    # covered, to (1 - PERC_OF_HT_COVERABLE_BY_LT) * 100%, by the booster heat pump, but agents can also use the
-    # accumulator tank.
-    # (Hhw - acc_tank_capacity) * (1 - PERC_OF_HT_COVERABLE_BY_LT) must be covered by booster in any given hour.
-    # If the booster cannot cover this, we won't be able to find a solution (the TerminationCondition will be
-    # 'infeasible'). Easier to raise this error straight away, so that the user knows specifically what went wrong.
-    if summer_mode:
-        max_tank_dis = [x * y for x, y in zip(kwh_per_deg, thermalstorage_max_temp)]
-        must_be_covered_by_booster = hot_water_heatdem.sub(max_tank_dis, axis=0) * (1 - PERC_OF_HT_COVERABLE_BY_LT)
-        too_big_hot_water_demand = must_be_covered_by_booster.gt(booster_heatpump_max_heat, axis=0).any(axis=1)
-        if sum(too_big_hot_water_demand) > 0:
-            problematic_agent_indices = [i for i, x in enumerate(too_big_hot_water_demand) if x]
-            raise CEMSError(message='Unfillable hot water demand for agent(s)',
-                            agent_indices=problematic_agent_indices,
-                            hour_indices=[])
-
-    # Similarly, check the maximum cooling produced vs the cooling demand
-    max_cooling_produced_for_1_hour = Pccmax * chiller_COP \
-                                      + sum([(hp_cop - 1) * max_php if hpc_active else
-                                             np.inf if has_bh and month not in [6, 7, 8] else 0
-                                             for hp_cop, max_php, hpc_active, has_bh in
-                                             zip(heatpump_COP, heatpump_max_power, HP_Cproduct_active, borehole)])
-    too_big_cool_demand = cold_consumption.sum(axis=0).gt(max_cooling_produced_for_1_hour)
-    if too_big_cool_demand.any():
-        problematic_hours = [i for i, x in enumerate(too_big_cool_demand) if x]
-        raise CEMSError(message='Unfillable cooling demand in LEC',
-                        agent_indices=[],
-                        hour_indices=problematic_hours)
-
+    check_lec_inputs(summer_mode, month, elec_consumption, pv_production, hot_water_heatdem, cold_consumption,
+                     battery_discharge_rate, heatpump_cop=heatpump_COP, heatpump_max_power=heatpump_max_power,
+                     hp_cproduct_active=HP_Cproduct_active, borehole=borehole,
+                     booster_heatpump_max_heat=booster_heatpump_max_heat, kwh_per_deg=kwh_per_deg,
+                     thermalstorage_max_temp=thermalstorage_max_temp,
+                     max_elec_transfer_between_agents=max_elec_transfer_between_agents,
+                     max_elec_transfer_to_external=max_elec_transfer_to_external, chiller_cop=chiller_COP,
+                     chiller_max_power=Pccmax, trading_horizon=trading_horizon)
+
+    # Everything that decides which variables and constraints the model has, or that constraint rules branch on, is part
+    # of the structural signature. Everything else is a mutable parameter, updated for each call.
+    structure_key = (summer_mode, month in [6, 7, 8], n_agents, trading_horizon,
+                     tuple(battery_capacity), tuple(battery_charge_rate), tuple(battery_discharge_rate),
+                     tuple(HP_Cproduct_active), tuple(heatpump_COP), tuple(heatpump_max_power),
+                     tuple(heatpump_max_heat), tuple(booster_heatpump_COP), tuple(booster_heatpump_max_power),
+                     tuple(booster_heatpump_max_heat), tuple(build_area), tuple(thermalstorage_max_temp),
+                     tuple(kwh_per_deg), tuple(borehole), battery_efficiency,
+                     max_elec_transfer_between_agents, max_elec_transfer_to_external,
+                     max_heat_transfer_between_agents, max_heat_transfer_to_external,
+                     chiller_COP, chiller_heat_recovery, Pccmax, thermalstorage_efficiency,
+                     heat_trans_loss, cold_trans_loss, time_step)
+    model = model_store.get(structure_key) if model_store is not None else None
+    # Variable values of a stored model are those of its previous solution
+    has_previous_solution = model is not None
+    if model is None:
+        model = build_model(summer_mode, month, n_agents, battery_capacity, battery_charge_rate,
+                            battery_discharge_rate, HP_Cproduct_active, heatpump_COP, heatpump_max_power,
+                            heatpump_max_heat, booster_heatpump_COP, booster_heatpump_max_power,
+                            booster_heatpump_max_heat, build_area, thermalstorage_max_temp, kwh_per_deg, borehole,
+                            battery_efficiency, max_elec_transfer_between_agents, max_elec_transfer_to_external,
+                            max_heat_transfer_between_agents, max_heat_transfer_to_external, chiller_COP,
+                            chiller_heat_recovery, Pccmax, thermalstorage_efficiency, heat_trans_loss,
+                            cold_trans_loss, trading_horizon, time_step)
+        if model_store is not None:
+            model_store[structure_key] = model
+    update_model_data(model, nordpool_price, external_heat_buy_price, SOCBES0, SOCTES0, BITES_Eshallow0,
+                      BITES_Edeep0, elec_consumption, hot_water_heatdem, space_heating_heatdem, cold_consumption,
+                      pv_production, excess_low_temp_heat, excess_high_temp_heat, elec_trans_fee, elec_tax_fee,
+                      incentive_fee, hist_top_three_elec_peak_load, elec_peak_load_fee,
+                      hist_monthly_heat_peak_energy, heat_peak_load_fee)
+    return model, has_previous_solution
+
+
+def build_model(summer_mode: bool, month: int, n_agents: int,
+                battery_capacity: List[float], battery_charge_rate: List[float], battery_discharge_rate: List[float],
+                HP_Cproduct_active: List[bool], heatpump_COP: List[float],
+                heatpump_max_power: List[float], heatpump_max_heat: List[float],
+                booster_heatpump_COP: List[float], booster_heatpump_max_power: List[float],
+                booster_heatpump_max_heat: List[float], build_area: List[float],
+                thermalstorage_max_temp: List[float], kwh_per_deg: List[float], borehole: List[bool],
+                battery_efficiency: float,
+                max_elec_transfer_between_agents: float, max_elec_transfer_to_external: float,
+                max_heat_transfer_between_agents: float, max_heat_transfer_to_external: float,
+                chiller_COP: float, chiller_heat_recovery: bool, Pccmax: float,
+                thermalstorage_efficiency: float,
+                heat_trans_loss: float, cold_trans_loss: float, trading_horizon: int,
+                time_step: int = 1) -> pyo.ConcreteModel:
+    """
+    Constructs the LEC model. Prices, demand and supply data, peak load history and start-of-horizon storage levels are
+    mutable parameters, initialized to 0 - use update_model_data to set them before solving.
+    """
     model = pyo.ConcreteModel(name="LEC")
     # Sets
     model.T = pyo.Set(initialize=range(int(trading_horizon)))  # index of time intervals
     model.I = pyo.Set(initialize=range(int(n_agents)))  # index of agents
     # Parameters
     model.penalty = pyo.Param(initialize=1000)
-    model.nordpool_price = pyo.Param(model.T, initialize=nordpool_price)
-    model.elec_peak_load_fee = pyo.Param(initialize=elec_peak_load_fee)
-    model.elec_trans_fee = pyo.Param(initialize=elec_trans_fee)
-    model.elec_tax_fee = pyo.Param(initialize=elec_tax_fee)
-    model.incentive_fee = pyo.Param(initialize=incentive_fee)
-    model.Hprice_energy = pyo.Param(initialize=external_heat_buy_price)
-    model.heat_peak_load_fee = pyo.Param(initialize=heat_peak_load_fee)
+    model.time_step = pyo.Param(initialize=time_step)  # hours per time interval
+    model.nordpool_price = pyo.Param(model.T, mutable=True, initialize=0)
+    model.elec_peak_load_fee = pyo.Param(mutable=True, initialize=0)
+    model.elec_trans_fee = pyo.Param(mutable=True, initialize=0)
+    model.elec_tax_fee = pyo.Param(mutable=True, initialize=0)
+    model.incentive_fee = pyo.Param(mutable=True, initialize=0)
+    model.Hprice_energy = pyo.Param(mutable=True, initialize=0)
+    model.heat_peak_load_fee = pyo.Param(mutable=True, initialize=0)
     # Grid data
     model.Pmax_grid = pyo.Param(initialize=max_elec_transfer_between_agents)
     model.Hmax_grid = pyo.Param(initialize=max_heat_transfer_between_agents)
     model.Pmax_market = pyo.Param(initialize=max_elec_transfer_to_external)
     model.Hmax_market = pyo.Param(initialize=max_heat_transfer_to_external)
-    model.hist_top_three_elec_peak_load = pyo.Param(range(3), initialize={i: hist_top_three_elec_peak_load[i]
-                                                                          for i in range(3)})
-    model.Hist_monthly_heat_peak_energy = pyo.Param(initialize=hist_monthly_heat_peak_energy)
+    model.hist_top_three_elec_peak_load = pyo.Param(range(3), mutable=True, initialize=0)
+    model.Hist_monthly_heat_peak_energy = pyo.Param(mutable=True, initialize=0)
     # Demand data of agents
-    model.Pdem = pyo.Param(model.I, model.T, initialize=lambda m, i, t: elec_consumption.iloc[i, t])
-    model.Hhw = pyo.Param(model.I, model.T, initialize=lambda m, i, t: hot_water_heatdem.iloc[i, t])
-    model.Hsh = pyo.Param(model.I, model.T, initialize=lambda m, i, t: space_heating_heatdem.iloc[i, t])
-    model.Cld = pyo.Param(model.I, model.T, initialize=lambda m, i, t: cold_consumption.iloc[i, t])
+    model.Pdem = pyo.Param(model.I, model.T, mutable=True, initialize=0)
+    model.Hhw = pyo.Param(model.I, model.T, mutable=True, initialize=0)
+    model.Hsh = pyo.Param(model.I, model.T, mutable=True, initialize=0)
+    model.Cld = pyo.Param(model.I, model.T, mutable=True, initialize=0)
+    # 1 if there is a cooling demand, 0 otherwise
+    model.Cld_positive = pyo.Param(model.I, model.T, mutable=True, initialize=0)
     # Supply data of agents
-    model.Ppv = pyo.Param(model.I, model.T, initialize=lambda m, i, t: pv_production.iloc[i, t])
-    model.Hsh_excess_low_temp = pyo.Param(model.I, model.T, initialize=lambda m, i, t: excess_low_temp_heat.iloc[i, t])
-    model.Hsh_excess_high_temp = pyo.Param(model.I, model.T,
-                                           initialize=lambda m, i, t: excess_high_temp_heat.iloc[i, t])
+    model.Ppv = pyo.Param(model.I, model.T, mutable=True, initialize=0)
+    model.Hsh_excess_low_temp = pyo.Param(model.I, model.T, mutable=True, initialize=0)
+    model.Hsh_excess_high_temp = pyo.Param(model.I, model.T, mutable=True, initialize=0)
     # BES data
     model.effe = pyo.Param(initialize=battery_efficiency)
-    model.SOCBES0 = pyo.Param(model.I, initialize=SOCBES0)
+    model.SOCBES0 = pyo.Param(model.I, mutable=True, initialize=0)
     model.Emax_BES = pyo.Param(model.I, initialize=battery_capacity)
     model.Pmax_BES_Cha = pyo.Param(model.I, initialize=battery_charge_rate)
     model.Pmax_BES_Dis = pyo.Param(model.I, initialize=battery_discharge_rate)
     # Building inertia as thermal energy storage
-    model.BITES_Eshallow0 = pyo.Param(model.I, initialize=lambda m, i: BITES_Eshallow0[i])
-    model.BITES_Edeep0 = pyo.Param(model.I, initialize=lambda m, i: BITES_Edeep0[i])
+    model.BITES_Eshallow0 = pyo.Param(model.I, mutable=True, initialize=0)
+    model.BITES_Edeep0 = pyo.Param(model.I, mutable=True, initialize=0)
     model.Energy_shallow_cap = pyo.Param(model.I, initialize=lambda m, i: 0.046 * build_area[i])
     model.Energy_deep_cap = pyo.Param(model.I, initialize=lambda m, i: 0.291 * build_area[i])
     model.Heat_rate_shallow = pyo.Param(model.I, initialize=lambda m, i: 0.023 * build_area[i])
@@ -155,7 +274,7 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
     model.borehole = pyo.Param(model.I, initialize=lambda m, i: borehole[i])
     # Thermal energy storage data
     model.efft = pyo.Param(model.I, initialize=thermalstorage_efficiency)
-    model.SOCTES0 = pyo.Param(model.I, initialize=SOCTES0)
+    model.SOCTES0 = pyo.Param(model.I, mutable=True, initialize=0)
     model.Tmax_TES = pyo.Param(model.I, initialize=thermalstorage_max_temp)
     model.kwh_per_deg = pyo.Param(model.I, initialize=kwh_per_deg)
     # Local heat network efficiency
@@ -175,8 +294,7 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
     model.Csell_grid = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
     model.Pcha = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
     model.Pdis = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
-    model.SOCBES = pyo.Var(model.I, model.T, bounds=(0, 1), within=pyo.NonNegativeReals,
-                           initialize=lambda m, i, t: SOCBES0[i])
+    model.SOCBES = pyo.Var(model.I, model.T, bounds=(0, 1), within=pyo.NonNegativeReals, initialize=0)
     model.Hhp = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
     model.Chp = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
     model.Php = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
@@ -186,8 +304,7 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
     model.Uhp_Cmod = pyo.Var(model.I, model.T, within=pyo.Binary, initialize=0)
     model.HTEScha = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
     model.HTESdis = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
-    model.SOCTES = pyo.Var(model.I, model.T, bounds=(0, 1), within=pyo.NonNegativeReals,
-                           initialize=lambda m, i, t: SOCTES0[i])
+    model.SOCTES = pyo.Var(model.I, model.T, bounds=(0, 1), within=pyo.NonNegativeReals, initialize=0)
     model.Ccc = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
     model.Hcc = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
     model.Pcc = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
@@ -208,17 +325,94 @@ def solve_model(solver: OptSolver, summer_mode: bool, month: int, n_agents: int,
     model.cool_dump_agent = pyo.Var(model.I, model.T, within=pyo.NonNegativeReals, initialize=0)
     # Electrical and heat load peaks
     model.daily_elec_peak_load = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
-    model.avg_elec_peak_load = pyo.Var(within=pyo.NonNegativeReals, initialize=sum(hist_top_three_elec_peak_load) / 3.0)
+    model.avg_elec_peak_load = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
     model.daily_heat_peak_energy = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
     model.monthly_heat_peak_energy = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
 
     model.UCbuy_grid = pyo.Var(model.I, model.T, within=pyo.Binary, initialize=0)
     model.UCsell_grid = pyo.Var(model.I, model.T, within=pyo.Binary, initialize=0)
+    # Agents that have each asset. Constraints concerning only one asset are added for the agents having it, and the
+    # asset's variables are fixed to 0 for the other agents. Fixed variables are passed to the solver as constants, so
+    # the size of the problem scales with the assets actually installed.
+    model.I_BES = pyo.Set(initialize=[i for i in model.I if battery_capacity[i] != 0])
+    model.I_HP = pyo.Set(initialize=[i for i in model.I if heatpump_max_power[i] != 0])
+    model.I_HPB = pyo.Set(initialize=[i for i in model.I if booster_heatpump_max_heat[i] != 0])
+    model.I_TES = pyo.Set(initialize=[i for i in model.I if kwh_per_deg[i] != 0])
+    model.I_BITES = pyo.Set(initialize=[i for i in model.I if build_area[i] != 0])
+    fix_for_agents_without_asset(model, model.I_BES, ['Pcha', 'Pdis', 'SOCBES'])
+    fix_for_agents_without_asset(model, model.I_HP, ['Hhp', 'Chp', 'Php', 'Php_Hmod', 'Php_Cmod', 'Uhp_Hmod',
+                                                     'Uhp_Cmod'])
+    if summer_mode:
+        fix_for_agents_without_asset(model, model.I_HPB, ['HhpB', 'PhpB'])
+    fix_for_agents_without_asset(model, model.I_TES, ['HTEScha', 'HTESdis', 'SOCTES'])
+    fix_for_agents_without_asset(model, model.I_BITES, ['Energy_shallow', 'Hcha_shallow', 'Flow', 'Loss_shallow',
+                                                        'Energy_deep', 'Loss_deep'])
+    if Pccmax == 0:
+        # No chiller
+        model.Ccc.fix(0)
+        model.Hcc.fix(0)
+        model.Pcc.fix(0)
     add_obj_and_constraints(model, summer_mode, month)
-
-    # Solve!
-    results = solver.solve(model)
-    return model, results
+    return model
+
+
+def fix_for_agents_without_asset(model: pyo.ConcreteModel, agents_with_asset: pyo.Set, variable_names: List[str]):
+    """Fixes the given (agent, hour)-indexed variables to 0, for all agents that aren't in agents_with_asset."""
+    for variable_name in variable_names:
+        variable = getattr(model, variable_name)
+        for i in model.I:
+            if i not in agents_with_asset:
+                for t in model.T:
+                    variable[i, t].fix(0)
+
+
+def update_model_data(model: pyo.ConcreteModel, nordpool_price: np.ndarray, external_heat_buy_price: float,
+                      SOCBES0: List[float], SOCTES0: List[float],
+                      BITES_Eshallow0: List[float], BITES_Edeep0: List[float],
+                      elec_consumption: np.ndarray, hot_water_heatdem: np.ndarray,
+                      space_heating_heatdem: np.ndarray, cold_consumption: np.ndarray,
+                      pv_production: np.ndarray, excess_low_temp_heat: np.ndarray,
+                      excess_high_temp_heat: np.ndarray,
+                      elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
+                      hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
+                      hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float):
+    """
+    Sets the values of all mutable parameters of a model constructed by build_model. Time series are expected as arrays
+    with one row per agent and (at least) one column per hour.
+    """
+    model.nordpool_price.store_values(bulk_values(model.nordpool_price, nordpool_price), check=False)
+    model.elec_peak_load_fee = elec_peak_load_fee
+    model.elec_trans_fee = elec_trans_fee
+    model.elec_tax_fee = elec_tax_fee
+    model.incentive_fee = incentive_fee
+    model.Hprice_energy = external_heat_buy_price
+    model.heat_peak_load_fee = heat_peak_load_fee
+    model.hist_top_three_elec_peak_load.store_values(
+        bulk_values(model.hist_top_three_elec_peak_load, np.asarray(hist_top_three_elec_peak_load)), check=False)
+    model.Hist_monthly_heat_peak_energy = hist_monthly_heat_peak_energy
+    model.Pdem.store_values(bulk_values(model.Pdem, elec_consumption), check=False)
+    model.Hhw.store_values(bulk_values(model.Hhw, hot_water_heatdem), check=False)
+    model.Hsh.store_values(bulk_values(model.Hsh, space_heating_heatdem), check=False)
+    model.Cld.store_values(bulk_values(model.Cld, cold_consumption), check=False)
+    model.Cld_positive.store_values(bulk_values(model.Cld_positive, (cold_consumption > 0).astype(int)), check=False)
+    model.Ppv.store_values(bulk_values(model.Ppv, pv_production), check=False)
+    model.Hsh_excess_low_temp.store_values(bulk_values(model.Hsh_excess_low_temp, excess_low_temp_heat), check=False)
+    model.Hsh_excess_high_temp.store_values(bulk_values(model.Hsh_excess_high_temp, excess_high_temp_heat),
+                                            check=False)
+    model.SOCBES0.store_values(bulk_values(model.SOCBES0, np.asarray(SOCBES0)), check=False)
+    model.SOCTES0.store_values(bulk_values(model.SOCTES0, np.asarray(SOCTES0)), check=False)
+    model.BITES_Eshallow0.store_values(bulk_values(model.BITES_Eshallow0, np.asarray(BITES_Eshallow0)), check=False)
+    model.BITES_Edeep0.store_values(bulk_values(model.BITES_Edeep0, np.asarray(BITES_Edeep0)), check=False)
+
+
+def bulk_values(param: IndexedParam, values: np.ndarray) -> Dict[Any, float]:
+    """
+    Maps each index of "param" to its value in "values", which should have one dimension per index set of "param"
+    (agent, hour). Values outside the index sets (for example hours after the end of the horizon) are ignored.
+    """
+    shape = tuple(len(index_set) for index_set in param.index_set().subsets())
+    trimmed = values[tuple(slice(0, n) for n in shape)]
+    return dict(zip(param.index_set(), trimmed.ravel().tolist()))
 
 
 def add_obj_and_constraints(model: pyo.ConcreteModel, summer_mode: bool, month: int):
@@ -243,17 +437,17 @@ def add_obj_and_constraints(model: pyo.ConcreteModel, summer_mode: bool, month:
     else:
         model.con_agent_Cbalance_winter = pyo.Constraint(model.I, model.T, rule=agent_Cbalance_winter)
     model.con_Hhw_supplied_by_HTES = pyo.Constraint(model.I, model.T, rule=Hhw_supplied_by_HTES)
-    model.con_BITES_Eshallow_balance = pyo.Constraint(model.I, model.T, rule=BITES_Eshallow_balance)
-    model.con_BITES_shallow_dis = pyo.Constraint(model.I, model.T, rule=BITES_shallow_dis)
-    model.con_BITES_shallow_cha = pyo.Constraint(model.I, model.T, rule=BITES_shallow_cha)
-    model.con_BITES_Edeep_balance = pyo.Constraint(model.I, model.T, rule=BITES_Edeep_balance)
-    model.con_BITES_Eflow_between_storages = pyo.Constraint(model.I, model.T, rule=BITES_Eflow_between_storages)
-    model.con_BITES_shallow_loss = pyo.Constraint(model.I, model.T, rule=BITES_shallow_loss)
-    model.con_BITES_deep_loss = pyo.Constraint(model.I, model.T, rule=BITES_deep_loss)
-    model.con_BITES_max_Hdis_shallow = pyo.Constraint(model.I, model.T, rule=BITES_max_Hdis_shallow)
-    model.con_BITES_max_Hcha_shallow = pyo.Constraint(model.I, model.T, rule=BITES_max_Hcha_shallow)
-    model.con_BITES_max_Eshallow = pyo.Constraint(model.I, model.T, rule=BITES_max_Eshallow)
-    model.con_BITES_max_Edeep = pyo.Constraint(model.I, model.T, rule=BITES_max_Edeep)
+    model.con_BITES_Eshallow_balance = pyo.Constraint(model.I_BITES, model.T, rule=BITES_Eshallow_balance)
+    model.con_BITES_shallow_dis = pyo.Constraint(model.I_BITES, model.T, rule=BITES_shallow_dis)
+    model.con_BITES_shallow_cha = pyo.Constraint(model.I_BITES, model.T, rule=BITES_shallow_cha)
+    model.con_BITES_Edeep_balance = pyo.Constraint(model.I_BITES, model.T, rule=BITES_Edeep_balance)
+    model.con_BITES_Eflow_between_storages = pyo.Constraint(model.I_BITES, model.T, rule=BITES_Eflow_between_storages)
+    model.con_BITES_shallow_loss = pyo.Constraint(model.I_BITES, model.T, rule=BITES_shallow_loss)
+    model.con_BITES_deep_loss = pyo.Constraint(model.I_BITES, model.T, rule=BITES_deep_loss)
+    model.con_BITES_max_Hdis_shallow = pyo.Constraint(model.I_BITES, model.T, rule=BITES_max_Hdis_shallow)
+    model.con_BITES_max_Hcha_shallow = pyo.Constraint(model.I_BITES, model.T, rule=BITES_max_Hcha_shallow)
+    model.con_BITES_max_Eshallow = pyo.Constraint(model.I_BITES, model.T, rule=BITES_max_Eshallow)
+    model.con_BITES_max_Edeep = pyo.Constraint(model.I_BITES, model.T, rule=BITES_max_Edeep)
     model.con_LEC_Pbalance = pyo.Constraint(model.T, rule=LEC_Pbalance)
     model.con_LEC_Hbalance = pyo.Constraint(model.T, rule=LEC_Hbalance)
     model.con_LEC_Cbalance = pyo.Constraint(model.T, rule=LEC_Cbalance)
@@ -261,29 +455,30 @@ def add_obj_and_constraints(model: pyo.ConcreteModel, summer_mode: bool, month:
     model.con_LEC_Cbalance2 = pyo.Constraint(model.I, model.T, rule=LEC_Cbalance2)
     model.con_LEC_Cbalance3 = pyo.Constraint(model.I, model.T, rule=LEC_Cbalance3)
     model.con_LEC_cool_dump = pyo.Constraint(model.T, rule=LEC_cool_dump)
-    model.con_BES_max_dis = pyo.Constraint(model.I, model.T, rule=BES_max_dis)
-    model.con_BES_max_cha = pyo.Constraint(model.I, model.T, rule=BES_max_cha)
-    model.con_BES_Ebalance = pyo.Constraint(model.I, model.T, rule=BES_Ebalance)
-    model.con_BES_final_SOC = pyo.Constraint(model.I, rule=BES_final_SOC)
-    model.con_BES_remove_binaries = pyo.Constraint(model.I, model.T, rule=BES_remove_binaries)
-    model.con_HP_Hproduct = pyo.Constraint(model.I, model.T, rule=HP_Hproduct)
-    model.con_HP_Pconsump = pyo.Constraint(model.I, model.T, rule=HP_Pconsump)
-    model.con_HP_Cproduct = pyo.Constraint(model.I, model.T, rule=HP_Cproduct)
-    model.con_max_HP_Hproduct = pyo.Constraint(model.I, model.T, rule=max_HP_Hproduct)
-    model.con_max_HP_Pconsumption_Hmod = pyo.Constraint(model.I, model.T, rule=max_HP_Pconsumption_Hmod)
-    model.con_max_HP_Pconsumption_Cmod = pyo.Constraint(model.I, model.T, rule=max_HP_Pconsumption_Cmod)
-    model.con_max_HP_Pconsumption_Coordinate = pyo.Constraint(model.I, model.T,
+    model.con_BES_max_dis = pyo.Constraint(model.I_BES, model.T, rule=BES_max_dis)
+    model.con_BES_max_cha = pyo.Constraint(model.I_BES, model.T, rule=BES_max_cha)
+    model.con_BES_Ebalance = pyo.Constraint(model.I_BES, model.T, rule=BES_Ebalance)
+    model.con_BES_final_SOC = pyo.Constraint(model.I_BES, rule=BES_final_SOC)
+    model.con_BES_remove_binaries = pyo.Constraint(model.I_BES, model.T, rule=BES_remove_binaries)
+    model.con_HP_Hproduct = pyo.Constraint(model.I_HP, model.T, rule=HP_Hproduct)
+    model.con_HP_Pconsump = pyo.Constraint(model.I_HP, model.T, rule=HP_Pconsump)
+    model.con_HP_Cproduct = pyo.Constraint(model.I_HP, model.T, rule=HP_Cproduct)
+    model.con_max_HP_Hproduct = pyo.Constraint(model.I_HP, model.T, rule=max_HP_Hproduct)
+    model.con_max_HP_Pconsumption_Hmod = pyo.Constraint(model.I_HP, model.T, rule=max_HP_Pconsumption_Hmod)
+    model.con_max_HP_Pconsumption_Cmod = pyo.Constraint(model.I_HP, model.T, rule=max_HP_Pconsumption_Cmod)
+    model.con_max_HP_Pconsumption_Coordinate = pyo.Constraint(model.I_HP, model.T,
                                                               rule=max_HP_Pconsumption_Coordinate)
-    model.con_active_Cmod = pyo.Constraint(model.I, model.T, rule=active_Cmod)
+    model.con_active_Cmod = pyo.Constraint(model.I_HP, model.T, rule=active_Cmod)
     if summer_mode:
-        model.con_max_booster_HP_Hproduct_summer = pyo.Constraint(model.I, model.T, rule=max_booster_HP_Hproduct_summer)
+        model.con_max_booster_HP_Hproduct_summer = pyo.Constraint(model.I_HPB, model.T,
+                                                                  rule=max_booster_HP_Hproduct_summer)
         model.con_chiller_Hwaste_summer = pyo.Constraint(model.T, rule=chiller_Hwaste_summer)
     else:
         model.con_chiller_Hwaste_winter = pyo.Constraint(model.T, rule=chiller_Hwaste_winter)
     #    model.con_max_HTES_dis = pyo.Constraint(model.I, model.T, rule=max_HTES_dis)
     #    model.con_max_HTES_cha = pyo.Constraint(model.I, model.T, rule=max_HTES_cha)
-    model.con_HTES_Ebalance = pyo.Constraint(model.I, model.T, rule=HTES_Ebalance)
-    model.con_HTES_final_SOC = pyo.Constraint(model.I, rule=HTES_final_SOC)
+    model.con_HTES_Ebalance = pyo.Constraint(model.I_TES, model.T, rule=HTES_Ebalance)
+    model.con_HTES_final_SOC = pyo.Constraint(model.I_TES, rule=HTES_final_SOC)
     model.con_chiller_Cpower_product = pyo.Constraint(model.T, rule=chiller_Cpower_product)
     model.con_max_chiller_Cpower_product = pyo.Constraint(model.T, rule=max_chiller_Cpower_product)
     model.con_elec_peak_load1 = pyo.Constraint(model.T, rule=elec_peak_load1)
@@ -296,7 +491,8 @@ def add_obj_and_constraints(model: pyo.ConcreteModel, summer_mode: bool, month:
 
 # Objective function: minimize the total charging cost (eq. 1 of the report)
 def obj_rul(model):
-    return sum(
+    # Costs are per hour, so they are multiplied by the number of hours in each time step
+    return model.time_step * sum(
         # Electricity cost terms:
         model.Pbuy_market[t] * (model.nordpool_price[t] + model.elec_trans_fee + model.elec_tax_fee)  # Purchasing cost
         - model.Psell_market[t] * (model.nordpool_price[t] + model.incentive_fee)  # Selling cost
@@ -359,7 +555,7 @@ def elec_peak_load3(model):
 
 
 def heat_peak_load1(model):
-    return model.daily_heat_peak_energy >= sum(model.Hbuy_market[t] for t in model.T)
+    return model.daily_heat_peak_energy >= model.time_step * sum(model.Hbuy_market[t] for t in model.T)
 
 
 def heat_peak_load2(model):
@@ -434,6 +630,9 @@ def HTES_supplied_by_Bhp(model, i, t):
     # with TES
     if model.kwh_per_deg[i] != 0:
         return model.HhpB[i, t] == (1 - PERC_OF_HT_COVERABLE_BY_LT) * model.HTEScha[i, t]
+    # without TES or booster: solve_model has already checked that there is no hot water demand
+    elif model.HhpBmax[i] == 0:
+        return pyo.Constraint.Skip
     # without TES
     else:
         return model.HhpB[i, t] == (1 - PERC_OF_HT_COVERABLE_BY_LT) * model.Hhw[i, t]
@@ -451,11 +650,11 @@ def Hhw_supplied_by_HTES(model, i, t):
 # (eqs. 22 to 28 of the report)
 def BITES_Eshallow_balance(model, i, t):
     if t == 0:
-        return model.Energy_shallow[i, 0] == model.BITES_Eshallow0[i] + model.Hcha_shallow[i, 0] \
-            - model.Flow[i, 0] - model.Loss_shallow[i, 0]
+        return model.Energy_shallow[i, 0] == model.BITES_Eshallow0[i] \
+            + model.time_step * (model.Hcha_shallow[i, 0] - model.Flow[i, 0]) - model.Loss_shallow[i, 0]
     else:
-        return model.Energy_shallow[i, t] == model.Energy_shallow[i, t - 1] + model.Hcha_shallow[i, t] \
-            - model.Flow[i, t] - model.Loss_shallow[i, t]
+        return model.Energy_shallow[i, t] == model.Energy_shallow[i, t - 1] \
+            + model.time_step * (model.Hcha_shallow[i, t] - model.Flow[i, t]) - model.Loss_shallow[i, t]
 
 
 def BITES_shallow_dis(model, i, t):
@@ -469,9 +668,11 @@ def BITES_shallow_cha(model, i, t):
 
 def BITES_Edeep_balance(model, i, t):
     if t == 0:
-        return model.Energy_deep[i, 0] == model.BITES_Edeep0[i] + model.Flow[i, 0] - model.Loss_deep[i, 0]
+        return model.Energy_deep[i, 0] == model.BITES_Edeep0[i] + model.time_step * model.Flow[i, 0] \
+            - model.Loss_deep[i, 0]
     else:
-        return model.Energy_deep[i, t] == model.Energy_deep[i, t - 1] + model.Flow[i, t] - model.Loss_deep[i, t]
+        return model.Energy_deep[i, t] == model.Energy_deep[i, t - 1] + model.time_step * model.Flow[i, t] \
+            - model.Loss_deep[i, t]
 
 
 def BITES_Eflow_between_storages(model, i, t):
@@ -493,14 +694,14 @@ def BITES_shallow_loss(model, i, t):
     if t == 0:
         return model.Loss_shallow[i, 0] == 0
     else:
-        return model.Loss_shallow[i, t] == model.Energy_shallow[i, t - 1] * (1 - model.Kloss_shallow)
+        return model.Loss_shallow[i, t] == model.Energy_shallow[i, t - 1] * (1 - model.Kloss_shallow ** model.time_step)
 
 
 def BITES_deep_loss(model, i, t):
     if t == 0:
         return model.Loss_deep[i, 0] == 0
     else:
-        return model.Loss_deep[i, t] == model.Energy_deep[i, t - 1] * (1 - model.Kloss_deep)
+        return model.Loss_deep[i, t] == model.Energy_deep[i, t - 1] * (1 - model.Kloss_deep ** model.time_step)
 
 
 def BITES_max_Hdis_shallow(model, i, t):
@@ -558,17 +759,14 @@ def BES_max_cha(model, i, t):
 
 # State of charge modelling
 def BES_Ebalance(model, i, t):
-    if model.Emax_BES[i] == 0:
-        # No storage capacity, then we need to ensure that charge and discharge are 0 as well.
-        return model.Pcha[i, t] + model.Pdis[i, t] == model.Emax_BES[i]
-    # We assume that model.effe cannot be 0
+    # Only used for agents with a battery. We assume that model.effe cannot be 0
     if t == 0:
-        charge = model.Pcha[i, 0] * model.effe / model.Emax_BES[i]
-        discharge = model.Pdis[i, 0] / (model.Emax_BES[i] * model.effe)
+        charge = model.time_step * model.Pcha[i, 0] * model.effe / model.Emax_BES[i]
+        discharge = model.time_step * model.Pdis[i, 0] / (model.Emax_BES[i] * model.effe)
         return model.SOCBES[i, 0] == model.SOCBES0[i] + charge - discharge
     else:
-        charge = model.Pcha[i, t] * model.effe / model.Emax_BES[i]
-        discharge = model.Pdis[i, t] / (model.Emax_BES[i] * model.effe)
+        charge = model.time_step * model.Pcha[i, t] * model.effe / model.Emax_BES[i]
+        discharge = model.time_step * model.Pdis[i, t] / (model.Emax_BES[i] * model.effe)
         return model.SOCBES[i, t] == model.SOCBES[i, t - 1] + charge - discharge
 
 
@@ -616,10 +814,8 @@ def max_HP_Pconsumption_Coordinate(model, i, t):
 
 
 def active_Cmod(model, i, t):
-    if model.Cld[i, t] > 0:
-        return model.Uhp_Cmod[i, t] >= 0
-    else:
-        return model.Uhp_Cmod[i, t] == 0
+    # Cooling mode can only be active when there is a cooling demand
+    return model.Uhp_Cmod[i, t] <= model.Cld_positive[i, t]
 
 
 # Booster heat pump model (eq. 20 of the report)
@@ -645,13 +841,10 @@ def max_booster_HP_Hproduct_summer(model, i, t):
 
 # State of charge modelling
 def HTES_Ebalance(model, i, t):
-    if model.kwh_per_deg[i] == 0:
-        # No storage capacity, then we need to ensure that charge and discharge are 0 as well.
-        return model.HTESdis[i, t] + model.HTEScha[i, t] == model.kwh_per_deg[i]
-    # We assume that model.efft and model.Tmax_TES cannot be 0
+    # Only used for agents with an accumulator tank. We assume that model.efft and model.Tmax_TES cannot be 0
     charge = model.HTEScha[i, t] * model.efft[i] / (model.kwh_per_deg[i] * model.Tmax_TES[i])
     discharge = model.HTESdis[i, t] / ((model.kwh_per_deg[i] * model.Tmax_TES[i]) * model.efft[i])
-    charge_change = charge - discharge
+    charge_change = model.time_step * (charge - discharge)
     if t == 0:
         return model.SOCTES[i, 0] == model.SOCTES0[i] + charge_change
     else:
@@ -664,19 +857,323 @@ def HTES_final_SOC(model, i):
 
 # Compression chiller model (eqs. 29 to 31 of the report)
 def chiller_Cpower_product(model, t):
+    if model.Pccmax == 0:
+        return pyo.Constraint.Skip
     return model.Ccc[t] == model.COPcc * model.Pcc[t]
 
 
 def max_chiller_Cpower_product(model, t):
+    if model.Pccmax == 0:
+        return pyo.Constraint.Skip
     return model.Pcc[t] <= model.Pccmax
 
 
 def chiller_Hwaste_summer(model, t):
     # Only used in summer mode
+    if model.Pccmax == 0:
+        return pyo.Constraint.Skip
     return model.Hcc[t] == (1 + model.COPcc) * model.Pcc[t] * model.chiller_heat_recovery
 
 
 def chiller_Hwaste_winter(model, t):
     # Only used in winter mode : Due to high temperature of district heating (60 deg. C),
     # it is not possible to export heat from building to the district heating
+    if model.Pccmax == 0:
+        return pyo.Constraint.Skip
     return model.Hcc[t] <= 0
+
+
+def build_matrix_model(summer_mode: bool, month: int, n_agents: int, nordpool_price: np.ndarray,
+                       external_heat_buy_price: float,
+                       battery_capacity: List[float], battery_charge_rate: List[float],
+                       battery_discharge_rate: List[float], SOCBES0: List[float], HP_Cproduct_active: List[bool],
+                       heatpump_COP: List[float], heatpump_max_power: List[float], heatpump_max_heat: List[float],
+                       booster_heatpump_COP: List[float], booster_heatpump_max_power: List[float],
+                       booster_heatpump_max_heat: List[float], build_area: List[float], SOCTES0: List[float],
+                       thermalstorage_max_temp: List[float], thermalstorage_volume: List[float],
+                       BITES_Eshallow0: List[float], BITES_Edeep0: List[float], borehole: List[bool],
+                       elec_consumption: np.ndarray, hot_water_heatdem: np.ndarray, space_heating_heatdem: np.ndarray,
+                       cold_consumption: np.ndarray, pv_production: np.ndarray,
+                       excess_low_temp_heat: np.ndarray, excess_high_temp_heat: np.ndarray,
+                       elec_trans_fee: float, elec_tax_fee: float, incentive_fee: float,
+                       hist_top_three_elec_peak_load: list, elec_peak_load_fee: float,
+                       hist_monthly_heat_peak_energy: float, heat_peak_load_fee: float,
+                       battery_efficiency: float = 0.95,
+                       max_elec_transfer_between_agents: float = 500, max_elec_transfer_to_external: float = 1000,
+                       max_heat_transfer_between_agents: float = 500, max_heat_transfer_to_external: float = 1000,
+                       chiller_COP: float = 1.5, chiller_heat_recovery: bool = True, Pccmax: float = 100,
+                       thermalstorage_efficiency: float = 0.98,
+                       heat_trans_loss: float = 0.05, cold_trans_loss: float = 0.05, trading_horizon: int = 24,
+                       time_step: int = 1) -> MatrixModel:
+    """
+    Assembles the same LEC model as build_model and update_model_data, but directly as a sparse matrix, skipping Pyomo
+    expression generation and model file writing. Takes the same arguments as solve_model. The Pyomo model is the
+    reference implementation: any change to the equations above needs to be mirrored here (test_matrix_model compares
+    the two).
+    Variables have the same names as in the Pyomo model, with per-agent variables shaped (agent, hour).
+    """
+    n = int(n_agents)
+    T = int(trading_horizon)
+    penalty = 1000
+    Kloss_shallow = 0.9913
+    Kloss_deep = 0.9963
+    price = np.asarray(nordpool_price, dtype=float)[:T]
+    Pdem = np.asarray(elec_consumption, dtype=float)[:, :T]
+    Hhw = np.asarray(hot_water_heatdem, dtype=float)[:, :T]
+    Hsh = np.asarray(space_heating_heatdem, dtype=float)[:, :T]
+    Cld = np.asarray(cold_consumption, dtype=float)[:, :T]
+    Ppv = np.asarray(pv_production, dtype=float)[:, :T]
+    Hsh_excess_low_temp = np.asarray(excess_low_temp_heat, dtype=float)[:, :T]
+    Hsh_excess_high_temp = np.asarray(excess_high_temp_heat, dtype=float)[:, :T]
+    # Per-agent data as column vectors, to broadcast against (agent, hour)-shaped variables
+    Emax_BES = np.array(battery_capacity, dtype=float)[:, np.newaxis]
+    Pmax_BES_Cha = np.array(battery_charge_rate, dtype=float)[:, np.newaxis]
+    Pmax_BES_Dis = np.array(battery_discharge_rate, dtype=float)[:, np.newaxis]
+    COPhp = np.array(heatpump_COP, dtype=float)[:, np.newaxis]
+    Phpmax = np.array(heatpump_max_power, dtype=float)[:, np.newaxis]
+    Hhpmax = np.array(heatpump_max_heat, dtype=float)[:, np.newaxis]
+    HhpBmax = np.array(booster_heatpump_max_heat, dtype=float)[:, np.newaxis]
+    area = np.array(build_area, dtype=float)[:, np.newaxis]
+    Energy_shallow_cap = 0.046 * area
+    Energy_deep_cap = 0.291 * area
+    Heat_rate_shallow = 0.023 * area
+    Kval = 0.03 * area
+    Tmax_TES = np.array(thermalstorage_max_temp, dtype=float)[:, np.newaxis]
+    kwh_per_deg = np.array(thermalstorage_volume, dtype=float)[:, np.newaxis] * 4182 * 998 / 3600000
+    has_tes = (kwh_per_deg != 0).astype(float)
+    cooling_active = np.array(HP_Cproduct_active, dtype=float)[:, np.newaxis]
+    has_borehole = np.array(borehole, dtype=float)[:, np.newaxis]
+    agent_rows = np.arange(n)
+    # Agents having each asset, see build_model
+    bes = np.flatnonzero(Emax_BES[:, 0] != 0)
+    hp = np.flatnonzero(Phpmax[:, 0] != 0)
+    hpb = np.flatnonzero(HhpBmax[:, 0] != 0)
+    tes_agents = np.flatnonzero(has_tes[:, 0])
+    bites = np.flatnonzero(area[:, 0] != 0)
+
+    mm = MatrixModel(name="LEC")
+    # Variables
+    Pbuy_market = mm.add_variable('Pbuy_market', T)
+    Psell_market = mm.add_variable('Psell_market', T)
+    U_buy_sell_market = mm.add_binary_variable('U_buy_sell_market', T)
+    Hbuy_market = mm.add_variable('Hbuy_market', T)
+    Pbuy_grid = mm.add_variable('Pbuy_grid', (n, T))
+    Psell_grid = mm.add_variable('Psell_grid', (n, T))
+    U_power_buy_sell_grid = mm.add_binary_variable('U_power_buy_sell_grid', (n, T))
+    Hbuy_grid = mm.add_variable('Hbuy_grid', (n, T))
+    Hsell_grid = mm.add_variable('Hsell_grid', (n, T))
+    Cbuy_grid = mm.add_variable('Cbuy_grid', (n, T))
+    Csell_grid = mm.add_variable('Csell_grid', (n, T))
+    Pcha = mm.add_variable('Pcha', (n, T))
+    Pdis = mm.add_variable('Pdis', (n, T))
+    SOCBES = mm.add_variable('SOCBES', (n, T), ub=1)
+    Hhp = mm.add_variable('Hhp', (n, T))
+    Chp = mm.add_variable('Chp', (n, T))
+    Php = mm.add_variable('Php', (n, T))
+    Php_Hmod = mm.add_variable('Php_Hmod', (n, T))
+    Php_Cmod = mm.add_variable('Php_Cmod', (n, T))
+    Uhp_Hmod = mm.add_binary_variable('Uhp_Hmod', (n, T))
+    Uhp_Cmod = mm.add_binary_variable('Uhp_Cmod', (n, T))
+    HTEScha = mm.add_variable('HTEScha', (n, T))
+    HTESdis = mm.add_variable('HTESdis', (n, T))
+    SOCTES = mm.add_variable('SOCTES', (n, T), ub=1)
+    Ccc = mm.add_variable('Ccc', T)
+    Hcc = mm.add_variable('Hcc', T)
+    Pcc = mm.add_variable('Pcc', T)
+    Energy_shallow = mm.add_variable('Energy_shallow', (n, T))
+    Hcha_shallow = mm.add_variable('Hcha_shallow', (n, T), lb=-np.inf)
+    Flow = mm.add_variable('Flow', (n, T), lb=-np.inf)
+    Loss_shallow = mm.add_variable('Loss_shallow', (n, T))
+    Energy_deep = mm.add_variable('Energy_deep', (n, T))
+    Loss_deep = mm.add_variable('Loss_deep', (n, T))
+    if summer_mode:
+        HhpB = mm.add_variable('HhpB', (n, T))
+        PhpB = mm.add_variable('PhpB', (n, T))
+    heat_dump = mm.add_variable('heat_dump', (n, T))
+    cool_dump = mm.add_variable('cool_dump', T)
+    cool_dump_agent = mm.add_variable('cool_dump_agent', (n, T))
+    daily_elec_peak_load = mm.add_variable('daily_elec_peak_load')
+    avg_elec_peak_load = mm.add_variable('avg_elec_peak_load')
+    daily_heat_peak_energy = mm.add_variable('daily_heat_peak_energy')
+    monthly_heat_peak_energy = mm.add_variable('monthly_heat_peak_energy')
+    UCbuy_grid = mm.add_binary_variable('UCbuy_grid', (n, T))
+    UCsell_grid = mm.add_binary_variable('UCsell_grid', (n, T))
+    # Variables of absent assets are fixed to 0, as in build_model
+    for columns in [Pcha, Pdis, SOCBES]:
+        mm.fix_variables(np.delete(columns, bes, axis=0))
+    for columns in [Hhp, Chp, Php, Php_Hmod, Php_Cmod, Uhp_Hmod, Uhp_Cmod]:
+        mm.fix_variables(np.delete(columns, hp, axis=0))
+    if summer_mode:
+        for columns in [HhpB, PhpB]:
+            mm.fix_variables(np.delete(columns, hpb, axis=0))
+    for columns in [HTEScha, HTESdis, SOCTES]:
+        mm.fix_variables(np.delete(columns, tes_agents, axis=0))
+    for columns in [Energy_shallow, Hcha_shallow, Flow, Loss_shallow, Energy_deep, Loss_deep]:
+        mm.fix_variables(np.delete(columns, bites, axis=0))
+    if Pccmax == 0:
+        for columns in [Ccc, Hcc, Pcc]:
+            mm.fix_variables(columns)
+
+    # Objective function (see obj_rul), with the terms that don't depend on t summed over the horizon
+    mm.add_to_objective(time_step * (price + elec_trans_fee + elec_tax_fee), Pbuy_market)
+    mm.add_to_objective(-time_step * (price + incentive_fee), Psell_market)
+    mm.add_to_objective(time_step * T * elec_peak_load_fee, avg_elec_peak_load)
+    mm.add_to_objective(time_step * external_heat_buy_price, Hbuy_market)
+    mm.add_to_objective(time_step * T * heat_peak_load_fee / 24, monthly_heat_peak_energy)
+    mm.add_to_objective(time_step * penalty, heat_dump)
+    mm.add_to_objective(time_step * penalty, cool_dump_agent)
+
+    # Constraints, in the same order and with the same names as in add_obj_and_constraints
+    Pmax_grid = max_elec_transfer_between_agents
+    Hmax_grid = max_heat_transfer_between_agents
+    Pmax_market = max_elec_transfer_to_external
+    mm.add_constraints('con_max_Pbuy_grid', [(1, Pbuy_grid), (-Pmax_grid, U_power_buy_sell_grid)], '<=', 0)
+    mm.add_constraints('con_max_Hbuy_grid', [(1, Hbuy_grid)], '<=', Hmax_grid)
+    mm.add_constraints('con_max_Psell_grid', [(1, Psell_grid), (Pmax_grid, U_power_buy_sell_grid)], '<=', Pmax_grid)
+    mm.add_constraints('con_max_Pbuy_market', [(1, Pbuy_market), (-Pmax_market, U_buy_sell_market)], '<=', 0)
+    mm.add_constraints('con_max_Psell_market', [(1, Psell_market), (Pmax_market, U_buy_sell_market)], '<=',
+                       Pmax_market)
+    mm.add_constraints('con_max_Hsell_grid', [(1, Hsell_grid)], '<=', Hmax_grid)
+    if summer_mode:
+        mm.add_constraints('con_agent_Pbalance_summer',
+                           [(1, Pdis), (1, Pbuy_grid), (-1, Php), (-1, PhpB), (-1, Pcha), (-1, Psell_grid)],
+                           '==', Pdem - Ppv)
+        mm.add_constraints('con_agent_Hbalance_summer',
+                           [(1, Hbuy_grid), (1, Hhp), (-1, Hsell_grid), (-1, Hcha_shallow),
+                            (-PERC_OF_HT_COVERABLE_BY_LT * has_tes, HTEScha), (-1, heat_dump)],
+                           '==', Hsh + PERC_OF_HT_COVERABLE_BY_LT * (1 - has_tes) * Hhw
+                           - Hsh_excess_high_temp - Hsh_excess_low_temp)
+        # Agents without TES or booster have no hot water demand, see solve_model
+        bhp = np.flatnonzero((has_tes[:, 0] != 0) | (HhpBmax[:, 0] != 0))
+        mm.add_constraints('con_HTES_supplied_by_Bhp',
+                           [(1, HhpB[bhp]), (-(1 - PERC_OF_HT_COVERABLE_BY_LT) * has_tes[bhp], HTEScha[bhp])],
+                           '==', (1 - PERC_OF_HT_COVERABLE_BY_LT) * (1 - has_tes[bhp]) * Hhw[bhp])
+    else:
+        mm.add_constraints('con_agent_Pbalance_winter',
+                           [(1, Pdis), (1, Pbuy_grid), (-1, Php), (-1, Pcha), (-1, Psell_grid)],
+                           '==', Pdem - Ppv)
+        mm.add_constraints('con_agent_Hbalance_winter',
+                           [(1, Hbuy_grid), (1, Hhp), (-1, Hsell_grid), (-1, Hcha_shallow), (-has_tes, HTEScha),
+                            (-1, heat_dump)],
+                           '==', Hsh + (1 - has_tes) * Hhw - Hsh_excess_high_temp)
+
+    cooling_terms = [(1, Cbuy_grid), (1, Chp), (-1, Csell_grid), (-1, cool_dump_agent)]
+    if month in [6, 7, 8]:
+        mm.add_constraints('con_agent_Cbalance_summer', cooling_terms, '==', Cld)
+    else:
+        mm.add_constraints('con_agent_Cbalance_winter', cooling_terms, '==', Cld * (1 - has_borehole))
+    mm.add_constraints('con_Hhw_supplied_by_HTES', [(1, HTESdis[tes_agents])], '==', Hhw[tes_agents])
+    add_storage_balance(mm, 'con_BITES_Eshallow_balance', Energy_shallow[bites],
+                        [(time_step, Hcha_shallow[bites]), (-time_step, Flow[bites]), (-1, Loss_shallow[bites])],
+                        np.array(BITES_Eshallow0, dtype=float)[bites])
+    mm.add_constraints('con_BITES_shallow_dis', [(-1, Hcha_shallow[bites])], '<=', Heat_rate_shallow[bites])
+    mm.add_constraints('con_BITES_shallow_cha', [(1, Hcha_shallow[bites])], '<=', Heat_rate_shallow[bites])
+    add_storage_balance(mm, 'con_BITES_Edeep_balance', Energy_deep[bites],
+                        [(time_step, Flow[bites]), (-1, Loss_deep[bites])], np.array(BITES_Edeep0, dtype=float)[bites])
+    mm.add_constraints('con_BITES_Eflow_between_storages',
+                       [(1, Flow[bites]), (-Kval[bites] / Energy_shallow_cap[bites], Energy_shallow[bites]),
+                        (Kval[bites] / Energy_deep_cap[bites], Energy_deep[bites])],
+                       '==', 0)
+    mm.add_constraints('con_BITES_shallow_loss', [(1, Loss_shallow[bites, :1])], '==', 0)
+    mm.add_constraints('con_BITES_shallow_loss', [(1, Loss_shallow[bites, 1:]),
+                                                  (-(1 - Kloss_shallow ** time_step), Energy_shallow[bites, :-1])],
+                       '==', 0)
+    mm.add_constraints('con_BITES_deep_loss', [(1, Loss_deep[bites, :1])], '==', 0)
+    mm.add_constraints('con_BITES_deep_loss', [(1, Loss_deep[bites, 1:]),
+                                               (-(1 - Kloss_deep ** time_step), Energy_deep[bites, :-1])], '==', 0)
+    mm.add_constraints('con_BITES_max_Hdis_shallow', [(-1, Hcha_shallow[bites])], '<=', Hsh[bites])
+    mm.add_constraints('con_BITES_max_Hcha_shallow', [(1, Hcha_shallow[bites])], '<=',
+                       (Hhpmax + Hmax_grid - Hsh)[bites])
+    mm.add_constraints('con_BITES_max_Eshallow', [(1, Energy_shallow[bites])], '<=', Energy_shallow_cap[bites])
+    mm.add_constraints('con_BITES_max_Edeep', [(1, Energy_deep[bites])], '<=', Energy_deep_cap[bites])
+    mm.add_constraints('con_LEC_Pbalance',
+                       [(1, Psell_grid[i]) for i in agent_rows] + [(-1, Pbuy_grid[i]) for i in agent_rows]
+                       + [(1, Pbuy_market), (-1, Psell_market), (-1, Pcc)],
+                       '==', 0)
+    mm.add_constraints('con_LEC_Hbalance',
+                       [(1 - heat_trans_loss, Hsell_grid[i]) for i in agent_rows]
+                       + [(-1, Hbuy_grid[i]) for i in agent_rows]
+                       + [(1 - heat_trans_loss, Hbuy_market), (1 - heat_trans_loss, Hcc)],
+                       '==', 0)
+    mm.add_constraints('con_LEC_Cbalance',
+                       [(1 - cold_trans_loss, Csell_grid[i]) for i in agent_rows]
+                       + [(-1, Cbuy_grid[i]) for i in agent_rows] + [(1 - cold_trans_loss, Ccc)],
+                       '==', 0)
+    mm.add_constraints('con_LEC_Cbalance1', [(1, Csell_grid), (-100000, UCsell_grid)], '<=', 0)
+    mm.add_constraints('con_LEC_Cbalance2', [(1, Cbuy_grid), (-100000, UCbuy_grid)], '<=', 0)
+    mm.add_constraints('con_LEC_Cbalance3', [(1, UCbuy_grid), (1, UCsell_grid)], '<=', 1)
+    mm.add_constraints('con_LEC_cool_dump', [(1, cool_dump)] + [(-1, cool_dump_agent[i]) for i in agent_rows],
+                       '==', 0)
+    mm.add_constraints('con_BES_max_dis', [(1, Pdis[bes])], '<=', Pmax_BES_Dis[bes])
+    mm.add_constraints('con_BES_max_cha', [(1, Pcha[bes])], '<=', Pmax_BES_Cha[bes])
+    add_storage_balance(mm, 'con_BES_Ebalance', SOCBES[bes],
+                        [(time_step * battery_efficiency / Emax_BES[bes, 0], Pcha[bes]),
+                         (-time_step / (Emax_BES[bes, 0] * battery_efficiency), Pdis[bes])],
+                        np.array(SOCBES0, dtype=float)[bes])
+    mm.add_constraints('con_BES_final_SOC', [(1, SOCBES[bes, -1])], '==', np.array(SOCBES0, dtype=float)[bes])
+    cannot_use_bes = ((Pmax_BES_Dis == 0) | (Pmax_BES_Cha == 0))[:, 0]
+    no_rate = np.intersect1d(bes, np.flatnonzero(cannot_use_bes))
+    mm.add_constraints('con_BES_remove_binaries', [(1, Pcha[no_rate]), (1, Pdis[no_rate])], '<=', 0)
+    rate = np.intersect1d(bes, np.flatnonzero(~cannot_use_bes))
+    mm.add_constraints('con_BES_remove_binaries', [(1 / Pmax_BES_Dis[rate], Pdis[rate]),
+                                                   (1 / Pmax_BES_Cha[rate], Pcha[rate])], '<=', 1)
+    mm.add_constraints('con_HP_Hproduct', [(1, Hhp[hp]), (-COPhp[hp], Php[hp])], '==', 0)
+    mm.add_constraints('con_HP_Pconsump', [(1, Php[hp]), (-1, Php_Hmod[hp]), (-1, Php_Cmod[hp])], '==', 0)
+    mm.add_constraints('con_HP_Cproduct', [(1, Chp[hp]), (-(COPhp[hp] - 1) * cooling_active[hp], Php_Cmod[hp])],
+                       '==', 0)
+    mm.add_constraints('con_max_HP_Hproduct', [(1, Hhp[hp])], '<=', Hhpmax[hp])
+    mm.add_constraints('con_max_HP_Pconsumption_Hmod', [(1, Php_Hmod[hp]), (-Phpmax[hp], Uhp_Hmod[hp])], '<=', 0)
+    mm.add_constraints('con_max_HP_Pconsumption_Cmod', [(1, Php_Cmod[hp]), (-Phpmax[hp], Uhp_Cmod[hp])], '<=', 0)
+    mm.add_constraints('con_max_HP_Pconsumption_Coordinate', [(1, Uhp_Hmod[hp]), (1, Uhp_Cmod[hp])], '<=', 1)
+    mm.add_constraints('con_active_Cmod', [(1, Uhp_Cmod[hp])], '<=', (Cld[hp] > 0).astype(float))
+    if summer_mode:
+        mm.add_constraints('con_max_booster_HP_Hproduct_summer', [(1, HhpB[hpb])], '<=', HhpBmax[hpb])
+        if Pccmax != 0:
+            mm.add_constraints('con_chiller_Hwaste_summer',
+                               [(1, Hcc), (-(1 + chiller_COP) * chiller_heat_recovery, Pcc)], '==', 0)
+    elif Pccmax != 0:
+        mm.add_constraints('con_chiller_Hwaste_winter', [(1, Hcc)], '<=', 0)
+    tes_capacity = kwh_per_deg[tes_agents, 0] * Tmax_TES[tes_agents, 0]
+    add_storage_balance(mm, 'con_HTES_Ebalance', SOCTES[tes_agents],
+                        [(time_step * thermalstorage_efficiency / tes_capacity, HTEScha[tes_agents]),
+                         (-time_step / (tes_capacity * thermalstorage_efficiency), HTESdis[tes_agents])],
+                        np.array(SOCTES0, dtype=float)[tes_agents])
+    mm.add_constraints('con_HTES_final_SOC', [(1, SOCTES[tes_agents, -1])], '==',
+                       np.array(SOCTES0, dtype=float)[tes_agents])
+    if Pccmax != 0:
+        mm.add_constraints('con_chiller_Cpower_product', [(1, Ccc), (-chiller_COP, Pcc)], '==', 0)
+        mm.add_constraints('con_max_chiller_Cpower_product', [(1, Pcc)], '<=', Pccmax)
+    mm.add_constraints('con_elec_peak_load1', [(1, daily_elec_peak_load), (-1, Pbuy_market), (1, Psell_market)],
+                       '>=', 0)
+    mm.add_constraints('con_elec_peak_load2', [(1, avg_elec_peak_load), (-1 / 3, daily_elec_peak_load)],
+                       '>=', (hist_top_three_elec_peak_load[0] + hist_top_three_elec_peak_load[1]) / 3)
+    mm.add_constraints('con_elec_peak_load3', [(1, avg_elec_peak_load)], '>=',
+                       (hist_top_three_elec_peak_load[0] + hist_top_three_elec_peak_load[1]
+                        + hist_top_three_elec_peak_load[2]) / 3)
+    mm.add_constraints('con_heat_peak_load1',
+                       [(1, daily_heat_peak_energy)] + [(-time_step, Hbuy_market[t]) for t in range(T)], '>=', 0)
+    mm.add_constraints('con_heat_peak_load2', [(1, monthly_heat_peak_energy), (-1, daily_heat_peak_energy)], '>=', 0)
+    mm.add_constraints('con_heat_peak_load3', [(1, monthly_heat_peak_energy)], '>=', hist_monthly_heat_peak_energy)
+
+    # Inputs that outputs are read from (see chalmers_interface.MatrixModelValues), named as in the Pyomo model
+    mm.add_parameter('time_step', time_step)
+    mm.add_parameter('nordpool_price', price, hourly=True)
+    mm.add_parameter('elec_peak_load_fee', elec_peak_load_fee)
+    mm.add_parameter('elec_trans_fee', elec_trans_fee)
+    mm.add_parameter('elec_tax_fee', elec_tax_fee)
+    mm.add_parameter('incentive_fee', incentive_fee)
+    mm.add_parameter('Hprice_energy', external_heat_buy_price)
+    mm.add_parameter('heat_peak_load_fee', heat_peak_load_fee)
+    mm.add_parameter('Heat_trans_loss', heat_trans_loss)
+    mm.add_parameter('cold_trans_loss', cold_trans_loss)
+    mm.add_parameter('Emax_BES', Emax_BES[:, 0])
+    mm.add_parameter('kwh_per_deg', kwh_per_deg[:, 0])
+    mm.add_parameter('Energy_shallow_cap', Energy_shallow_cap[:, 0])
+    mm.add_parameter('Energy_deep_cap', Energy_deep_cap[:, 0])
+    mm.add_parameter('Phpmax', Phpmax[:, 0])
+    mm.add_parameter('PhpBmax', booster_heatpump_max_power)
+    mm.add_parameter('SOCBES0', SOCBES0)
+    mm.add_parameter('SOCTES0', SOCTES0)
+    mm.add_parameter('BITES_Eshallow0', BITES_Eshallow0)
+    mm.add_parameter('BITES_Edeep0', BITES_Edeep0)
+    return mm
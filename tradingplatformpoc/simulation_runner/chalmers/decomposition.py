@@ -0,0 +1,442 @@
+import inspect
+import logging
+import time
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import pyomo.environ as pyo
+from pyomo.opt import OptSolver, SolverResults
+
+from tradingplatformpoc.simulation_runner.chalmers import CEMS_function
+from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError, is_solved
+from tradingplatformpoc.simulation_runner.chalmers.relaxation import get_objective_value
+from tradingplatformpoc.simulation_runner.solution_cache import get_solution, load_solution
+from tradingplatformpoc.trading_platform_utils import DEFAULT_SOLVER, get_solver
+
+logger = logging.getLogger(__name__)
+
+"""
+Solves the LEC problem of CEMS_function by Lagrangian relaxation of its local market balances (the LEC_Pbalance,
+LEC_Hbalance and LEC_Cbalance constraints), for communities too large to solve as one MILP. Each iteration:
+ 1. Every agent's subproblem is solved separately, in parallel if an executor is given: the agent's part of the LEC
+    model, trading electricity, heat and cooling with the rest of the LEC at local prices, one per resource and hour.
+ 2. A coordinator subproblem, holding the LEC's connections to the external grids, the chiller and the peak loads,
+    is solved at the same prices.
+ 3. A solution of the full LEC problem is recovered, by fixing all agents' binary variables to the values from their
+    subproblems, and solving what remains (essentially an LP).
+ 4. The local prices are updated by a subgradient step on the imbalance between what the agents buy and what the
+    coordinator supplies.
+The subproblems' objectives add up to a lower bound on the LEC's optimal objective, and each recovered solution gives an
+upper bound. Iterations stop once these are within the tolerance of each other. As the problem is a MILP, the bounds
+may never meet, in which case the best recovered solution is used after the maximum number of iterations.
+"""
+
+# Resources traded in the local market, in the order of the rows of the price and imbalance arrays
+ELECTRICITY = 0
+HEAT = 1
+COOLING = 2
+N_RESOURCES = 3
+
+# Inputs to CEMS_function.solve_model with one value per agent, and with one row per agent
+AGENT_LIST_INPUTS = ['battery_capacity', 'battery_charge_rate', 'battery_discharge_rate', 'SOCBES0',
+                     'HP_Cproduct_active', 'heatpump_COP', 'heatpump_max_power', 'heatpump_max_heat',
+                     'booster_heatpump_COP', 'booster_heatpump_max_power', 'booster_heatpump_max_heat', 'build_area',
+                     'SOCTES0', 'thermalstorage_max_temp', 'thermalstorage_volume', 'BITES_Eshallow0', 'BITES_Edeep0',
+                     'borehole']
+AGENT_ARRAY_INPUTS = ['elec_consumption', 'hot_water_heatdem', 'space_heating_heatdem', 'cold_consumption',
+                      'pv_production', 'excess_low_temp_heat', 'excess_high_temp_heat']
+# Variables of the LEC as a whole, and the constraints containing them (some only exist in summer or winter mode)
+COORDINATOR_VARIABLES = ['Pbuy_market', 'Psell_market', 'U_buy_sell_market', 'Hbuy_market', 'Ccc', 'Hcc', 'Pcc',
+                         'daily_elec_peak_load', 'avg_elec_peak_load', 'daily_heat_peak_energy',
+                         'monthly_heat_peak_energy']
+COORDINATOR_CONSTRAINTS = ['con_max_Pbuy_market', 'con_max_Psell_market', 'con_elec_peak_load1',
+                           'con_elec_peak_load2', 'con_elec_peak_load3', 'con_heat_peak_load1', 'con_heat_peak_load2',
+                           'con_heat_peak_load3', 'con_chiller_Hwaste_summer', 'con_chiller_Hwaste_winter',
+                           'con_chiller_Cpower_product', 'con_max_chiller_Cpower_product', 'con_LEC_Pbalance',
+                           'con_LEC_Hbalance', 'con_LEC_Cbalance']
+# Binary variables of the agents, fixed to their subproblems' values when recovering a solution of the full problem
+AGENT_BINARIES = ['U_power_buy_sell_grid', 'UCbuy_grid', 'UCsell_grid', 'Uhp_Hmod', 'Uhp_Cmod']
+
+# The step size of the price updates is halved when the lower bound hasn't improved for this many iterations
+STEP_PATIENCE = 3
+VERY_SMALL_NUMBER = 0.000001
+
+
+class DecompositionSettings:
+    """
+    tolerance: iterations stop once the best recovered solution is guaranteed to be within this fraction of the
+        optimal one.
+    max_iterations: the maximum number of price updates.
+    """
+    tolerance: float
+    max_iterations: int
+
+    def __init__(self, tolerance: float = 0.001, max_iterations: int = 50):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+
+class SubproblemSolution:
+    """The parts of an agent subproblem's solution needed by the coordinating process."""
+    solved: bool
+    objective: float
+    # Net purchases from the local market, one row per resource and one column per time step. Sales count negatively,
+    # after the transfer losses in the local heating and cooling networks.
+    net_purchases: np.ndarray
+    # Values of AGENT_BINARIES, one per time step
+    binaries: Dict[str, np.ndarray]
+
+    def __init__(self, solved: bool, objective: float, net_purchases: np.ndarray, binaries: Dict[str, np.ndarray]):
+        self.solved = solved
+        self.objective = objective
+        self.net_purchases = net_purchases
+        self.binaries = binaries
+
+
+class AgentSubproblems:
+    """
+    The agents' subproblems of one trading horizon. Without an executor, the models are built once and solved again
+    with each iteration's prices. Models can't be passed between processes, so with an executor, each worker builds the
+    model it is to solve.
+    """
+
+    def __init__(self, agent_inputs: List[Dict[str, Any]], solver: OptSolver, executor: Optional[Executor] = None,
+                 solver_name: str = DEFAULT_SOLVER, mip_gap: float = 0.0, time_limit: float = 0.0):
+        self.agent_inputs = agent_inputs
+        self.solver = solver
+        self.executor = executor
+        self.solver_name = solver_name
+        self.mip_gap = mip_gap
+        self.time_limit = time_limit
+        self.models = [build_agent_subproblem(agent, inputs) for agent, inputs in enumerate(agent_inputs)] \
+            if executor is None else []
+
+    def solve(self, local_prices: np.ndarray) -> List[SubproblemSolution]:
+        if self.executor is None:
+            return [solve_agent_subproblem(self.solver, model, local_prices) for model in self.models]
+        futures = [self.executor.submit(build_and_solve_agent_subproblem, self.solver_name, self.mip_gap,
+                                        self.time_limit, agent, inputs, local_prices)
+                   for agent, inputs in enumerate(self.agent_inputs)]
+        return [future.result() for future in futures]
+
+
+def solve_decomposed(solver: OptSolver, lec_inputs: Dict[str, Any], settings: DecompositionSettings,
+                     executor: Optional[Executor] = None, solver_name: str = DEFAULT_SOLVER, mip_gap: float = 0.0,
+                     time_limit: float = 0.0, model_store: Optional[Dict[tuple, pyo.ConcreteModel]] = None) \
+        -> Tuple[pyo.ConcreteModel, SolverResults]:
+    """
+    Solves the LEC problem given by lec_inputs (the arguments to CEMS_function.solve_model, except the solver), as
+    described at the top of this module. Returns the LEC model, loaded with the best solution found, and the results of
+    solving it. If executor is given, the agents' subproblems are solved in parallel with it, using solver_name with
+    mip_gap and time_limit (see trading_platform_utils.get_solver); otherwise they are solved with solver, which is also
+    used for the coordinator and the full problem. The model is taken from, or stored in, model_store, as in
+    CEMS_function.solve_model.
+    Should an agent's subproblem be infeasible, or no solution of the full problem be recovered, the full problem is
+    solved as one MILP instead.
+    """
+    start = time.perf_counter()
+    inputs = get_inputs_with_defaults(lec_inputs)
+    # Prepared first, so that inputs giving an obviously infeasible problem are reported for the LEC as a whole
+    model, _ = CEMS_function.prepare_model(model_store=model_store, **lec_inputs)
+    subproblems = AgentSubproblems([get_agent_inputs(lec_inputs, agent) for agent in range(inputs['n_agents'])],
+                                   solver, executor, solver_name, mip_gap, time_limit)
+    coordinator = build_coordinator(inputs)
+    local_prices = get_initial_prices(inputs)
+
+    best_solution = None
+    best_results: Optional[SolverResults] = None
+    upper_bound = np.inf
+    lower_bound = -np.inf
+    step_scale = 1.0
+    iterations_without_improvement = 0
+    iteration = 0
+    while iteration < settings.max_iterations:
+        iteration += 1
+        solutions = subproblems.solve(local_prices)
+        if not all(solution.solved for solution in solutions):
+            logger.warning('LEC decomposition: subproblem of agent(s) {} could not be solved, solving the full problem '
+                           'instead'.format([agent for agent, solution in enumerate(solutions) if not solution.solved]))
+            return solve_full_problem(solver, lec_inputs, model_store, start)
+        set_local_prices(coordinator, local_prices)
+        if not is_solved(solver.solve(coordinator)):
+            logger.warning('LEC decomposition: coordinator could not be solved, solving the full problem instead')
+            return solve_full_problem(solver, lec_inputs, model_store, start)
+
+        dual_value = sum(solution.objective for solution in solutions) + get_objective_value(coordinator)
+        if dual_value > lower_bound + VERY_SMALL_NUMBER * max(abs(lower_bound), 1.0):
+            lower_bound = dual_value
+            iterations_without_improvement = 0
+        else:
+            iterations_without_improvement += 1
+            if iterations_without_improvement >= STEP_PATIENCE:
+                step_scale /= 2
+                iterations_without_improvement = 0
+
+        results = recover_solution(solver, model, solutions)
+        if is_solved(results) and pyo.value(model.obj) < upper_bound:
+            upper_bound = pyo.value(model.obj)
+            best_solution = get_solution(model)
+            best_results = results
+
+        gap = get_gap(lower_bound, upper_bound)
+        logger.debug('LEC decomposition iteration {}: lower bound {:.4f}, upper bound {:.4f}'.format(
+            iteration, lower_bound, upper_bound))
+        if gap <= settings.tolerance:
+            break
+        # Time steps are weighted by their length, as in the objective
+        imbalance = inputs['time_step'] * (sum(solution.net_purchases for solution in solutions)
+                                           - get_coordinator_supply(coordinator))
+        squared_norm = float(np.sum(imbalance ** 2))
+        if squared_norm < VERY_SMALL_NUMBER:
+            # The agents' plans match the coordinator's, so the bounds can't get any closer
+            break
+        local_prices = local_prices + get_step_size(step_scale, dual_value, upper_bound, local_prices,
+                                                    squared_norm) * imbalance
+
+    if best_solution is None or best_results is None:
+        logger.warning('LEC decomposition: no solution recovered in {} iterations, solving the full problem '
+                       'instead'.format(iteration))
+        return solve_full_problem(solver, lec_inputs, model_store, start)
+    load_solution(model, best_solution)
+    logger.info('LEC decomposition: {} agents, {} iterations, objective {:.4f}, at most {:.2%} from optimal'.format(
+        inputs['n_agents'], iteration, upper_bound, get_gap(lower_bound, upper_bound)))
+    best_results.solver.wallclock_time = time.perf_counter() - start
+    return model, best_results
+
+
+def solve_full_problem(solver: OptSolver, lec_inputs: Dict[str, Any],
+                       model_store: Optional[Dict[tuple, pyo.ConcreteModel]], start: float) \
+        -> Tuple[pyo.ConcreteModel, SolverResults]:
+    model, results = CEMS_function.solve_model(solver, model_store=model_store, **lec_inputs)
+    results.solver.wallclock_time = time.perf_counter() - start
+    return model, results
+
+
+def get_gap(lower_bound: float, upper_bound: float) -> float:
+    """How far from optimal, relatively, a solution with objective upper_bound can be."""
+    if not np.isfinite(upper_bound) or not np.isfinite(lower_bound):
+        return np.inf
+    return max(upper_bound - lower_bound, 0.0) / max(abs(upper_bound), VERY_SMALL_NUMBER)
+
+
+def get_step_size(step_scale: float, dual_value: float, upper_bound: float, local_prices: np.ndarray,
+                  squared_norm: float) -> float:
+    """
+    Polyak's step size, aiming for the best objective found so far. Until a solution has been recovered, steps change
+    the prices by step_scale times their average magnitude.
+    """
+    if np.isfinite(upper_bound):
+        return step_scale * max(upper_bound - dual_value, VERY_SMALL_NUMBER) / squared_norm
+    return step_scale * max(float(np.mean(np.abs(local_prices))), VERY_SMALL_NUMBER) / np.sqrt(squared_norm)
+
+
+def get_inputs_with_defaults(lec_inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """lec_inputs, with the default values of CEMS_function.solve_model for the arguments not in it."""
+    defaults = {name: parameter.default
+                for name, parameter in inspect.signature(CEMS_function.solve_model).parameters.items()
+                if parameter.default is not inspect.Parameter.empty}
+    return {**defaults, **lec_inputs}
+
+
+def get_agent_inputs(lec_inputs: Dict[str, Any], agent: int) -> Dict[str, Any]:
+    """The inputs to CEMS_function.solve_model for an LEC with only the given agent in it."""
+    agent_inputs = dict(lec_inputs, n_agents=1)
+    for name in AGENT_LIST_INPUTS:
+        agent_inputs[name] = list(lec_inputs[name])[agent:agent + 1]
+    for name in AGENT_ARRAY_INPUTS:
+        agent_inputs[name] = np.asarray(lec_inputs[name], dtype=float)[agent:agent + 1, :]
+    return agent_inputs
+
+
+def get_initial_prices(inputs: Dict[str, Any]) -> np.ndarray:
+    """
+    What it costs the LEC to supply one more unit of each resource to the local market from outside: by buying
+    electricity or heat from the external grids, and cooling from the chiller. These are the local prices whenever the
+    capacities of the connections to the external grids aren't limiting.
+    """
+    trading_horizon = int(inputs['trading_horizon'])
+    elec_price = np.asarray(inputs['nordpool_price'], dtype=float)[:trading_horizon] \
+        + inputs['elec_trans_fee'] + inputs['elec_tax_fee']
+    heat_price = np.full(trading_horizon, inputs['external_heat_buy_price'] / (1 - inputs['heat_trans_loss']))
+    cooling_price = elec_price / (inputs['chiller_COP'] * (1 - inputs['cold_trans_loss'])) \
+        if inputs['Pccmax'] > 0 else np.zeros(trading_horizon)
+    return np.stack([elec_price, heat_price, cooling_price])
+
+
+def set_local_prices(model: pyo.ConcreteModel, local_prices: np.ndarray):
+    model.local_price.store_values(CEMS_function.bulk_values(model.local_price, local_prices), check=False)
+
+
+def build_agent_subproblem(agent: int, agent_inputs: Dict[str, Any]) -> pyo.ConcreteModel:
+    """
+    The LEC model for a single agent (see get_agent_inputs), which trades with the rest of the LEC at local prices
+    (set with set_local_prices), rather than with the external grids. The variables of the LEC as a whole are fixed to
+    0, and the constraints containing them are deactivated.
+    """
+    try:
+        model, _ = CEMS_function.prepare_model(**agent_inputs)
+    except CEMSError as e:
+        raise CEMSError(e.message, [agent], e.hour_indices)
+    for name in COORDINATOR_CONSTRAINTS:
+        constraint = model.component(name)
+        if constraint is not None:
+            constraint.deactivate()
+    for name in COORDINATOR_VARIABLES:
+        model.component(name).fix(0)
+    model.obj.deactivate()
+    model.local_price = pyo.Param(range(N_RESOURCES), model.T, mutable=True, initialize=0)
+    model.subproblem_obj = pyo.Objective(rule=agent_subproblem_obj, sense=pyo.minimize)
+    return model
+
+
+def agent_subproblem_obj(model):
+    return model.time_step * sum(
+        # Penalty terms, as in CEMS_function.obj_rul
+        model.heat_dump[i, t] * model.penalty
+        + model.cool_dump_agent[i, t] * model.penalty
+        # Trading with the rest of the LEC
+        + model.local_price[ELECTRICITY, t] * (model.Pbuy_grid[i, t] - model.Psell_grid[i, t])
+        + model.local_price[HEAT, t] * (model.Hbuy_grid[i, t] - model.Hsell_grid[i, t] * (1 - model.Heat_trans_loss))
+        + model.local_price[COOLING, t] * (model.Cbuy_grid[i, t] - model.Csell_grid[i, t] * (1 - model.cold_trans_loss))
+        for i in model.I for t in model.T)
+
+
+def solve_agent_subproblem(solver: OptSolver, model: pyo.ConcreteModel, local_prices: np.ndarray) \
+        -> SubproblemSolution:
+    set_local_prices(model, local_prices)
+    if not is_solved(solver.solve(model)):
+        return SubproblemSolution(False, np.inf, np.zeros((N_RESOURCES, len(model.T))), {})
+
+    def values(name: str) -> np.ndarray:
+        variable = getattr(model, name)
+        return np.array([pyo.value(variable[0, t]) for t in model.T], dtype=float)
+
+    net_purchases = np.stack([
+        values('Pbuy_grid') - values('Psell_grid'),
+        values('Hbuy_grid') - values('Hsell_grid') * (1 - pyo.value(model.Heat_trans_loss)),
+        values('Cbuy_grid') - values('Csell_grid') * (1 - pyo.value(model.cold_trans_loss))])
+    return SubproblemSolution(True, get_objective_value(model), net_purchases,
+                              {name: np.round(values(name)) for name in AGENT_BINARIES})
+
+
+def build_and_solve_agent_subproblem(solver_name: str, mip_gap: float, time_limit: float, agent: int,
+                                     agent_inputs: Dict[str, Any], local_prices: np.ndarray) -> SubproblemSolution:
+    """Meant to be run in a worker process."""
+    solver = get_solver(solver_name, mip_gap, time_limit)
+    return solve_agent_subproblem(solver, build_agent_subproblem(agent, agent_inputs), local_prices)
+
+
+def build_coordinator(inputs: Dict[str, Any]) -> pyo.ConcreteModel:
+    """
+    The part of the LEC model concerning the LEC as a whole, which buys and sells electricity and buys heat on the
+    external grids, runs the chiller, and pays for the peak loads. It supplies the local market at local prices (set
+    with set_local_prices). inputs should include the defaults of CEMS_function.solve_model.
+    """
+    trading_horizon = int(inputs['trading_horizon'])
+    model = pyo.ConcreteModel(name="LEC coordinator")
+    model.T = pyo.Set(initialize=range(trading_horizon))
+    # No agents, so the penalty terms of CEMS_function.obj_rul are empty
+    model.add_component('I', pyo.Set(initialize=[]))
+    model.penalty = pyo.Param(initialize=1000)
+    model.time_step = pyo.Param(initialize=inputs['time_step'])
+    model.nordpool_price = pyo.Param(model.T, initialize=dict(enumerate(
+        np.asarray(inputs['nordpool_price'], dtype=float)[:trading_horizon].tolist())))
+    model.elec_peak_load_fee = pyo.Param(initialize=inputs['elec_peak_load_fee'])
+    model.elec_trans_fee = pyo.Param(initialize=inputs['elec_trans_fee'])
+    model.elec_tax_fee = pyo.Param(initialize=inputs['elec_tax_fee'])
+    model.incentive_fee = pyo.Param(initialize=inputs['incentive_fee'])
+    model.Hprice_energy = pyo.Param(initialize=inputs['external_heat_buy_price'])
+    model.heat_peak_load_fee = pyo.Param(initialize=inputs['heat_peak_load_fee'])
+    model.Pmax_market = pyo.Param(initialize=inputs['max_elec_transfer_to_external'])
+    model.hist_top_three_elec_peak_load = pyo.Param(range(3), initialize=dict(enumerate(
+        float(peak) for peak in inputs['hist_top_three_elec_peak_load'])))
+    model.Hist_monthly_heat_peak_energy = pyo.Param(initialize=inputs['hist_monthly_heat_peak_energy'])
+    model.COPcc = pyo.Param(initialize=inputs['chiller_COP'])
+    model.chiller_heat_recovery = pyo.Param(initialize=inputs['chiller_heat_recovery'])
+    model.Pccmax = pyo.Param(initialize=inputs['Pccmax'])
+    model.Heat_trans_loss = pyo.Param(initialize=inputs['heat_trans_loss'])
+    model.cold_trans_loss = pyo.Param(initialize=inputs['cold_trans_loss'])
+    model.local_price = pyo.Param(range(N_RESOURCES), model.T, mutable=True, initialize=0)
+
+    # The agents can't take more heat than this from the local market, so neither can the LEC need more from outside.
+    # Bounding it keeps the coordinator's problem bounded for any local heat price.
+    max_heat_bought = inputs['n_agents'] * inputs['max_heat_transfer_between_agents'] / (1 - inputs['heat_trans_loss'])
+    model.Pbuy_market = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
+    model.Psell_market = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
+    model.U_buy_sell_market = pyo.Var(model.T, within=pyo.Binary, initialize=0)
+    model.Hbuy_market = pyo.Var(model.T, bounds=(0, max_heat_bought), within=pyo.NonNegativeReals, initialize=0)
+    model.Ccc = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
+    model.Hcc = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
+    model.Pcc = pyo.Var(model.T, within=pyo.NonNegativeReals, initialize=0)
+    model.daily_elec_peak_load = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
+    model.avg_elec_peak_load = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
+    model.daily_heat_peak_energy = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
+    model.monthly_heat_peak_energy = pyo.Var(within=pyo.NonNegativeReals, initialize=0)
+    if inputs['Pccmax'] == 0:
+        # No chiller
+        model.Ccc.fix(0)
+        model.Hcc.fix(0)
+        model.Pcc.fix(0)
+
+    model.obj = pyo.Objective(rule=coordinator_obj, sense=pyo.minimize)
+    model.con_max_Pbuy_market = pyo.Constraint(model.T, rule=CEMS_function.max_Pbuy_market)
+    model.con_max_Psell_market = pyo.Constraint(model.T, rule=CEMS_function.max_Psell_market)
+    if inputs['summer_mode']:
+        model.con_chiller_Hwaste_summer = pyo.Constraint(model.T, rule=CEMS_function.chiller_Hwaste_summer)
+    else:
+        model.con_chiller_Hwaste_winter = pyo.Constraint(model.T, rule=CEMS_function.chiller_Hwaste_winter)
+    model.con_chiller_Cpower_product = pyo.Constraint(model.T, rule=CEMS_function.chiller_Cpower_product)
+    model.con_max_chiller_Cpower_product = pyo.Constraint(model.T, rule=CEMS_function.max_chiller_Cpower_product)
+    model.con_elec_peak_load1 = pyo.Constraint(model.T, rule=CEMS_function.elec_peak_load1)
+    model.con_elec_peak_load2 = pyo.Constraint(rule=CEMS_function.elec_peak_load2)
+    model.con_elec_peak_load3 = pyo.Constraint(rule=CEMS_function.elec_peak_load3)
+    model.con_heat_peak_load1 = pyo.Constraint(rule=CEMS_function.heat_peak_load1)
+    model.con_heat_peak_load2 = pyo.Constraint(rule=CEMS_function.heat_peak_load2)
+    model.con_heat_peak_load3 = pyo.Constraint(rule=CEMS_function.heat_peak_load3)
+    return model
+
+
+def coordinator_obj(model):
+    # The LEC's costs, as in CEMS_function.obj_rul, minus the value, at local prices, of what it supplies
+    return CEMS_function.obj_rul(model) - model.time_step * sum(
+        model.local_price[ELECTRICITY, t] * (model.Pbuy_market[t] - model.Psell_market[t] - model.Pcc[t])
+        + model.local_price[HEAT, t] * (model.Hbuy_market[t] + model.Hcc[t]) * (1 - model.Heat_trans_loss)
+        + model.local_price[COOLING, t] * model.Ccc[t] * (1 - model.cold_trans_loss)
+        for t in model.T)
+
+
+def get_coordinator_supply(model: pyo.ConcreteModel) -> np.ndarray:
+    """What the coordinator supplies to the local market, with one row per resource and one column per time step."""
+
+    def values(name: str) -> np.ndarray:
+        variable = getattr(model, name)
+        return np.array([pyo.value(variable[t]) for t in model.T], dtype=float)
+
+    return np.stack([
+        values('Pbuy_market') - values('Psell_market') - values('Pcc'),
+        (values('Hbuy_market') + values('Hcc')) * (1 - pyo.value(model.Heat_trans_loss)),
+        values('Ccc') * (1 - pyo.value(model.cold_trans_loss))])
+
+
+def recover_solution(solver: OptSolver, model: pyo.ConcreteModel, solutions: List[SubproblemSolution]) \
+        -> SolverResults:
+    """
+    Solves the full LEC model with each agent's binary variables fixed to the values from its subproblem, which leaves
+    an LP apart from the market's buy/sell binaries. The continuous variables are free, so the agents' plans can be
+    adjusted to balance the local market. The variables are unfixed again afterwards, leaving the solution loaded.
+    """
+    fixed = []
+    for agent, solution in enumerate(solutions):
+        for name, values in solution.binaries.items():
+            variable = getattr(model, name)
+            for t in model.T:
+                if not variable[agent, t].fixed:
+                    variable[agent, t].fix(float(values[t]))
+                    fixed.append(variable[agent, t])
+    try:
+        return solver.solve(model)
+    finally:
+        for var in fixed:
+            var.unfix()
@@ -1,3 +1,5 @@
+from pyomo.opt import SolverResults, TerminationCondition
+
 # This share of high-temp heat need can be covered by low-temp heat (source: BDAB). The rest needs to be covered by
 # a booster heat pump.
 PERC_OF_HT_COVERABLE_BY_LT = 0.6
@@ -11,3 +13,15 @@ class CEMSError(Exception):
         self.message = message
         self.agent_indices = agent_indices
         self.hour_indices = hour_indices
+
+    def __reduce__(self):
+        # So that the error can be pickled, and raised in the main process when solving in a worker process
+        return CEMSError, (self.message, self.agent_indices, self.hour_indices)
+
+
+def is_solved(results: SolverResults) -> bool:
+    """
+    Whether the solver found a solution to use: an optimal one, or, if a MIP gap or time limit was set, a feasible one
+    found before the solver stopped.
+    """
+    return results.solver.termination_condition in [TerminationCondition.optimal, TerminationCondition.feasible]
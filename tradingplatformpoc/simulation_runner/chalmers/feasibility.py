@@ -0,0 +1,102 @@
+"""
+Cheap checks of the inputs to the optimization models, run before the models are built. Each check is a necessary
+condition for the model to be feasible, evaluated for all agents and hours of the horizon at once, so that the agent(s)
+and hour(s) responsible can be reported straight away, instead of after a failed solve.
+"""
+from typing import List
+
+import numpy as np
+
+from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError, PERC_OF_HT_COVERABLE_BY_LT
+
+SUMMER_MONTHS = [6, 7, 8]
+
+
+def check_lec_inputs(summer_mode: bool, month: int, elec_consumption: np.ndarray, pv_production: np.ndarray,
+                     hot_water_heatdem: np.ndarray, cold_consumption: np.ndarray,
+                     battery_discharge_rate: List[float], heatpump_cop: List[float],
+                     heatpump_max_power: List[float], hp_cproduct_active: List[bool], borehole: List[bool],
+                     booster_heatpump_max_heat: List[float], kwh_per_deg: List[float],
+                     thermalstorage_max_temp: List[float], max_elec_transfer_between_agents: float,
+                     max_elec_transfer_to_external: float, chiller_cop: float, chiller_max_power: float,
+                     trading_horizon: int):
+    """
+    Raises a CEMSError if the inputs to CEMS_function.solve_model can be seen to give an infeasible problem. Time series
+    inputs are arrays with one row per agent and one column per hour.
+    """
+    elec_consumption = elec_consumption[:, :trading_horizon]
+    pv_production = pv_production[:, :trading_horizon]
+    hot_water_heatdem = hot_water_heatdem[:, :trading_horizon]
+    cold_consumption = cold_consumption[:, :trading_horizon]
+
+    # Agents' electricity need, which can't be covered by their own PV or battery, must be bought from the LEC, and the
+    # LEC's total need from the external grid.
+    max_discharge = np.array(battery_discharge_rate, dtype=float)[:, np.newaxis]
+    min_elec_bought = elec_consumption - pv_production - max_discharge
+    raise_if_any('Unfillable electricity demand for agent(s)', min_elec_bought > max_elec_transfer_between_agents)
+    raise_if_any('Unfillable electricity demand in LEC',
+                 (min_elec_bought.sum(axis=0) > max_elec_transfer_to_external)[np.newaxis, :],
+                 report_agents=False)
+
+    # When running in summer mode, agents cannot buy high-temperature district heating, so all hot water needs to be
+    # covered, to (1 - PERC_OF_HT_COVERABLE_BY_LT) * 100%, by the booster heat pump, but agents can also use the
+    # accumulator tank.
+    # (Hhw - acc_tank_capacity) * (1 - PERC_OF_HT_COVERABLE_BY_LT) must be covered by booster in any given hour.
+    if summer_mode:
+        max_tank_dis = np.array(kwh_per_deg, dtype=float) * np.array(thermalstorage_max_temp, dtype=float)
+        must_be_covered_by_booster = (hot_water_heatdem - max_tank_dis[:, np.newaxis]) \
+            * (1 - PERC_OF_HT_COVERABLE_BY_LT)
+        raise_if_any('Unfillable hot water demand for agent(s)',
+                     must_be_covered_by_booster > np.array(booster_heatpump_max_heat, dtype=float)[:, np.newaxis])
+
+    # Cooling can be traded within the LEC, so the total cooling demand is compared with what the chiller and the heat
+    # pumps can produce together
+    max_cooling_produced_for_1_hour = chiller_max_power * chiller_cop \
+        + max_heat_pump_cooling(month, heatpump_cop, heatpump_max_power, hp_cproduct_active, borehole).sum()
+    raise_if_any('Unfillable cooling demand in LEC',
+                 (cold_consumption.sum(axis=0) > max_cooling_produced_for_1_hour)[np.newaxis, :],
+                 report_agents=False)
+
+
+def check_agent_inputs(month: int, agent: int, elec_consumption: np.ndarray, pv_production: np.ndarray,
+                       cold_consumption: np.ndarray, battery_discharge_rate: float, heatpump_cop: float,
+                       heatpump_max_power: float, hp_cproduct_active: bool, borehole: bool,
+                       max_elec_transfer_to_external: float, trading_horizon: int):
+    """
+    Raises a CEMSError if the inputs to AgentEMS.solve_model can be seen to give an infeasible problem. The error's
+    agent index is "agent".
+    """
+    min_elec_bought = elec_consumption[:trading_horizon] - pv_production[:trading_horizon] - battery_discharge_rate
+    too_big_elec_demand = min_elec_bought > max_elec_transfer_to_external
+    if too_big_elec_demand.any():
+        raise CEMSError(message='Unfillable electricity demand for agent',
+                        agent_indices=[agent],
+                        hour_indices=np.flatnonzero(too_big_elec_demand).tolist())
+
+    max_cooling_produced_for_1_hour = max_heat_pump_cooling(month, [heatpump_cop], [heatpump_max_power],
+                                                            [hp_cproduct_active], [borehole])[0]
+    too_big_cool_demand = cold_consumption[:trading_horizon] > max_cooling_produced_for_1_hour
+    if too_big_cool_demand.any():
+        raise CEMSError(message='Unfillable cooling demand for agent',
+                        agent_indices=[agent],
+                        hour_indices=np.flatnonzero(too_big_cool_demand).tolist())
+
+
+def max_heat_pump_cooling(month: int, heatpump_cop: List[float], heatpump_max_power: List[float],
+                          hp_cproduct_active: List[bool], borehole: List[bool]) -> np.ndarray:
+    """
+    Maximum cooling that each agent can produce in one hour. Agents with a borehole have unlimited free cooling, except
+    in the summer months.
+    """
+    return np.array([(hp_cop - 1) * max_php if hpc_active else
+                     np.inf if has_bh and month not in SUMMER_MONTHS else 0
+                     for hp_cop, max_php, hpc_active, has_bh in
+                     zip(heatpump_cop, heatpump_max_power, hp_cproduct_active, borehole)], dtype=float)
+
+
+def raise_if_any(message: str, problematic: np.ndarray, report_agents: bool = True):
+    """Raises a CEMSError if any element of "problematic" (agents x hours) is True."""
+    if problematic.any():
+        raise CEMSError(message=message,
+                        agent_indices=np.flatnonzero(problematic.any(axis=1)).tolist() if report_agents else [],
+                        hour_indices=np.flatnonzero(problematic.any(axis=0)).tolist())
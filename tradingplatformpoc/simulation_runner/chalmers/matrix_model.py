@@ -0,0 +1,219 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import coo_matrix, csr_matrix
+
+# A term of a linear expression: coefficient(s) and the columns of the variable(s) they multiply. Coefficients and
+# columns are broadcast against each other, and against the shape of the constraint family they are used in.
+Term = Tuple[Union[float, np.ndarray], np.ndarray]
+
+# Status codes of scipy.optimize.milp
+OPTIMAL = 0
+LIMIT_REACHED = 1
+INFEASIBLE = 2
+UNBOUNDED = 3
+
+
+class MatrixSolution:
+    status: int
+    message: str
+    objective: Optional[float]
+    mip_gap: Optional[float]
+    values: Dict[str, np.ndarray]
+
+    def __init__(self, status: int, message: str, objective: Optional[float], values: Dict[str, np.ndarray],
+                 mip_gap: Optional[float] = None):
+        self.status = status
+        self.message = message
+        self.objective = objective
+        self.mip_gap = mip_gap
+        self.values = values
+
+    def is_optimal(self) -> bool:
+        return self.status == OPTIMAL
+
+    def has_values(self) -> bool:
+        """Whether a solution was found, which may not be optimal if the time limit was reached."""
+        return len(self.values) > 0
+
+
+class MatrixModel:
+    """
+    A mixed-integer linear program on the form
+        minimize c'x  subject to  row_lb <= Ax <= row_ub,  lb <= x <= ub,  x_j integer for some j,
+    assembled directly as a sparse matrix, without building any Pyomo expressions.
+    Variables are added in blocks: add_variable returns an array of column indices, shaped like the variable's index
+    sets (for example agent x hour), which is then used to refer to the variable when adding constraints and costs.
+    Constraints are added a whole family at a time, with one row per element of the broadcast shape of the terms.
+    Input data that outputs are read from, after solving, is kept as parameters, with the names of the corresponding
+    Pyomo parameters.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.variables: Dict[str, np.ndarray] = {}
+        self.constraints: Dict[str, np.ndarray] = {}
+        self.parameters: Dict[str, np.ndarray] = {}
+        self.hourly_parameters: List[str] = []
+        self.n_columns = 0
+        self.n_rows = 0
+        self._lower_bounds: List[np.ndarray] = []
+        self._upper_bounds: List[np.ndarray] = []
+        self._integrality: List[np.ndarray] = []
+        self._fixed_columns: List[np.ndarray] = []
+        self._fixed_values: List[np.ndarray] = []
+        self._cost_columns: List[np.ndarray] = []
+        self._cost_coefficients: List[np.ndarray] = []
+        self._rows: List[np.ndarray] = []
+        self._columns: List[np.ndarray] = []
+        self._coefficients: List[np.ndarray] = []
+        self._row_lower_bounds: List[np.ndarray] = []
+        self._row_upper_bounds: List[np.ndarray] = []
+
+    def add_variable(self, name: str, shape: Union[int, Tuple[int, ...]] = (), lb: float = 0.0,
+                     ub: float = np.inf, integer: bool = False) -> np.ndarray:
+        """Adds a block of variables, and returns their column indices, in an array of the given shape."""
+        if name in self.variables:
+            raise ValueError('Variable {} already exists in model {}'.format(name, self.name))
+        columns = self.n_columns + np.arange(int(np.prod(shape, dtype=int))).reshape(shape)
+        self.n_columns += columns.size
+        self._lower_bounds.append(np.full(columns.size, lb, dtype=float))
+        self._upper_bounds.append(np.full(columns.size, ub, dtype=float))
+        self._integrality.append(np.full(columns.size, 1 if integer else 0, dtype=np.uint8))
+        self.variables[name] = columns
+        return columns
+
+    def add_binary_variable(self, name: str, shape: Union[int, Tuple[int, ...]] = ()) -> np.ndarray:
+        return self.add_variable(name, shape, lb=0.0, ub=1.0, integer=True)
+
+    def fix_variables(self, columns: np.ndarray, value: Union[float, np.ndarray] = 0.0):
+        """Fixes the given variables to a value (scalar, or broadcast against "columns"), via both their bounds."""
+        columns = np.asarray(columns)
+        self._fixed_columns.append(columns.ravel())
+        self._fixed_values.append(np.broadcast_to(np.asarray(value, dtype=float), columns.shape).ravel())
+
+    def add_parameter(self, name: str, value: Union[float, Sequence[float], np.ndarray], hourly: bool = False):
+        """Keeps input data, with hourly=True if its last axis is the hour, like that of the variables."""
+        self.parameters[name] = np.asarray(value, dtype=float)
+        if hourly:
+            self.hourly_parameters.append(name)
+
+    def add_constraints(self, name: str, terms: Sequence[Term], sense: str, rhs: Union[float, np.ndarray] = 0.0):
+        """
+        Adds one row per element of the broadcast shape of "terms" and "rhs": sum(coefficient * variable) <sense> rhs,
+        where sense is one of '==', '<=' and '>='. Adding to an existing name extends that constraint family, which is
+        useful for families with special cases, such as the first hour of a storage balance.
+        """
+        shape = np.broadcast_shapes(*[np.shape(coefficient) for coefficient, _ in terms],
+                                    *[np.shape(columns) for _, columns in terms], np.shape(rhs))
+        n_new_rows = int(np.prod(shape, dtype=int))
+        rows = self.n_rows + np.arange(n_new_rows)
+        for coefficient, columns in terms:
+            coefficients = np.broadcast_to(np.asarray(coefficient, dtype=float), shape).ravel()
+            non_zero = coefficients != 0
+            self._rows.append(rows[non_zero])
+            self._columns.append(np.broadcast_to(columns, shape).ravel()[non_zero])
+            self._coefficients.append(coefficients[non_zero])
+        rhs_values = np.broadcast_to(np.asarray(rhs, dtype=float), shape).ravel()
+        if sense == '==':
+            self._row_lower_bounds.append(rhs_values)
+            self._row_upper_bounds.append(rhs_values)
+        elif sense == '<=':
+            self._row_lower_bounds.append(np.full(n_new_rows, -np.inf))
+            self._row_upper_bounds.append(rhs_values)
+        elif sense == '>=':
+            self._row_lower_bounds.append(rhs_values)
+            self._row_upper_bounds.append(np.full(n_new_rows, np.inf))
+        else:
+            raise ValueError('Unrecognized constraint sense {}'.format(sense))
+        self.constraints[name] = np.concatenate([self.constraints[name], rows]) if name in self.constraints else rows
+        self.n_rows += n_new_rows
+
+    def add_to_objective(self, coefficient: Union[float, np.ndarray], columns: np.ndarray):
+        """Adds coefficient * variable to the (minimized) objective. Coefficients of repeated columns are summed."""
+        coefficients, columns = np.broadcast_arrays(np.asarray(coefficient, dtype=float), columns)
+        self._cost_columns.append(columns.ravel())
+        self._cost_coefficients.append(coefficients.ravel())
+
+    def cost_vector(self) -> np.ndarray:
+        costs = np.zeros(self.n_columns)
+        if self._cost_columns:
+            np.add.at(costs, np.concatenate(self._cost_columns), np.concatenate(self._cost_coefficients))
+        return costs
+
+    def constraint_matrix(self) -> csr_matrix:
+        """The constraint matrix A, in CSR format. Coefficients of repeated (row, column) pairs are summed."""
+        if not self._rows:
+            return csr_matrix((self.n_rows, self.n_columns))
+        return coo_matrix((np.concatenate(self._coefficients), (np.concatenate(self._rows),
+                                                                np.concatenate(self._columns))),
+                          shape=(self.n_rows, self.n_columns)).tocsr()
+
+    def row_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        return np.concatenate(self._row_lower_bounds), np.concatenate(self._row_upper_bounds)
+
+    def variable_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        lower_bounds = np.concatenate(self._lower_bounds)
+        upper_bounds = np.concatenate(self._upper_bounds)
+        if self._fixed_columns:
+            fixed_columns = np.concatenate(self._fixed_columns)
+            fixed_values = np.concatenate(self._fixed_values)
+            lower_bounds[fixed_columns] = fixed_values
+            upper_bounds[fixed_columns] = fixed_values
+        return lower_bounds, upper_bounds
+
+    def integrality(self) -> np.ndarray:
+        return np.concatenate(self._integrality)
+
+    def free_columns(self) -> np.ndarray:
+        """Mask of the variables that aren't fixed, which are the ones the Pyomo models give the solver."""
+        free = np.full(self.n_columns, True)
+        if self._fixed_columns:
+            free[np.concatenate(self._fixed_columns)] = False
+        return free
+
+    def solve(self, time_limit: Optional[float] = None, mip_rel_gap: Optional[float] = None) -> MatrixSolution:
+        """
+        Solves the model with scipy's MILP solver (HiGHS), straight from the matrices - no model file is written.
+        Values of the solution are returned per variable, in the shape of the variable's column index array.
+        """
+        options: Dict[str, float] = {}
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+        if mip_rel_gap is not None:
+            options['mip_rel_gap'] = mip_rel_gap
+        row_lb, row_ub = self.row_bounds()
+        lb, ub = self.variable_bounds()
+        result = milp(c=self.cost_vector(), integrality=self.integrality(), bounds=Bounds(lb, ub),
+                      constraints=LinearConstraint(self.constraint_matrix(), row_lb, row_ub), options=options)
+        values = {} if result.x is None else {name: result.x[columns] for name, columns in self.variables.items()}
+        return MatrixSolution(result.status, result.message, result.fun, values, getattr(result, 'mip_gap', None))
+
+
+def add_storage_balance(model: MatrixModel, name: str, level: np.ndarray, flows: Sequence[Term],
+                        start_level: Union[float, Sequence[float], np.ndarray]):
+    """
+    Adds level[t] == level[t - 1] + sum(coefficient * flow[t]) for all hours t (the last axis of "level"), where
+    level[-1] is the start level of the horizon.
+    "flows" should be given with the same shape as "level", coefficients may be scalars or broadcast against the
+    leading axes of "level".
+    """
+    first = (slice(None),) * (level.ndim - 1) + (slice(0, 1),)
+    rest = (slice(None),) * (level.ndim - 1) + (slice(1, None),)
+    start = np.asarray(start_level, dtype=float).reshape(level.shape[:-1] + (1,))
+    first_hour: List[Term] = [(1.0, level[first])]
+    first_hour += [(-_expand_coefficient(coefficient, level), columns[first]) for coefficient, columns in flows]
+    model.add_constraints(name, first_hour, '==', start)
+    other_hours: List[Term] = [(1.0, level[rest]), (-1.0, level[first[:-1] + (slice(0, -1),)])]
+    other_hours += [(-_expand_coefficient(coefficient, level), columns[rest]) for coefficient, columns in flows]
+    model.add_constraints(name, other_hours, '==', 0.0)
+
+
+def _expand_coefficient(coefficient: Union[float, np.ndarray], level: np.ndarray) -> np.ndarray:
+    """Per-agent coefficients (one dimension less than the storage level) get an hour axis added."""
+    coefficient = np.asarray(coefficient, dtype=float)
+    if coefficient.ndim == level.ndim - 1 and coefficient.ndim > 0:
+        return coefficient[..., np.newaxis]
+    return coefficient
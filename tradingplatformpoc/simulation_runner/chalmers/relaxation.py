@@ -0,0 +1,87 @@
+import logging
+
+import pyomo.environ as pyo
+from pyomo.contrib.appsi.base import PersistentSolver
+from pyomo.opt import OptSolver, SolverResults
+
+from tradingplatformpoc.simulation_runner.chalmers.domain import is_solved
+
+# Relaxed values this close to 0 or 1 are considered integral
+INTEGRALITY_TOLERANCE = 1e-6
+
+logger = logging.getLogger(__name__)
+
+
+def solve_with_relaxed_binaries(solver: OptSolver, model: pyo.ConcreteModel) -> SolverResults:
+    """
+    Fast, approximate alternative to solving the MILP: the model's binary variables are first relaxed to continuous
+    variables in [0, 1], and the resulting LP is solved. If any binary variable gets a fractional value, the solution is
+    repaired: the binaries that got integral values are fixed to them, and the model is solved again, which leaves a
+    much smaller MILP than the original one. Should that not be feasible, the full MILP is solved.
+    The relaxed objective is a lower bound on the optimal objective, so the gap between it and the repaired objective is
+    an upper bound on how far from optimal the returned solution is. It is logged.
+    The model is returned to its original state (binaries, and which variables are fixed), with the solution loaded.
+    """
+    binaries = [var for var in model.component_data_objects(pyo.Var, descend_into=True)
+                if var.is_binary() and not var.fixed]
+    for var in binaries:
+        var.domain = pyo.UnitInterval
+    try:
+        results = solve_modified_model(solver, model)
+    finally:
+        for var in binaries:
+            var.domain = pyo.Binary
+    if not is_solved(results):
+        reset_solver(solver, model)
+        return results
+    relaxed_objective = get_objective_value(model)
+
+    fractional = [var for var in binaries if not is_integral(var.value)]
+    if len(fractional) == 0:
+        logger.info('{}: relaxed solution has no fractional binaries, and is optimal'.format(model.name))
+        reset_solver(solver, model)
+        return results
+
+    integral = [var for var in binaries if is_integral(var.value)]
+    for var in integral:
+        var.fix(round(var.value))
+    try:
+        results = solve_modified_model(solver, model)
+    finally:
+        for var in integral:
+            var.unfix()
+    if not is_solved(results):
+        logger.warning('{}: could not repair relaxed solution, with {} fractional binaries, solving the full problem '
+                       'instead'.format(model.name, len(fractional)))
+        return solve_modified_model(solver, model)
+    reset_solver(solver, model)
+
+    repaired_objective = get_objective_value(model)
+    gap = (repaired_objective - relaxed_objective) / max(abs(repaired_objective), INTEGRALITY_TOLERANCE)
+    logger.info('{}: repaired {} fractional binaries, objective {:.4f}, at most {:.2%} from optimal'.format(
+        model.name, len(fractional), repaired_objective, gap))
+    return results
+
+
+def solve_modified_model(solver: OptSolver, model: pyo.ConcreteModel) -> SolverResults:
+    reset_solver(solver, model)
+    return solver.solve(model)
+
+
+def reset_solver(solver: OptSolver, model: pyo.ConcreteModel):
+    """
+    A persistent solver, such as the HiGHS interface, keeps its own copy of the model, and only passes on what changed
+    to it before the next solve. Changed domains and fixed variables aren't passed on reliably (HiGHS fails to delete
+    the rows of the constraints involved, and then reports a feasible model as infeasible), so after changing them, the
+    solver's copy is built anew.
+    """
+    if isinstance(solver, PersistentSolver):
+        solver.set_instance(model)
+
+
+def is_integral(value: float) -> bool:
+    return abs(value - round(value)) <= INTEGRALITY_TOLERANCE
+
+
+def get_objective_value(model: pyo.ConcreteModel) -> float:
+    return pyo.value(next(model.component_data_objects(pyo.Objective, active=True, descend_into=True)))
@@ -1,14 +1,13 @@
 import datetime
 import logging
+import time
+from concurrent.futures import Executor
 from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 import numpy as np
 
-import pandas as pd
-
 import pyomo.environ as pyo
-from pyomo.core.base.param import IndexedParam, ScalarParam
-from pyomo.core.base.var import IndexedVar
+from pyomo.core.base.param import IndexedParam
 from pyomo.opt import OptSolver, SolverResults, TerminationCondition
 from pyomo.util.infeasible import find_infeasible_constraints, log_infeasible_constraints
 
@@ -19,12 +18,31 @@ from tradingplatformpoc.market.trade import Action, Market, Resource, Trade, Tra
 from tradingplatformpoc.price.electricity_price import ElectricityPrice
 from tradingplatformpoc.price.heating_price import HeatingPrice
 from tradingplatformpoc.price.iprice import IPrice
-from tradingplatformpoc.simulation_runner.chalmers import AgentEMS, CEMS_function
-from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError
-from tradingplatformpoc.trading_platform_utils import add_to_nested_dict, should_use_summer_mode
+from tradingplatformpoc.settings import settings
+from tradingplatformpoc.simulation_runner import model_export
+from tradingplatformpoc.simulation_runner.chalmers import AgentEMS, CEMS_function, decomposition
+from tradingplatformpoc.simulation_runner.chalmers.decomposition import DecompositionSettings
+from tradingplatformpoc.simulation_runner.chalmers.domain import CEMSError, is_solved
+from tradingplatformpoc.simulation_runner.chalmers.matrix_model import INFEASIBLE, LIMIT_REACHED, MatrixModel, \
+    MatrixSolution, OPTIMAL, UNBOUNDED
+from tradingplatformpoc.simulation_runner.solution_cache import SolutionCache, get_cache_key, load_solution
+from tradingplatformpoc.simulation_runner.time_aggregation import ENERGIES_PER_TIME_STEP, STORAGE_LEVELS, aggregate, \
+    expand, expand_levels, get_aggregation_error, get_time_step
+from tradingplatformpoc.trading_platform_utils import DEFAULT_SOLVER, add_to_nested_dict, get_if_exists_else, \
+    get_solver, should_use_summer_mode
 
 VERY_SMALL_NUMBER = 0.000001  # to avoid trades with quantity 1e-7, for example
 DECIMALS_TO_ROUND_TO = 6  # To avoid saving for example storage levels of -1e-8
+# What to do when the solver reaches the time limit. Should match the "options" of the "TimeLimitFallback" parameter in
+# area_info_specs.json
+ACCEPT_INCUMBENT = 'AcceptIncumbent'
+SOLVE_RELAXATION = 'SolveRelaxation'
+FAIL_JOB = 'Fail'
+# Statuses of MatrixModel.solve, as the termination conditions that Pyomo reports
+MATRIX_MODEL_STATUSES = {OPTIMAL: str(TerminationCondition.optimal),
+                         LIMIT_REACHED: str(TerminationCondition.maxTimeLimit),
+                         INFEASIBLE: str(TerminationCondition.infeasible),
+                         UNBOUNDED: str(TerminationCondition.unbounded)}
 
 logger = logging.getLogger(__name__)
 
@@ -36,19 +54,97 @@ Here we keep methods that do either
 """
 
 
+class SolveInfo:
+    model_name: str
+    horizon_start: datetime.datetime
+    # Wall-clock times spent constructing/updating the model, in the solver, and extracting outputs from the model
+    build_seconds: float
+    solve_seconds: float
+    extraction_seconds: float
+    # Whether the solver was given a MIP start (the previous horizon's solution)
+    warm_start: bool
+    # Size of the problem passed to the solver: fixed variables and inactive constraints aren't counted
+    n_variables: int
+    n_constraints: int
+    n_binaries: int
+    # Termination condition of the solver
+    status: str
+    mip_gap: Optional[float]
+    objective: Optional[float]
+    # The fallback used if the solver reached the time limit, see SolverSettings
+    fallback: Optional[str]
+
+    def __init__(self, model_name: str, horizon_start: datetime.datetime, build_seconds: float, solve_seconds: float,
+                 warm_start: bool, n_variables: int, n_constraints: int, n_binaries: int, status: str,
+                 mip_gap: Optional[float], objective: Optional[float], extraction_seconds: float = 0.0,
+                 fallback: Optional[str] = None):
+        self.model_name = model_name
+        self.horizon_start = horizon_start
+        self.build_seconds = build_seconds
+        self.solve_seconds = solve_seconds
+        self.extraction_seconds = extraction_seconds
+        self.warm_start = warm_start
+        self.n_variables = n_variables
+        self.n_constraints = n_constraints
+        self.n_binaries = n_binaries
+        self.status = status
+        self.mip_gap = mip_gap
+        self.objective = objective
+        self.fallback = fallback
+
+
+class SolverSettings:
+    """
+    Limits on each solve, from area_info. The solver stops once it has found a solution within mip_gap (relative) of
+    the optimal one, or after time_limit seconds (0 meaning no limit). If it reaches the time limit, time_limit_fallback
+    decides what happens:
+    ACCEPT_INCUMBENT: the best solution found is used. If none was found, the job fails.
+    SOLVE_RELAXATION: the problem is solved again, approximately, with its binary variables relaxed (see
+        relaxation.solve_with_relaxed_binaries). If that doesn't give a solution within the time limit either, or the
+        problem was already solved approximately, the job fails.
+    FAIL_JOB: the job fails.
+    """
+    mip_gap: float
+    time_limit: float
+    time_limit_fallback: str
+
+    def __init__(self, mip_gap: float = 0.0, time_limit: float = 0.0, time_limit_fallback: str = ACCEPT_INCUMBENT):
+        self.mip_gap = mip_gap
+        self.time_limit = time_limit
+        self.time_limit_fallback = time_limit_fallback
+
+
+def get_solver_settings(area_info: Dict[str, Any]) -> SolverSettings:
+    # Configs created before these parameters were introduced don't have them
+    return SolverSettings(mip_gap=get_if_exists_else(area_info, 'MIPGap', 0.0),
+                          time_limit=get_if_exists_else(area_info, 'TimeLimit', 0.0),
+                          time_limit_fallback=get_if_exists_else(area_info, 'TimeLimitFallback', ACCEPT_INCUMBENT))
+
+
+def get_decomposition_settings(area_info: Dict[str, Any]) -> DecompositionSettings:
+    return DecompositionSettings(tolerance=get_if_exists_else(area_info, 'DecompositionTolerance', 0.001),
+                                 max_iterations=get_if_exists_else(area_info, 'DecompositionMaxIterations', 50))
+
+
 class ChalmersOutputs:
     trades: List[Trade]
     # (TradeMetadataKey, agent_guid, (period, level)))
     metadata_per_agent_and_period: Dict[TradeMetadataKey, Dict[str, Dict[datetime.datetime, float]]]
     # Data which isn't agent-individual: (TradeMetadataKey, (period, level))
     metadata_per_period: Dict[TradeMetadataKey, Dict[datetime.datetime, float]]
+    solve_infos: List[SolveInfo]
+    # Wall-clock time spent building the supply and demand arrays that the models are given
+    input_seconds: float
 
     def __init__(self, trades: List[Trade],
                  metadata_per_agent_and_period: Dict[TradeMetadataKey, Dict[str, Dict[datetime.datetime, float]]],
-                 metadata_per_period: Dict[TradeMetadataKey, Dict[datetime.datetime, float]]):
+                 metadata_per_period: Dict[TradeMetadataKey, Dict[datetime.datetime, float]],
+                 solve_infos: Optional[List[SolveInfo]] = None, input_seconds: float = 0.0):
         self.trades = trades
         self.metadata_per_agent_and_period = metadata_per_agent_and_period
         self.metadata_per_period = metadata_per_period
+        self.solve_infos = solve_infos if solve_infos is not None else []
+        self.input_seconds = input_seconds
 
 
 class InfeasibilityError(CEMSError):
@@ -65,21 +161,67 @@ class InfeasibilityError(CEMSError):
         self.horizon_end = horizon_end
         self.constraints = constraints
 
+    def __reduce__(self):
+        # So that the error can be pickled, and raised in the main process when solving in a worker process
+        return InfeasibilityError, (self.message, self.agent_names, self.hour_indices, self.horizon_start,
+                                    self.horizon_end, self.constraints)
+
 
 def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dict[Resource, GridAgent],
              area_info: Dict[str, Any], start_datetime: datetime.datetime,
              elec_pricing: ElectricityPrice, heat_pricing: HeatingPrice,
-             shallow_storage_start_dict: Dict[str, float], deep_storage_start_dict: Dict[str, float]) \
-        -> ChalmersOutputs:
+             shallow_storage_start_dict: Dict[str, float], deep_storage_start_dict: Dict[str, float],
+             lec_model_store: Optional[Dict[tuple, pyo.ConcreteModel]] = None,
+             agent_model_store: Optional[Dict[str, pyo.ConcreteModel]] = None,
+             executor: Optional[Executor] = None,
+             solution_cache: Optional[SolutionCache] = None) -> ChalmersOutputs:
+    """
+    Optimizes one trading horizon. If lec_model_store is specified, LEC models are kept in it and reused for
+    subsequent horizons with the same structure, see CEMS_function.solve_model.
+    If "WarmStart" is enabled in area_info, and the solver supports it, each model is given the previous horizon's
+    solution as a MIP start: for the LEC, the stored models hold their previous solution; when the local market is
+    disabled, each agent's model is kept in agent_model_store until the next horizon.
+    If executor is specified, and the local market is disabled, the agents' problems are solved in parallel with it,
+    using the solver specified in area_info. Models can't be passed between processes, so there are no warm starts then.
+    If the local market is enabled, and "DecomposeLEC" is enabled in area_info, the LEC's problem is solved by
+    decomposing it into one subproblem per agent, coordinated by local prices (see the decomposition module), with the
+    subproblems solved in parallel if executor is specified. Warm starts and relaxed binaries are not used then.
+    Otherwise, if "BatchAgentProblems" is enabled in area_info, all agents' problems are solved together, as one
+    block-diagonal problem (see AgentEMS.solve_models_batched), also without warm starts. Should that problem not be
+    solved to optimality, the agents are solved one at a time instead, so that an infeasible agent can be identified.
+    If solution_cache is specified, models whose inputs are exactly the same as those of a previously solved model are
+    given the cached solution instead of being solved (not in the batched mode).
+    Inputs that obviously give infeasible problems are detected before any model is built (see the "feasibility"
+    module). If a problem still turns out to be infeasible, its violated constraints are only searched for if
+    "DiagnoseInfeasibility" is enabled in area_info.
+    If "RelaxBinaries" is enabled in area_info, the problems are solved approximately, by first solving them with the
+    binary variables relaxed to continuous ones (see relaxation.solve_with_relaxed_binaries). Warm starts are not used
+    then.
+    The solver should have been given the MIP gap and time limit from area_info (see get_solver). What happens when a
+    problem reaches the time limit is decided by "TimeLimitFallback", see SolverSettings. If all agents' problems are
+    solved together and reach the time limit, they are solved one at a time instead, and the fallback applies to each.
+    If "TimeStep" in area_info is more than one hour, the horizon is optimized at that resolution, with inputs averaged
+    over each time step, see the time_aggregation module. The outputs are still hourly, with the energy by which the
+    averaged inputs deviate from the hourly ones as TIME_AGGREGATION_ERROR metadata.
+    If "MatrixModel" is enabled in area_info, the LEC's problem (unless decomposed), or each agent's problem when solved
+    one at a time, is built directly as a sparse matrix instead of through Pyomo, and solved straight from it, see
+    solve_matrix_model. Warm starts, solution_cache and model export are not used then, and neither is the matrix model
+    if "RelaxBinaries" is enabled.
+    """
     elec_grid_agent_guid = grid_agents[Resource.ELECTRICITY].guid
     heat_grid_agent_guid = grid_agents[Resource.HIGH_TEMP_HEAT].guid
     agent_guids = [agent.guid for agent in block_agents]
     # The order specified in "agents" will be used throughout
     trading_horizon = area_info['TradingHorizon']
+    time_step = get_time_step(area_info)
 
-    elec_demand_df, elec_supply_df, high_heat_demand_df, high_heat_supply_df, \
-        low_heat_demand_df, low_heat_supply_df, cooling_demand_df, cooling_supply_df = \
-        build_supply_and_demand_dfs(block_agents, start_datetime, trading_horizon)
+    input_start = time.perf_counter()
+    hourly_arrays = build_supply_and_demand_arrays(block_agents, start_datetime, trading_horizon)
+    elec_demand, elec_supply, high_heat_demand, high_heat_supply, \
+        low_heat_demand, low_heat_supply, cooling_demand, cooling_supply = \
+        [aggregate(values, time_step) for values in hourly_arrays]
+    aggregation_error = get_aggregation_error_per_period(hourly_arrays, start_datetime, time_step)
+    input_seconds = time.perf_counter() - input_start
 
     battery_capacities = [agent.battery.max_capacity_kwh for agent in block_agents]
     battery_max_charge = [agent.battery.charge_limit_kwh for agent in block_agents]
@@ -96,17 +238,23 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
     deep_storage_start = [(deep_storage_start_dict[agent] if agent in shallow_storage_start_dict.keys() else 0.0)
                           for agent in agent_guids]
 
-    nordpool_prices: pd.Series = elec_pricing.get_nordpool_price_for_periods(start_datetime, trading_horizon)
-    nordpool_prices = nordpool_prices.reset_index(drop=True)
+    nordpool_prices = aggregate(np.array(elec_pricing.get_nordpool_price_for_periods(start_datetime, trading_horizon),
+                                         dtype=float, ndmin=1), time_step)
     heat_retail_price = heat_pricing.get_retail_price_excl_effect_fee(start_datetime)
 
     n_agents = len(block_agents)
     summer_mode = should_use_summer_mode(start_datetime)
     heat_pump_cop = area_info['COPHeatPumpsLowTemp'] if summer_mode else area_info['COPHeatPumpsHighTemp']
+    relax_binaries = get_if_exists_else(area_info, 'RelaxBinaries', False)
+    use_matrix_model = get_if_exists_else(area_info, 'MatrixModel', False) and not relax_binaries
+    warm_start = get_if_exists_else(area_info, 'WarmStart', False) and solver.warm_start_capable() \
+        and not relax_binaries and not use_matrix_model
+    diagnose = get_if_exists_else(area_info, 'DiagnoseInfeasibility', False)
+    solver_settings = get_solver_settings(area_info)
+    decompose = get_if_exists_else(area_info, 'DecomposeLEC', False)
     try:
         if area_info['LocalMarketEnabled']:
-            optimized_model, results = CEMS_function.solve_model(
-                solver=solver,
+            lec_inputs: Dict[str, Any] = dict(
                 summer_mode=summer_mode,
                 month=start_datetime.month,
                 n_agents=n_agents,
@@ -130,13 +278,13 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
                 thermalstorage_volume=acc_tank_volumes,
                 BITES_Eshallow0=shallow_storage_start,
                 BITES_Edeep0=deep_storage_start,
-                elec_consumption=elec_demand_df,
-                hot_water_heatdem=high_heat_demand_df,
-                space_heating_heatdem=low_heat_demand_df,
-                cold_consumption=cooling_demand_df,
-                pv_production=elec_supply_df,
-                excess_low_temp_heat=low_heat_supply_df,
-                excess_high_temp_heat=high_heat_supply_df,
+                elec_consumption=elec_demand,
+                hot_water_heatdem=high_heat_demand,
+                space_heating_heatdem=low_heat_demand,
+                cold_consumption=cooling_demand,
+                pv_production=elec_supply,
+                excess_low_temp_heat=low_heat_supply,
+                excess_high_temp_heat=high_heat_supply,
                 battery_efficiency=area_info['BatteryEfficiency'],
                 thermalstorage_efficiency=area_info['AccTankEfficiency'],
                 max_elec_transfer_between_agents=area_info['InterAgentElectricityTransferCapacity'],
@@ -148,7 +296,8 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
                 Pccmax=area_info['CompChillerMaxInput'],
                 cold_trans_loss=area_info['CoolingTransferLoss'],
                 heat_trans_loss=area_info['HeatTransferLoss'],
-                trading_horizon=trading_horizon,
+                trading_horizon=trading_horizon // time_step,
+                time_step=time_step,
                 elec_tax_fee=elec_pricing.tax,
                 elec_trans_fee=elec_pricing.transmission_fee,
                 elec_peak_load_fee=elec_pricing.get_effect_fee_per_day(start_datetime),
@@ -157,18 +306,67 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
                 hist_top_three_elec_peak_load=elec_pricing.get_top_three_hourly_outtakes_for_month(start_datetime),
                 hist_monthly_heat_peak_energy=heat_pricing.get_avg_peak_for_month(start_datetime)
             )
-            handle_infeasibility(optimized_model, results, start_datetime, trading_horizon, [])
-            return extract_outputs_for_lec(optimized_model, start_datetime,
-                                           elec_grid_agent_guid, heat_grid_agent_guid,
-                                           elec_pricing, heat_pricing,
-                                           agent_guids)
+            if use_matrix_model and not decompose:
+                model_values, solve_info = solve_matrix_model(
+                    lambda: CEMS_function.build_matrix_model(**lec_inputs), 'LEC', start_datetime, trading_horizon, [],
+                    solver_settings)
+                extraction_start = time.perf_counter()
+                lec_outputs = extract_outputs_for_lec(model_values, start_datetime,
+                                                      elec_grid_agent_guid, heat_grid_agent_guid,
+                                                      elec_pricing, heat_pricing,
+                                                      agent_guids)
+                solve_info.extraction_seconds = time.perf_counter() - extraction_start
+                lec_outputs.metadata_per_period.update(aggregation_error)
+                lec_outputs.input_seconds = input_seconds
+                lec_outputs.solve_infos.append(solve_info)
+                return lec_outputs
+            # Solutions found by decomposition may be suboptimal, so they are cached separately from exact ones
+            lec_model_type = 'LEC decomposed' if decompose else get_model_type('LEC', relax_binaries)
+            cache_key = get_cache_key(lec_model_type, type(solver).__name__, solver_settings.mip_gap, lec_inputs) \
+                if solution_cache is not None else ''
+            cached_solution = solution_cache.get(cache_key) if solution_cache is not None else None
+            stored_model_ids = set(id(model) for model in lec_model_store.values()) if lec_model_store else set()
+            solve_start = time.perf_counter()
+            if decompose and cached_solution is None:
+                optimized_model, results = decomposition.solve_decomposed(
+                    solver, lec_inputs, get_decomposition_settings(area_info), executor,
+                    get_if_exists_else(area_info, 'Solver', DEFAULT_SOLVER), solver_settings.mip_gap,
+                    solver_settings.time_limit, lec_model_store)
+                fallback = None
+                warm_start = False
+            else:
+                optimized_model, results, fallback = solve_with_time_limit_fallback(
+                    lambda relax: CEMS_function.solve_model(solver=solver, model_store=lec_model_store,
+                                                            warm_start=warm_start, solution=cached_solution,
+                                                            relax_binaries=relax, **lec_inputs),
+                    relax_binaries, solver_settings, 'LEC', start_datetime, trading_horizon, [])
+            solve_info = create_solve_info('LEC', start_datetime, [optimized_model], results,
+                                           time.perf_counter() - solve_start,
+                                           warm_start and id(optimized_model) in stored_model_ids, fallback)
+            if cached_solution is None:
+                export_model_if_configured(optimized_model, 'LEC', get_model_type('LEC', True)
+                                           if fallback == SOLVE_RELAXATION else lec_model_type,
+                                           start_datetime, solve_info.status, solve_info.objective,
+                                           solve_info.solve_seconds)
+            handle_infeasibility(optimized_model, results, start_datetime, trading_horizon, [], diagnose)
+            if solution_cache is not None and cached_solution is None and is_cacheable(results, fallback):
+                solution_cache.put(cache_key, optimized_model)
+            extraction_start = time.perf_counter()
+            lec_outputs = extract_outputs_for_lec(optimized_model, start_datetime,
+                                                  elec_grid_agent_guid, heat_grid_agent_guid,
+                                                  elec_pricing, heat_pricing,
+                                                  agent_guids)
+            solve_info.extraction_seconds = time.perf_counter() - extraction_start
+            lec_outputs.metadata_per_period.update(aggregation_error)
+            lec_outputs.input_seconds = input_seconds
+            if cached_solution is None:
+                lec_outputs.solve_infos.append(solve_info)
+            return lec_outputs
         else:
-            all_trades: List[Trade] = []
-            all_metadata: Dict[str, Dict[TradeMetadataKey, Dict[datetime.datetime, float]]] = {}
+            agent_inputs: List[Dict[str, Any]] = []
             for i_agent in range(len(block_agents)):
                 agent_id = agent_guids[i_agent]
-                optimized_model, results = AgentEMS.solve_model(
-                    solver=solver,
+                agent_inputs.append(dict(
                     month=start_datetime.month,
                     agent=i_agent,
                     nordpool_price=nordpool_prices,
@@ -188,18 +386,19 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
                     thermalstorage_volume=acc_tank_volumes[i_agent],
                     BITES_Eshallow0=shallow_storage_start[i_agent],
                     BITES_Edeep0=deep_storage_start[i_agent],
-                    elec_consumption=elec_demand_df.iloc[i_agent, :],
-                    hot_water_heatdem=high_heat_demand_df.iloc[i_agent, :],
-                    space_heating_heatdem=low_heat_demand_df.iloc[i_agent, :],
-                    cold_consumption=cooling_demand_df.iloc[i_agent, :],
-                    pv_production=elec_supply_df.iloc[i_agent, :],
-                    excess_high_temp_heat=high_heat_supply_df.iloc[i_agent, :],
+                    elec_consumption=elec_demand[i_agent, :],
+                    hot_water_heatdem=high_heat_demand[i_agent, :],
+                    space_heating_heatdem=low_heat_demand[i_agent, :],
+                    cold_consumption=cooling_demand[i_agent, :],
+                    pv_production=elec_supply[i_agent, :],
+                    excess_high_temp_heat=high_heat_supply[i_agent, :],
                     battery_efficiency=area_info['BatteryEfficiency'],
                     thermalstorage_efficiency=area_info['AccTankEfficiency'],
                     max_elec_transfer_to_external=grid_agents[Resource.ELECTRICITY].max_transfer_per_hour,
                     max_heat_transfer_to_external=grid_agents[Resource.HIGH_TEMP_HEAT].max_transfer_per_hour,
                     heat_trans_loss=area_info['HeatTransferLoss'],
-                    trading_horizon=trading_horizon,
+                    trading_horizon=trading_horizon // time_step,
+                    time_step=time_step,
                     elec_tax_fee=elec_pricing.tax,
                     elec_trans_fee=elec_pricing.transmission_fee,
                     elec_peak_load_fee=elec_pricing.get_effect_fee_per_day(start_datetime),
@@ -208,22 +407,90 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
                     hist_top_three_elec_peak_load=elec_pricing.get_top_three_hourly_outtakes_for_month(
                         start_datetime, agent_id),
                     hist_monthly_heat_peak_energy=heat_pricing.get_avg_peak_for_month(start_datetime, agent_id)
-                )
-                handle_infeasibility(optimized_model, results, start_datetime, trading_horizon,
-                                     [block_agents[i_agent].guid])
-                trades, metadata = extract_outputs_for_agent(optimized_model, start_datetime,
-                                                             elec_grid_agent_guid, heat_grid_agent_guid,
-                                                             elec_pricing, heat_pricing,
-                                                             agent_id)
-                all_trades.extend(trades)
-                all_metadata[agent_id] = metadata
+                ))
+
+            all_trades: List[Trade] = []
+            all_metadata: Dict[str, Dict[TradeMetadataKey, Dict[datetime.datetime, float]]] = {}
+            solve_infos: List[SolveInfo] = []
+            if executor is not None:
+                solver_name = get_if_exists_else(area_info, 'Solver', DEFAULT_SOLVER)
+                futures = [executor.submit(solve_and_extract_for_agent, solver_name, agent_inputs[i_agent],
+                                           start_datetime, elec_grid_agent_guid, heat_grid_agent_guid,
+                                           elec_pricing.copy_without_history(), heat_pricing.copy_without_history(),
+                                           agent_guids[i_agent], solution_cache, diagnose, relax_binaries,
+                                           solver_settings, use_matrix_model)
+                           for i_agent in range(len(block_agents))]
+                # Merge in agent order, regardless of which finished first, so that results are the same as when
+                # solving serially
+                for agent_id, future in zip(agent_guids, futures):
+                    trades, metadata, agent_solve_info, agent_elec_pricing, agent_heat_pricing = future.result()
+                    elec_pricing.add_history_from(agent_elec_pricing)
+                    heat_pricing.add_history_from(agent_heat_pricing)
+                    all_trades.extend(trades)
+                    all_metadata[agent_id] = metadata
+                    if agent_solve_info is not None:
+                        solve_infos.append(agent_solve_info)
+            else:
+                batched_models: Optional[List[pyo.ConcreteModel]] = None
+                batched_solve_info: Optional[SolveInfo] = None
+                if get_if_exists_else(area_info, 'BatchAgentProblems', False):
+                    solve_start = time.perf_counter()
+                    models, results = AgentEMS.solve_models_batched(solver, agent_inputs, relax_binaries)
+                    batched_solve_info = create_solve_info('Agents', start_datetime, models, results,
+                                                           time.perf_counter() - solve_start, False)
+                    solve_infos.append(batched_solve_info)
+                    if is_solved(results) and not time_limit_reached(results, solver_settings.time_limit):
+                        batched_models = models
+                        # The time spent in the solver is for all agents together, so isn't saved with each model
+                        for agent_id, model in zip(agent_guids, models):
+                            export_model_if_configured(model, agent_id, get_model_type('Agent', relax_binaries),
+                                                       start_datetime, str(results.solver.termination_condition),
+                                                       pyo.value(model.obj), None)
+                    else:
+                        logger.warning('Batched optimization of agents was not solved, will solve one agent at a '
+                                       'time to find the problematic one.')
+                for i_agent in range(len(block_agents)):
+                    agent_id = agent_guids[i_agent]
+                    # The solve info to add the extraction time to
+                    extracted_solve_info: Optional[SolveInfo] = batched_solve_info
+                    solved_agent: Union[pyo.ConcreteModel, ModelValues]
+                    if batched_models is not None:
+                        solved_agent = batched_models[i_agent]
+                    elif use_matrix_model:
+                        solved_agent, extracted_solve_info = solve_agent_matrix_model(
+                            agent_inputs[i_agent], start_datetime, agent_id, solver_settings)
+                        solve_infos.append(extracted_solve_info)
+                    else:
+                        previous_model = agent_model_store.get(agent_id) \
+                            if warm_start and agent_model_store is not None else None
+                        optimized_model, agent_solve_info = solve_agent(solver, agent_inputs[i_agent],
+                                                                        start_datetime, agent_id, solution_cache,
+                                                                        previous_model, diagnose, relax_binaries,
+                                                                        solver_settings)
+                        extracted_solve_info = agent_solve_info
+                        if agent_solve_info is not None:
+                            solve_infos.append(agent_solve_info)
+                        if warm_start and agent_model_store is not None:
+                            agent_model_store[agent_id] = optimized_model
+                        solved_agent = optimized_model
+                    extraction_start = time.perf_counter()
+                    trades, metadata = extract_outputs_for_agent(solved_agent, start_datetime,
+                                                                 elec_grid_agent_guid, heat_grid_agent_guid,
+                                                                 elec_pricing, heat_pricing,
+                                                                 agent_id)
+                    if extracted_solve_info is not None:
+                        extracted_solve_info.extraction_seconds += time.perf_counter() - extraction_start
+                    all_trades.extend(trades)
+                    all_metadata[agent_id] = metadata
 
         metadata_per_agent_and_period = flip_dict_keys(all_metadata)
         metadata_per_period: Dict[TradeMetadataKey, Dict[datetime.datetime, float]] = {
             TradeMetadataKey.HEAT_DUMP: sum_for_all_agents(metadata_per_agent_and_period[TradeMetadataKey.HEAT_DUMP]),
-            TradeMetadataKey.COOL_DUMP: sum_for_all_agents(metadata_per_agent_and_period[TradeMetadataKey.COOL_DUMP])
+            TradeMetadataKey.COOL_DUMP: sum_for_all_agents(metadata_per_agent_and_period[TradeMetadataKey.COOL_DUMP]),
+            **aggregation_error
         }
-        return ChalmersOutputs(all_trades, metadata_per_agent_and_period, metadata_per_period)
+        return ChalmersOutputs(all_trades, metadata_per_agent_and_period, metadata_per_period, solve_infos,
+                               input_seconds)
     except CEMSError as e:
         raise InfeasibilityError(message=e.message,
                                  agent_names=e.agent_names if isinstance(e, InfeasibilityError) else
@@ -234,6 +501,244 @@ def optimize(solver: OptSolver, block_agents: List[BlockAgent], grid_agents: Dic
                                  constraints=set())
 
 
+def solve_agent(solver: OptSolver, agent_inputs: Dict[str, Any], start_datetime: datetime.datetime, agent_guid: str,
+                solution_cache: Optional[SolutionCache] = None,
+                warm_start_model: Optional[pyo.ConcreteModel] = None, diagnose: bool = False,
+                relax_binaries: bool = False, solver_settings: Optional[SolverSettings] = None) \
+        -> Tuple[pyo.ConcreteModel, Optional[SolveInfo]]:
+    """
+    Solves one agent's optimization problem, raising an InfeasibilityError if no solution is found. If the
+    solution is in solution_cache, the model is built and given the cached solution instead, and no SolveInfo is
+    returned. The agent index only names the model, so agents with the same data share cached solutions. For diagnose,
+    see handle_infeasibility. For relax_binaries, see AgentEMS.solve_model. For solver_settings, see
+    solve_with_time_limit_fallback.
+    """
+    if solver_settings is None:
+        solver_settings = SolverSettings()
+    cache_key = get_cache_key(get_model_type('Agent', relax_binaries), type(solver).__name__, solver_settings.mip_gap,
+                              {name: value for name, value in agent_inputs.items() if name != 'agent'}) \
+        if solution_cache is not None else ''
+    cached_solution = solution_cache.get(cache_key) if solution_cache is not None else None
+    if cached_solution is not None:
+        optimized_model = AgentEMS.build_model(**agent_inputs)
+        load_solution(optimized_model, cached_solution)
+        return optimized_model, None
+    horizon_hours = agent_inputs['trading_horizon'] * agent_inputs.get('time_step', 1)
+    solve_start = time.perf_counter()
+    optimized_model, results, fallback = solve_with_time_limit_fallback(
+        lambda relax: AgentEMS.solve_model(solver=solver, warm_start_model=warm_start_model, relax_binaries=relax,
+                                           **agent_inputs),
+        relax_binaries, solver_settings, agent_guid, start_datetime, horizon_hours, [agent_guid])
+    solve_info = create_solve_info(agent_guid, start_datetime, [optimized_model], results,
+                                   time.perf_counter() - solve_start, warm_start_model is not None, fallback)
+    export_model_if_configured(optimized_model, agent_guid,
+                               get_model_type('Agent', relax_binaries or fallback == SOLVE_RELAXATION),
+                               start_datetime, solve_info.status, solve_info.objective, solve_info.solve_seconds)
+    handle_infeasibility(optimized_model, results, start_datetime, horizon_hours, [agent_guid], diagnose)
+    if solution_cache is not None and is_cacheable(results, fallback):
+        solution_cache.put(cache_key, optimized_model)
+    return optimized_model, solve_info
+
+
+def solve_and_extract_for_agent(solver_name: str, agent_inputs: Dict[str, Any], start_datetime: datetime.datetime,
+                                elec_grid_agent_guid: str, heat_grid_agent_guid: str,
+                                elec_pricing: ElectricityPrice, heat_pricing: HeatingPrice, agent_guid: str,
+                                solution_cache: Optional[SolutionCache] = None, diagnose: bool = False,
+                                relax_binaries: bool = False, solver_settings: Optional[SolverSettings] = None,
+                                use_matrix_model: bool = False) -> \
+        Tuple[List[Trade], Dict[TradeMetadataKey, Dict[datetime.datetime, float]], Optional[SolveInfo],
+              ElectricityPrice, HeatingPrice]:
+    """
+    Solves one agent's optimization problem (see solve_agent, or solve_agent_matrix_model if use_matrix_model is True),
+    and extracts trades and metadata from it. Meant to be run in a worker process: the pricing objects should be copies
+    without history (see IPrice.copy_without_history), and are returned, so that the external sells and price
+    estimates recorded during extraction can be added to the originals.
+    """
+    if solver_settings is None:
+        solver_settings = SolverSettings()
+    solved_agent: Union[pyo.ConcreteModel, ModelValues]
+    solve_info: Optional[SolveInfo]
+    if use_matrix_model:
+        solved_agent, solve_info = solve_agent_matrix_model(agent_inputs, start_datetime, agent_guid, solver_settings)
+    else:
+        solver = get_solver(solver_name, solver_settings.mip_gap, solver_settings.time_limit)
+        solved_agent, solve_info = solve_agent(solver, agent_inputs, start_datetime, agent_guid, solution_cache,
+                                               diagnose=diagnose, relax_binaries=relax_binaries,
+                                               solver_settings=solver_settings)
+    extraction_start = time.perf_counter()
+    trades, metadata = extract_outputs_for_agent(solved_agent, start_datetime,
+                                                 elec_grid_agent_guid, heat_grid_agent_guid,
+                                                 elec_pricing, heat_pricing,
+                                                 agent_guid)
+    if solve_info is not None:
+        solve_info.extraction_seconds = time.perf_counter() - extraction_start
+    return trades, metadata, solve_info, elec_pricing, heat_pricing
+
+
+def solve_agent_matrix_model(agent_inputs: Dict[str, Any], start_datetime: datetime.datetime, agent_guid: str,
+                             solver_settings: SolverSettings) -> Tuple['MatrixModelValues', SolveInfo]:
+    """Solves one agent's optimization problem as a matrix model, see solve_matrix_model."""
+    horizon_hours = agent_inputs['trading_horizon'] * agent_inputs.get('time_step', 1)
+    return solve_matrix_model(lambda: AgentEMS.build_matrix_model(**agent_inputs), agent_guid, start_datetime,
+                              horizon_hours, [agent_guid], solver_settings)
+
+
+def solve_matrix_model(build: Callable[[], MatrixModel], model_name: str, start_datetime: datetime.datetime,
+                       trading_horizon: int, agent_names: List[str], solver_settings: SolverSettings) \
+        -> Tuple['MatrixModelValues', SolveInfo]:
+    """
+    Builds a model by calling "build" (CEMS_function.build_matrix_model or AgentEMS.build_matrix_model), and solves it
+    with HiGHS, through scipy, straight from its matrices, whichever solver area_info specifies. The Pyomo models are
+    the reference implementation, which these give the same optimal objective as.
+    If the time limit is reached, the best solution found is used if the time limit fallback is ACCEPT_INCUMBENT; the
+    other fallbacks fail the job, as does not finding a solution. Violated constraints are not diagnosed.
+    """
+    build_start = time.perf_counter()
+    matrix_model = build()
+    solve_start = time.perf_counter()
+    solution = matrix_model.solve(time_limit=solver_settings.time_limit if solver_settings.time_limit > 0 else None,
+                                  mip_rel_gap=solver_settings.mip_gap)
+    solve_seconds = time.perf_counter() - solve_start
+    fallback = solver_settings.time_limit_fallback if solution.status == LIMIT_REACHED else None
+    accepted = solution.is_optimal() or (fallback == ACCEPT_INCUMBENT and solution.has_values())
+    free_columns = matrix_model.free_columns()
+    solve_info = SolveInfo(model_name, start_datetime, solve_start - build_start, solve_seconds, False,
+                           int(free_columns.sum()), matrix_model.n_rows,
+                           int((free_columns & (matrix_model.integrality() == 1)).sum()),
+                           MATRIX_MODEL_STATUSES.get(solution.status, str(TerminationCondition.error)),
+                           solution.mip_gap if accepted else None, solution.objective if accepted else None,
+                           fallback=fallback)
+    if fallback is not None:
+        logger.warning('{}: time limit of {} seconds reached for horizon starting {:%Y-%m-%d %H:%M}, fallback is {}'
+                       .format(model_name, solver_settings.time_limit, start_datetime, fallback))
+    if not accepted:
+        raise InfeasibilityError(message='Optimization time limit reached, with time limit fallback ' + fallback
+                                 if fallback is not None else 'Infeasible optimization problem',
+                                 agent_names=agent_names,
+                                 hour_indices=[],
+                                 horizon_start=start_datetime,
+                                 horizon_end=start_datetime + datetime.timedelta(hours=trading_horizon),
+                                 constraints=set())
+    return MatrixModelValues(matrix_model, solution), solve_info
+
+
+def export_model_if_configured(model: pyo.ConcreteModel, model_name: str, model_type: str,
+                               horizon_start: datetime.datetime, status: str, objective: Optional[float],
+                               solve_seconds: Optional[float]):
+    """
+    If MODEL_EXPORT_DIR is set, writes the solved model there, with the status and objective that the solver got for
+    it, for benchmarking solvers on (see model_export).
+    """
+    if settings.MODEL_EXPORT_DIR:
+        model_export.export_model(model, settings.MODEL_EXPORT_DIR, model_name, model_type, horizon_start, status,
+                                  objective, solve_seconds, settings.MODEL_EXPORT_FORMAT)
+
+
+def get_model_type(model_type: str, relax_binaries: bool) -> str:
+    """Approximate solutions, with relaxed binaries, are cached separately from exact ones."""
+    return model_type + ' relaxed' if relax_binaries else model_type
+
+
+def solve_with_time_limit_fallback(solve: Callable[[bool], Tuple[pyo.ConcreteModel, SolverResults]],
+                                   relax_binaries: bool, solver_settings: SolverSettings, model_name: str,
+                                   start_datetime: datetime.datetime, trading_horizon: int, agent_names: List[str]) \
+        -> Tuple[pyo.ConcreteModel, SolverResults, Optional[str]]:
+    """
+    Solves a model by calling "solve" with relax_binaries. If the solver reaches the time limit, the fallback in
+    solver_settings is applied (see SolverSettings), and returned along with the model and results; otherwise, the
+    returned fallback is None. If the job should fail, an InfeasibilityError is raised.
+    """
+    optimized_model, results = solve(relax_binaries)
+    if not time_limit_reached(results, solver_settings.time_limit):
+        return optimized_model, results, None
+    fallback = solver_settings.time_limit_fallback
+    logger.warning('{}: time limit of {} seconds reached for horizon starting {:%Y-%m-%d %H:%M}, fallback is {}'.format(
+        model_name, solver_settings.time_limit, start_datetime, fallback))
+    if fallback == ACCEPT_INCUMBENT and is_solved(results):
+        return optimized_model, results, fallback
+    if fallback == SOLVE_RELAXATION and not relax_binaries:
+        first_solve_seconds = results.solver.wallclock_time
+        optimized_model, results = solve(True)
+        solved = is_solved(results) and not time_limit_reached(results, solver_settings.time_limit)
+        results.solver.wallclock_time += first_solve_seconds
+        if solved:
+            return optimized_model, results, fallback
+    raise InfeasibilityError(message='Optimization time limit reached, with time limit fallback ' + fallback,
+                             agent_names=agent_names,
+                             hour_indices=[],
+                             horizon_start=start_datetime,
+                             horizon_end=start_datetime + datetime.timedelta(hours=trading_horizon),
+                             constraints=set())
+
+
+def time_limit_reached(results: SolverResults, time_limit: float) -> bool:
+    """
+    Whether the solver stopped because of the time limit. GLPK reports a solution found before reaching the MIP gap the
+    same way as one found before reaching the time limit, so these are told apart by the time spent solving.
+    """
+    if time_limit <= 0:
+        return False
+    termination_condition = results.solver.termination_condition
+    return termination_condition == TerminationCondition.maxTimeLimit \
+        or (termination_condition == TerminationCondition.feasible and results.solver.wallclock_time >= time_limit)
+
+
+def is_cacheable(results: SolverResults, fallback: Optional[str]) -> bool:
+    """
+    Solutions cut short by the time limit, or found by a time limit fallback, are not cached: solving again, for example
+    with a longer time limit, may give a better one. Solutions within the MIP gap are reported as optimal, and cached,
+    but only reused with the same solver and MIP gap, which are part of the cache key.
+    """
+    return results.solver.termination_condition == TerminationCondition.optimal and fallback is None
+
+
+def create_solve_info(model_name: str, horizon_start: datetime.datetime, models: List[pyo.ConcreteModel],
+                      results: SolverResults, seconds: float, warm_start: bool,
+                      fallback: Optional[str] = None) -> SolveInfo:
+    """
+    Collects information about a solve, in which the models (one, or several solved together) were built and solved
+    in "seconds". The solve_model functions report the part of this spent in the solver as the results' wallclock_time.
+    """
+    solve_seconds = results.solver.wallclock_time
+    n_variables = 0
+    n_constraints = 0
+    n_binaries = 0
+    for model in models:
+        for var in model.component_data_objects(pyo.Var):
+            if not var.fixed:
+                n_variables += 1
+                if var.is_binary():
+                    n_binaries += 1
+        n_constraints += sum(1 for _ in model.component_data_objects(pyo.Constraint, active=True))
+    solved = is_solved(results)
+    return SolveInfo(model_name, horizon_start, seconds - solve_seconds, solve_seconds, warm_start,
+                     n_variables, n_constraints, n_binaries, str(results.solver.termination_condition),
+                     get_mip_gap(results) if solved else None,
+                     sum(pyo.value(model.obj) for model in models) if solved else None,
+                     fallback=fallback)
+
+
+def get_mip_gap(results: SolverResults) -> Optional[float]:
+    """The relative gap between the bounds on the objective reported by the solver, if it reports both."""
+    try:
+        lower_bound = float(results.problem.lower_bound)
+        upper_bound = float(results.problem.upper_bound)
+    except (TypeError, ValueError):
+        return None
+    if not (np.isfinite(lower_bound) and np.isfinite(upper_bound)):
+        return None
+    return abs(upper_bound - lower_bound) / max(abs(upper_bound), VERY_SMALL_NUMBER)
+
+
+def log_solve_time_summary(solve_infos: List[SolveInfo]):
+    """Logs the number of solves, and the mean solve time, with and without warm start."""
+    for warm_start in [True, False]:
+        seconds = [solve_info.solve_seconds for solve_info in solve_infos if solve_info.warm_start == warm_start]
+        if len(seconds) > 0:
+            logger.info('{} optimization problems solved {}, in {:.3f} seconds on average'.format(
+                len(seconds), 'with warm start' if warm_start else 'without warm start', sum(seconds) / len(seconds)))
+
+
 def sum_for_all_agents(dict_per_agent_and_period: Dict[str, Dict[datetime.datetime, float]]) \
         -> Dict[datetime.datetime, float]:
     return {date: sum(inner_dict[date] for inner_dict in dict_per_agent_and_period.values() if date in inner_dict)
@@ -252,13 +757,20 @@ def flip_dict_keys(all_metadata: Dict[str, Dict[TradeMetadataKey, Dict[datetime.
 
 
 def handle_infeasibility(optimized_model: pyo.ConcreteModel, results: SolverResults, start_datetime: datetime.datetime,
-                         trading_horizon: int, agent_names: List[str]):
-    """If the solver exits with infeasibility, log this, and raise an informative error."""
-    if results.solver.termination_condition != TerminationCondition.optimal:
+                         trading_horizon: int, agent_names: List[str], diagnose: bool = False):
+    """
+    If the solver exits without a solution, log this, and raise an informative error. Finding the violated constraints
+    means evaluating every constraint of the model, which is slow for large models, so this is only done if diagnose is
+    True. Most infeasibilities are caught before solving anyway, by the checks in the "feasibility" module.
+    """
+    if not is_solved(results):
         constraint_names_no_index: Set[str] = set()
-        for constraint, _body_value, _infeasible in find_infeasible_constraints(optimized_model):
-            constraint_names_no_index.add(constraint.name.split('[')[0])
-        log_infeasible_constraints(optimized_model)
+        if diagnose:
+            for constraint, _body_value, _infeasible in find_infeasible_constraints(optimized_model):
+                constraint_names_no_index.add(constraint.name.split('[')[0])
+            log_infeasible_constraints(optimized_model)
+        else:
+            logger.info('Infeasible constraints not diagnosed, enable "DiagnoseInfeasibility" to find them.')
         raise InfeasibilityError(message='Infeasible optimization problem',
                                  agent_names=agent_names,
                                  hour_indices=[],
@@ -267,7 +779,101 @@ def handle_infeasibility(optimized_model: pyo.ConcreteModel, results: SolverResu
                                  constraints=constraint_names_no_index)
 
 
-def extract_outputs_for_agent(optimized_model: pyo.ConcreteModel,
+class ModelValues:
+    """
+    Values of a solved model, read in bulk: each variable or parameter is read from the model once, the first time it
+    is asked for, into a numpy array shaped like its index sets (for example agents x hours). Reading values one index
+    at a time through Pyomo is slow, and the same values are needed for several trades and metadata entries.
+    If the model's time steps are longer than one hour, values indexed by time step are expanded to hourly values (see
+    the time_aggregation module), so that they can be used as those of an hourly model.
+    """
+    model: pyo.ConcreteModel
+    hours: List[int]
+    time_step: int
+
+    def __init__(self, model: pyo.ConcreteModel):
+        self.model = model
+        self.time_step = int(pyo.value(model.time_step)) if hasattr(model, 'time_step') else 1
+        self.hours = list(range(len(model.T) * self.time_step))
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def has(self, name: str) -> bool:
+        return hasattr(self.model, name)
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            component = getattr(self.model, name)
+            if component.is_indexed():
+                shape = tuple(len(index_set) for index_set in component.index_set().subsets())
+                values = [pyo.value(component[index], exception=False) for index in component.index_set()]
+            else:
+                shape = ()
+                values = [pyo.value(component, exception=False)]
+            array = np.array(values, dtype=float).reshape(shape)
+            if self.time_step > 1 and component.is_indexed() \
+                    and any(subset is self.model.T for subset in component.index_set().subsets()):
+                array = self._expand_to_hours(name, array)
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    def _expand_to_hours(self, name: str, array: np.ndarray) -> np.ndarray:
+        if name in STORAGE_LEVELS:
+            return expand_levels(array, self.array(STORAGE_LEVELS[name]), self.time_step)
+        if name in ENERGIES_PER_TIME_STEP:
+            return expand(array, self.time_step) / self.time_step
+        return expand(array, self.time_step)
+
+    def array_or_zeros(self, name: str) -> np.ndarray:
+        """For variables that only exist in some models, for example "Psell_grid" only exists in the LEC model."""
+        if self.has(name):
+            return self.array(name)
+        return np.zeros(len(self.hours))
+
+    def scalar(self, name: str) -> float:
+        return float(self.array(name))
+
+    def sum_of_param(self, name: str) -> float:
+        return get_sum_of_param(getattr(self.model, name))
+
+
+class MatrixModelValues(ModelValues):
+    """
+    Values of a solved MatrixModel, read as ModelValues reads those of the corresponding Pyomo model: variables from the
+    solution, and parameters from the input data that the model builder kept.
+    """
+    matrix_model: MatrixModel
+    solution: MatrixSolution
+
+    def __init__(self, matrix_model: MatrixModel, solution: MatrixSolution):
+        self.matrix_model = matrix_model
+        self.solution = solution
+        self.time_step = int(matrix_model.parameters['time_step'])
+        self.hours = list(range(matrix_model.parameters['nordpool_price'].size * self.time_step))
+        self._arrays = {}
+
+    def has(self, name: str) -> bool:
+        return name in self.solution.values or name in self.matrix_model.parameters
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            if name in self.solution.values:
+                array = self.solution.values[name]
+                # Variables are either per time step, possibly also per agent, or scalars
+                hourly = array.ndim > 0
+            else:
+                array = self.matrix_model.parameters[name]
+                hourly = name in self.matrix_model.hourly_parameters
+            if self.time_step > 1 and hourly:
+                array = self._expand_to_hours(name, array)
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    def sum_of_param(self, name: str) -> float:
+        # What get_sum_of_param gives for the Pyomo model: summing a Pyomo component sums its indices
+        return sum(range(self.solution.values[name].size))
+
+
+def extract_outputs_for_agent(optimized_model: Union[pyo.ConcreteModel, ModelValues],
                               start_datetime: datetime.datetime,
                               elec_grid_agent_guid: str,
                               heat_grid_agent_guid: str,
@@ -275,392 +881,365 @@ def extract_outputs_for_agent(optimized_model: pyo.ConcreteModel,
                               heating_price_data: HeatingPrice,
                               agent_guid: str) -> \
         Tuple[List[Trade], Dict[TradeMetadataKey, Dict[datetime.datetime, float]]]:
-    elec_trades = get_power_transfers(optimized_model, start_datetime, elec_grid_agent_guid, [agent_guid],
+    model_values = optimized_model if isinstance(optimized_model, ModelValues) else ModelValues(optimized_model)
+    elec_trades = get_power_transfers(model_values, start_datetime, elec_grid_agent_guid, [agent_guid],
                                       electricity_price_data, local_market_enabled=False)
-    heat_trades = get_heat_transfers(optimized_model, start_datetime, heat_grid_agent_guid, [agent_guid],
+    heat_trades = get_heat_transfers(model_values, start_datetime, heat_grid_agent_guid, [agent_guid],
                                      heating_price_data, local_market_enabled=False)
     metadata = {
-        TradeMetadataKey.BATTERY_LEVEL: get_value_per_period(optimized_model, start_datetime, 'SOCBES'),
-        TradeMetadataKey.ACC_TANK_LEVEL: get_value_per_period(optimized_model, start_datetime, 'SOCTES'),
-        TradeMetadataKey.SHALLOW_STORAGE_REL: get_value_per_period(optimized_model, start_datetime, 'Energy_shallow'),
-        TradeMetadataKey.DEEP_STORAGE_REL: get_value_per_period(optimized_model, start_datetime, 'Energy_deep'),
-        TradeMetadataKey.SHALLOW_STORAGE_ABS: get_value_per_period(optimized_model, start_datetime, 'Energy_shallow'),
-        TradeMetadataKey.DEEP_STORAGE_ABS: get_value_per_period(optimized_model, start_datetime, 'Energy_deep'),
-        TradeMetadataKey.SHALLOW_LOSS: get_value_per_period(optimized_model, start_datetime, 'Loss_shallow'),
-        TradeMetadataKey.DEEP_LOSS: get_value_per_period(optimized_model, start_datetime, 'Loss_deep'),
-        TradeMetadataKey.SHALLOW_CHARGE: get_value_per_period(optimized_model, start_datetime, 'Hcha_shallow'),
-        TradeMetadataKey.FLOW_SHALLOW_TO_DEEP: get_value_per_period(optimized_model, start_datetime, 'Flow'),
-        TradeMetadataKey.HP_COOL_PROD: get_value_per_period(optimized_model, start_datetime, 'Chp'),
-        TradeMetadataKey.HP_HIGH_HEAT_PROD: get_value_per_period(optimized_model, start_datetime, 'Hhp'),
+        TradeMetadataKey.BATTERY_LEVEL: get_value_per_period(model_values, start_datetime, 'SOCBES'),
+        TradeMetadataKey.ACC_TANK_LEVEL: get_value_per_period(model_values, start_datetime, 'SOCTES'),
+        TradeMetadataKey.SHALLOW_STORAGE_REL: get_value_per_period(model_values, start_datetime, 'Energy_shallow'),
+        TradeMetadataKey.DEEP_STORAGE_REL: get_value_per_period(model_values, start_datetime, 'Energy_deep'),
+        TradeMetadataKey.SHALLOW_STORAGE_ABS: get_value_per_period(model_values, start_datetime, 'Energy_shallow'),
+        TradeMetadataKey.DEEP_STORAGE_ABS: get_value_per_period(model_values, start_datetime, 'Energy_deep'),
+        TradeMetadataKey.SHALLOW_LOSS: get_value_per_period(model_values, start_datetime, 'Loss_shallow'),
+        TradeMetadataKey.DEEP_LOSS: get_value_per_period(model_values, start_datetime, 'Loss_deep'),
+        TradeMetadataKey.SHALLOW_CHARGE: get_value_per_period(model_values, start_datetime, 'Hcha_shallow'),
+        TradeMetadataKey.FLOW_SHALLOW_TO_DEEP: get_value_per_period(model_values, start_datetime, 'Flow'),
+        TradeMetadataKey.HP_COOL_PROD: get_value_per_period(model_values, start_datetime, 'Chp'),
+        TradeMetadataKey.HP_HIGH_HEAT_PROD: get_value_per_period(model_values, start_datetime, 'Hhp'),
         # Heat dump and cool dump will have to be aggregated later
-        TradeMetadataKey.HEAT_DUMP: get_value_per_period(optimized_model, start_datetime, 'heat_dump'),
-        TradeMetadataKey.COOL_DUMP: get_value_per_period(optimized_model, start_datetime, 'cool_dump')
+        TradeMetadataKey.HEAT_DUMP: get_value_per_period(model_values, start_datetime, 'heat_dump'),
+        TradeMetadataKey.COOL_DUMP: get_value_per_period(model_values, start_datetime, 'cool_dump')
     }
     return elec_trades + heat_trades, metadata
 
 
-def extract_outputs_for_lec(optimized_model: pyo.ConcreteModel,
+def extract_outputs_for_lec(optimized_model: Union[pyo.ConcreteModel, ModelValues],
                             start_datetime: datetime.datetime,
                             elec_grid_agent_guid: str,
                             heat_grid_agent_guid: str,
                             electricity_price_data: ElectricityPrice,
                             heating_price_data: HeatingPrice,
                             agent_guids: List[str]) -> ChalmersOutputs:
-    elec_trades = get_power_transfers(optimized_model, start_datetime, elec_grid_agent_guid, agent_guids,
+    model_values = optimized_model if isinstance(optimized_model, ModelValues) else ModelValues(optimized_model)
+    elec_trades = get_power_transfers(model_values, start_datetime, elec_grid_agent_guid, agent_guids,
                                       electricity_price_data, local_market_enabled=True)
-    heat_trades = get_heat_transfers(optimized_model, start_datetime, heat_grid_agent_guid, agent_guids,
+    heat_trades = get_heat_transfers(model_values, start_datetime, heat_grid_agent_guid, agent_guids,
                                      heating_price_data, local_market_enabled=True)
-    cool_trades = get_cool_transfers(optimized_model, start_datetime, agent_guids)
+    cool_trades = get_cool_transfers(model_values, start_datetime, agent_guids)
+    has_battery = model_values.array('Emax_BES') > 0
+    has_acc_tank = model_values.array('kwh_per_deg') > 0
+    shallow_cap = model_values.array('Energy_shallow_cap')
+    deep_cap = model_values.array('Energy_deep_cap')
+    has_heat_pump = model_values.array('Phpmax') > 0
     metadata_per_agent_and_period = {
-        TradeMetadataKey.BATTERY_LEVEL: get_value_per_agent(optimized_model, start_datetime, 'SOCBES', agent_guids,
-                                                            lambda i: optimized_model.Emax_BES[i] > 0),
-        TradeMetadataKey.ACC_TANK_LEVEL: get_value_per_agent(optimized_model, start_datetime, 'SOCTES', agent_guids,
-                                                             lambda i: optimized_model.kwh_per_deg[i] > 0),
-        TradeMetadataKey.SHALLOW_STORAGE_REL: get_value_per_agent(optimized_model, start_datetime, 'Energy_shallow',
-                                                                  agent_guids,
-                                                                  lambda i: optimized_model.Energy_shallow_cap[i] > 0,
-                                                                  lambda i: optimized_model.Energy_shallow_cap[i]),
-        TradeMetadataKey.DEEP_STORAGE_REL: get_value_per_agent(optimized_model, start_datetime, 'Energy_deep',
-                                                               agent_guids,
-                                                               lambda i: optimized_model.Energy_deep_cap[i] > 0,
-                                                               lambda i: optimized_model.Energy_deep_cap[i]),
-        TradeMetadataKey.SHALLOW_STORAGE_ABS: get_value_per_agent(optimized_model, start_datetime, 'Energy_shallow',
-                                                                  agent_guids,
-                                                                  lambda i: optimized_model.Energy_shallow_cap[i] > 0),
-        TradeMetadataKey.DEEP_STORAGE_ABS: get_value_per_agent(optimized_model, start_datetime, 'Energy_deep',
-                                                               agent_guids,
-                                                               lambda i: optimized_model.Energy_deep_cap[i] > 0),
-        TradeMetadataKey.SHALLOW_LOSS: get_value_per_agent(optimized_model, start_datetime, 'Loss_shallow', agent_guids,
-                                                           lambda i: optimized_model.Energy_shallow_cap[i] > 0),
-        TradeMetadataKey.DEEP_LOSS: get_value_per_agent(optimized_model, start_datetime, 'Loss_deep', agent_guids,
-                                                        lambda i: optimized_model.Energy_deep_cap[i] > 0),
-        TradeMetadataKey.SHALLOW_CHARGE: get_value_per_agent(optimized_model, start_datetime, 'Hcha_shallow',
-                                                             agent_guids,
-                                                             lambda i: optimized_model.Energy_shallow_cap[i] > 0),
-        TradeMetadataKey.FLOW_SHALLOW_TO_DEEP: get_value_per_agent(optimized_model, start_datetime, 'Flow', agent_guids,
-                                                                   lambda i: optimized_model.Energy_deep_cap[i] > 0),
-        TradeMetadataKey.HP_COOL_PROD: get_value_per_agent(optimized_model, start_datetime, 'Chp', agent_guids,
-                                                           lambda i: optimized_model.Phpmax[i] > 0)
+        TradeMetadataKey.BATTERY_LEVEL: get_value_per_agent(model_values, start_datetime, 'SOCBES', agent_guids,
+                                                            has_battery),
+        TradeMetadataKey.ACC_TANK_LEVEL: get_value_per_agent(model_values, start_datetime, 'SOCTES', agent_guids,
+                                                             has_acc_tank),
+        TradeMetadataKey.SHALLOW_STORAGE_REL: get_value_per_agent(model_values, start_datetime, 'Energy_shallow',
+                                                                  agent_guids, shallow_cap > 0, shallow_cap),
+        TradeMetadataKey.DEEP_STORAGE_REL: get_value_per_agent(model_values, start_datetime, 'Energy_deep',
+                                                               agent_guids, deep_cap > 0, deep_cap),
+        TradeMetadataKey.SHALLOW_STORAGE_ABS: get_value_per_agent(model_values, start_datetime, 'Energy_shallow',
+                                                                  agent_guids, shallow_cap > 0),
+        TradeMetadataKey.DEEP_STORAGE_ABS: get_value_per_agent(model_values, start_datetime, 'Energy_deep',
+                                                               agent_guids, deep_cap > 0),
+        TradeMetadataKey.SHALLOW_LOSS: get_value_per_agent(model_values, start_datetime, 'Loss_shallow', agent_guids,
+                                                           shallow_cap > 0),
+        TradeMetadataKey.DEEP_LOSS: get_value_per_agent(model_values, start_datetime, 'Loss_deep', agent_guids,
+                                                        deep_cap > 0),
+        TradeMetadataKey.SHALLOW_CHARGE: get_value_per_agent(model_values, start_datetime, 'Hcha_shallow',
+                                                             agent_guids, shallow_cap > 0),
+        TradeMetadataKey.FLOW_SHALLOW_TO_DEEP: get_value_per_agent(model_values, start_datetime, 'Flow', agent_guids,
+                                                                   deep_cap > 0),
+        TradeMetadataKey.HP_COOL_PROD: get_value_per_agent(model_values, start_datetime, 'Chp', agent_guids,
+                                                           has_heat_pump)
     }
     if should_use_summer_mode(start_datetime):
         metadata_per_agent_and_period[TradeMetadataKey.HP_LOW_HEAT_PROD] = \
-            get_value_per_agent(optimized_model, start_datetime, 'Hhp', agent_guids,
-                                lambda i: optimized_model.Phpmax[i] > 0)
+            get_value_per_agent(model_values, start_datetime, 'Hhp', agent_guids, has_heat_pump)
         metadata_per_agent_and_period[TradeMetadataKey.HP_HIGH_HEAT_PROD] = \
-            get_value_per_agent(optimized_model, start_datetime, 'HhpB', agent_guids,
-                                lambda i: optimized_model.PhpBmax[i] > 0)
+            get_value_per_agent(model_values, start_datetime, 'HhpB', agent_guids, model_values.array('PhpBmax') > 0)
     else:
         metadata_per_agent_and_period[TradeMetadataKey.HP_LOW_HEAT_PROD] = {}
         metadata_per_agent_and_period[TradeMetadataKey.HP_HIGH_HEAT_PROD] = \
-            get_value_per_agent(optimized_model, start_datetime, 'Hhp', agent_guids,
-                                lambda i: optimized_model.Phpmax[i] > 0)
+            get_value_per_agent(model_values, start_datetime, 'Hhp', agent_guids, has_heat_pump)
 
     # Build metadata per period (not agent-individual)
     metadata_per_period = {
-        TradeMetadataKey.COOL_DUMP: get_value_per_period(optimized_model, start_datetime, 'cool_dump'),
-        TradeMetadataKey.CM_COOL_PROD: get_value_per_period(optimized_model, start_datetime, 'Ccc'),
-        TradeMetadataKey.CM_HEAT_PROD: get_value_per_period(optimized_model, start_datetime, 'Hcc'),
-        TradeMetadataKey.CM_ELEC_CONS: get_value_per_period(optimized_model, start_datetime, 'Pcc')
+        TradeMetadataKey.COOL_DUMP: get_value_per_period(model_values, start_datetime, 'cool_dump'),
+        TradeMetadataKey.CM_COOL_PROD: get_value_per_period(model_values, start_datetime, 'Ccc'),
+        TradeMetadataKey.CM_HEAT_PROD: get_value_per_period(model_values, start_datetime, 'Hcc'),
+        TradeMetadataKey.CM_ELEC_CONS: get_value_per_period(model_values, start_datetime, 'Pcc')
     }
-    heat_dump_per_agent = get_value_per_agent(optimized_model, start_datetime, 'heat_dump', agent_guids,
-                                              lambda i: True)
+    heat_dump_per_agent = get_value_per_agent(model_values, start_datetime, 'heat_dump', agent_guids,
+                                              np.full(len(agent_guids), True))
     heat_dump_total = {dt: sum(inner_dict[dt] for inner_dict in heat_dump_per_agent.values() if dt in inner_dict)
                        for dt in set(key for inner_dict in heat_dump_per_agent.values() for key in inner_dict)}
     metadata_per_period[TradeMetadataKey.HEAT_DUMP] = heat_dump_total
     return ChalmersOutputs(elec_trades + heat_trades + cool_trades, metadata_per_agent_and_period, metadata_per_period)
 
 
-def build_supply_and_demand_dfs(agents: List[BlockAgent], start_datetime: datetime.datetime, trading_horizon: int) -> \
-        Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame,
-              pd.DataFrame]:
-    elec_demand = []
-    elec_supply = []
-    high_heat_demand = []
-    high_heat_supply = []
-    low_heat_demand = []
-    low_heat_supply = []
-    cooling_demand = []
-    cooling_supply = []
-    for agent in agents:
-        agent_elec_demand: List[float] = []
-        agent_elec_supply: List[float] = []
-        agent_high_heat_demand: List[float] = []
-        agent_high_heat_supply: List[float] = []
-        agent_low_heat_demand: List[float] = []
-        agent_low_heat_supply: List[float] = []
-        agent_cooling_demand: List[float] = []
-        agent_cooling_supply: List[float] = []
-        for hour in range(trading_horizon):
-            usage_per_resource = agent.get_actual_usage(start_datetime + datetime.timedelta(hours=hour))
-            add_usage_to_demand_list(agent_elec_demand, usage_per_resource[Resource.ELECTRICITY])
-            add_usage_to_supply_list(agent_elec_supply, usage_per_resource[Resource.ELECTRICITY])
-            add_usage_to_demand_list(agent_high_heat_demand, usage_per_resource[Resource.HIGH_TEMP_HEAT])
-            add_usage_to_supply_list(agent_high_heat_supply, usage_per_resource[Resource.HIGH_TEMP_HEAT])
-            add_usage_to_demand_list(agent_low_heat_demand, usage_per_resource[Resource.LOW_TEMP_HEAT])
-            add_usage_to_supply_list(agent_low_heat_supply, usage_per_resource[Resource.LOW_TEMP_HEAT])
-            add_usage_to_demand_list(agent_cooling_demand, usage_per_resource[Resource.COOLING])
-            add_usage_to_supply_list(agent_cooling_supply, usage_per_resource[Resource.COOLING])
-        elec_demand.append(agent_elec_demand)
-        elec_supply.append(agent_elec_supply)
-        high_heat_demand.append(agent_high_heat_demand)
-        high_heat_supply.append(agent_high_heat_supply)
-        low_heat_demand.append(agent_low_heat_demand)
-        low_heat_supply.append(agent_low_heat_supply)
-        cooling_demand.append(agent_cooling_demand)
-        cooling_supply.append(agent_cooling_supply)
-    elec_demand_df = pd.DataFrame(elec_demand)
-    elec_supply_df = pd.DataFrame(elec_supply)
-    high_heat_demand_df = pd.DataFrame(high_heat_demand)
-    high_heat_supply_df = pd.DataFrame(high_heat_supply)
-    low_heat_demand_df = pd.DataFrame(low_heat_demand)
-    low_heat_supply_df = pd.DataFrame(low_heat_supply)
-    cooling_demand_df = pd.DataFrame(cooling_demand)
-    cooling_supply_df = pd.DataFrame(cooling_supply)
-    return (elec_demand_df, elec_supply_df, high_heat_demand_df, high_heat_supply_df,
-            low_heat_demand_df, low_heat_supply_df, cooling_demand_df, cooling_supply_df)
-
-
-def add_usage_to_demand_list(agent_list: List[float], usage_of_resource: float):
-    agent_list.append(usage_of_resource if usage_of_resource > 0 else 0)
-
-
-def add_usage_to_supply_list(agent_list: List[float], usage_of_resource: float):
-    agent_list.append(-usage_of_resource if usage_of_resource < 0 else 0)
-
-
-def get_power_transfers(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime, grid_agent_guid: str,
+def get_aggregation_error_per_period(hourly_arrays: Tuple[np.ndarray, ...], start_datetime: datetime.datetime,
+                                     time_step: int) -> Dict[TradeMetadataKey, Dict[datetime.datetime, float]]:
+    """
+    The energy by which the agents' net usage, of all resources, deviates from the average over each time step, per
+    period. hourly_arrays are as returned by build_supply_and_demand_arrays. Empty if the time step is one hour.
+    """
+    if time_step == 1:
+        return {}
+    net_usage = np.array(hourly_arrays[0::2]) - np.array(hourly_arrays[1::2])
+    error = get_aggregation_error(net_usage, time_step)
+    return {TradeMetadataKey.TIME_AGGREGATION_ERROR: {start_datetime + datetime.timedelta(hours=hour):
+                                                      round(value, DECIMALS_TO_ROUND_TO)
+                                                      for hour, value in enumerate(error.tolist())}}
+
+
+def build_supply_and_demand_arrays(agents: List[BlockAgent], start_datetime: datetime.datetime,
+                                   trading_horizon: int) -> \
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns demand and supply of electricity, high-temperature heat, low-temperature heat and cooling, in that order.
+    Each array has one row per agent and one column per hour of the trading horizon.
+    """
+    periods = [start_datetime + datetime.timedelta(hours=hour) for hour in range(trading_horizon)]
+    arrays: List[np.ndarray] = []
+    for resource in [Resource.ELECTRICITY, Resource.HIGH_TEMP_HEAT, Resource.LOW_TEMP_HEAT, Resource.COOLING]:
+        usage = np.array([agent.get_actual_usage_for_periods(periods, resource) for agent in agents],
+                         dtype=float).reshape(len(agents), trading_horizon)
+        arrays.append(np.where(usage > 0, usage, 0.0))  # Demand
+        arrays.append(np.where(usage < 0, -usage, 0.0))  # Supply
+    elec_demand, elec_supply, high_heat_demand, high_heat_supply, \
+        low_heat_demand, low_heat_supply, cooling_demand, cooling_supply = arrays
+    return (elec_demand, elec_supply, high_heat_demand, high_heat_supply,
+            low_heat_demand, low_heat_supply, cooling_demand, cooling_supply)
+
+
+def get_power_transfers(model_values: ModelValues, start_datetime: datetime.datetime, grid_agent_guid: str,
                         agent_guids: List[str], resource_price_data: ElectricityPrice, local_market_enabled: bool) \
         -> List[Trade]:
-    total_bought = get_sum_of_param(optimized_model.Pbuy_market)
+    total_bought = model_values.sum_of_param('Pbuy_market')
     if local_market_enabled:
         # For example: Pbuy_market is how much the LEC bought from the external grid operator
-        agent_trades = get_agent_transfers_with_lec(optimized_model, start_datetime,
-                                                    sold_internal_name='Psell_grid', bought_internal_name='Pbuy_grid',
-                                                    resource=Resource.ELECTRICITY, agent_guids=agent_guids, loss=0.0,
-                                                    resource_price_data=resource_price_data, total_bought=total_bought)
-        external_trades = get_external_elec_transfers(optimized_model, start_datetime,
+        agent_trades = get_agent_transfers(model_values, start_datetime,
+                                           sold_internal_name='Psell_grid', bought_internal_name='Pbuy_grid',
+                                           resource=Resource.ELECTRICITY, agent_guids=agent_guids, loss=0.0,
+                                           market=Market.LOCAL, resource_price_data=resource_price_data,
+                                           total_bought=total_bought)
+        external_trades = get_external_elec_transfers(model_values, start_datetime,
                                                       sold_to_external_name='Psell_market',
                                                       bought_from_external_name='Pbuy_market',
                                                       grid_agent_guid=grid_agent_guid,
-                                                      loss=0.0, resource_price_data=resource_price_data,
+                                                      loss=0.0, elec_price_data=resource_price_data,
                                                       market=Market.LOCAL, total_bought=total_bought)
     else:
-        agent_trades = get_agent_transfers_no_lec(optimized_model, start_datetime,
-                                                  sold_internal_name='Psell_market', bought_internal_name='Pbuy_market',
-                                                  resource=Resource.ELECTRICITY, agent_guid=agent_guids[0], loss=0.0,
-                                                  resource_price_data=resource_price_data, total_bought=total_bought)
-        external_trades = get_external_elec_transfers(optimized_model, start_datetime,
+        agent_trades = get_agent_transfers(model_values, start_datetime,
+                                           sold_internal_name='Psell_market', bought_internal_name='Pbuy_market',
+                                           resource=Resource.ELECTRICITY, agent_guids=agent_guids, loss=0.0,
+                                           market=Market.EXTERNAL, resource_price_data=resource_price_data,
+                                           total_bought=total_bought)
+        external_trades = get_external_elec_transfers(model_values, start_datetime,
                                                       sold_to_external_name='Psell_market',
                                                       bought_from_external_name='Pbuy_market',
                                                       grid_agent_guid=grid_agent_guid,
-                                                      loss=0.0, resource_price_data=resource_price_data,
+                                                      loss=0.0, elec_price_data=resource_price_data,
                                                       market=Market.EXTERNAL, total_bought=total_bought)
     return agent_trades + external_trades
 
 
-def get_heat_transfers(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime, grid_agent_guid: str,
+def get_heat_transfers(model_values: ModelValues, start_datetime: datetime.datetime, grid_agent_guid: str,
                        agent_guids: List[str], resource_price_data: HeatingPrice, local_market_enabled: bool) \
         -> List[Trade]:
     resource = Resource.LOW_TEMP_HEAT if (should_use_summer_mode(start_datetime) and local_market_enabled) \
         else Resource.HIGH_TEMP_HEAT
-    total_bought = get_sum_of_param(optimized_model.Hbuy_market)
+    total_bought = model_values.sum_of_param('Hbuy_market')
+    loss = model_values.scalar('Heat_trans_loss')
     if local_market_enabled:
-        agent_trades = get_agent_transfers_with_lec(optimized_model, start_datetime,
-                                                    sold_internal_name='Hsell_grid', bought_internal_name='Hbuy_grid',
-                                                    resource=resource, agent_guids=agent_guids,
-                                                    loss=optimized_model.Heat_trans_loss,
-                                                    resource_price_data=resource_price_data, total_bought=total_bought)
-        external_trades = get_external_heat_transfers(optimized_model, start_datetime,
+        agent_trades = get_agent_transfers(model_values, start_datetime,
+                                           sold_internal_name='Hsell_grid', bought_internal_name='Hbuy_grid',
+                                           resource=resource, agent_guids=agent_guids, loss=loss, market=Market.LOCAL,
+                                           resource_price_data=resource_price_data, total_bought=total_bought)
+        external_trades = get_external_heat_transfers(model_values, start_datetime,
                                                       sold_to_external_name='NA',
                                                       bought_from_external_name='Hbuy_market',
-                                                      grid_agent_guid=grid_agent_guid,
-                                                      loss=optimized_model.Heat_trans_loss,
-                                                      resource_price_data=resource_price_data, market=Market.LOCAL,
+                                                      grid_agent_guid=grid_agent_guid, loss=loss,
+                                                      heat_price_data=resource_price_data, market=Market.LOCAL,
                                                       total_bought=total_bought)
     else:
-        agent_trades = get_agent_transfers_no_lec(optimized_model, start_datetime,
-                                                  sold_internal_name='NA', bought_internal_name='Hbuy_market',
-                                                  resource=resource, agent_guid=agent_guids[0],
-                                                  loss=optimized_model.Heat_trans_loss,
-                                                  resource_price_data=resource_price_data, total_bought=total_bought)
-        external_trades = get_external_heat_transfers(optimized_model, start_datetime,
+        agent_trades = get_agent_transfers(model_values, start_datetime,
+                                           sold_internal_name='NA', bought_internal_name='Hbuy_market',
+                                           resource=resource, agent_guids=agent_guids, loss=loss,
+                                           market=Market.EXTERNAL, resource_price_data=resource_price_data,
+                                           total_bought=total_bought)
+        external_trades = get_external_heat_transfers(model_values, start_datetime,
                                                       sold_to_external_name='NA',
                                                       bought_from_external_name='Hbuy_market',
-                                                      grid_agent_guid=grid_agent_guid,
-                                                      loss=optimized_model.Heat_trans_loss,
-                                                      resource_price_data=resource_price_data, market=Market.EXTERNAL,
+                                                      grid_agent_guid=grid_agent_guid, loss=loss,
+                                                      heat_price_data=resource_price_data, market=Market.EXTERNAL,
                                                       total_bought=total_bought)
     return agent_trades + external_trades
 
 
-def get_cool_transfers(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime, agent_guids: List[str]) \
+def get_cool_transfers(model_values: ModelValues, start_datetime: datetime.datetime, agent_guids: List[str]) \
         -> List[Trade]:
-    return get_agent_transfers_with_lec(optimized_model, start_datetime,
-                                        sold_internal_name='Csell_grid', bought_internal_name='Cbuy_grid',
-                                        resource=Resource.COOLING, agent_guids=agent_guids,
-                                        loss=optimized_model.cold_trans_loss, resource_price_data=None,
-                                        total_bought=0.0)  # No external grid operator for cooling
+    return get_agent_transfers(model_values, start_datetime,
+                               sold_internal_name='Csell_grid', bought_internal_name='Cbuy_grid',
+                               resource=Resource.COOLING, agent_guids=agent_guids,
+                               loss=model_values.scalar('cold_trans_loss'), market=Market.LOCAL,
+                               resource_price_data=None, total_bought=0.0)  # No external grid operator for cooling
 
 
-def get_external_elec_transfers(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
-                                sold_to_external_name: str, bought_from_external_name: str,
-                                grid_agent_guid: str, loss: float,
-                                resource_price_data: ElectricityPrice, market: Market,
-                                total_bought: float) -> List[Trade]:
+def get_agent_transfers(model_values: ModelValues, start_datetime: datetime.datetime,
+                        sold_internal_name: str, bought_internal_name: str,
+                        resource: Resource, agent_guids: List[str], loss: float, market: Market,
+                        resource_price_data: Optional[IPrice], total_bought: float) -> List[Trade]:
+    """
+    Trades between each agent and the LEC (market = LOCAL), or, if the local market isn't used, between the single
+    agent and the external grid (market = EXTERNAL). Price estimates and sells are added to resource_price_data.
+    """
+    net = model_values.array_or_zeros(bought_internal_name) - model_values.array_or_zeros(sold_internal_name)
+    # The LEC model has one row per agent, the agent model only has the hour index
+    net_per_agent = net.reshape(len(agent_guids), len(model_values.hours)).tolist()
+    price_estimates_by_agent: Dict[str, Dict[datetime.datetime, float]] = {}
+    sells_by_agent: Dict[str, Dict[datetime.datetime, float]] = {}
     transfers: List[Trade] = []
-    for hour in optimized_model.T:
-        add_external_elec_trade(transfers, bought_from_external_name, hour, optimized_model, sold_to_external_name,
-                                start_datetime, grid_agent_guid, loss,
-                                resource_price_data, market, total_bought)
+    for hour in model_values.hours:
+        period = start_datetime + datetime.timedelta(hours=hour)
+        for i_agent, agent_name in enumerate(agent_guids):
+            quantity = net_per_agent[i_agent][hour]
+            if quantity > VERY_SMALL_NUMBER or quantity < -VERY_SMALL_NUMBER:
+                quantity_pre_loss = quantity / (1 - loss)
+                trade_quantity = abs(quantity_pre_loss if quantity > 0 else quantity)
+
+                if resource_price_data is None:
+                    estimated_marginal_price = np.nan
+                    wholesale_price = np.nan
+                    grid_fee_per_kwh = 0.0
+                elif resource == Resource.ELECTRICITY:
+                    estimated_marginal_price, tax_per_kwh, grid_fee_per_kwh = \
+                        calculate_estimated_electricity_retail_price(hour, model_values, total_bought)
+                    wholesale_price = calculate_estimated_electricity_wholesale_price(hour, model_values)
+                    add_to_nested_dict(price_estimates_by_agent, agent_name, period, estimated_marginal_price)
+                else:
+                    estimated_marginal_price = calculate_estimated_heating_retail_price(model_values, total_bought)
+                    wholesale_price = calculate_estimated_heating_wholesale_price()
+                    add_to_nested_dict(price_estimates_by_agent, agent_name, period, estimated_marginal_price)
+                    grid_fee_per_kwh = 0.0
+
+                transfers.append(Trade(period=period,
+                                       action=Action.BUY if quantity > 0 else Action.SELL, resource=resource,
+                                       quantity=trade_quantity,
+                                       price=estimated_marginal_price if quantity > 0 else wholesale_price,
+                                       source=agent_name, by_external=False, market=market, loss=loss,
+                                       grid_fee_paid=grid_fee_per_kwh))
+            else:
+                trade_quantity = 0.0
+
+            # Add to resource price data - needs to be done even if quantity is 0
+            if market == Market.EXTERNAL and resource_price_data is not None:
+                add_to_nested_dict(sells_by_agent, agent_name, period, trade_quantity)
+
+    if resource_price_data is not None:
+        for agent_name, price_estimates in price_estimates_by_agent.items():
+            resource_price_data.add_price_estimates_for_agent(list(price_estimates.keys()),
+                                                              list(price_estimates.values()), agent_name)
+        for agent_name, sells in sells_by_agent.items():
+            resource_price_data.add_external_sells_for_agent(list(sells.keys()), list(sells.values()), agent_name)
     return transfers
 
 
-def get_external_heat_transfers(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
+def get_external_elec_transfers(model_values: ModelValues, start_datetime: datetime.datetime,
                                 sold_to_external_name: str, bought_from_external_name: str,
                                 grid_agent_guid: str, loss: float,
-                                resource_price_data: HeatingPrice, market: Market, total_bought: float) -> List[Trade]:
-    transfers: List[Trade] = []
-    retail_price = calculate_estimated_heating_retail_price(optimized_model, total_bought)
-    wholesale_price = calculate_estimated_heating_wholesale_price()
-    for hour in optimized_model.T:
-        add_external_heat_trade(transfers, bought_from_external_name, hour, optimized_model, sold_to_external_name,
-                                start_datetime, grid_agent_guid, loss,
-                                resource_price_data, market, retail_price, wholesale_price)
-    return transfers
-
-
-def get_agent_transfers_with_lec(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
-                                 sold_internal_name: str, bought_internal_name: str,
-                                 resource: Resource, agent_guids: List[str], loss: float,
-                                 resource_price_data: Optional[IPrice], total_bought: float) -> List[Trade]:
+                                elec_price_data: ElectricityPrice, market: Market,
+                                total_bought: float) -> List[Trade]:
+    external_quantities = (model_values.array_or_zeros(sold_to_external_name)
+                           - model_values.array_or_zeros(bought_from_external_name)).tolist()
+    price_estimates: Dict[datetime.datetime, float] = {}
+    sells: Dict[datetime.datetime, float] = {}
     transfers: List[Trade] = []
-    for hour in optimized_model.T:
-        for i_agent in optimized_model.I:
-            add_agent_trade(transfers, bought_internal_name, sold_internal_name, hour, i_agent, optimized_model,
-                            start_datetime, resource, agent_guids, loss, Market.LOCAL, resource_price_data,
-                            total_bought)
+    for hour in model_values.hours:
+        external_quantity = external_quantities[hour]
+        period = start_datetime + datetime.timedelta(hours=hour)
+        if external_quantity > VERY_SMALL_NUMBER:
+            wholesale_price = calculate_estimated_electricity_wholesale_price(hour, model_values)
+            transfers.append(Trade(period=period,
+                                   action=Action.BUY, resource=Resource.ELECTRICITY,
+                                   quantity=external_quantity / (1 - loss),
+                                   price=wholesale_price, source=grid_agent_guid, by_external=True, market=market,
+                                   loss=loss))
+        else:
+            if external_quantity < -VERY_SMALL_NUMBER:
+                trade_quantity = -external_quantity
+                retail_price, elec_tax_fee, grid_fee_per_kwh = calculate_estimated_electricity_retail_price(
+                    hour, model_values, total_bought)
+                if market == Market.LOCAL:
+                    # Means this is for LEC, so we add a price estimate. If it is not for LEC, the price estimate will
+                    # be different for each agent, so the price estimates are added when the agent trade is created
+                    # instead.
+                    price_estimates[period] = retail_price
+
+                transfers.append(Trade(period=period,
+                                       action=Action.SELL, resource=Resource.ELECTRICITY, quantity=trade_quantity,
+                                       price=retail_price,
+                                       source=grid_agent_guid, by_external=True, market=market,
+                                       loss=loss,
+                                       tax_paid=elec_tax_fee))
+            else:
+                trade_quantity = 0.0
+            # Add to ElectricityPrice - needs to be done even if quantity is 0
+            sells[period] = trade_quantity
+    elec_price_data.add_price_estimates(list(price_estimates.keys()), list(price_estimates.values()))
+    elec_price_data.add_external_sells(list(sells.keys()), list(sells.values()))
     return transfers
 
 
-def get_agent_transfers_no_lec(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
-                               sold_internal_name: str, bought_internal_name: str,
-                               resource: Resource, agent_guid: str, loss: float,
-                               resource_price_data: IPrice, total_bought: float) -> List[Trade]:
+def get_external_heat_transfers(model_values: ModelValues, start_datetime: datetime.datetime,
+                                sold_to_external_name: str, bought_from_external_name: str,
+                                grid_agent_guid: str, loss: float,
+                                heat_price_data: HeatingPrice, market: Market, total_bought: float) -> List[Trade]:
+    retail_price = calculate_estimated_heating_retail_price(model_values, total_bought)
+    wholesale_price = calculate_estimated_heating_wholesale_price()
+    external_quantities = (model_values.array_or_zeros(sold_to_external_name)
+                           - model_values.array_or_zeros(bought_from_external_name)).tolist()
+    price_estimates: Dict[datetime.datetime, float] = {}
+    sells: Dict[datetime.datetime, float] = {}
     transfers: List[Trade] = []
-    for hour in optimized_model.T:
-        add_agent_trade(transfers, bought_internal_name, sold_internal_name, hour, None, optimized_model,
-                        start_datetime, resource, [agent_guid], loss, Market.EXTERNAL, resource_price_data,
-                        total_bought)
-    return transfers
-
-
-def add_agent_trade(trade_list: List[Trade], bought_internal_name: str, sold_internal_name: str, hour: int,
-                    i_agent: Optional[int], optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
-                    resource: Resource, agent_guids: List[str], loss: float, market: Market,
-                    resource_price_data: Optional[IPrice], total_bought: float):
-    bought_internal: IndexedVar = getattr(optimized_model, bought_internal_name)
-    sold_internal: Optional[IndexedVar] = getattr(optimized_model, sold_internal_name) \
-        if hasattr(optimized_model, sold_internal_name) else None
-    if i_agent is not None:
-        net = bought_internal[i_agent, hour] - sold_internal[i_agent, hour] \
-            if sold_internal is not None else bought_internal[i_agent, hour]
-        agent_name = agent_guids[i_agent]
-    else:
-        net = bought_internal[hour] - sold_internal[hour] \
-            if sold_internal is not None else bought_internal[hour]
-        agent_name = agent_guids[0]
-    quantity = pyo.value(net)
-    period = start_datetime + datetime.timedelta(hours=hour)
-    if quantity > VERY_SMALL_NUMBER or quantity < -VERY_SMALL_NUMBER:
-        quantity_pre_loss = quantity / (1 - loss)
-        trade_quantity = abs(quantity_pre_loss if quantity > 0 else quantity)
-
-        if resource_price_data is None:
-            estimated_marginal_price = np.nan
-            wholesale_price = np.nan
-            grid_fee_per_kwh = 0.0
-        elif resource == Resource.ELECTRICITY:
-            nordpool_prices = optimized_model.nordpool_price
-            estimated_marginal_price, tax_per_kwh, grid_fee_per_kwh = calculate_estimated_electricity_retail_price(
-                hour, nordpool_prices, optimized_model, total_bought)
-            wholesale_price = calculate_estimated_electricity_wholesale_price(hour, nordpool_prices, optimized_model)
-            resource_price_data.add_price_estimate_for_agent(period, estimated_marginal_price, agent_name)
-        else:
-            estimated_marginal_price = calculate_estimated_heating_retail_price(optimized_model, total_bought)
-            wholesale_price = calculate_estimated_heating_wholesale_price()
-            resource_price_data.add_price_estimate_for_agent(period, estimated_marginal_price, agent_name)
-            grid_fee_per_kwh = 0.0
-
-        trade_list.append(Trade(period=period,
-                                action=Action.BUY if quantity > 0 else Action.SELL, resource=resource,
-                                quantity=trade_quantity,
-                                price=estimated_marginal_price if quantity > 0 else wholesale_price,
-                                source=agent_name, by_external=False, market=market, loss=loss,
-                                grid_fee_paid=grid_fee_per_kwh))
-    else:
-        trade_quantity = 0.0
-
-    # Add to resource price data - needs to be done even if quantity is 0
-    if market == Market.EXTERNAL and resource_price_data is not None:
-        resource_price_data.add_external_sell_for_agent(period, trade_quantity, agent_name)
-
-
-def add_external_elec_trade(trade_list: List[Trade], bought_from_external_name: str, hour: int,
-                            optimized_model: pyo.ConcreteModel, sold_to_external_name: str,
-                            start_datetime: datetime.datetime, grid_agent_guid: str,
-                            loss: float, elec_price_data: ElectricityPrice, market: Market,
-                            total_bought: float):
-    external_quantity = pyo.value(get_variable_value_or_else(optimized_model, sold_to_external_name, hour)
-                                  - get_variable_value_or_else(optimized_model, bought_from_external_name, hour))
-    period = start_datetime + datetime.timedelta(hours=hour)
-    nordpool_prices = optimized_model.nordpool_price
-    if external_quantity > VERY_SMALL_NUMBER:
-        wholesale_price = calculate_estimated_electricity_wholesale_price(hour, nordpool_prices, optimized_model)
-        trade_list.append(Trade(period=period,
-                                action=Action.BUY, resource=Resource.ELECTRICITY,
-                                quantity=external_quantity / (1 - loss),
-                                price=wholesale_price, source=grid_agent_guid, by_external=True, market=market,
-                                loss=loss))
-    else:
-        if external_quantity < -VERY_SMALL_NUMBER:
-            trade_quantity = -external_quantity
-            retail_price, elec_tax_fee, grid_fee_per_kwh = calculate_estimated_electricity_retail_price(
-                hour, nordpool_prices, optimized_model, total_bought)
-            if market == Market.LOCAL:
-                # Means this is for LEC, so we add a price estimate. If it is not for LEC, the price estimate will be
-                # different for each agent, so the price estimates are added when the agent trade is created instead.
-                elec_price_data.add_price_estimate(period, retail_price)
-
-            trade_list.append(Trade(period=period,
-                                    action=Action.SELL, resource=Resource.ELECTRICITY, quantity=trade_quantity,
-                                    price=retail_price,
-                                    source=grid_agent_guid, by_external=True, market=market,
-                                    loss=loss,
-                                    tax_paid=elec_tax_fee))
+    for hour in model_values.hours:
+        external_quantity = external_quantities[hour]
+        period = start_datetime + datetime.timedelta(hours=hour)
+        if external_quantity > VERY_SMALL_NUMBER:
+            transfers.append(Trade(period=period,
+                                   action=Action.BUY, resource=Resource.HIGH_TEMP_HEAT,
+                                   quantity=external_quantity / (1 - loss),
+                                   price=wholesale_price, source=grid_agent_guid, by_external=True, market=market,
+                                   loss=loss))
         else:
-            trade_quantity = 0.0
-        # Add to ElectricityPrice - needs to be done even if quantity is 0
-        elec_price_data.add_external_sell(period, trade_quantity)
+            if external_quantity < -VERY_SMALL_NUMBER:
+                trade_quantity = -external_quantity
+                if market == Market.LOCAL:
+                    # Means this is for LEC, so we add a price estimate. If it is not for LEC, the price estimate will
+                    # be different for each agent, so the price estimates are added when the agent trade is created
+                    # instead.
+                    price_estimates[period] = retail_price
+                transfers.append(Trade(period=period,
+                                       action=Action.SELL, resource=Resource.HIGH_TEMP_HEAT, quantity=trade_quantity,
+                                       price=retail_price, source=grid_agent_guid, by_external=True, market=market,
+                                       loss=loss))
+            else:
+                trade_quantity = 0.0
+            # Add to HeatingPrice - needs to be done even if quantity is 0
+            sells[period] = trade_quantity
+    heat_price_data.add_price_estimates(list(price_estimates.keys()), list(price_estimates.values()))
+    heat_price_data.add_external_sells(list(sells.keys()), list(sells.values()))
+    return transfers
 
 
-def calculate_estimated_electricity_retail_price(hour: int,
-                                                 nordpool_prices,
-                                                 optimized_model: pyo.ConcreteModel,
-                                                 total_bought: float) -> Tuple[float, float, float]:
+def calculate_estimated_electricity_retail_price(hour: int, model_values: ModelValues, total_bought: float) \
+        -> Tuple[float, float, float]:
     """
     Reconstructs the retail price estimate from the objective functions in CEMS_function.py and AgentEMS.py.
     Returns the estimated total price, the tax, and the grid fee (all marginal, i.e. per kWh)
     """
-    elec_trans_fee_param = optimized_model.elec_trans_fee
-    elec_tax_fee_param = optimized_model.elec_tax_fee
-    elec_peak_load_fee_param = optimized_model.elec_peak_load_fee
-    avg_elec_peak_load_var = optimized_model.avg_elec_peak_load
-    elec_tax_fee = get_value_from_param(elec_tax_fee_param)
-    elec_trans_fee = get_value_from_param(elec_trans_fee_param)
-    elec_peak_load_fee = get_value_from_param(elec_peak_load_fee_param)
-    price_per_kwh = get_value_from_param(nordpool_prices, hour) + elec_trans_fee + elec_tax_fee
+    elec_tax_fee = model_values.scalar('elec_tax_fee')
+    elec_trans_fee = model_values.scalar('elec_trans_fee')
+    elec_peak_load_fee = model_values.scalar('elec_peak_load_fee')
+    price_per_kwh = float(model_values.array('nordpool_price')[hour]) + elec_trans_fee + elec_tax_fee
     # Get the total effect fee, and then per kWh
-    total_effect_fee_for_horizon = elec_peak_load_fee * avg_elec_peak_load_var.value
+    total_effect_fee_for_horizon = elec_peak_load_fee * model_values.scalar('avg_elec_peak_load')
     effect_fee_per_kwh = total_effect_fee_for_horizon / total_bought
     # The "grid fee" is essentially what goes into the pocket of the external grid operator
     grid_fee_per_kwh = effect_fee_per_kwh + elec_trans_fee
@@ -668,28 +1247,22 @@ def calculate_estimated_electricity_retail_price(hour: int,
     return estimated_marginal_price, elec_tax_fee, grid_fee_per_kwh
 
 
-def calculate_estimated_electricity_wholesale_price(hour: int,
-                                                    nordpool_prices,
-                                                    optimized_model: pyo.ConcreteModel) -> float:
+def calculate_estimated_electricity_wholesale_price(hour: int, model_values: ModelValues) -> float:
     """
     Reconstructs the wholesale price estimate from the objective functions in CEMS_function.py and AgentEMS.py.
     """
-    incentive_fee = optimized_model.incentive_fee
-    return get_value_from_param(nordpool_prices, hour) + get_value_from_param(incentive_fee)
+    return float(model_values.array('nordpool_price')[hour]) + model_values.scalar('incentive_fee')
 
 
-def calculate_estimated_heating_retail_price(optimized_model: pyo.ConcreteModel, total_bought: float) -> float:
+def calculate_estimated_heating_retail_price(model_values: ModelValues, total_bought: float) -> float:
     """
     Reconstructs the retail price estimate from the objective functions in CEMS_function.py and AgentEMS.py.
     Returns the estimated marginal price (i.e. per kWh)
     """
-    heat_price_param = optimized_model.Hprice_energy
-    heat_peak_load_fee_param = optimized_model.heat_peak_load_fee
-    monthly_heat_peak_energy_var = optimized_model.monthly_heat_peak_energy
-    heat_price = get_value_from_param(heat_price_param)
-    heat_peak_load_fee = get_value_from_param(heat_peak_load_fee_param)
+    heat_price = model_values.scalar('Hprice_energy')
+    heat_peak_load_fee = model_values.scalar('heat_peak_load_fee')
     # Get the total effect fee, and then per kWh
-    total_effect_fee_for_horizon = (heat_peak_load_fee / 24) * monthly_heat_peak_energy_var.value
+    total_effect_fee_for_horizon = (heat_peak_load_fee / 24) * model_values.scalar('monthly_heat_peak_energy')
     effect_fee_per_kwh = total_effect_fee_for_horizon / total_bought
     return heat_price + effect_fee_per_kwh
 
@@ -701,103 +1274,38 @@ def calculate_estimated_heating_wholesale_price() -> float:
     return np.nan  # Selling of heat is not defined!
 
 
-def add_external_heat_trade(trade_list: List[Trade], bought_from_external_name: str, hour: int,
-                            optimized_model: pyo.ConcreteModel, sold_to_external_name: str,
-                            start_datetime: datetime.datetime, grid_agent_guid: str,
-                            loss: float, heat_price_data: HeatingPrice, market: Market,
-                            retail_price: float, wholesale_price: float):
-    external_quantity = pyo.value(get_variable_value_or_else(optimized_model, sold_to_external_name, hour)
-                                  - get_variable_value_or_else(optimized_model, bought_from_external_name, hour))
-    period = start_datetime + datetime.timedelta(hours=hour)
-    if external_quantity > VERY_SMALL_NUMBER:
-        trade_list.append(Trade(period=period,
-                                action=Action.BUY, resource=Resource.HIGH_TEMP_HEAT,
-                                quantity=external_quantity / (1 - loss),
-                                price=wholesale_price, source=grid_agent_guid, by_external=True, market=market,
-                                loss=loss))
-    else:
-        if external_quantity < -VERY_SMALL_NUMBER:
-            trade_quantity = -external_quantity
-            if market == Market.LOCAL:
-                # Means this is for LEC, so we add a price estimate. If it is not for LEC, the price estimate will be
-                # different for each agent, so the price estimates are added when the agent trade is created instead.
-                heat_price_data.add_price_estimate(period, retail_price)
-            trade_list.append(Trade(period=period,
-                                    action=Action.SELL, resource=Resource.HIGH_TEMP_HEAT, quantity=trade_quantity,
-                                    price=retail_price, source=grid_agent_guid, by_external=True, market=market,
-                                    loss=loss))
-        else:
-            trade_quantity = 0.0
-        # Add to HeatingPrice - needs to be done even if quantity is 0
-        heat_price_data.add_external_sell(period, trade_quantity)
-
-
-def get_value_from_param(maybe_indexed_param: Union[IndexedParam, ScalarParam], index: int = 0) -> float:
-    """If maybe_indexed_param is indexed, gets the 'index':th value. If it is a scalar, gets its value."""
-    if isinstance(maybe_indexed_param, IndexedParam):
-        return maybe_indexed_param[index]
-    elif isinstance(maybe_indexed_param, ScalarParam):
-        return maybe_indexed_param.value
-    raise RuntimeError('Unsupported type: {}'.format(type(maybe_indexed_param)))
-
-
 def get_sum_of_param(indexed_param: IndexedParam) -> float:
     return sum(indexed_param)
 
 
-def get_variable_value_or_else(optimized_model: pyo.ConcreteModel, variable_name: str, index: int,
-                               if_not_exists: float = 0.0) -> float:
-    if hasattr(optimized_model, variable_name):
-        return getattr(optimized_model, variable_name)[index]
-    return if_not_exists
-
-
-def add_value_per_agent_to_dict(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
-                                dict_to_add_to: Dict[str, Dict[datetime.datetime, Any]],
-                                variable_name: str, agent_guids: List[str]):
-    """
-    Example variable names: "Hhp" for heat pump production, "SOCBES" for state of charge of battery storage.
-    Adds to a nested dict where agent GUID is the first key, the period the second.
-    """
-    for hour in optimized_model.T:
-        for i_agent in optimized_model.I:
-            quantity = pyo.value(getattr(optimized_model, variable_name)[i_agent, hour])
-            period = start_datetime + datetime.timedelta(hours=hour)
-            add_to_nested_dict(dict_to_add_to, agent_guids[i_agent], period, quantity)
-
-
-def get_value_per_agent(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime,
+def get_value_per_agent(model_values: ModelValues, start_datetime: datetime.datetime,
                         variable_name: str, agent_guids: List[str],
-                        should_add_for_agent: Callable[[int], bool],
-                        divide_by: Callable[[int], float] = lambda i: 1.0) \
+                        should_add_for_agent: np.ndarray,
+                        divide_by: Optional[np.ndarray] = None) \
         -> Dict[str, Dict[datetime.datetime, Any]]:
     """
     Example variable names: "Hhp" for heat pump production, "SOCBES" for state of charge of battery storage.
     Returns a nested dict where agent GUID is the first key, the period the second.
-    Will only add values for which "should_add_for_agent(agent_index)" is True. This can be used to ensure that battery
-    charge state is only added for agents that actually have a battery.
-    If "divide_by" is specified, all quantities will be divided by "divide_by(agent_index)". Can be used to translate
-    energy quantities to % of max, for example.
+    Will only add values for agents where "should_add_for_agent" (one boolean per agent) is True. This can be used to
+    ensure that battery charge state is only added for agents that actually have a battery.
+    If "divide_by" (one number per agent) is specified, each agent's quantities will be divided by its number. Can be
+    used to translate energy quantities to % of max, for example.
     """
+    values = model_values.array(variable_name)
+    periods = [start_datetime + datetime.timedelta(hours=hour) for hour in model_values.hours]
     dict_to_add_to: Dict[str, Dict[datetime.datetime, Any]] = {}
-    for hour in optimized_model.T:
-        period = start_datetime + datetime.timedelta(hours=hour)
-        for i_agent in optimized_model.I:
-            if should_add_for_agent(i_agent):
-                quantity = pyo.value(getattr(optimized_model, variable_name)[i_agent, hour])
-                value = round(quantity / divide_by(i_agent), DECIMALS_TO_ROUND_TO)
-                add_to_nested_dict(dict_to_add_to, agent_guids[i_agent], period, value)
+    for i_agent in np.flatnonzero(should_add_for_agent):
+        agent_values = values[i_agent] if divide_by is None else values[i_agent] / divide_by[i_agent]
+        dict_to_add_to[agent_guids[i_agent]] = {period: round(value, DECIMALS_TO_ROUND_TO)
+                                                for period, value in zip(periods, agent_values.tolist())}
     return dict_to_add_to
 
 
-def get_value_per_period(optimized_model: pyo.ConcreteModel, start_datetime: datetime.datetime, variable_name: str) \
+def get_value_per_period(model_values: ModelValues, start_datetime: datetime.datetime, variable_name: str) \
         -> Dict[datetime.datetime, Any]:
     """
     Example variable names: "heat_dump" for heat reservoir.
     """
-    dict_to_add_to: Dict[datetime.datetime, Any] = {}
-    for hour in optimized_model.T:
-        period = start_datetime + datetime.timedelta(hours=hour)
-        quantity = pyo.value(getattr(optimized_model, variable_name)[hour])
-        dict_to_add_to[period] = round(quantity, DECIMALS_TO_ROUND_TO)
-    return dict_to_add_to
+    periods = [start_datetime + datetime.timedelta(hours=hour) for hour in model_values.hours]
+    return {period: round(value, DECIMALS_TO_ROUND_TO)
+            for period, value in zip(periods, model_values.array(variable_name).tolist())}
@@ -0,0 +1,111 @@
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from tradingplatformpoc.simulation_runner.time_aggregation import get_time_step
+from tradingplatformpoc.trading_platform_utils import get_if_exists_else
+
+logger = logging.getLogger(__name__)
+
+"""
+A worker runs several jobs at once, as long as they fit within its CPU and memory budget. What a job needs is estimated
+from its config: how many processes it is simulated in, and how large its optimization models are, which depends on
+the number of agents optimized, the length of the trading horizon, and whether BITES is modelled. The estimates are
+rough, and meant to keep a worker from running more jobs than its host can hold, not to be exact.
+"""
+
+# Memory used by a job regardless of its size: input data, pricing history, the solver and so on
+BASE_MEMORY_MB = 500
+# Memory used per agent for its digital twin and the results of the simulation
+MEMORY_MB_PER_AGENT = 20
+# Memory used by optimization models, per agent optimized and hour of the trading horizon
+MODEL_MEMORY_MB_PER_AGENT_HOUR = 0.25
+# Models of agents using BITES (building inertia as thermal energy storage) have more variables and constraints
+BITES_MODEL_MEMORY_FACTOR = 1.5
+
+
+class JobFootprint:
+    """Estimated number of CPUs and amount of memory that a job uses while running."""
+    cpus: int
+    memory_mb: float
+
+    def __init__(self, cpus: int, memory_mb: float):
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+
+    def __repr__(self) -> str:
+        return 'JobFootprint(cpus={}, memory_mb={:.0f})'.format(self.cpus, self.memory_mb)
+
+
+def get_number_of_processes(area_info: Dict[str, Any], optimization_workers: int, month_workers: int) -> int:
+    """The number of processes a job is simulated in, see TradingSimulator.create_executor."""
+    if month_workers > 1:
+        return month_workers
+    if optimization_workers > 1 and \
+            (not area_info['LocalMarketEnabled'] or get_if_exists_else(area_info, 'DecomposeLEC', False)):
+        return optimization_workers
+    return 1
+
+
+def estimate_footprint(config: Dict[str, Any], optimization_workers: int, month_workers: int) -> JobFootprint:
+    area_info = config['AreaInfo']
+    n_agents = len([agent for agent in config['Agents'] if agent['Type'] != 'GridAgent'])
+    n_optimized = n_agents
+    n_clusters = get_if_exists_else(area_info, 'AgentClusters', 0)
+    if area_info['LocalMarketEnabled'] and 0 < n_clusters < n_agents:
+        n_optimized = n_clusters
+    model_hours = area_info['TradingHorizon'] / get_time_step(area_info)
+    uses_bites = any(get_if_exists_else(agent, 'FractionUsedForBITES', 0) > 0 for agent in config['Agents'])
+
+    model_memory_mb = MODEL_MEMORY_MB_PER_AGENT_HOUR * n_optimized * model_hours
+    if uses_bites:
+        model_memory_mb = model_memory_mb * BITES_MODEL_MEMORY_FACTOR
+    n_processes = get_number_of_processes(area_info, optimization_workers, month_workers)
+    # Each process holds its own copy of the models it solves
+    return JobFootprint(n_processes, BASE_MEMORY_MB + MEMORY_MB_PER_AGENT * n_agents + model_memory_mb * n_processes)
+
+
+def get_total_memory_mb() -> Optional[float]:
+    """Physical memory of this host, or None if it can't be determined (for example on Windows)."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ResourceBudget:
+    """
+    Keeps track of the CPUs and memory reserved by the jobs a worker is running. A job that doesn't fit in what is left
+    has to wait, unless no job is running: a job larger than the whole budget is then run on its own, rather than never.
+    """
+    cpus: int
+    memory_mb: float
+    used_cpus: int
+    used_memory_mb: float
+    n_jobs: int
+
+    def __init__(self, cpus: int, memory_mb: float):
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.used_cpus = 0
+        self.used_memory_mb = 0.0
+        self.n_jobs = 0
+
+    def fits(self, footprint: JobFootprint) -> bool:
+        if self.n_jobs == 0:
+            return True
+        return self.used_cpus + footprint.cpus <= self.cpus and \
+            self.used_memory_mb + footprint.memory_mb <= self.memory_mb
+
+    def reserve(self, footprint: JobFootprint):
+        if footprint.cpus > self.cpus or footprint.memory_mb > self.memory_mb:
+            logger.warning('{} exceeds the budget of {} CPUs and {:.0f} MB, running it on its own.'.format(
+                footprint, self.cpus, self.memory_mb))
+        self.used_cpus += footprint.cpus
+        self.used_memory_mb += footprint.memory_mb
+        self.n_jobs += 1
+
+    def release(self, footprint: JobFootprint):
+        self.used_cpus -= footprint.cpus
+        self.used_memory_mb -= footprint.memory_mb
+        self.n_jobs -= 1
@@ -0,0 +1,177 @@
+import argparse
+import logging
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import socket
+import threading
+import time
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tradingplatformpoc.app.app_threading import StoppableThread
+from tradingplatformpoc.database import create_db_and_tables
+from tradingplatformpoc.settings import settings
+from tradingplatformpoc.simulation_runner.job_scheduling import JobFootprint, ResourceBudget, estimate_footprint, \
+    get_total_memory_mb
+from tradingplatformpoc.simulation_runner.trading_simulator import TradingSimulator
+from tradingplatformpoc.sql.config.crud import read_config
+from tradingplatformpoc.sql.job.crud import claim_next_job, delete_job, job_exists, release_lease, renew_lease
+
+logger = logging.getLogger(__name__)
+
+"""
+Runs queued jobs without the app. Each worker takes jobs from the job table, holding a lease on each job that it renews
+while the job runs. Jobs are taken with their rows locked, so any number of workers, on any number of hosts, can take
+jobs from the same queue. If a worker stops renewing its lease, for example because it was shut down, the job is taken
+by the next worker looking for a job, and resumed from its last checkpoint.
+A worker runs several jobs at once, each in its own process, as long as they fit within its CPU and memory budget (see
+job_scheduling). Jobs are taken in order of priority, and then in the order they were queued. A job that doesn't fit is
+waited for, rather than overtaken by smaller jobs queued after it. Run as:
+    python -m tradingplatformpoc.simulation_runner.job_worker [--poll-seconds 10] [--exit-when-empty] [--cpus 8]
+        [--memory-mb 16000]
+The app runs queued jobs too, one at a time, unless the RUN_JOBS_IN_APP environment variable is set to False.
+"""
+
+
+def get_worker_id() -> str:
+    """Identifies this process, among all workers (and apps) taking jobs from the same database."""
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+class JobThread(StoppableThread):
+    """
+    Runs a job that has been leased to worker_id, see claim_next_job, renewing the lease in another thread while the
+    job runs. If the lease is lost, because the job was deleted or taken over by another worker, the job is stopped.
+    Once the job has finished, then is called, if specified.
+    """
+
+    def __init__(self, job_id: str, worker_id: str, then: Optional[Callable[[], Any]] = None):
+        super().__init__(name='run_' + job_id)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.then = then
+        self.finished = threading.Event()
+
+    def run(self):
+        heartbeat = threading.Thread(target=self.keep_lease, name='lease_' + self.job_id, daemon=True)
+        heartbeat.start()
+        try:
+            TradingSimulator(self.job_id)()
+        except Exception as e:
+            # TradingSimulator handles errors in the simulation itself, this is for errors in setting it up. Deleting
+            # the job, as for errors in the simulation, since it would otherwise be taken again by the next worker.
+            logger.exception(e)
+            delete_job(self.job_id)
+        finally:
+            self.finished.set()
+            heartbeat.join()
+        if self.then is not None:
+            self.then()
+
+    def keep_lease(self):
+        while not self.finished.wait(settings.JOB_HEARTBEAT_SECONDS):
+            # None if the database couldn't be reached, in which case the job goes on: it can only have been taken over
+            # if the lease has expired
+            if renew_lease(self.job_id, self.worker_id, settings.JOB_LEASE_SECONDS) is False:
+                deleted = not job_exists(self.job_id)
+                logger.warning('Lost lease on job {}, since it was {}. Stopping it.'.format(
+                    self.job_id, 'deleted' if deleted else 'taken over by another worker'))
+                self.stop_it(keep_job_data=not deleted)
+                return
+        release_lease(self.job_id, self.worker_id)
+
+
+def run_job(job_id: str, worker_id: str):
+    """Runs a job in a process of its own, started by run_worker."""
+    configure_logging()
+    job_thread = JobThread(job_id, worker_id)
+    job_thread.start()
+    job_thread.join()
+
+
+class BudgetCheck:
+    """
+    Accepts a job, when passed to claim_next_job, if its estimated footprint fits in budget. The footprint of the last
+    job checked is kept, to reserve it once the job has been taken.
+    """
+    budget: ResourceBudget
+    footprint: Optional[JobFootprint]
+
+    def __init__(self, budget: ResourceBudget):
+        self.budget = budget
+        self.footprint = None
+
+    def __call__(self, config_id: str) -> bool:
+        self.footprint = estimate_footprint(read_config(config_id), settings.OPTIMIZATION_WORKERS,
+                                            settings.MONTH_WORKERS)
+        return self.budget.fits(self.footprint)
+
+
+def run_worker(poll_seconds: float, budget: ResourceBudget, exit_when_empty: bool = False):
+    """
+    Runs jobs while they fit in budget, looking for a new job every poll_seconds, or as soon as a running job finishes.
+    """
+    worker_id = get_worker_id()
+    logger.info('Worker {} looking for jobs, with a budget of {} CPUs and {:.0f} MB'.format(
+        worker_id, budget.cpus, budget.memory_mb))
+    # Using "spawn" also on Linux, since the worker process has running threads
+    context = multiprocessing.get_context('spawn')
+    running: Dict[str, Tuple[BaseProcess, JobFootprint]] = {}
+    while True:
+        for job_id, (process, footprint) in list(running.items()):
+            if not process.is_alive():
+                process.join()
+                budget.release(footprint)
+                del running[job_id]
+
+        budget_check = BudgetCheck(budget)
+        job_id = claim_next_job(worker_id, settings.JOB_LEASE_SECONDS, settings.JOB_MAX_ATTEMPTS, budget_check)
+        if job_id is None:
+            if exit_when_empty and len(running) == 0:
+                logger.info('No jobs in queue, exiting.')
+                return
+            if len(running) == 0:
+                time.sleep(poll_seconds)
+            else:
+                # Waking up as soon as a job finishes, since the next job may be waiting for its resources
+                multiprocessing.connection.wait([process.sentinel for process, _ in running.values()], poll_seconds)
+            continue
+        # claim_next_job only takes a job that the check accepted, so its footprint has been estimated
+        assert budget_check.footprint is not None
+        footprint = budget_check.footprint
+        logger.info('Running job with ID {}, estimated to need {}'.format(job_id, footprint))
+        budget.reserve(footprint)
+        process = context.Process(target=run_job, args=(job_id, worker_id), name='job_' + job_id)
+        process.start()
+        running[job_id] = (process, footprint)
+
+
+def configure_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-15s | %(levelname)-7s | %(name)-35.35s | %(message)s')
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Runs queued simulation jobs.')
+    parser.add_argument('--poll-seconds', type=float, default=10.0,
+                        help='Seconds to wait before looking for jobs again, when there are none.')
+    parser.add_argument('--exit-when-empty', action='store_true',
+                        help='Exit when there are no jobs in the queue, once running jobs have finished.')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count() or 1,
+                        help='Number of CPUs that jobs run at the same time may use. Defaults to all of them.')
+    parser.add_argument('--memory-mb', type=float, default=None,
+                        help='Memory, in MB, that jobs run at the same time may use. Defaults to 80%% of this host\'s.')
+    parsed = parser.parse_args(args)
+    configure_logging()
+
+    memory_mb = parsed.memory_mb
+    if memory_mb is None:
+        total_memory_mb = get_total_memory_mb()
+        memory_mb = math.inf if total_memory_mb is None else 0.8 * total_memory_mb
+    create_db_and_tables()
+    run_worker(parsed.poll_seconds, ResourceBudget(parsed.cpus, memory_mb), parsed.exit_when_empty)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import pyomo.environ as pyo
+
+logger = logging.getLogger(__name__)
+
+"""
+Solved optimization models can be written to a corpus directory, as LP or MPS files, each with a JSON file describing
+it: which model and horizon it is, and the status and objective that the simulation's solver got for it. The corpus
+can then be replayed against other solvers and option sets with the solver_benchmark module, without the simulator,
+the database or the app.
+"""
+
+FILE_FORMATS = ['mps', 'lp']
+
+
+def export_model(model: pyo.ConcreteModel, directory: str, model_name: str, model_type: str,
+                 horizon_start: datetime.datetime, status: str, objective: Optional[float],
+                 solve_seconds: Optional[float], file_format: str = 'mps') -> str:
+    """
+    Writes the model, as it was passed to the solver, to directory. Fixed variables are written as constants, and
+    deactivated constraints are left out. The file name includes a hash of the written model, so that models that are
+    exactly the same (for example from re-running a configuration) are only kept once. Returns the path of the model
+    file.
+    """
+    if file_format not in FILE_FORMATS:
+        raise ValueError('Unknown model file format {}, should be one of {}'.format(file_format, FILE_FORMATS))
+    os.makedirs(directory, exist_ok=True)
+    base_name = get_base_name(model_name, horizon_start)
+    # Writing to a temporary file first, so that other processes never read a half-written file
+    temporary_path = os.path.join(directory, '{}.{}.tmp.{}'.format(base_name, os.getpid(), file_format))
+    model.write(temporary_path, io_options={'symbolic_solver_labels': True})
+    with open(temporary_path, 'rb') as model_file:
+        content_hash = hashlib.sha256(model_file.read()).hexdigest()[:12]
+    name = '{}_{}'.format(base_name, content_hash)
+    path = os.path.join(directory, '{}.{}'.format(name, file_format))
+    os.replace(temporary_path, path)
+    description = {'file': os.path.basename(path),
+                   'model_name': model_name,
+                   'model_type': model_type,
+                   'horizon_start': horizon_start.isoformat(),
+                   'status': status,
+                   'objective': objective,
+                   'solve_seconds': solve_seconds}
+    with open(os.path.join(directory, name + '.json'), 'w') as description_file:
+        json.dump(description, description_file, indent=2)
+    logger.debug('Exported model to {}'.format(path))
+    return path
+
+
+def get_base_name(model_name: str, horizon_start: datetime.datetime) -> str:
+    """A file name for the model, with characters that aren't safe in file names (from agent names) replaced."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', '{}_{:%Y%m%d%H}'.format(model_name, horizon_start))
+
+
+def read_corpus(directory: str) -> List[Dict[str, Any]]:
+    """
+    The descriptions of all models in directory (see export_model), sorted by file name, with the full path of each
+    model file added as "path". Models whose files are missing are left out.
+    """
+    descriptions: List[Dict[str, Any]] = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, file_name)) as f:
+            description = json.load(f)
+        path = os.path.join(directory, description['file'])
+        if not os.path.exists(path):
+            logger.warning('Model file {} is missing, skipping it'.format(path))
+            continue
+        description['path'] = path
+        descriptions.append(description)
+    return descriptions
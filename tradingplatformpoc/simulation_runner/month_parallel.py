@@ -0,0 +1,264 @@
+"""
+Simulating the months of a year in parallel processes.
+
+Trading horizons are only coupled through the BITES storage levels carried from one horizon to the next, and through
+the peak usage recorded in the pricing objects: each horizon is given the month's peaks so far, and early in the month
+(see DAYS_USING_PREVIOUS_MONTH_PEAKS) also the previous month's peaks. The state that a month is simulated from, its
+"boundary", is therefore made up of the storage levels and the peaks at the end of the previous month.
+
+All months are first simulated at once, from empty boundaries. Then, in each reconciliation pass, the months whose
+boundary differs from the end of the previous month, as simulated in the previous pass, are simulated again. A month
+whose predecessor is final, and whose boundary matches it, is final. At least one more month becomes final in each
+pass, so the result is the same as when simulating sequentially, in at most as many passes as there are months.
+When simulating a month again, the state at the start of each horizon is compared with that of the previous
+simulation of the month. Once they match, after the first days of the month, the rest of the month would be simulated
+exactly as before, so the previous results are reused from there.
+"""
+import datetime
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import pandas as pd
+
+from tradingplatformpoc.agent.block_agent import BlockAgent
+from tradingplatformpoc.agent.grid_agent import GridAgent
+from tradingplatformpoc.market.trade import Resource, TradeMetadataKey
+from tradingplatformpoc.price.electricity_price import ElectricityPrice, calculate_top_three_hourly_outtakes_for_month
+from tradingplatformpoc.price.heating_price import HeatingPrice, calculate_peak_day_avg_cons_kw
+from tradingplatformpoc.price.iprice import DAYS_USING_PREVIOUS_MONTH_PEAKS, IPrice
+from tradingplatformpoc.simulation_runner.chalmers_interface import ChalmersOutputs, SolverSettings, optimize
+from tradingplatformpoc.simulation_runner.solution_cache import SolutionCache
+from tradingplatformpoc.trading_platform_utils import get_final_storage_level, get_solver
+
+# Storage levels and peaks closer than this are considered equal
+STATE_TOLERANCE = 0.000001
+
+# The state that a horizon or month is simulated from: (name, value) pairs, see get_state
+State = List[Tuple[str, float]]
+
+logger = logging.getLogger(__name__)
+
+
+class MonthTask:
+    """Everything needed to simulate one month in a worker process."""
+    horizon_starts: List[datetime.datetime]
+    # Pricing objects, with no history other than that of the previous month
+    elec_pricing: ElectricityPrice
+    heat_pricing: HeatingPrice
+    shallow_storage_start: Dict[str, float]
+    deep_storage_start: Dict[str, float]
+    # The state at the start of each horizon, when the month was last simulated (None for the first simulation)
+    previous_states: Optional[List[Optional[State]]]
+
+    def __init__(self, horizon_starts: List[datetime.datetime], elec_pricing: ElectricityPrice,
+                 heat_pricing: HeatingPrice, shallow_storage_start: Dict[str, float],
+                 deep_storage_start: Dict[str, float], previous_states: Optional[List[Optional[State]]] = None):
+        self.horizon_starts = horizon_starts
+        self.elec_pricing = elec_pricing
+        self.heat_pricing = heat_pricing
+        self.shallow_storage_start = shallow_storage_start
+        self.deep_storage_start = deep_storage_start
+        self.previous_states = previous_states
+
+
+class MonthResult:
+    horizon_starts: List[datetime.datetime]
+    # The month's outputs, one per horizon. Emptied once the month has been saved.
+    outputs: List[ChalmersOutputs]
+    # The state at the start of each horizon, see get_horizon_state
+    states: List[Optional[State]]
+    shallow_storage_end: Dict[str, float]
+    deep_storage_end: Dict[str, float]
+    # Pricing objects, with the history recorded for this month's periods only
+    elec_pricing: ElectricityPrice
+    heat_pricing: HeatingPrice
+    # The state the month was simulated from, see get_boundary_state
+    boundary: State
+    # If the month was simulated again, the index of the horizon from which the previous results were reused
+    reused_from: Optional[int]
+
+    def __init__(self, horizon_starts: List[datetime.datetime], outputs: List[ChalmersOutputs],
+                 states: List[Optional[State]], shallow_storage_end: Dict[str, float],
+                 deep_storage_end: Dict[str, float], elec_pricing: ElectricityPrice, heat_pricing: HeatingPrice,
+                 boundary: State, reused_from: Optional[int] = None):
+        self.horizon_starts = horizon_starts
+        self.outputs = outputs
+        self.states = states
+        self.shallow_storage_end = shallow_storage_end
+        self.deep_storage_end = deep_storage_end
+        self.elec_pricing = elec_pricing
+        self.heat_pricing = heat_pricing
+        self.boundary = boundary
+        self.reused_from = reused_from
+
+
+def split_into_months(horizon_starts: List[datetime.datetime]) -> List[List[datetime.datetime]]:
+    """Groups consecutive horizons by the month in which they start."""
+    months: List[List[datetime.datetime]] = []
+    for horizon_start in horizon_starts:
+        if len(months) > 0 and (months[-1][0].year, months[-1][0].month) == (horizon_start.year, horizon_start.month):
+            months[-1].append(horizon_start)
+        else:
+            months.append([horizon_start])
+    return months
+
+
+def create_month_task(horizon_starts: List[datetime.datetime], elec_pricing: ElectricityPrice,
+                      heat_pricing: HeatingPrice, previous_month: Optional[MonthResult],
+                      previous_simulation: Optional[MonthResult] = None) -> Tuple[MonthTask, State]:
+    """
+    A task simulating the month from the end of previous_month, or from empty storages and history if it is None, and
+    the boundary state it is simulated from. If the month has been simulated before, previous_simulation should be
+    specified, so that its results can be reused once the states match.
+    """
+    month_elec_pricing = elec_pricing.copy_without_history()
+    month_heat_pricing = heat_pricing.copy_without_history()
+    shallow_storage_start: Dict[str, float] = {}
+    deep_storage_start: Dict[str, float] = {}
+    if previous_month is not None:
+        month_elec_pricing.add_history_from(previous_month.elec_pricing)
+        month_heat_pricing.add_history_from(previous_month.heat_pricing)
+        shallow_storage_start = dict(previous_month.shallow_storage_end)
+        deep_storage_start = dict(previous_month.deep_storage_end)
+    boundary = get_boundary_state(horizon_starts[0], shallow_storage_start, deep_storage_start, month_elec_pricing,
+                                  month_heat_pricing)
+    task = MonthTask(horizon_starts, month_elec_pricing, month_heat_pricing, shallow_storage_start, deep_storage_start,
+                     previous_simulation.states if previous_simulation is not None else None)
+    return task, boundary
+
+
+def simulate_month(task: MonthTask, boundary: State, solver_name: str, solver_settings: SolverSettings,
+                   block_agents: List[BlockAgent], grid_agents: Dict[Resource, GridAgent], area_info: Dict[str, Any],
+                   solution_cache: Optional[SolutionCache] = None) -> MonthResult:
+    """
+    Simulates the horizons of one month, one after the other, as TradingSimulator.run does. Meant to be run in a worker
+    process. If the task has the states of a previous simulation of the month, and the state at the start of a horizon
+    matches it, the simulation stops there, see merge_month_results.
+    """
+    solver = get_solver(solver_name, solver_settings.mip_gap, solver_settings.time_limit)
+    lec_models: Dict[tuple, Any] = {}
+    agent_models: Dict[str, Any] = {}
+    trading_horizon = area_info['TradingHorizon']
+    shallow_storage_end = task.shallow_storage_start
+    deep_storage_end = task.deep_storage_start
+    outputs: List[ChalmersOutputs] = []
+    states: List[Optional[State]] = []
+    reused_from: Optional[int] = None
+    for i_horizon, horizon_start in enumerate(task.horizon_starts):
+        state = get_horizon_state(horizon_start, shallow_storage_end, deep_storage_end, task.elec_pricing,
+                                  task.heat_pricing)
+        if state is not None and task.previous_states is not None \
+                and states_match(state, task.previous_states[i_horizon]):
+            reused_from = i_horizon
+            break
+        states.append(state)
+        logger.info("Simulating {:%Y-%m-%d}".format(horizon_start))
+        chalmers_outputs = optimize(solver, block_agents, grid_agents, area_info, horizon_start,
+                                    task.elec_pricing, task.heat_pricing, shallow_storage_end, deep_storage_end,
+                                    lec_models, agent_models, None, solution_cache)
+        outputs.append(chalmers_outputs)
+        shallow_storage_end = get_final_storage_level(
+            trading_horizon, chalmers_outputs.metadata_per_agent_and_period[TradeMetadataKey.SHALLOW_STORAGE_ABS],
+            horizon_start)
+        deep_storage_end = get_final_storage_level(
+            trading_horizon, chalmers_outputs.metadata_per_agent_and_period[TradeMetadataKey.DEEP_STORAGE_ABS],
+            horizon_start)
+    end = task.horizon_starts[reused_from] if reused_from is not None else None
+    return MonthResult(task.horizon_starts, outputs, states, shallow_storage_end, deep_storage_end,
+                       task.elec_pricing.copy_with_history_between(task.horizon_starts[0], end),
+                       task.heat_pricing.copy_with_history_between(task.horizon_starts[0], end),
+                       boundary, reused_from)
+
+
+def merge_month_results(new: MonthResult, previous: MonthResult) -> MonthResult:
+    """
+    If the new simulation of a month stopped at a horizon, from which on the previous simulation would be repeated
+    exactly, the results of the previous simulation are used from that horizon.
+    """
+    if new.reused_from is None:
+        return new
+    reuse_start = new.horizon_starts[new.reused_from]
+    new.outputs = new.outputs + previous.outputs[new.reused_from:]
+    new.states = new.states + previous.states[new.reused_from:]
+    new.shallow_storage_end = previous.shallow_storage_end
+    new.deep_storage_end = previous.deep_storage_end
+    new.elec_pricing.add_history_from(previous.elec_pricing.copy_with_history_between(reuse_start))
+    new.heat_pricing.add_history_from(previous.heat_pricing.copy_with_history_between(reuse_start))
+    return new
+
+
+def get_boundary_state(month_start: datetime.datetime, shallow_storage_start: Dict[str, float],
+                       deep_storage_start: Dict[str, float], elec_pricing: ElectricityPrice,
+                       heat_pricing: HeatingPrice) -> State:
+    """
+    The state that a month is simulated from: the storage levels, and the previous month's peaks. Also the month's own
+    peaks so far, which there may be if a horizon of the previous month reached into this one.
+    """
+    previous_month = month_start - datetime.timedelta(days=DAYS_USING_PREVIOUS_MONTH_PEAKS + 1)
+    return get_storage_state(shallow_storage_start, deep_storage_start) \
+        + get_peak_state(month_start, elec_pricing, heat_pricing) \
+        + [('previous ' + name, value) for name, value in
+           get_peak_state(previous_month, elec_pricing, heat_pricing, whole_month=True)]
+
+
+def get_horizon_state(horizon_start: datetime.datetime, shallow_storage_start: Dict[str, float],
+                      deep_storage_start: Dict[str, float], elec_pricing: ElectricityPrice,
+                      heat_pricing: HeatingPrice) -> Optional[State]:
+    """
+    The state at the start of a horizon, that the rest of the month's simulation depends on: the storage levels, and
+    the month's peaks so far. None early in the month, when the previous month's peaks are also used.
+    """
+    if horizon_start.day < DAYS_USING_PREVIOUS_MONTH_PEAKS:
+        return None
+    return get_storage_state(shallow_storage_start, deep_storage_start) \
+        + get_peak_state(horizon_start, elec_pricing, heat_pricing)
+
+
+def get_storage_state(shallow_storage: Dict[str, float], deep_storage: Dict[str, float]) -> State:
+    return [('shallow storage ' + agent, level) for agent, level in sorted(shallow_storage.items())] \
+        + [('deep storage ' + agent, level) for agent, level in sorted(deep_storage.items())]
+
+
+def get_peak_state(period: datetime.datetime, elec_pricing: ElectricityPrice, heat_pricing: HeatingPrice,
+                   whole_month: bool = False) -> State:
+    """
+    The electricity and heating peaks of period's month, before period (or for the whole month), for the LEC and for
+    each agent, as used by ElectricityPrice.get_top_three_hourly_outtakes_for_month and
+    HeatingPrice.get_avg_peak_for_month. Days' heating use is summed up, so the heating use of period's day so far is
+    included separately from the peak of previous days.
+    """
+    state: State = []
+    for name, sells in get_sells_by_name(elec_pricing):
+        top_3 = calculate_top_three_hourly_outtakes_for_month(sells, period.year, period.month)
+        top_3 += [0.0] * (3 - len(top_3))
+        state.extend([('electricity peak {} {}'.format(name, i), value) for i, value in enumerate(top_3)])
+    for name, sells in get_sells_by_name(heat_pricing):
+        if whole_month:
+            state.append(('heating peak ' + name, nan_to_zero(calculate_peak_day_avg_cons_kw(sells, period.year,
+                                                                                             period.month))))
+        else:
+            in_month = sells[(sells.index.year == period.year) & (sells.index.month == period.month)]
+            earlier_days = in_month[in_month.index.day < period.day]
+            state.append(('heating peak ' + name, nan_to_zero(calculate_peak_day_avg_cons_kw(earlier_days,
+                                                                                             period.year,
+                                                                                             period.month))))
+            state.append(('heating so far today ' + name, float(in_month[in_month.index.day == period.day].sum())))
+    return state
+
+
+def get_sells_by_name(pricing: IPrice) -> List[Tuple[str, pd.Series]]:
+    return [('LEC', pricing.all_external_sells)] + sorted(pricing.external_sells_by_agent.items())
+
+
+def nan_to_zero(value: float) -> float:
+    return 0.0 if np.isnan(value) else float(value)
+
+
+def states_match(state: Optional[State], other: Optional[State]) -> bool:
+    if state is None or other is None or len(state) != len(other):
+        return False
+    names_match = all(name == other_name for (name, _), (other_name, _) in zip(state, other))
+    return names_match and bool(np.allclose([value for _, value in state], [value for _, value in other],
+                                            rtol=0, atol=STATE_TOLERANCE))
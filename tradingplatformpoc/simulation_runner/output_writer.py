@@ -0,0 +1,70 @@
+import logging
+import queue
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+"""
+Saving a batch of trading horizons means converting its trades and levels to database rows and inserting them, which
+on a remote database takes a good part of the simulation's wall time. OutputWriter does this in a background thread,
+so that the next batch is optimized in the meantime. The queue of batches waiting to be written is bounded, so that
+outputs don't pile up in memory when the database is slower than the solver: the simulation then waits for the writer.
+"""
+
+
+class OutputWriter:
+    """
+    Calls write_function with the arguments passed to submit, one call at a time and in the order submitted, in a
+    background thread. With max_queued 0, write_function is instead called directly by submit.
+    """
+    error: Optional[Exception]
+
+    def __init__(self, write_function: Callable[..., None], max_queued: int, name: str = 'output_writer'):
+        self.write_function: Callable[..., None] = write_function
+        self.error = None
+        self.queue: Optional[queue.Queue] = None
+        self.thread: Optional[threading.Thread] = None
+        if max_queued > 0:
+            self.queue = queue.Queue(maxsize=max_queued)
+            self.thread = threading.Thread(target=self.work, name=name, daemon=True)
+            self.thread.start()
+
+    def submit(self, *args):
+        """Queues a call to write_function, waiting while max_queued calls are already queued."""
+        self.raise_if_failed()
+        if self.queue is None:
+            self.write_function(*args)
+        else:
+            self.queue.put(args)
+
+    def flush(self):
+        """Waits until everything submitted has been written, raising the error if writing any of it failed."""
+        if self.queue is not None:
+            self.queue.join()
+        self.raise_if_failed()
+
+    def close(self):
+        """Writes what has been submitted, and stops the thread. Doesn't raise errors from writing, unlike flush."""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def raise_if_failed(self):
+        if self.error is not None:
+            raise self.error
+
+    def work(self):
+        while True:
+            args = self.queue.get()
+            try:
+                if args is None:
+                    return
+                # After an error, what is still queued is discarded: the simulation stops at the next submit or flush
+                if self.error is None:
+                    self.write_function(*args)
+            except Exception as e:
+                logger.exception(e)
+                self.error = e
+            finally:
+                self.queue.task_done()
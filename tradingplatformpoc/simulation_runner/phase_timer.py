@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+"""
+Keeps track of where a job spends its time, to tell whether a slow job is held up by the solver, by the database, or by
+the calculations before and after the optimization. The time of each phase is summed over all times it is entered, and
+saved with the job.
+"""
+
+LOAD_DATA = 'Load data'
+SET_UP_AGENTS = 'Set up agents'
+BUILD_SUPPLY_AND_DEMAND = 'Build supply and demand'
+BUILD_MODELS = 'Build models'
+SOLVE = 'Solve'
+EXTRACT_OUTPUTS = 'Extract outputs'
+WRITE_OUTPUTS = 'Write outputs'
+EXTRACT_RESOURCE_PRICES = 'Extract resource prices'
+CORRECT_FOR_EXACT_PRICE = 'Correct for exact price'
+CALCULATE_RESULTS = 'Calculate and save results'
+
+PHASES = [LOAD_DATA, SET_UP_AGENTS, BUILD_SUPPLY_AND_DEMAND, BUILD_MODELS, SOLVE, EXTRACT_OUTPUTS, WRITE_OUTPUTS,
+          EXTRACT_RESOURCE_PRICES, CORRECT_FOR_EXACT_PRICE, CALCULATE_RESULTS]
+
+
+class PhaseTimer:
+    """
+    Sums up the wall-clock time spent in each phase, and the number of times it was entered. Phases may be timed from
+    several threads, such as the thread writing outputs to the database.
+    """
+    seconds: Dict[str, float]
+    counts: Dict[str, int]
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def time(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def add(self, phase: str, seconds: float, count: int = 1):
+        with self.lock:
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+            self.counts[phase] = self.counts.get(phase, 0) + count
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """The phases timed so far, in the order of PHASES, as saved with the job."""
+        with self.lock:
+            return {phase: {'seconds': round(self.seconds[phase], 3), 'count': self.counts[phase]}
+                    for phase in PHASES if phase in self.seconds}
+
+    def log_summary(self):
+        for phase, timing in self.to_dict().items():
+            logger.info('{}: {:.1f} seconds, in {} steps'.format(phase, timing['seconds'], timing['count']))
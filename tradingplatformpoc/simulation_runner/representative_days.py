@@ -0,0 +1,82 @@
+import datetime
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+import pandas as pd
+
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from tradingplatformpoc.agent.block_agent import BlockAgent
+from tradingplatformpoc.market.trade import Resource
+
+logger = logging.getLogger(__name__)
+
+"""
+A fast approximation of a full-year simulation: the days (trading horizons) of each month are clustered on their
+consumption, production, temperature and price, and only one representative day per cluster is simulated. Annual
+results are then reconstructed by weighting each simulated period with the number of days its cluster represents.
+Clustering within each month keeps the months' effect fee peaks and the summer/winter modes of the optimization apart.
+"""
+
+
+def get_horizon_features(block_agents: List[BlockAgent], horizon_starts: List[datetime.datetime],
+                         trading_horizon: int, temperature: pd.Series, nordpool_prices: pd.Series) -> pd.DataFrame:
+    """
+    Features of each trading horizon, summed over all agents, with one row per horizon start: electricity, heating and
+    cooling demand, electricity demand peak, PV production, mean outdoor temperature, and the mean and spread of the
+    Nordpool price. temperature and nordpool_prices should be indexed by period.
+    """
+    periods = [start + datetime.timedelta(hours=hour) for start in horizon_starts for hour in range(trading_horizon)]
+    shape = (len(horizon_starts), trading_horizon)
+
+    def total_demand_and_supply(resource: Resource):
+        usage = np.array([agent.get_actual_usage_for_periods(periods, resource) for agent in block_agents],
+                         dtype=float).reshape((len(block_agents),) + shape)
+        return np.clip(usage, 0, None).sum(axis=0), np.clip(-usage, 0, None).sum(axis=0)
+
+    elec_demand, pv_production = total_demand_and_supply(Resource.ELECTRICITY)
+    high_heat_demand, _ = total_demand_and_supply(Resource.HIGH_TEMP_HEAT)
+    low_heat_demand, _ = total_demand_and_supply(Resource.LOW_TEMP_HEAT)
+    cooling_demand, _ = total_demand_and_supply(Resource.COOLING)
+    temperatures = temperature.reindex(periods).to_numpy(dtype=float).reshape(shape)
+    prices = nordpool_prices.reindex(periods).to_numpy(dtype=float).reshape(shape)
+    return pd.DataFrame({'elec_demand': elec_demand.sum(axis=1),
+                         'elec_peak': elec_demand.max(axis=1),
+                         'heat_demand': (high_heat_demand + low_heat_demand).sum(axis=1),
+                         'cooling_demand': cooling_demand.sum(axis=1),
+                         'pv_production': pv_production.sum(axis=1),
+                         'temperature': np.nanmean(temperatures, axis=1),
+                         'price': np.nanmean(prices, axis=1),
+                         'price_spread': np.nanmax(prices, axis=1) - np.nanmin(prices, axis=1)},
+                        index=pd.Index(horizon_starts))
+
+
+def select_representative_horizons(features: pd.DataFrame, per_month: int) -> Dict[datetime.datetime, int]:
+    """
+    Clusters the horizons of each month into (at most) per_month clusters, using Ward's hierarchical clustering on the
+    standardized features. Each cluster is represented by its medoid: the horizon closest to the cluster's mean.
+    Returns the representative horizons' starts, in order, each with the number of horizons that it represents.
+    """
+    std = features.std(ddof=0).replace(0.0, 1.0)
+    standardized = ((features - features.mean()) / std).fillna(0.0)
+    representatives: Dict[datetime.datetime, int] = {}
+    for _, month_features in standardized.groupby([standardized.index.year, standardized.index.month]):
+        values = month_features.to_numpy()
+        if len(values) <= per_month:
+            labels = np.arange(len(values))
+        else:
+            labels = fcluster(linkage(values, method='ward'), t=per_month, criterion='maxclust')
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            distances = np.linalg.norm(values[members] - values[members].mean(axis=0), axis=1)
+            representatives[month_features.index[members[np.argmin(distances)]]] = len(members)
+    logger.info('Selected {} representative days for {} days'.format(len(representatives), len(features)))
+    return dict(sorted(representatives.items()))
+
+
+def get_period_weights(representatives: Dict[datetime.datetime, int], trading_horizon: int) -> pd.Series:
+    """The weight of each period of the representative horizons, indexed by period."""
+    return pd.Series({start + datetime.timedelta(hours=hour): float(weight)
+                      for start, weight in representatives.items() for hour in range(trading_horizon)})
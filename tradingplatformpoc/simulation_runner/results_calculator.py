@@ -1,6 +1,6 @@
 import datetime
 import logging
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 import pandas as pd
 
@@ -10,11 +10,12 @@ from tradingplatformpoc.agent.iagent import IAgent
 from tradingplatformpoc.market.trade import Action, Resource, TradeMetadataKey
 from tradingplatformpoc.sql.extra_cost.crud import db_to_extra_cost_df
 from tradingplatformpoc.sql.input_data.crud import read_input_column_df_from_db
-from tradingplatformpoc.sql.level.crud import sum_levels
+from tradingplatformpoc.sql.level.crud import sum_levels, sum_levels_per_period
 from tradingplatformpoc.sql.results.crud import save_results
 from tradingplatformpoc.sql.results.models import PreCalculatedResults, ResultsKey
-from tradingplatformpoc.sql.trade.crud import get_external_trades_df, get_total_grid_fee_paid, \
-    get_total_tax_paid
+from tradingplatformpoc.sql.solve_info.crud import count_time_limit_fallbacks
+from tradingplatformpoc.sql.trade.crud import get_external_trades_df, get_tax_and_grid_fee_paid_per_period, \
+    get_total_grid_fee_paid, get_total_tax_paid
 
 logger = logging.getLogger(__name__)
 
@@ -35,20 +36,25 @@ class AggregatedTrades:
     sum_export_below_1_c: float
 
     def __init__(self, external_trades_df: pd.DataFrame, periods_above_1_c: List[datetime.datetime],
-                 value_column_name: str = 'quantity_pre_loss'):
+                 value_column_name: str = 'quantity_pre_loss', weight_column_name: Optional[str] = None):
         """
         Expected columns in external_trades_df:
         ['period', 'action', 'price', value_column_name]
 
         Sold by the external = bought by the LEC
         So a positive "net" means the LEC imported
+
+        If weight_column_name is specified, sums are weighted by that column (when only representative days were
+        simulated), while maximums are not.
         """
+        weights = external_trades_df[weight_column_name] if weight_column_name is not None else 1.0
+        external_trades_df['weighted_quantity'] = external_trades_df[value_column_name] * weights
         external_sell_trades = external_trades_df[external_trades_df['action'] == Action.SELL]
         external_buy_trades = external_trades_df[external_trades_df['action'] == Action.BUY]
 
-        monthly_sum_import_series = external_sell_trades[value_column_name]. \
+        monthly_sum_import_series = external_sell_trades['weighted_quantity']. \
             groupby(external_sell_trades['period'].dt.month).sum()
-        monthly_sum_export_series = external_buy_trades[value_column_name]. \
+        monthly_sum_export_series = external_buy_trades['weighted_quantity']. \
             groupby(external_buy_trades['period'].dt.month).sum()
 
         self.monthly_sum_import = monthly_sum_import_series.to_dict()
@@ -62,19 +68,21 @@ class AggregatedTrades:
         self.sum_export_jan_feb = monthly_sum_export_series.get(1, 0) + monthly_sum_export_series.get(2, 0)
 
         self.sum_import_below_1_c = external_sell_trades. \
-            loc[external_sell_trades['period'].isin(periods_above_1_c), value_column_name].sum()
+            loc[external_sell_trades['period'].isin(periods_above_1_c), 'weighted_quantity'].sum()
         self.sum_export_below_1_c = external_buy_trades. \
-            loc[external_buy_trades['period'].isin(periods_above_1_c), value_column_name].sum()
+            loc[external_buy_trades['period'].isin(periods_above_1_c), 'weighted_quantity'].sum()
         external_trades_df['net_imported'] = external_trades_df.apply(lambda x: x[value_column_name]
                                                                       if x.action == Action.SELL
                                                                       else -x[value_column_name],
                                                                       axis=1)
-        self.net_energy_spend = (external_trades_df['net_imported'] * external_trades_df['price']).sum()
-        net_import_summed = external_trades_df[['period', 'net_imported']].groupby('period', as_index=False).sum()
-        grouped_by_month = net_import_summed['net_imported'].groupby(net_import_summed['period'].dt.month)
+        external_trades_df['weighted_net_imported'] = external_trades_df['net_imported'] * weights
+        self.net_energy_spend = (external_trades_df['weighted_net_imported'] * external_trades_df['price']).sum()
+        net_import_summed = external_trades_df[['period', 'net_imported', 'weighted_net_imported']]. \
+            groupby('period', as_index=False).sum()
+        months = net_import_summed['period'].dt.month
         # These are converted to dicts, to make them JSON-serializable
-        self.monthly_sum_net_import = grouped_by_month.sum().to_dict()
-        self.monthly_max_net_import = grouped_by_month.max().to_dict()
+        self.monthly_sum_net_import = net_import_summed['weighted_net_imported'].groupby(months).sum().to_dict()
+        self.monthly_max_net_import = net_import_summed['net_imported'].groupby(months).max().to_dict()
 
         self.daily_max_net_import = (external_trades_df['net_imported'].
                                      groupby(external_trades_df['period'].dt.date).
@@ -82,25 +90,33 @@ class AggregatedTrades:
                                      max()) if len(external_trades_df) else 0
 
 
-def calculate_results_and_save(job_id: str, agents: List[IAgent], grid_agents: Dict[Resource, GridAgent]):
+def calculate_results_and_save(job_id: str, agents: List[IAgent], grid_agents: Dict[Resource, GridAgent],
+                               period_weights: Optional[pd.Series] = None):
     """
     Pre-calculates some results, so that they can be easily fetched later.
+    If only representative days were simulated, period_weights holds the number of days that each simulated period
+    represents (see representative_days), and annual sums are reconstructed by weighting each period with it. Peaks are
+    taken from the simulated periods only.
     """
     logger.info('Calculating some results')
     result_dict: Dict[str, Any] = {}
     external_trades = get_external_trades_df([job_id])
 
     external_trades = sum_external_trades(external_trades)
+    weight_column_name: Optional[str] = None
+    if period_weights is not None:
+        weight_column_name = 'weight'
+        external_trades[weight_column_name] = external_trades['period'].map(period_weights).fillna(1.0)
 
-    extra_costs_sum = get_extra_costs_sum(grid_agents, job_id)
+    extra_costs_sum = get_extra_costs_sum(grid_agents, job_id, period_weights)
 
     temperature_df = read_input_column_df_from_db('temperature')
     periods_below_1_c = list(temperature_df[temperature_df['temperature'].values < 1.0].period)
 
     elec_trades = external_trades[(external_trades.resource == Resource.ELECTRICITY)].copy()
     heat_trades = external_trades[(external_trades.resource == Resource.HIGH_TEMP_HEAT)].copy()
-    agg_elec_trades = AggregatedTrades(elec_trades, periods_below_1_c)
-    agg_heat_trades = AggregatedTrades(heat_trades, periods_below_1_c)
+    agg_elec_trades = AggregatedTrades(elec_trades, periods_below_1_c, weight_column_name=weight_column_name)
+    agg_heat_trades = AggregatedTrades(heat_trades, periods_below_1_c, weight_column_name=weight_column_name)
     result_dict[ResultsKey.NET_ENERGY_SPEND] = (agg_elec_trades.net_energy_spend
                                                 + extra_costs_sum
                                                 + agg_heat_trades.net_energy_spend)
@@ -138,14 +154,28 @@ def calculate_results_and_save(job_id: str, agents: List[IAgent], grid_agents: D
     result_dict[ResultsKey.SUM_EXPORT_BELOW_1_C] = {Resource.ELECTRICITY.name: agg_elec_trades.sum_export_below_1_c,
                                                     Resource.HIGH_TEMP_HEAT.name: agg_heat_trades.sum_export_below_1_c}
     # Aggregated local production
-    local_prod_dict = aggregated_local_productions(agents, job_id)
+    local_prod_dict = aggregated_local_productions(agents, job_id, period_weights)
     result_dict[ResultsKey.LOCALLY_PRODUCED_RESOURCES] = local_prod_dict
     # Taxes and grid fees
-    result_dict[ResultsKey.TAX_PAID] = get_total_tax_paid(job_id=job_id)
-    result_dict[ResultsKey.GRID_FEES_PAID] = get_total_grid_fee_paid(job_id=job_id)
+    if period_weights is None:
+        result_dict[ResultsKey.TAX_PAID] = get_total_tax_paid(job_id=job_id)
+        result_dict[ResultsKey.GRID_FEES_PAID] = get_total_grid_fee_paid(job_id=job_id)
+    else:
+        paid_per_period = get_tax_and_grid_fee_paid_per_period(job_id)
+        result_dict[ResultsKey.TAX_PAID] = weighted_sum(paid_per_period['tax_paid'], period_weights)
+        result_dict[ResultsKey.GRID_FEES_PAID] = weighted_sum(paid_per_period['grid_fee_paid'], period_weights)
+        result_dict[ResultsKey.REPRESENTATIVE_DAYS] = len(set(period.date() for period in period_weights.index))
     # Resources dumped into reservoir
-    result_dict[ResultsKey.HEAT_DUMPED] = sum_levels(job_id, TradeMetadataKey.HEAT_DUMP.name)
-    result_dict[ResultsKey.COOL_DUMPED] = sum_levels(job_id, TradeMetadataKey.COOL_DUMP.name)
+    result_dict[ResultsKey.HEAT_DUMPED] = sum_levels_weighted(job_id, TradeMetadataKey.HEAT_DUMP.name, period_weights)
+    result_dict[ResultsKey.COOL_DUMPED] = sum_levels_weighted(job_id, TradeMetadataKey.COOL_DUMP.name, period_weights)
+    # Number of optimization problems that reached the solver time limit, per fallback used
+    result_dict[ResultsKey.TIME_LIMIT_FALLBACKS] = count_time_limit_fallbacks(job_id)
+    # Only non-zero if optimizing with time steps longer than one hour
+    result_dict[ResultsKey.TIME_AGGREGATION_ERROR] = sum_levels_weighted(
+        job_id, TradeMetadataKey.TIME_AGGREGATION_ERROR.name, period_weights)
+    # Only non-zero if agents are merged into aggregate agents
+    result_dict[ResultsKey.AGENT_CLUSTERING_ERROR] = sum_levels_weighted(
+        job_id, TradeMetadataKey.AGENT_CLUSTERING_ERROR.name, period_weights)
 
     save_results(PreCalculatedResults(job_id=job_id, result_dict=result_dict))
 
@@ -169,23 +199,39 @@ def max_dict_value(some_dict: Dict[Any, Union[int, float]]) -> Union[int, float]
     return max(some_dict.values()) if some_dict else 0
 
 
-def get_extra_costs_sum(grid_agents: Dict[Resource, GridAgent], job_id: str) -> float:
+def weighted_sum(values_per_period: pd.Series, period_weights: pd.Series) -> float:
+    """Sum of values indexed by period, each weighted by its period's weight. Periods without a weight count once."""
+    return float((values_per_period * period_weights.reindex(values_per_period.index).fillna(1.0)).sum())
+
+
+def sum_levels_weighted(job_id: str, level_type: str, period_weights: Optional[pd.Series]) -> float:
+    """Same as sum_levels, with each period weighted by period_weights, if specified."""
+    if period_weights is None:
+        return sum_levels(job_id, level_type)
+    return weighted_sum(sum_levels_per_period(job_id, level_type), period_weights)
+
+
+def get_extra_costs_sum(grid_agents: Dict[Resource, GridAgent], job_id: str,
+                        period_weights: Optional[pd.Series] = None) -> float:
     extra_costs = db_to_extra_cost_df(job_id)
     if len(extra_costs) > 0:
         extra_costs = extra_costs[~extra_costs['agent'].isin([x.guid for x in grid_agents.values()])]
+        if period_weights is not None:
+            return weighted_sum(extra_costs.groupby('period')['cost'].sum(), period_weights)
         extra_costs_sum = extra_costs['cost'].sum()
         return extra_costs_sum
     return 0.0
 
 
-def aggregated_local_productions(agents: List[IAgent], job_id: str) -> Dict[str, float]:
+def aggregated_local_productions(agents: List[IAgent], job_id: str,
+                                 period_weights: Optional[pd.Series] = None) -> Dict[str, float]:
     """
     Computing total amount of locally produced resources.
     @return Summed local production by resource name
     """
-    hp_high_heat_prod = sum_levels(job_id, TradeMetadataKey.HP_HIGH_HEAT_PROD.name)
-    hp_low_heat_prod = sum_levels(job_id, TradeMetadataKey.HP_LOW_HEAT_PROD.name)
-    cm_low_heat_prod = sum_levels(job_id, TradeMetadataKey.CM_HEAT_PROD.name)
+    hp_high_heat_prod = sum_levels_weighted(job_id, TradeMetadataKey.HP_HIGH_HEAT_PROD.name, period_weights)
+    hp_low_heat_prod = sum_levels_weighted(job_id, TradeMetadataKey.HP_LOW_HEAT_PROD.name, period_weights)
+    cm_low_heat_prod = sum_levels_weighted(job_id, TradeMetadataKey.CM_HEAT_PROD.name, period_weights)
 
     production_electricity_lst = []
     production_low_temp_heat_lst = []
@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+import pickle
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+import pyomo.environ as pyo
+from pyomo.opt import SolverResults, SolverStatus, TerminationCondition
+
+# Should be increased whenever the optimization models change in a way that changes their solutions, so that solutions
+# cached by an earlier version aren't used
+CACHE_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+# Variable values of a solved model: (variable name, (index, value))
+Solution = Dict[str, Dict[Any, Optional[float]]]
+
+
+class SolutionCache:
+    """
+    Stores the variable values of solved optimization models on disk, one file per set of inputs. If a model with
+    exactly the same inputs is to be solved again - in a later job with an identical configuration, or for an agent
+    with the same data as another agent - the stored values can be used instead of calling the solver.
+    """
+    directory: str
+    hits: int
+    misses: int
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Solution]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as f:
+                solution = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            logger.warning('Could not read cached solution {}, will solve instead.'.format(path))
+            self.misses += 1
+            return None
+        self.hits += 1
+        return solution
+
+    def put(self, key: str, model: pyo.ConcreteModel):
+        path = self._path(key)
+        # Writing to a temporary file first, so that other processes never read a half-written file
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(get_solution(model), f)
+        os.replace(temporary_path, path)
+
+    def log_summary(self):
+        logger.info('Solution cache: {} hits, {} misses'.format(self.hits, self.misses))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.pickle')
+
+
+def get_cache_key(model_type: str, solver_name: str, mip_gap: float, inputs: Dict[str, Any]) -> str:
+    """
+    A stable hash of all inputs to a model, and of the solver settings that its solution depends on: solvers may find
+    different solutions of equal cost, and with a MIP gap, they stop at solutions that are not optimal. Numeric inputs
+    (scalars, lists and arrays) are hashed by their values as 64-bit floats, so that for example 1 and 1.0, or a list
+    and an array with the same values, give the same key.
+    """
+    hasher = hashlib.sha256()
+    hasher.update('{}:{}:{}:{!r}'.format(model_type, CACHE_VERSION, solver_name, float(mip_gap)).encode())
+    for name in sorted(inputs.keys()):
+        value = inputs[name]
+        hasher.update(name.encode())
+        if isinstance(value, str):
+            hasher.update(value.encode())
+        else:
+            array = np.asarray(value, dtype=float)
+            hasher.update(str(array.shape).encode())
+            hasher.update(np.ascontiguousarray(array).tobytes())
+    return hasher.hexdigest()
+
+
+def get_solution(model: pyo.ConcreteModel) -> Solution:
+    return {var.name: {index: var_data.value for index, var_data in var.items()}
+            for var in model.component_objects(pyo.Var)}
+
+
+def load_solution(model: pyo.ConcreteModel, solution: Solution):
+    """Sets the values of the model's variables to those in the solution, as if the model had been solved."""
+    for var in model.component_objects(pyo.Var):
+        values = solution[var.name]
+        for index, var_data in var.items():
+            var_data.set_value(values[index], skip_validation=True)
+
+
+def get_optimal_results() -> SolverResults:
+    """Solver results saying that the model was solved to optimality, for models loaded with a cached solution."""
+    results = SolverResults()
+    results.solver.status = SolverStatus.ok
+    results.solver.termination_condition = TerminationCondition.optimal
+    return results
@@ -0,0 +1,268 @@
+import argparse
+import csv
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from tradingplatformpoc.simulation_runner.model_export import read_corpus
+
+logger = logging.getLogger(__name__)
+
+"""
+Replays a corpus of exported optimization models (see model_export) against every solver backend installed locally,
+reporting solve time, status and objective of each model, for each solver and MIP gap. Meant for choosing solvers and
+option sets on the simulation's own models. Doesn't need the database, or any of the environment variables that the
+simulation needs. Run as:
+    python -m tradingplatformpoc.simulation_runner.solver_benchmark CORPUS_DIR [--mip-gaps 0 0.01] [--time-limit 60]
+        [--solvers GLPK HiGHS] [--output results.csv]
+"""
+
+# Shift (in seconds) of the shifted geometric mean of solve times, so that very short solves don't dominate it
+TIME_SHIFT = 1.0
+# Relative difference in objective to the corpus' reference objective, above which a result is flagged
+OBJECTIVE_TOLERANCE = 1e-4
+# Statuses in GLPK's solution report for which a solution was found. "Integer non-optimal" is reported when a MIP solve
+# stops at the time limit or MIP gap.
+GLPK_STATUSES_WITH_SOLUTION = ['optimal', 'feasible', 'integer optimal', 'integer non-optimal']
+
+
+class BenchmarkResult:
+    model_file: str
+    model_type: str
+    solver: str
+    mip_gap: float
+    status: str
+    objective: Optional[float]
+    reference_objective: Optional[float]
+    seconds: float
+
+    def __init__(self, model_file: str, model_type: str, solver: str, mip_gap: float, status: str,
+                 objective: Optional[float], reference_objective: Optional[float], seconds: float):
+        self.model_file = model_file
+        self.model_type = model_type
+        self.solver = solver
+        self.mip_gap = mip_gap
+        self.status = status
+        self.objective = objective
+        self.reference_objective = reference_objective
+        self.seconds = seconds
+
+    @property
+    def objective_difference(self) -> Optional[float]:
+        """Relative difference to the objective that the simulation's solver got for the model."""
+        if self.objective is None or self.reference_objective is None:
+            return None
+        return (self.objective - self.reference_objective) / max(abs(self.reference_objective), 1.0)
+
+
+class SolverBackend(ABC):
+    """A solver that can solve LP and MPS files."""
+    name: str
+
+    @abstractmethod
+    def available(self) -> bool:
+        """Whether the solver is installed in this environment."""
+        pass
+
+    @abstractmethod
+    def solve(self, path: str, mip_gap: float, time_limit: float) -> Tuple[str, Optional[float]]:
+        """Solves the model in path, returning the status and the objective, if a solution was found."""
+        pass
+
+
+class GlpkBackend(SolverBackend):
+    name = 'GLPK'
+
+    def __init__(self):
+        # Same as the simulation: GLPK_PATH if set, otherwise glpsol on the PATH. Read directly rather than from the
+        # settings, which require the database's environment variables.
+        self.executable = os.getenv('GLPK_PATH') or shutil.which('glpsol')
+
+    def available(self) -> bool:
+        return self.executable is not None and shutil.which(self.executable) is not None
+
+    def solve(self, path: str, mip_gap: float, time_limit: float) -> Tuple[str, Optional[float]]:
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, 'output.txt')
+            command = [self.executable, '--freemps' if path.endswith('.mps') else '--cpxlp', path, '-o', output_path]
+            if mip_gap > 0:
+                command += ['--mipgap', str(mip_gap)]
+            if time_limit > 0:
+                command += ['--tmlim', str(max(1, math.ceil(time_limit)))]
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            if not os.path.exists(output_path):
+                return 'error', None
+            with open(output_path) as f:
+                return parse_glpk_output(f.read())
+
+
+class HighsBackend(SolverBackend):
+    name = 'HiGHS'
+
+    def available(self) -> bool:
+        try:
+            import highspy  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def solve(self, path: str, mip_gap: float, time_limit: float) -> Tuple[str, Optional[float]]:
+        import highspy
+        highs = highspy.Highs()
+        highs.setOptionValue('output_flag', False)
+        if mip_gap > 0:
+            highs.setOptionValue('mip_rel_gap', mip_gap)
+        if time_limit > 0:
+            highs.setOptionValue('time_limit', float(time_limit))
+        highs.readModel(path)
+        highs.run()
+        status = highs.modelStatusToString(highs.getModelStatus())
+        info = highs.getInfo()
+        # 2 is kSolutionStatusFeasible: a primal solution was found
+        objective = info.objective_function_value if info.primal_solution_status == 2 else None
+        return status.lower(), objective
+
+
+class CbcBackend(SolverBackend):
+    name = 'CBC'
+
+    def __init__(self):
+        self.executable = shutil.which('cbc')
+
+    def available(self) -> bool:
+        return self.executable is not None
+
+    def solve(self, path: str, mip_gap: float, time_limit: float) -> Tuple[str, Optional[float]]:
+        with tempfile.TemporaryDirectory() as directory:
+            solution_path = os.path.join(directory, 'solution.txt')
+            command = [self.executable, path]
+            if mip_gap > 0:
+                command += ['ratioGap', str(mip_gap)]
+            if time_limit > 0:
+                command += ['seconds', str(time_limit)]
+            command += ['solve', 'solution', solution_path]
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            if not os.path.exists(solution_path):
+                return 'error', None
+            with open(solution_path) as f:
+                return parse_cbc_solution(f.readline())
+
+
+BACKENDS: List[SolverBackend] = [GlpkBackend(), HighsBackend(), CbcBackend()]
+
+
+def parse_glpk_output(output: str) -> Tuple[str, Optional[float]]:
+    """Status and objective from a GLPK solution report (glpsol's -o option)."""
+    status_match = re.search(r'^Status:\s+(.+)$', output, re.MULTILINE)
+    status = status_match.group(1).strip().lower() if status_match else 'unknown'
+    objective_match = re.search(r'^Objective:\s+\S+\s*=\s*(\S+)', output, re.MULTILINE)
+    has_solution = status in GLPK_STATUSES_WITH_SOLUTION
+    objective = float(objective_match.group(1)) if objective_match and has_solution else None
+    return status, objective
+
+
+def parse_cbc_solution(first_line: str) -> Tuple[str, Optional[float]]:
+    """Status and objective from the first line of a CBC solution file, e.g. "Optimal - objective value 12.5"."""
+    match = re.match(r'^(.*?)\s*-\s*objective value\s+(\S+)', first_line.strip())
+    if match is None:
+        return first_line.strip().lower() or 'unknown', None
+    status = match.group(1).strip().lower()
+    objective = None if 'infeasible' in status else float(match.group(2))
+    return status, objective
+
+
+def run_benchmark(models: List[Dict[str, Any]], backends: List[SolverBackend], mip_gaps: List[float],
+                  time_limit: float) -> List[BenchmarkResult]:
+    """Solves each model (as returned by model_export.read_corpus) with each backend and MIP gap."""
+    results: List[BenchmarkResult] = []
+    for backend in backends:
+        for mip_gap in mip_gaps:
+            for model in models:
+                start = time.perf_counter()
+                try:
+                    status, objective = backend.solve(model['path'], mip_gap, time_limit)
+                except Exception as e:
+                    logger.warning('{} failed on {}: {}'.format(backend.name, model['file'], e))
+                    status, objective = 'error', None
+                result = BenchmarkResult(model['file'], model['model_type'], backend.name, mip_gap, status,
+                                         objective, model.get('objective'), time.perf_counter() - start)
+                logger.info('{} (MIP gap {}) on {}: {} in {:.3f} seconds, objective {}'.format(
+                    backend.name, mip_gap, model['file'], status, result.seconds, objective))
+                results.append(result)
+    return results
+
+
+def shifted_geometric_mean(values: List[float], shift: float = TIME_SHIFT) -> float:
+    """The usual summary of solve times in solver benchmarks: less sensitive to outliers than the arithmetic mean."""
+    if len(values) == 0:
+        return math.nan
+    return math.exp(sum(math.log(value + shift) for value in values) / len(values)) - shift
+
+
+def summarize(results: List[BenchmarkResult]) -> List[Dict[str, Any]]:
+    """One row per solver and MIP gap, in the order they were run."""
+    rows: List[Dict[str, Any]] = []
+    for solver, mip_gap in dict.fromkeys((result.solver, result.mip_gap) for result in results):
+        selected = [result for result in results if result.solver == solver and result.mip_gap == mip_gap]
+        differences = [result.objective_difference for result in selected if result.objective_difference is not None]
+        rows.append({'solver': solver,
+                     'mip_gap': mip_gap,
+                     'models': len(selected),
+                     'solved': sum(1 for result in selected if result.objective is not None),
+                     'objective_mismatches': sum(1 for difference in differences
+                                                 if abs(difference) > max(mip_gap, OBJECTIVE_TOLERANCE)),
+                     'total_seconds': sum(result.seconds for result in selected),
+                     'shifted_geometric_mean_seconds': shifted_geometric_mean([result.seconds for result in selected])})
+    return rows
+
+
+def write_results(results: List[BenchmarkResult], path: str):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['model_file', 'model_type', 'solver', 'mip_gap', 'status', 'objective', 'reference_objective',
+                         'objective_difference', 'seconds'])
+        for result in results:
+            writer.writerow([result.model_file, result.model_type, result.solver, result.mip_gap, result.status,
+                             result.objective, result.reference_objective, result.objective_difference,
+                             result.seconds])
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmarks locally installed solvers on exported models.')
+    parser.add_argument('corpus_dir', help='Directory of exported models (MODEL_EXPORT_DIR)')
+    parser.add_argument('--solvers', nargs='+', default=None,
+                        help='Solvers to benchmark, of {}. Defaults to all installed ones.'.format(
+                            ', '.join(backend.name for backend in BACKENDS)))
+    parser.add_argument('--mip-gaps', nargs='+', type=float, default=[0.0],
+                        help='Relative MIP gaps to solve with, 0 meaning to optimality.')
+    parser.add_argument('--time-limit', type=float, default=0.0, help='Time limit per solve, in seconds. 0 for none.')
+    parser.add_argument('--output', default=None, help='CSV file to write the result of each solve to.')
+    parsed = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-15s | %(levelname)-7s | %(message)s')
+
+    backends = [backend for backend in BACKENDS if parsed.solvers is None or backend.name in parsed.solvers]
+    for backend in backends:
+        if not backend.available():
+            logger.info('{} is not installed, skipping it'.format(backend.name))
+    backends = [backend for backend in backends if backend.available()]
+    models = read_corpus(parsed.corpus_dir)
+    logger.info('Benchmarking {} on {} models'.format(', '.join(backend.name for backend in backends), len(models)))
+
+    results = run_benchmark(models, backends, parsed.mip_gaps, parsed.time_limit)
+    if parsed.output is not None:
+        write_results(results, parsed.output)
+    for row in summarize(results):
+        logger.info('{solver} (MIP gap {mip_gap}): {solved} of {models} solved, {objective_mismatches} objectives '
+                    'differing from the simulation\'s, {total_seconds:.1f} seconds in total, shifted geometric mean '
+                    '{shifted_geometric_mean_seconds:.3f} seconds'.format(**row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import logging
+from typing import Any, Dict
+
+import numpy as np
+
+from tradingplatformpoc.trading_platform_utils import get_if_exists_else
+
+logger = logging.getLogger(__name__)
+
+"""
+Trading horizons can be optimized at a coarser resolution than hourly, for quick screening runs: with a time step of
+for example 2 hours, a 24-hour horizon is optimized as 12 time steps, which gives much smaller models. Hourly time
+series are aggregated to the average over each time step before the models are built, and the models' solutions are
+expanded back to hourly values afterwards, so that everything downstream (trades, metadata, pricing history) works as
+usual.
+"""
+
+# Storage level variables, and the parameters holding their levels at the start of the horizon
+STORAGE_LEVELS = {'SOCBES': 'SOCBES0', 'SOCTES': 'SOCTES0', 'Energy_shallow': 'BITES_Eshallow0',
+                  'Energy_deep': 'BITES_Edeep0'}
+# Variables that are energies per time step, rather than average powers
+ENERGIES_PER_TIME_STEP = ['Loss_shallow', 'Loss_deep']
+
+
+def get_time_step(area_info: Dict[str, Any]) -> int:
+    """
+    The number of hours in each time step of the optimization models. Falls back to hourly time steps if the trading
+    horizon isn't a multiple of the time step.
+    """
+    time_step = int(get_if_exists_else(area_info, 'TimeStep', 1))
+    trading_horizon = area_info['TradingHorizon']
+    if time_step > 1 and trading_horizon % time_step != 0:
+        logger.warning('Trading horizon of {} hours is not a multiple of the time step of {} hours, will optimize '
+                       'with hourly time steps.'.format(trading_horizon, time_step))
+        return 1
+    return time_step
+
+
+def aggregate(hourly_values: np.ndarray, time_step: int) -> np.ndarray:
+    """
+    Averages the values over each time step. The last axis is the hour, and its length should be a multiple of
+    time_step.
+    """
+    values = np.asarray(hourly_values, dtype=float)
+    if time_step == 1:
+        return values
+    return values.reshape(values.shape[:-1] + (values.shape[-1] // time_step, time_step)).mean(axis=-1)
+
+
+def expand(values: np.ndarray, time_step: int) -> np.ndarray:
+    """Repeats each time step's value for all hours in it. The last axis is the time step."""
+    return np.repeat(values, time_step, axis=-1)
+
+
+def expand_levels(levels: np.ndarray, start_levels: np.ndarray, time_step: int) -> np.ndarray:
+    """
+    Levels at the end of each hour, interpolated linearly between the levels at the end of each time step. The last
+    axis of levels is the time step, start_levels holds the levels at the start of the first one.
+    """
+    levels_with_start = np.concatenate([np.asarray(start_levels, dtype=float)[..., np.newaxis], levels], axis=-1)
+    fractions = np.arange(1, time_step + 1) / time_step
+    previous = np.repeat(levels_with_start[..., :-1], time_step, axis=-1)
+    change = np.repeat(np.diff(levels_with_start, axis=-1), time_step, axis=-1)
+    return previous + change * np.tile(fractions, levels.shape[-1])
+
+
+def get_aggregation_error(hourly_values: np.ndarray, time_step: int) -> np.ndarray:
+    """
+    The energy [kWh] by which the aggregated values differ from the hourly ones, for each hour, summed over all other
+    axes (typically agents). This is the energy that the optimization has effectively moved in time, within time steps,
+    for example using storage that may not exist, so it shows how much the energy balances of the aggregated model
+    deviate from the hourly ones.
+    """
+    values = np.asarray(hourly_values, dtype=float)
+    error = np.abs(values - expand(aggregate(values, time_step), time_step))
+    return error.reshape(-1, values.shape[-1]).sum(axis=0)
@@ -1,11 +1,14 @@
 import datetime
 import logging
 import math
+import multiprocessing
 import threading
-from typing import Any, Dict, List, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 
+import pyomo.environ as pyo
 from pyomo.opt import OptSolver
 
 from tradingplatformpoc.agent.block_agent import BlockAgent
@@ -13,7 +16,7 @@ from tradingplatformpoc.agent.grid_agent import GridAgent
 from tradingplatformpoc.agent.iagent import IAgent
 from tradingplatformpoc.app.app_threading import StoppableThread
 from tradingplatformpoc.constants import LEC_CAN_SELL_HEAT_TO_EXTERNAL
-from tradingplatformpoc.database import bulk_insert
+from tradingplatformpoc.database import bulk_insert, bulk_insert_all
 from tradingplatformpoc.digitaltwin.battery import Battery
 from tradingplatformpoc.digitaltwin.static_digital_twin import StaticDigitalTwin
 from tradingplatformpoc.generate_data.generate_mock_data import get_generated_mock_data
@@ -27,41 +30,94 @@ from tradingplatformpoc.market.trade import Resource, Trade, TradeMetadataKey
 from tradingplatformpoc.price.electricity_price import ElectricityPrice
 from tradingplatformpoc.price.heating_price import HeatingPrice
 from tradingplatformpoc.settings import settings
-from tradingplatformpoc.simulation_runner.chalmers_interface import InfeasibilityError, optimize
+from tradingplatformpoc.simulation_runner.agent_clustering import AgentClusters, cluster_agents, disaggregate_outputs
+from tradingplatformpoc.simulation_runner.chalmers_interface import ChalmersOutputs, InfeasibilityError, SolveInfo, \
+    get_solver_settings, log_solve_time_summary, optimize
+from tradingplatformpoc.simulation_runner.month_parallel import MonthResult, State, create_month_task, \
+    merge_month_results, simulate_month, split_into_months, states_match
+from tradingplatformpoc.simulation_runner.output_writer import OutputWriter
+from tradingplatformpoc.simulation_runner.phase_timer import BUILD_MODELS, BUILD_SUPPLY_AND_DEMAND, \
+    CALCULATE_RESULTS, CORRECT_FOR_EXACT_PRICE, EXTRACT_OUTPUTS, EXTRACT_RESOURCE_PRICES, LOAD_DATA, PhaseTimer, \
+    SET_UP_AGENTS, SOLVE, WRITE_OUTPUTS
+from tradingplatformpoc.simulation_runner.representative_days import get_horizon_features, get_period_weights, \
+    select_representative_horizons
 from tradingplatformpoc.simulation_runner.results_calculator import calculate_results_and_save
+from tradingplatformpoc.simulation_runner.solution_cache import SolutionCache
+from tradingplatformpoc.sql.checkpoint.crud import add_price_history_from_db_dict, checkpoint_to_db_dict, \
+    read_checkpoints
+from tradingplatformpoc.sql.checkpoint.models import Checkpoint as TableCheckpoint
 from tradingplatformpoc.sql.config.crud import get_all_agent_name_id_pairs_in_config, read_config
 from tradingplatformpoc.sql.electricity_price.models import ElectricityPrice as TableElectricityPrice
 from tradingplatformpoc.sql.extra_cost.crud import extra_costs_to_db_dict
 from tradingplatformpoc.sql.extra_cost.models import ExtraCost as TableExtraCost
 from tradingplatformpoc.sql.heating_price.models import HeatingPrice as TableHeatingPrice
-from tradingplatformpoc.sql.input_data.crud import get_periods_from_db, read_inputs_df_for_agent_creation
+from tradingplatformpoc.sql.input_data.crud import get_periods_from_db, read_input_column_df_from_db, \
+    read_inputs_df_for_agent_creation
 from tradingplatformpoc.sql.input_electricity_price.crud import get_nordpool_data
-from tradingplatformpoc.sql.job.crud import delete_job, get_config_id_for_job_id, set_error_info, update_job_with_time
+from tradingplatformpoc.sql.job.crud import delete_job, delete_results_for_job, get_config_id_for_job_id, \
+    set_error_info, set_phase_timings, update_job_with_time
 from tradingplatformpoc.sql.level.crud import tmk_levels_dict_to_db_dict, tmk_overall_levels_dict_to_db_dict
 from tradingplatformpoc.sql.level.models import Level as TableLevel
+from tradingplatformpoc.sql.solve_info.crud import solve_infos_to_db_dict
+from tradingplatformpoc.sql.solve_info.models import SolveInfo as TableSolveInfo
 from tradingplatformpoc.sql.trade.crud import trades_to_db_dict
 from tradingplatformpoc.sql.trade.models import Trade as TableTrade
-from tradingplatformpoc.trading_platform_utils import add_all_to_nested_dict, add_all_to_twice_nested_dict, \
-    calculate_solar_prod, get_external_prices, get_final_storage_level, get_glpk_solver
+from tradingplatformpoc.trading_platform_utils import DEFAULT_SOLVER, add_all_to_nested_dict, \
+    add_all_to_twice_nested_dict, calculate_solar_prod, get_external_prices, get_final_storage_level, \
+    get_if_exists_else, get_solver
 
 logger = logging.getLogger(__name__)
 
 
+class SimulationStoppedError(Exception):
+    """Raised when the thread running the simulation is stopped, see StoppableThread."""
+    keep_job_data: bool
+
+    def __init__(self, keep_job_data: bool):
+        super().__init__('Simulation stopped by event.')
+        self.keep_job_data = keep_job_data
+
+
 class TradingSimulator:
     def __init__(self, job_id: str):
-        self.solver: OptSolver = get_glpk_solver()
         self.job_id: str = job_id
         self.config_id: str = get_config_id_for_job_id(self.job_id)
         self.config_data: Dict[str, Any] = read_config(self.config_id)
+        # Configs created before the "Solver" parameter was introduced don't have it
+        solver_settings = get_solver_settings(self.config_data['AreaInfo'])
+        self.solver: OptSolver = get_solver(get_if_exists_else(self.config_data['AreaInfo'], 'Solver', DEFAULT_SOLVER),
+                                            solver_settings.mip_gap, solver_settings.time_limit)
         self.agent_name_id_pairs: Dict[str, str] = get_all_agent_name_id_pairs_in_config(self.config_id)
+        if get_if_exists_else(self.config_data['AreaInfo'], 'WarmStart', False) \
+                and not self.solver.warm_start_capable():
+            logger.warning('The chosen solver does not support warm starts, will solve without.')
+        # LEC models, built once per structural signature and reused for all trading horizons
+        self.lec_models: Dict[tuple, pyo.ConcreteModel] = {}
+        # Only used for warm starts: each agent's model for the previous horizon, when the local market is disabled
+        self.agent_models: Dict[str, pyo.ConcreteModel] = {}
+        self.solve_infos: List[SolveInfo] = []
+        # Only used when agents' problems are solved in parallel, see create_executor
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.solution_cache: Optional[SolutionCache] = SolutionCache(settings.SOLUTION_CACHE_DIR) \
+            if settings.SOLUTION_CACHE_DIR else None
+        # Only used when block agents are merged into aggregate agents, see cluster_agents
+        self.agent_clusters: Optional[AgentClusters] = None
+        # Writes outputs to the database while the simulation goes on, see save_outputs
+        self.output_writer: OutputWriter = OutputWriter(self.write_outputs, 0)
+        # Time spent in each phase of the simulation, saved with the job as the simulation goes on
+        self.phase_timer: PhaseTimer = PhaseTimer()
 
     def __call__(self):
         if (self.job_id is not None) and (self.config_data is not None):
             try:
                 update_job_with_time(self.job_id, 'start_time')
-                self.initialize_data()
-                self.agents, self.grid_agents = self.initialize_agents()
+                with self.phase_timer.time(LOAD_DATA):
+                    self.initialize_data()
+                with self.phase_timer.time(SET_UP_AGENTS):
+                    self.agents, self.grid_agents = self.initialize_agents()
                 self.block_agents: List[BlockAgent] = [agent for agent in self.agents if isinstance(agent, BlockAgent)]
+                # The agents that are optimized: the block agents, or aggregate agents in their place
+                self.optimized_agents: List[BlockAgent] = self.block_agents
                 self.run()
                 update_job_with_time(self.job_id, 'end_time')
 
@@ -70,10 +126,21 @@ class TradingSimulator:
                 set_error_info(self.job_id, e)
                 delete_job(self.job_id, only_delete_associated_data=True)
 
+            except SimulationStoppedError as e:
+                if e.keep_job_data:
+                    logger.warning('Simulation of job {} stopped, since another worker has taken it over.'.format(
+                        self.job_id))
+                else:
+                    delete_job(self.job_id)
+
             except Exception as other_error:
                 logger.exception(other_error)
                 delete_job(self.job_id)
 
+            finally:
+                if self.executor is not None:
+                    self.executor.shutdown()
+
     def initialize_data(self):
         self.trading_periods = get_periods_from_db().sort_values()
 
@@ -211,38 +278,140 @@ class TradingSimulator:
 
         logger.info("Starting trading simulations")
 
-        shallow_storage_end: Dict[str, float] = {}
-        deep_storage_end: Dict[str, float] = {}
+        # Only used when simulating representative days: the weight of each simulated period in the annual results
+        period_weights: Optional[pd.Series] = None
+        representative_days = get_if_exists_else(self.config_data['AreaInfo'], 'RepresentativeDaysPerMonth', 0)
+        if representative_days > 0:
+            period_weights = self.select_representative_days(representative_days)
+
+        n_clusters = get_if_exists_else(self.config_data['AreaInfo'], 'AgentClusters', 0)
+        if self.local_market_enabled and 0 < n_clusters < len(self.block_agents):
+            self.cluster_agents(n_clusters)
 
         number_of_trading_horizons = int(len(self.trading_periods) // self.trading_horizon)
         logger.info('Will run {} trading horizons'.format(number_of_trading_horizons))
+        trading_horizon_start_points = self.trading_periods[::self.trading_horizon][:number_of_trading_horizons]
+        n_horizons_done, shallow_storage_end, deep_storage_end = self.resume_from_checkpoints(
+            trading_horizon_start_points)
+
+        self.output_writer = OutputWriter(self.write_outputs, settings.OUTPUT_QUEUE_SIZE, 'write_' + self.job_id)
+        try:
+            if settings.MONTH_WORKERS > 1:
+                self.run_months_in_parallel(list(trading_horizon_start_points), n_horizons_done, shallow_storage_end,
+                                            deep_storage_end)
+            else:
+                self.run_in_batches(trading_horizon_start_points, number_of_batches, n_horizons_done,
+                                    shallow_storage_end, deep_storage_end)
+            # Prices are calculated from the trades in the database, so all of them need to have been written
+            self.output_writer.flush()
+        finally:
+            # If the simulation failed, still writing what was queued, so that the job isn't deleted while writing
+            self.output_writer.close()
+
+        log_solve_time_summary(self.solve_infos)
+        if self.solution_cache is not None:
+            self.solution_cache.log_summary()
+        logger.info("Finished simulating trades, beginning calculations on district heating price...")
+
+        self.extract_resource_prices()
+
+        with self.phase_timer.time(CALCULATE_RESULTS):
+            calculate_results_and_save(self.job_id, self.agents, self.grid_agents, period_weights)
+
+        self.phase_timer.log_summary()
+        set_phase_timings(self.job_id, self.phase_timer.to_dict())
+        logger.info('Simulation finished!')
+
+    def select_representative_days(self, per_month: int) -> pd.Series:
+        """
+        Restricts the trading periods to those of the representative days (trading horizons) of each month, see
+        representative_days. Returns the weight of each remaining period, i.e. the number of days it represents.
+        """
+        number_of_trading_horizons = int(len(self.trading_periods) // self.trading_horizon)
+        horizon_starts = list(self.trading_periods[::self.trading_horizon][:number_of_trading_horizons])
+        temperature_df = read_input_column_df_from_db('temperature')
+        features = get_horizon_features(self.block_agents, horizon_starts, self.trading_horizon,
+                                        temperature_df.set_index('period')['temperature'],
+                                        self.electricity_pricing.nordpool_data)
+        period_weights = get_period_weights(select_representative_horizons(features, per_month), self.trading_horizon)
+        self.trading_periods = pd.DatetimeIndex(period_weights.index)
+        return period_weights
+
+    def cluster_agents(self, n_clusters: int):
+        """
+        Merges the block agents into n_clusters aggregate agents, which are optimized in place of them, see
+        agent_clustering. Their outputs are split back between the block agents before they are saved.
+        """
+        self.agent_clusters = cluster_agents(self.block_agents, n_clusters, list(self.trading_periods))
+        self.optimized_agents = self.agent_clusters.aggregate_agents
+
+    def resume_from_checkpoints(self, trading_horizon_start_points: pd.DatetimeIndex) \
+            -> Tuple[int, Dict[str, float], Dict[str, float]]:
+        """
+        If the job has been run before, and was interrupted, restores the pricing history saved in its checkpoints.
+        Returns the number of trading horizons already simulated, and the BITES storage levels at the end of the last
+        of them.
+        """
+        checkpoints = read_checkpoints(self.job_id)
+        if len(checkpoints) == 0:
+            return 0, {}, {}
+        last_checkpoint = checkpoints[-1]
+        n_horizons_done = last_checkpoint['n_horizons']
+        if n_horizons_done > len(trading_horizon_start_points) \
+                or trading_horizon_start_points[n_horizons_done - 1] != last_checkpoint['horizon_start']:
+            # For example if NOT_FULL_YEAR was changed since the job was interrupted
+            logger.warning('Checkpoints for job {} do not match its trading horizons, will simulate from the '
+                           'start.'.format(self.job_id))
+            delete_job(self.job_id, only_delete_associated_data=True)
+            return 0, {}, {}
+        logger.info('Resuming job {} after {} of {} trading horizons'.format(self.job_id, n_horizons_done,
+                                                                             len(trading_horizon_start_points)))
+        for checkpoint in checkpoints:
+            add_price_history_from_db_dict(self.electricity_pricing, checkpoint['electricity_price_history'])
+            add_price_history_from_db_dict(self.heat_pricing, checkpoint['heating_price_history'])
+        # The job may have been interrupted after simulating all horizons, while calculating results
+        delete_results_for_job(self.job_id)
+        return n_horizons_done, last_checkpoint['shallow_storage_end'], last_checkpoint['deep_storage_end']
+
+    def run_in_batches(self, trading_horizon_start_points: pd.DatetimeIndex, number_of_batches: int,
+                       n_horizons_done: int = 0, shallow_storage_end: Optional[Dict[str, float]] = None,
+                       deep_storage_end: Optional[Dict[str, float]] = None) \
+            -> Tuple[Dict[str, float], Dict[str, float]]:
+        """
+        Simulates the trading horizons one after the other, saving the results to the database in batches, each with a
+        checkpoint that the job can be resumed from. When resuming, the first n_horizons_done horizons are skipped, and
+        the storage levels at the end of them should be specified. Returns the storage levels at the end of the last
+        horizon.
+        """
+        shallow_storage_end = shallow_storage_end if shallow_storage_end is not None else {}
+        deep_storage_end = deep_storage_end if deep_storage_end is not None else {}
+        number_of_trading_horizons = len(trading_horizon_start_points)
         new_batch_size = math.ceil(number_of_trading_horizons / number_of_batches)
 
+        self.executor = self.create_executor()
+
         # Loop over batches
         for batch_number in range(number_of_batches):
-            current_thread = threading.current_thread()
-            if isinstance(current_thread, StoppableThread):
-                if current_thread.is_stopped():
-                    logger.error('Simulation stopped by event.')
-                    raise Exception("Simulation stopped by event.")
+            batch_start = max(batch_number * new_batch_size, n_horizons_done)
+            batch_end = min((batch_number + 1) * new_batch_size, number_of_trading_horizons)
+            if batch_start >= batch_end:
+                continue
+            self.raise_if_stopped()
             logger.info("Simulating batch number {} of {}".format(batch_number + 1, number_of_batches))
 
             # Horizons in batch
-            trading_horizon_start_points = self.trading_periods[::self.trading_horizon]
-            thsps_in_this_batch = trading_horizon_start_points[
-                batch_number * new_batch_size:min((batch_number + 1) * new_batch_size, number_of_trading_horizons)]
-            all_trades_list_batch: List[List[Trade]] = []
-            metadata_per_agent_and_period: Dict[TradeMetadataKey, Dict[str, Dict[datetime.datetime, float]]] = {}
-            metadata_per_period: Dict[TradeMetadataKey, Dict[datetime.datetime, float]] = {}
+            thsps_in_this_batch = trading_horizon_start_points[batch_start:batch_end]
+            outputs_batch: List[ChalmersOutputs] = []
 
             # ------- NEW --------
             for horizon_start in thsps_in_this_batch:
                 logger.info("Simulating {:%Y-%m-%d}".format(horizon_start))
-                chalmers_outputs = optimize(self.solver, self.block_agents, self.grid_agents,
+                chalmers_outputs = optimize(self.solver, self.optimized_agents, self.grid_agents,
                                             self.config_data['AreaInfo'], horizon_start,
                                             self.electricity_pricing, self.heat_pricing,
-                                            shallow_storage_end, deep_storage_end)
-                all_trades_list_batch.append(chalmers_outputs.trades)
+                                            shallow_storage_end, deep_storage_end, self.lec_models,
+                                            self.agent_models, self.executor, self.solution_cache)
+                outputs_batch.append(chalmers_outputs)
                 shallow_storage_end = get_final_storage_level(
                     self.trading_horizon,
                     chalmers_outputs.metadata_per_agent_and_period[TradeMetadataKey.SHALLOW_STORAGE_ABS],
@@ -251,27 +420,182 @@ class TradingSimulator:
                     self.trading_horizon,
                     chalmers_outputs.metadata_per_agent_and_period[TradeMetadataKey.DEEP_STORAGE_ABS],
                     horizon_start)
-                add_all_to_twice_nested_dict(metadata_per_agent_and_period,
-                                             chalmers_outputs.metadata_per_agent_and_period)
-                add_all_to_nested_dict(metadata_per_period, chalmers_outputs.metadata_per_period)
-
-            logger.info('Saving trades to db...')
-            trade_dict = trades_to_db_dict(all_trades_list_batch, self.job_id)
-            bulk_insert(TableTrade, trade_dict)
-
-            logger.info('Saving metadata to db...')
-            metadata_per_agent_and_period_dicts = tmk_levels_dict_to_db_dict(metadata_per_agent_and_period, self.job_id)
-            metadata_per_period_dicts = tmk_overall_levels_dict_to_db_dict(metadata_per_period, self.job_id)
-            bulk_insert(TableLevel, metadata_per_agent_and_period_dicts)
-            bulk_insert(TableLevel, metadata_per_period_dicts)
-
-        logger.info("Finished simulating trades, beginning calculations on district heating price...")
 
-        self.extract_resource_prices()
-
-        calculate_results_and_save(self.job_id, self.agents, self.grid_agents)
+            # The pricing history recorded in the batch, which is the history for the periods of its horizons
+            batch_end_time = trading_horizon_start_points[batch_end] if batch_end < number_of_trading_horizons \
+                else None
+            checkpoint = checkpoint_to_db_dict(
+                self.job_id, batch_end, thsps_in_this_batch[-1], shallow_storage_end, deep_storage_end,
+                self.electricity_pricing.copy_with_history_between(thsps_in_this_batch[0], batch_end_time),
+                self.heat_pricing.copy_with_history_between(thsps_in_this_batch[0], batch_end_time))
+            self.save_outputs(outputs_batch, checkpoint)
+        return shallow_storage_end, deep_storage_end
+
+    def run_months_in_parallel(self, trading_horizon_start_points: List[datetime.datetime], n_horizons_done: int = 0,
+                               shallow_storage_end: Optional[Dict[str, float]] = None,
+                               deep_storage_end: Optional[Dict[str, float]] = None):
+        """
+        Simulates the months of the year in parallel processes, reconciling the storage levels and peaks that each
+        month starts from with the end of the previous month, see month_parallel. Months are saved to the database as
+        soon as they are final, each with a checkpoint. When resuming, the first n_horizons_done horizons are skipped,
+        and the storage levels at the end of them should be specified.
+        """
+        shallow_storage_end = shallow_storage_end if shallow_storage_end is not None else {}
+        deep_storage_end = deep_storage_end if deep_storage_end is not None else {}
+        done_months = split_into_months(trading_horizon_start_points[:n_horizons_done])
+        if len(done_months) > 0 and n_horizons_done < len(trading_horizon_start_points) \
+                and len(split_into_months(trading_horizon_start_points[:n_horizons_done + 1])) == len(done_months):
+            # Resuming in the middle of a month, from a checkpoint saved when simulating in batches. Finishing the
+            # month in the same way, since months can only be simulated in parallel from their start.
+            month_end = n_horizons_done + len(split_into_months(trading_horizon_start_points[n_horizons_done:])[0])
+            shallow_storage_end, deep_storage_end = self.run_in_batches(
+                pd.DatetimeIndex(trading_horizon_start_points[:month_end]), 1, n_horizons_done, shallow_storage_end,
+                deep_storage_end)
+            done_months = split_into_months(trading_horizon_start_points[:month_end])
+            n_horizons_done = month_end
+        months = split_into_months(trading_horizon_start_points[n_horizons_done:])
+        area_info = self.config_data['AreaInfo']
+        solver_name = get_if_exists_else(area_info, 'Solver', DEFAULT_SOLVER)
+        solver_settings = get_solver_settings(area_info)
+        logger.info('Will simulate {} months in {} processes'.format(len(months), settings.MONTH_WORKERS))
+        if self.executor is not None:
+            self.executor.shutdown()
+        # Using "spawn" also on Linux, since forking a process with running threads (such as the app's) is unsafe
+        self.executor = ProcessPoolExecutor(max_workers=settings.MONTH_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+        # When resuming, the end of the last month simulated before, which the first month is simulated from
+        resumed_month: Optional[MonthResult] = None
+        if len(done_months) > 0:
+            resumed_month = MonthResult(done_months[-1], [], [], shallow_storage_end, deep_storage_end,
+                                        self.electricity_pricing.copy_with_history_between(done_months[-1][0]),
+                                        self.heat_pricing.copy_with_history_between(done_months[-1][0]), [])
+        results: List[Optional[MonthResult]] = [None] * len(months)
+        boundaries: List[Optional[State]] = [None] * len(months)
+        n_final = 0
+        n_passes = 0
+        n_horizons_simulated = 0
+        while n_final < len(months):
+            self.raise_if_stopped()
+            n_passes += 1
+            futures: Dict[int, Future] = {}
+            for i_month in range(n_final, len(months)):
+                previous_month = results[i_month - 1] if i_month > 0 else resumed_month
+                task, boundary = create_month_task(months[i_month], self.electricity_pricing, self.heat_pricing,
+                                                   previous_month, results[i_month])
+                if results[i_month] is None or not states_match(boundary, boundaries[i_month]):
+                    boundaries[i_month] = boundary
+                    futures[i_month] = self.executor.submit(simulate_month, task, boundary, solver_name,
+                                                            solver_settings, self.optimized_agents,
+                                                            self.grid_agents,
+                                                            area_info, self.solution_cache)
+            logger.info('Reconciliation pass {}: simulating {} months'.format(n_passes, len(futures)))
+            for i_month, future in futures.items():
+                month_result: MonthResult = future.result()
+                n_horizons_simulated += len(month_result.states)
+                previous_simulation = results[i_month]
+                results[i_month] = merge_month_results(month_result, previous_simulation) \
+                    if previous_simulation is not None else month_result
+            # A month is final if the previous month is final, and the month was simulated from its end
+            while n_final < len(months):
+                if n_final > 0:
+                    _, boundary = create_month_task(months[n_final], self.electricity_pricing, self.heat_pricing,
+                                                    results[n_final - 1])
+                    if not states_match(boundary, boundaries[n_final]):
+                        break
+                final_month = results[n_final]
+                # Months are only final once simulated
+                assert final_month is not None
+                n_horizons_done += len(final_month.horizon_starts)
+                checkpoint = checkpoint_to_db_dict(self.job_id, n_horizons_done, final_month.horizon_starts[-1],
+                                                   final_month.shallow_storage_end, final_month.deep_storage_end,
+                                                   final_month.elec_pricing, final_month.heat_pricing)
+                self.save_outputs(final_month.outputs, checkpoint)
+                self.electricity_pricing.add_history_from(final_month.elec_pricing)
+                self.heat_pricing.add_history_from(final_month.heat_pricing)
+                final_month.outputs = []
+                n_final += 1
+        logger.info('Simulated {} horizons in {} passes, for {} horizons in total'.format(
+            n_horizons_simulated, n_passes, sum(len(month) for month in months)))
+
+    def save_outputs(self, outputs: List[ChalmersOutputs], checkpoint: Optional[Dict[str, Any]] = None):
+        """
+        Queues the outputs to be written to the database, see write_outputs. Unless OUTPUT_QUEUE_SIZE is 0, they are
+        written in the background, while the simulation goes on.
+        """
+        self.add_optimization_timings(outputs)
+        self.output_writer.submit(outputs, checkpoint)
 
-        logger.info('Simulation finished!')
+    def add_optimization_timings(self, outputs: List[ChalmersOutputs]):
+        """
+        Adds the time spent optimizing the horizons of outputs to the phase timings. The times are measured per model,
+        so when models are solved in parallel, they add up to more than the wall-clock time of the simulation.
+        """
+        solve_infos = [solve_info for chalmers_outputs in outputs for solve_info in chalmers_outputs.solve_infos]
+        n_models = len(solve_infos)
+        self.phase_timer.add(BUILD_SUPPLY_AND_DEMAND,
+                             sum(chalmers_outputs.input_seconds for chalmers_outputs in outputs), len(outputs))
+        self.phase_timer.add(BUILD_MODELS, sum(solve_info.build_seconds for solve_info in solve_infos), n_models)
+        self.phase_timer.add(SOLVE, sum(solve_info.solve_seconds for solve_info in solve_infos), n_models)
+        self.phase_timer.add(EXTRACT_OUTPUTS, sum(solve_info.extraction_seconds for solve_info in solve_infos),
+                             n_models)
+
+    def write_outputs(self, outputs: List[ChalmersOutputs], checkpoint: Optional[Dict[str, Any]] = None):
+        """
+        Saves the outputs to the database, along with the checkpoint if specified, in a single transaction, so that a
+        checkpoint is only saved along with all outputs up to it. Then updates the job's phase timings, so that they can
+        be followed while the job runs.
+        """
+        with self.phase_timer.time(WRITE_OUTPUTS):
+            self.insert_outputs(outputs, checkpoint)
+        set_phase_timings(self.job_id, self.phase_timer.to_dict())
+
+    def insert_outputs(self, outputs: List[ChalmersOutputs], checkpoint: Optional[Dict[str, Any]] = None):
+        if self.agent_clusters is not None:
+            outputs = [disaggregate_outputs(chalmers_outputs, self.agent_clusters) for chalmers_outputs in outputs]
+        all_trades_list: List[List[Trade]] = []
+        metadata_per_agent_and_period: Dict[TradeMetadataKey, Dict[str, Dict[datetime.datetime, float]]] = {}
+        metadata_per_period: Dict[TradeMetadataKey, Dict[datetime.datetime, float]] = {}
+        solve_infos: List[SolveInfo] = []
+        for chalmers_outputs in outputs:
+            all_trades_list.append(chalmers_outputs.trades)
+            solve_infos.extend(chalmers_outputs.solve_infos)
+            add_all_to_twice_nested_dict(metadata_per_agent_and_period, chalmers_outputs.metadata_per_agent_and_period)
+            add_all_to_nested_dict(metadata_per_period, chalmers_outputs.metadata_per_period)
+
+        logger.info('Saving trades, metadata and solver telemetry to db...')
+        inserts = [(TableTrade, trades_to_db_dict(all_trades_list, self.job_id)),
+                   (TableLevel, tmk_levels_dict_to_db_dict(metadata_per_agent_and_period, self.job_id)),
+                   (TableLevel, tmk_overall_levels_dict_to_db_dict(metadata_per_period, self.job_id)),
+                   (TableSolveInfo, solve_infos_to_db_dict(solve_infos, self.job_id))]
+        if checkpoint is not None:
+            inserts.append((TableCheckpoint, [checkpoint]))
+        bulk_insert_all(inserts)
+        self.solve_infos.extend(solve_infos)
+
+    def raise_if_stopped(self):
+        current_thread = threading.current_thread()
+        if isinstance(current_thread, StoppableThread):
+            if current_thread.is_stopped():
+                logger.error('Simulation stopped by event.')
+                raise SimulationStoppedError(current_thread.keep_job_data)
+
+    def create_executor(self) -> Optional[ProcessPoolExecutor]:
+        """
+        If more than one optimization worker is configured, returns a process pool to solve agents' problems in. This
+        is only done when the local market is disabled, or when the LEC's problem is decomposed into agents' problems
+        - otherwise there is a single optimization problem per horizon.
+        """
+        area_info = self.config_data['AreaInfo']
+        if settings.OPTIMIZATION_WORKERS <= 1 or \
+                (self.local_market_enabled and not get_if_exists_else(area_info, 'DecomposeLEC', False)):
+            return None
+        if get_if_exists_else(area_info, 'WarmStart', False):
+            logger.warning('Warm starts are not used when solving in parallel.')
+        logger.info('Will solve agents\' optimization problems in {} processes'.format(settings.OPTIMIZATION_WORKERS))
+        # Using "spawn" also on Linux, since forking a process with running threads (such as the app's) is unsafe
+        return ProcessPoolExecutor(max_workers=settings.OPTIMIZATION_WORKERS,
+                                   mp_context=multiprocessing.get_context('spawn'))
 
     def extract_resource_prices(self):
         """
@@ -281,45 +605,49 @@ class TradingSimulator:
 
         # First for heating
         logger.info('Calculating heating_price_list')
-        heating_price_list = get_external_prices(self.heat_pricing,
-                                                 self.job_id,
-                                                 self.trading_periods,
-                                                 agent_guids,
-                                                 self.local_market_enabled)
-        bulk_insert(TableHeatingPrice, heating_price_list)
-        heating_prices = pd.DataFrame.from_records(heating_price_list)
+        with self.phase_timer.time(EXTRACT_RESOURCE_PRICES):
+            heating_price_list = get_external_prices(self.heat_pricing,
+                                                     self.job_id,
+                                                     self.trading_periods,
+                                                     agent_guids,
+                                                     self.local_market_enabled)
+            bulk_insert(TableHeatingPrice, heating_price_list)
+            heating_prices = pd.DataFrame.from_records(heating_price_list)
 
         logger.info('Calculating heat_cost_discrepancy_corrections')
-        heat_cost_discrepancy_corrections = correct_for_exact_price(self.trading_periods,
-                                                                    heating_prices,
-                                                                    Resource.HIGH_TEMP_HEAT,
-                                                                    ExtraCostType.HEAT_EXT_COST_CORR,
-                                                                    self.job_id,
-                                                                    self.local_market_enabled,
-                                                                    agent_guids)
+        with self.phase_timer.time(CORRECT_FOR_EXACT_PRICE):
+            heat_cost_discrepancy_corrections = correct_for_exact_price(self.trading_periods,
+                                                                        heating_prices,
+                                                                        Resource.HIGH_TEMP_HEAT,
+                                                                        ExtraCostType.HEAT_EXT_COST_CORR,
+                                                                        self.job_id,
+                                                                        self.local_market_enabled,
+                                                                        agent_guids)
 
         # Then for electricity
         logger.info('Calculating elec_price_list')
-        elec_price_list = get_external_prices(self.electricity_pricing,
-                                              self.job_id,
-                                              self.trading_periods,
-                                              agent_guids,
-                                              self.local_market_enabled)
-        bulk_insert(TableElectricityPrice, elec_price_list)
-        elec_prices = pd.DataFrame.from_records(elec_price_list)
+        with self.phase_timer.time(EXTRACT_RESOURCE_PRICES):
+            elec_price_list = get_external_prices(self.electricity_pricing,
+                                                  self.job_id,
+                                                  self.trading_periods,
+                                                  agent_guids,
+                                                  self.local_market_enabled)
+            bulk_insert(TableElectricityPrice, elec_price_list)
+            elec_prices = pd.DataFrame.from_records(elec_price_list)
 
         logger.info('Calculating elec_cost_discrepancy_corrections')
-        elec_cost_discrepancy_corrections = correct_for_exact_price(self.trading_periods,
-                                                                    elec_prices,
-                                                                    Resource.ELECTRICITY,
-                                                                    ExtraCostType.ELEC_EXT_COST_CORR,
-                                                                    self.job_id,
-                                                                    self.local_market_enabled,
-                                                                    agent_guids)
-
-        logger.info('Saving extra costs to database...')
-        heat_extra_cost_dicts = extra_costs_to_db_dict(heat_cost_discrepancy_corrections, self.job_id)
-        elec_extra_cost_dicts = extra_costs_to_db_dict(elec_cost_discrepancy_corrections, self.job_id)
-        bulk_insert(TableExtraCost, heat_extra_cost_dicts + elec_extra_cost_dicts)
+        with self.phase_timer.time(CORRECT_FOR_EXACT_PRICE):
+            elec_cost_discrepancy_corrections = correct_for_exact_price(self.trading_periods,
+                                                                        elec_prices,
+                                                                        Resource.ELECTRICITY,
+                                                                        ExtraCostType.ELEC_EXT_COST_CORR,
+                                                                        self.job_id,
+                                                                        self.local_market_enabled,
+                                                                        agent_guids)
+
+            logger.info('Saving extra costs to database...')
+            heat_extra_cost_dicts = extra_costs_to_db_dict(heat_cost_discrepancy_corrections, self.job_id)
+            elec_extra_cost_dicts = extra_costs_to_db_dict(elec_cost_discrepancy_corrections, self.job_id)
+            bulk_insert(TableExtraCost, heat_extra_cost_dicts + elec_extra_cost_dicts)
 
         logger.info('Extra costs saved to database')
@@ -0,0 +1,75 @@
+import datetime
+from contextlib import _GeneratorContextManager
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from sqlalchemy import select
+
+from sqlmodel import Session
+
+from tradingplatformpoc.connection import session_scope
+from tradingplatformpoc.price.iprice import IPrice
+from tradingplatformpoc.sql.checkpoint.models import Checkpoint
+
+
+def checkpoint_to_db_dict(job_id: str, n_horizons: int, horizon_start: datetime.datetime,
+                          shallow_storage_end: Dict[str, float], deep_storage_end: Dict[str, float],
+                          elec_pricing: IPrice, heat_pricing: IPrice) -> Dict[str, Any]:
+    """
+    The pricing objects should only hold the history recorded in the batch, see IPrice.copy_with_history_between, so
+    that the size of each checkpoint doesn't grow with the number of horizons simulated before it.
+    """
+    return {'job_id': job_id,
+            'n_horizons': n_horizons,
+            'horizon_start': horizon_start,
+            'shallow_storage_end': {agent: float(level) for agent, level in shallow_storage_end.items()},
+            'deep_storage_end': {agent: float(level) for agent, level in deep_storage_end.items()},
+            'electricity_price_history': price_history_to_db_dict(elec_pricing),
+            'heating_price_history': price_history_to_db_dict(heat_pricing)}
+
+
+def read_checkpoints(job_id: str, session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope) \
+        -> List[Dict[str, Any]]:
+    """All checkpoints saved for the job, in the order they were saved."""
+    with session_generator() as db:
+        checkpoints = db.execute(select(Checkpoint).where(Checkpoint.job_id == job_id)
+                                 .order_by(Checkpoint.n_horizons)).all()
+        return [{'n_horizons': x.n_horizons,
+                 'horizon_start': x.horizon_start,
+                 'shallow_storage_end': x.shallow_storage_end,
+                 'deep_storage_end': x.deep_storage_end,
+                 'electricity_price_history': x.electricity_price_history,
+                 'heating_price_history': x.heating_price_history}
+                for (x, ) in checkpoints]
+
+
+def price_history_to_db_dict(pricing: IPrice) -> Dict[str, Any]:
+    """The external sells and price estimates recorded in the pricing object, in a form that can be stored as JSON."""
+    return {'all_external_sells': series_to_db_dict(pricing.all_external_sells),
+            'external_sells_by_agent': {agent: series_to_db_dict(sells)
+                                        for agent, sells in pricing.external_sells_by_agent.items()},
+            'price_estimates': series_to_db_dict(pricing.price_estimates),
+            'price_estimates_by_agent': {agent: series_to_db_dict(estimates)
+                                         for agent, estimates in pricing.price_estimates_by_agent.items()}}
+
+
+def add_price_history_from_db_dict(pricing: IPrice, history: Dict[str, Any]):
+    """Adds the history from price_history_to_db_dict to the pricing object, as IPrice.add_history_from does."""
+    saved = pricing.copy_without_history()
+    saved.all_external_sells = db_dict_to_series(history['all_external_sells'])
+    saved.external_sells_by_agent = {agent: db_dict_to_series(sells)
+                                     for agent, sells in history['external_sells_by_agent'].items()}
+    saved.price_estimates = db_dict_to_series(history['price_estimates'])
+    saved.price_estimates_by_agent = {agent: db_dict_to_series(estimates)
+                                      for agent, estimates in history['price_estimates_by_agent'].items()}
+    pricing.add_history_from(saved)
+
+
+def series_to_db_dict(dt_series: pd.Series) -> Dict[str, List[Any]]:
+    return {'periods': [period.isoformat() for period in dt_series.index],
+            'values': [float(value) for value in dt_series]}
+
+
+def db_dict_to_series(db_dict: Dict[str, List[Any]]) -> pd.Series:
+    return pd.Series(db_dict['values'], index=pd.to_datetime(db_dict['periods'], utc=True), dtype=float)
@@ -0,0 +1,51 @@
+import datetime
+
+from sqlalchemy import Column, DateTime, Integer
+from sqlalchemy.dialects.postgresql import JSONB
+
+from sqlmodel import Field, SQLModel
+
+
+class Checkpoint(SQLModel, table=True):
+    """
+    One row for each batch of trading horizons saved in a job, written in the same transaction as the batch's trades
+    and levels. Holds what is needed to continue the simulation after the batch, should the job be interrupted.
+    """
+    __tablename__ = 'checkpoint'
+
+    id: int = Field(
+        title='Unique integer ID',
+        sa_column=Column(Integer, autoincrement=True, primary_key=True, nullable=False)
+    )
+    job_id: str = Field(
+        primary_key=False,
+        default=None,
+        title='Unique job ID',
+        nullable=False
+    )
+    n_horizons: int = Field(
+        primary_key=False,
+        default=None,
+        title='Number of trading horizons simulated in the job, up to and including this batch',
+        nullable=False
+    )
+    horizon_start: datetime.datetime = Field(
+        title='Start of the last trading horizon in the batch',
+        sa_column=Column(DateTime(timezone=True), primary_key=False, nullable=False)
+    )
+    shallow_storage_end: dict = Field(
+        title='BITES shallow storage level per agent at the end of the batch',
+        sa_column=Column(JSONB(none_as_null=True), primary_key=False, nullable=False)
+    )
+    deep_storage_end: dict = Field(
+        title='BITES deep storage level per agent at the end of the batch',
+        sa_column=Column(JSONB(none_as_null=True), primary_key=False, nullable=False)
+    )
+    electricity_price_history: dict = Field(
+        title='External electricity sells and price estimates recorded in the batch',
+        sa_column=Column(JSONB(none_as_null=True), primary_key=False, nullable=False)
+    )
+    heating_price_history: dict = Field(
+        title='External heating sells and price estimates recorded in the batch',
+        sa_column=Column(JSONB(none_as_null=True), primary_key=False, nullable=False)
+    )
@@ -124,7 +124,9 @@ def get_all_config_ids_in_db_with_jobs_df(session_generator: Callable[[], _Gener
                          join(Config, Job.config_id == Config.id).
                          where(Job.fail_info.is_(None))).all()
         return pd.DataFrame.from_records([{'Job ID': job.id, 'Config ID': job.config_id, 'Description': desc,
-                                           'Start time': job.start_time, 'End time': job.end_time}
+                                           'Start time': job.start_time, 'End time': job.end_time,
+                                           'Worker': job.worker_id, 'Lease expires at': job.lease_expires_at,
+                                           'Phase timings': job.phase_timings}
                                          for (job, desc) in res])
 
 
@@ -1,25 +1,27 @@
 import datetime
 import logging
 from contextlib import _GeneratorContextManager
-from typing import Callable
+from typing import Any, Callable, Dict, Optional
 
 import pandas as pd
 
 import pytz
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, func, or_, select, update
 from sqlalchemy.orm.attributes import flag_modified
 
 from sqlmodel import Session
 
 from tradingplatformpoc.connection import session_scope
 from tradingplatformpoc.simulation_runner.chalmers_interface import InfeasibilityError
+from tradingplatformpoc.sql.checkpoint.models import Checkpoint
 from tradingplatformpoc.sql.electricity_price.models import ElectricityPrice as TableElectricityPrice
 from tradingplatformpoc.sql.extra_cost.models import ExtraCost as TableExtraCost
 from tradingplatformpoc.sql.heating_price.models import HeatingPrice as TableHeatingPrice
-from tradingplatformpoc.sql.job.models import Job, JobCreate
+from tradingplatformpoc.sql.job.models import BACKGROUND_PRIORITY, Job, JobCreate
 from tradingplatformpoc.sql.level.models import Level
 from tradingplatformpoc.sql.results.models import PreCalculatedResults
+from tradingplatformpoc.sql.solve_info.models import SolveInfo as TableSolveInfo
 from tradingplatformpoc.sql.trade.models import Trade as TableTrade
 
 logger = logging.getLogger(__name__)
@@ -33,12 +35,12 @@ def create_job(job: JobCreate, db: Session):
     return job_to_db
 
 
-def create_job_if_new_config(config_id: str,
+def create_job_if_new_config(config_id: str, priority: int = BACKGROUND_PRIORITY,
                              session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope):
     with session_generator() as db:
         exists = get_job_id_for_config(config_id, db)
         if not exists:
-            job_to_db = create_job(JobCreate(config_id=config_id), db=db)
+            job_to_db = create_job(JobCreate(config_id=config_id, priority=priority), db=db)
             logger.info('Job created with ID {}.'.format(job_to_db.id))
             return job_to_db.id
         else:
@@ -52,24 +54,45 @@ def delete_job(job_id: str,
     with session_generator() as db:
         job = db.get(Job, job_id)
         if not job:
-            logger.error('No job in database with ID {}'.format(job_id))
-        else:
-            # Delete job AND ALL RELATED DATA
-            db.execute(delete(TableElectricityPrice).where(TableElectricityPrice.job_id == job_id))
-            db.execute(delete(TableExtraCost).where(TableExtraCost.job_id == job_id))
-            db.execute(delete(TableHeatingPrice).where(TableHeatingPrice.job_id == job_id))
-            db.execute(delete(Level).where(Level.job_id == job_id))
-            db.execute(delete(TableTrade).where(TableTrade.job_id == job_id))
-            db.execute(delete(PreCalculatedResults).where(PreCalculatedResults.job_id == job_id))
-
-            if not only_delete_associated_data:
-                logger.info('Deleting job in database with ID {}, along with all related data'.format(job_id))
+            # Could have been deleted in the app while it was running, after which the worker running it may have saved
+            # more data
+            logger.error('No job in database with ID {}, deleting any data left for it'.format(job_id))
+        # Delete job AND ALL RELATED DATA
+        _delete_results(job_id, db)
+        db.execute(delete(Level).where(Level.job_id == job_id))
+        db.execute(delete(TableTrade).where(TableTrade.job_id == job_id))
+        db.execute(delete(Checkpoint).where(Checkpoint.job_id == job_id))
+
+        if not only_delete_associated_data:
+            # Solver telemetry is kept for failed jobs, since it can help explain the failure
+            db.execute(delete(TableSolveInfo).where(TableSolveInfo.job_id == job_id))
+            logger.info('Deleting job in database with ID {}, along with all related data'.format(job_id))
+            if job:
                 db.delete(job)
-            else:
-                logger.info('Deleting all related data for job {}, but keeping job for fail info'.format(job_id))
+        else:
+            logger.info('Deleting all related data for job {}, but keeping job for fail info'.format(job_id))
 
-            db.commit()
-            logger.info('Deleted data for job {}'.format(job_id))
+        db.commit()
+        logger.info('Deleted data for job {}'.format(job_id))
+
+
+def delete_results_for_job(job_id: str,
+                           session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope):
+    """
+    Deletes what is calculated from the trades and levels once all trading horizons have been simulated, keeping the
+    trades, levels and checkpoints. Used when resuming an interrupted job, which may have been interrupted while saving
+    these.
+    """
+    with session_generator() as db:
+        _delete_results(job_id, db)
+        db.commit()
+
+
+def _delete_results(job_id: str, db: Session):
+    db.execute(delete(TableElectricityPrice).where(TableElectricityPrice.job_id == job_id))
+    db.execute(delete(TableExtraCost).where(TableExtraCost.job_id == job_id))
+    db.execute(delete(TableHeatingPrice).where(TableHeatingPrice.job_id == job_id))
+    db.execute(delete(PreCalculatedResults).where(PreCalculatedResults.job_id == job_id))
 
 
 # TODO: If job for config exists show or delete and rerun
@@ -97,6 +120,14 @@ def update_job_with_time(job_id: str, time_attribute: str,
         db.refresh(job_to_update)
 
 
+def set_phase_timings(job_id: str, phase_timings: Dict[str, Dict[str, Any]],
+                      session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope):
+    """Saves the time spent in each phase of the job so far, see PhaseTimer."""
+    with session_generator() as db:
+        db.execute(update(Job).where(Job.id == job_id).values(phase_timings=phase_timings))
+        db.commit()
+
+
 def get_all_ongoing_jobs(session_generator: Callable[[], _GeneratorContextManager[Session]]
                          = session_scope):
     with session_generator() as db:
@@ -118,10 +149,91 @@ def get_all_queued_jobs(session_generator: Callable[[], _GeneratorContextManager
                         = session_scope):
     with session_generator() as db:
         res = db.query(Job.id).filter(Job.start_time.is_(None), Job.end_time.is_(None)).\
-            order_by(Job.created_at.asc()).all()
+            order_by(Job.priority.desc(), Job.created_at.asc()).all()
         return [job_id for (job_id,) in res]
 
 
+def claim_next_job(worker_id: str, lease_seconds: float, max_attempts: int,
+                   accept: Optional[Callable[[str], bool]] = None,
+                   session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope) \
+        -> Optional[str]:
+    """
+    Takes the job with the highest priority, and the oldest of those, that is neither finished, failed, nor leased by a
+    worker, and leases it to worker_id for lease_seconds. Jobs whose lease has expired are taken too: their worker
+    stopped renewing the lease, for example because it was shut down, and the job can be resumed from its last
+    checkpoint. A job that has already been taken max_attempts times is marked as failed instead, since it most likely
+    makes its worker crash, and would otherwise be taken again, and again, ahead of the jobs queued after it. Locks the
+    job's row while taking it, skipping rows locked by other workers, so that any number of workers can take jobs from
+    the same queue. If accept is specified, it is called with the job's config ID, and the job is only taken if it
+    returns True. Returns the ID of the job, or None if there is no job to take.
+    """
+    with session_generator() as db:
+        while True:
+            job = db.execute(select(Job).
+                             where(Job.end_time.is_(None), Job.fail_info.is_(None),
+                                   or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < func.now())).
+                             order_by(Job.priority.desc(), Job.created_at.asc()).limit(1).
+                             with_for_update(skip_locked=True)).scalars().first()
+            if job is None:
+                return None
+            if job.attempts < max_attempts:
+                break
+            logger.error('Job {} was taken {} times without finishing, marking it as failed'.format(
+                job.id, job.attempts))
+            job.fail_info = {'message': 'Job was taken {} times without finishing. Its worker process may have '
+                                        'crashed, for example by running out of memory.'.format(job.attempts),
+                             'agent_names': [],
+                             'hour_indices': [],
+                             'horizon_start': None,
+                             'horizon_end': None,
+                             'constraints': []}
+            job.worker_id = None
+            job.lease_expires_at = None
+            db.add(job)
+            db.commit()
+        if accept is not None and not accept(job.config_id):
+            # Not taking any other job either, so that the job isn't overtaken by jobs queued after it
+            return None
+        job_id = job.id
+        if job.start_time is not None:
+            logger.info('Lease of job {} by worker {} has expired, will resume it'.format(job_id, job.worker_id))
+        job.worker_id = worker_id
+        job.lease_expires_at = func.now() + datetime.timedelta(seconds=lease_seconds)
+        job.attempts = job.attempts + 1
+        db.add(job)
+        db.commit()
+        return job_id
+
+
+def renew_lease(job_id: str, worker_id: str, lease_seconds: float,
+                session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope) \
+        -> Optional[bool]:
+    """
+    Extends the worker's lease on the job. Returns False if the worker doesn't hold the lease anymore, because the job
+    was deleted or taken by another worker, and None if the database couldn't be reached.
+    """
+    with session_generator() as db:
+        result = db.execute(update(Job).where(Job.id == job_id, Job.worker_id == worker_id).
+                            values(lease_expires_at=func.now() + datetime.timedelta(seconds=lease_seconds)))
+        db.commit()
+        return result.rowcount > 0
+
+
+def release_lease(job_id: str, worker_id: str,
+                  session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope):
+    """Ends the worker's lease on the job, once it has finished running it."""
+    with session_generator() as db:
+        db.execute(update(Job).where(Job.id == job_id, Job.worker_id == worker_id).
+                   values(worker_id=None, lease_expires_at=None))
+        db.commit()
+
+
+def job_exists(job_id: str, session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope) \
+        -> bool:
+    with session_generator() as db:
+        return db.get(Job, job_id) is not None
+
+
 def set_error_info(job_id: str, e: InfeasibilityError,
                    session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope):
     with session_generator() as db:
@@ -2,12 +2,18 @@ import datetime
 import uuid
 from typing import Optional
 
-from sqlalchemy import Column, DateTime, func
+from sqlalchemy import Column, DateTime, Integer, String, func
 from sqlalchemy.dialects.postgresql import JSONB
 
 from sqlmodel import Field, SQLModel
 
 
+# Jobs with higher priority are run first. Jobs queued in the app are interactive, unless queued to run in the
+# background.
+BACKGROUND_PRIORITY = 0
+INTERACTIVE_PRIORITY = 10
+
+
 def uuid_as_str_generator() -> str:
     return str(uuid.uuid4())
 
@@ -38,11 +44,34 @@ class Job(SQLModel, table=True):
         title='Configuration ID',
         nullable=False
     )
+    priority: int = Field(
+        default=BACKGROUND_PRIORITY,
+        title='Priority, jobs with higher priority are run first',
+        sa_column=Column(Integer, server_default=str(BACKGROUND_PRIORITY), primary_key=False, nullable=False)
+    )
+    worker_id: Optional[str] = Field(
+        title='Worker running the job, if it is running',
+        sa_column=Column(String, primary_key=False, nullable=True)
+    )
+    attempts: int = Field(
+        default=0,
+        title='Number of times the job has been taken by a worker',
+        sa_column=Column(Integer, server_default='0', primary_key=False, nullable=False)
+    )
+    lease_expires_at: Optional[datetime.datetime] = Field(
+        title='Time at which the job may be taken over by another worker, unless its worker renews the lease, with tz',
+        sa_column=Column(DateTime(timezone=True), primary_key=False, nullable=True)
+    )
     fail_info: Optional[dict] = Field(
         title="Fail info",
         sa_column=Column(JSONB(none_as_null=True), primary_key=False, nullable=True)
     )
+    phase_timings: Optional[dict] = Field(
+        title='Time spent in each phase of the simulation, see PhaseTimer',
+        sa_column=Column(JSONB(none_as_null=True), primary_key=False, nullable=True)
+    )
 
 
 class JobCreate(SQLModel):
     config_id: str
+    priority: int = BACKGROUND_PRIORITY
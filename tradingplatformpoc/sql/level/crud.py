@@ -95,3 +95,13 @@ def sum_levels(job_id: str, level_type: str,
         if len(rows) > 0 and len(rows[0]) > 0:
             return rows[0][0] if rows[0][0] is not None else 0.0
         return 0.0
+
+
+def sum_levels_per_period(job_id: str, level_type: str,
+                          session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope) \
+        -> pd.Series:
+    """Same as sum_levels, but summed per period rather than in total. Indexed by period."""
+    with session_generator() as db:
+        rows = db.query(Level.period, func.sum(Level.level)).filter(Level.job_id == job_id, Level.type == level_type). \
+            group_by(Level.period).all()
+        return pd.Series({period: level for period, level in rows}, dtype=float)
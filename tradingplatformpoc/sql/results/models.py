@@ -42,6 +42,10 @@ class ResultsKey:
     LOCALLY_PRODUCED_RESOURCES = 'Local prod. {} [kWh]'
     HEAT_DUMPED = 'Heat dumped [kWh]'
     COOL_DUMPED = 'Cooling dumped [kWh]'
+    TIME_LIMIT_FALLBACKS = 'Optimizations reaching time limit'
+    TIME_AGGREGATION_ERROR = 'Energy balance error from time aggregation [kWh]'
+    AGENT_CLUSTERING_ERROR = 'Energy netted from agent clustering [kWh]'
+    REPRESENTATIVE_DAYS = 'Representative days simulated'
 
     @staticmethod
     def format_results_key_name(results_key_name: str, resource: Resource) -> str:
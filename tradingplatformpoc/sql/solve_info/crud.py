@@ -0,0 +1,64 @@
+from contextlib import _GeneratorContextManager
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from sqlalchemy import func, select
+
+from sqlmodel import Session
+
+from tradingplatformpoc.connection import session_scope
+from tradingplatformpoc.simulation_runner.chalmers_interface import SolveInfo
+from tradingplatformpoc.sql.solve_info.models import SolveInfo as TableSolveInfo
+
+
+def solve_infos_to_db_dict(solve_infos: List[SolveInfo], job_id: str) -> List[Dict[str, Any]]:
+    return [{'job_id': job_id,
+             'horizon_start': x.horizon_start,
+             'model_name': x.model_name,
+             'build_seconds': x.build_seconds,
+             'solve_seconds': x.solve_seconds,
+             'extraction_seconds': x.extraction_seconds,
+             'warm_start': x.warm_start,
+             'n_variables': x.n_variables,
+             'n_constraints': x.n_constraints,
+             'n_binaries': x.n_binaries,
+             'status': x.status,
+             'mip_gap': x.mip_gap,
+             'objective': x.objective,
+             'fallback': x.fallback}
+            for x in solve_infos]
+
+
+def db_to_solve_info_df(job_id: str,
+                        session_generator: Callable[[], _GeneratorContextManager[Session]]
+                        = session_scope) -> pd.DataFrame:
+    """One row per optimization problem solved in the job, ordered by horizon."""
+    with session_generator() as db:
+        solve_infos = db.execute(select(TableSolveInfo).where(TableSolveInfo.job_id == job_id)
+                                 .order_by(TableSolveInfo.horizon_start)).all()
+        return pd.DataFrame.from_records([{'horizon_start': x.horizon_start,
+                                           'model_name': x.model_name,
+                                           'build_seconds': x.build_seconds,
+                                           'solve_seconds': x.solve_seconds,
+                                           'extraction_seconds': x.extraction_seconds,
+                                           'warm_start': x.warm_start,
+                                           'n_variables': x.n_variables,
+                                           'n_constraints': x.n_constraints,
+                                           'n_binaries': x.n_binaries,
+                                           'status': x.status,
+                                           'mip_gap': x.mip_gap,
+                                           'objective': x.objective,
+                                           'fallback': x.fallback
+                                           } for (x, ) in solve_infos])
+
+
+def count_time_limit_fallbacks(job_id: str,
+                               session_generator: Callable[[], _GeneratorContextManager[Session]] = session_scope) \
+        -> Dict[str, int]:
+    """Number of optimization problems in the job that reached the time limit, per fallback used."""
+    with session_generator() as db:
+        rows = db.query(TableSolveInfo.fallback, func.count(TableSolveInfo.id)). \
+            filter(TableSolveInfo.job_id == job_id, TableSolveInfo.fallback.isnot(None)). \
+            group_by(TableSolveInfo.fallback).all()
+        return {fallback: count for (fallback, count) in rows}
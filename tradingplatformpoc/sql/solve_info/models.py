@@ -0,0 +1,99 @@
+import datetime
+
+from pydantic.types import Optional
+
+from sqlalchemy import Column, DateTime, Integer
+
+from sqlmodel import Field, SQLModel
+
+
+class SolveInfo(SQLModel, table=True):
+    """One row for each optimization problem solved in a job."""
+    __tablename__ = 'solve_info'
+
+    id: int = Field(
+        title='Unique integer ID',
+        sa_column=Column(Integer, autoincrement=True, primary_key=True, nullable=False)
+    )
+    job_id: str = Field(
+        primary_key=False,
+        default=None,
+        title='Unique job ID',
+        nullable=False
+    )
+    horizon_start: datetime.datetime = Field(
+        title='Start of the trading horizon',
+        sa_column=Column(DateTime(timezone=True), primary_key=False, nullable=False)
+    )
+    model_name: str = Field(
+        primary_key=False,
+        default=None,
+        title='LEC, an agent, or Agents if all agents were solved together',
+        nullable=False
+    )
+    build_seconds: float = Field(
+        primary_key=False,
+        default=None,
+        title='Time spent building or updating the model',
+        nullable=False
+    )
+    solve_seconds: float = Field(
+        primary_key=False,
+        default=None,
+        title='Time spent solving the model',
+        nullable=False
+    )
+    extraction_seconds: float = Field(
+        primary_key=False,
+        default=None,
+        title='Time spent extracting trades and metadata from the solved model',
+        nullable=False
+    )
+    warm_start: bool = Field(
+        primary_key=False,
+        default=None,
+        title='Whether the solver was given a MIP start',
+        nullable=False
+    )
+    n_variables: int = Field(
+        primary_key=False,
+        default=None,
+        title='Number of variables, not counting fixed ones',
+        nullable=False
+    )
+    n_constraints: int = Field(
+        primary_key=False,
+        default=None,
+        title='Number of active constraints',
+        nullable=False
+    )
+    n_binaries: int = Field(
+        primary_key=False,
+        default=None,
+        title='Number of binary variables, not counting fixed ones',
+        nullable=False
+    )
+    status: str = Field(
+        primary_key=False,
+        default=None,
+        title='Termination condition of the solver',
+        nullable=False
+    )
+    mip_gap: Optional[float] = Field(
+        primary_key=False,
+        default=None,
+        title='Relative MIP gap, if reported by the solver',
+        nullable=True
+    )
+    objective: Optional[float] = Field(
+        primary_key=False,
+        default=None,
+        title='Objective value',
+        nullable=True
+    )
+    fallback: Optional[str] = Field(
+        primary_key=False,
+        default=None,
+        title='What was done when the solver reached the time limit, if it did',
+        nullable=True
+    )
@@ -244,6 +244,24 @@ def get_total_grid_fee_paid(job_id: str, agent_guid: Optional[str] = None,
         return res.sum_grid_fee_paid_for_quantities if res.sum_grid_fee_paid_for_quantities is not None else 0.0
 
 
+def get_tax_and_grid_fee_paid_per_period(job_id: str,
+                                         session_generator: Callable[[], _GeneratorContextManager[Session]]
+                                         = session_scope) -> pd.DataFrame:
+    """Same as get_total_tax_paid and get_total_grid_fee_paid, but summed per period. Indexed by period."""
+    with session_generator() as db:
+        res = db.query(
+            TableTrade.period.label('period'),
+            func.sum(TableTrade.tax_paid_for_quantity).label('tax_paid'),
+            func.sum(TableTrade.grid_fee_paid_for_quantity).label('grid_fee_paid'),
+        ).filter(TableTrade.action == Action.SELL, TableTrade.job_id == job_id).group_by(TableTrade.period).all()
+        return pd.DataFrame.from_records([{'period': elem.period,
+                                           'tax_paid': elem.tax_paid if elem.tax_paid is not None else 0.0,
+                                           'grid_fee_paid': elem.grid_fee_paid
+                                           if elem.grid_fee_paid is not None else 0.0}
+                                          for elem in res], columns=['period', 'tax_paid', 'grid_fee_paid']). \
+            set_index('period')
+
+
 def get_total_import_export(job_id: str, resource: Resource, action: Action,
                             periods: Optional[List[datetime.datetime]] = None,
                             session_generator: Callable[[], _GeneratorContextManager[Session]]
@@ -1,14 +1,18 @@
 import logging
+import math
 import platform
 from datetime import datetime, timedelta
-from typing import Any, Collection, Dict, List
+from typing import Any, Callable, Collection, Dict, List, Optional
 
 import numpy as np
 
 import pandas as pd
 
 import pyomo.environ as pyo
-from pyomo.opt import OptSolver
+from pyomo.common.dependencies import attempt_import
+from pyomo.contrib.appsi.base import LegacySolverInterface
+from pyomo.contrib.appsi.solvers.highs import Highs
+from pyomo.opt import OptSolver, SolverResults, TerminationCondition
 
 from tradingplatformpoc import constants
 from tradingplatformpoc.market.trade import Resource
@@ -147,6 +151,118 @@ def get_glpk_solver() -> OptSolver:
         # executable=settings.GLPK_PATH)
 
 
+# highspy is optional: without it, this module can still be imported, and the HiGHS solver is not available (see
+# get_solver). It is only imported once it is used.
+highspy, highspy_available = attempt_import('highspy')
+
+# HiGHS' output is captured from stdout and stderr while solving, and then logged. It must not be logged to a handler
+# writing to stderr (as logging.basicConfig sets up), since that would be captured and logged again, endlessly. So it
+# goes to a logger of its own, which doesn't pass it on to the root logger.
+HIGHS_OUTPUT_LOGGER = logging.getLogger(__name__ + '.highs_output')
+HIGHS_OUTPUT_LOGGER.propagate = False
+HIGHS_OUTPUT_LOGGER.addHandler(logging.NullHandler())
+
+
+# Pyomo's HiGHS interface has no public way to set a MIP start, so it is set by overriding its _solve method, using
+# these attributes of it. Should a version of Pyomo not have them, warm starts are not supported, rather than failing.
+HIGHS_MIP_START_ATTRIBUTES = ['_pyomo_var_to_solver_var_map', '_solver_model']
+
+
+class InProcessHighsSolver(LegacySolverInterface, Highs):
+    """
+    HiGHS, solving in-process through highspy: no solver process is launched, and no model or solution files are
+    written. Like the GLPK interface, and unlike Pyomo's own HiGHS interface, infeasibility is reported through the
+    termination condition of the results, rather than by raising an error.
+    Supports MIP starts (see warm_start_capable): when solving with warmstart=True, the current values of the model's
+    variables are handed to HiGHS as a starting solution.
+    If time_limit is set, it applies to every solve. A solution found before the time limit is reached is loaded, and
+    reported with the termination condition "feasible", as GLPK does.
+    """
+    _warm_start_model: Optional[pyo.ConcreteModel] = None
+    time_limit: Optional[float] = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.config.solver_output_logger = HIGHS_OUTPUT_LOGGER
+
+    def warm_start_capable(self) -> bool:
+        return hasattr(Highs, '_solve') and all(hasattr(self, attribute) for attribute in HIGHS_MIP_START_ATTRIBUTES) \
+            and highspy_available and hasattr(highspy.Highs, 'setSolution')
+
+    def solve(self, model: pyo.ConcreteModel, warmstart: bool = False, **kwargs) -> SolverResults:
+        self._warm_start_model = model if warmstart and self.warm_start_capable() else None
+        kwargs.setdefault('timelimit', self.time_limit)
+        try:
+            results = super().solve(model, load_solutions=False, **kwargs)
+        finally:
+            self._warm_start_model = None
+        if len(results.solution) > 0:
+            model.solutions.load_from(results)
+            if results.solver.termination_condition == TerminationCondition.maxTimeLimit:
+                results.solver.termination_condition = TerminationCondition.feasible
+        return results
+
+    def _solve(self, timer):
+        # Called once the model has been passed to (or updated in) HiGHS, right before it is solved
+        if self._warm_start_model is not None:
+            col_values = [0.0] * len(self._pyomo_var_to_solver_var_map)
+            for var in self._warm_start_model.component_data_objects(pyo.Var, descend_into=True):
+                col = self._pyomo_var_to_solver_var_map.get(id(var))
+                if col is not None and var.value is not None:
+                    col_values[col] = var.value
+            start = highspy.HighsSolution()
+            start.col_value = col_values
+            start.value_valid = True
+            self._solver_model.setSolution(start)
+        return super()._solve(timer)
+
+
+DEFAULT_SOLVER = 'GLPK'
+# Should match the "options" of the "Solver" parameter in area_info_specs.json
+SOLVER_FACTORIES: Dict[str, Callable[[], OptSolver]] = {
+    DEFAULT_SOLVER: get_glpk_solver,
+    'HiGHS': InProcessHighsSolver
+}
+
+
+def get_solver(solver_name: str = DEFAULT_SOLVER, mip_gap: float = 0.0, time_limit: float = 0.0) -> OptSolver:
+    """
+    Returns a solver from SOLVER_FACTORIES. GLPK, running as a subprocess, is the fallback: it is used if the requested
+    solver is unknown, or not available in this environment.
+    For mip_gap and time_limit, see set_solver_limits.
+    """
+    if solver_name not in SOLVER_FACTORIES:
+        logger.warning('Unknown solver {}, using {} instead.'.format(solver_name, DEFAULT_SOLVER))
+        solver = SOLVER_FACTORIES[DEFAULT_SOLVER]()
+    else:
+        solver = SOLVER_FACTORIES[solver_name]()
+        if solver_name != DEFAULT_SOLVER and not solver.available(exception_flag=False):
+            logger.warning('Solver {} is not available, using {} instead.'.format(solver_name, DEFAULT_SOLVER))
+            solver = SOLVER_FACTORIES[DEFAULT_SOLVER]()
+        else:
+            logger.info('Using solver {}'.format(solver_name))
+    set_solver_limits(solver, mip_gap, time_limit)
+    return solver
+
+
+def set_solver_limits(solver: OptSolver, mip_gap: float, time_limit: float):
+    """
+    Makes the solver stop once it has found a solution within mip_gap (relative) of the optimal one, or after
+    time_limit seconds, for each solve. A value of 0 leaves the solver's default: solving to optimality (within the
+    solver's own tolerance), without any time limit.
+    """
+    if isinstance(solver, InProcessHighsSolver):
+        if mip_gap > 0:
+            solver.config.mip_gap = mip_gap
+        solver.time_limit = time_limit if time_limit > 0 else None
+    else:
+        if mip_gap > 0:
+            solver.options['mipgap'] = mip_gap
+        if time_limit > 0:
+            # GLPK only takes whole seconds
+            solver.options['tmlim'] = max(1, math.ceil(time_limit))
+
+
 def get_external_prices(pricing: IPrice, job_id: str,
                         trading_periods: Collection[datetime], block_agent_ids: List[str],
                         local_market_enabled: bool) -> List[Dict[str, Any]]: